@@ -10,6 +10,7 @@ setup(name='sina',
       author='Siboka Team',
       author_email='siboka@llnl.gov',
       packages=find_packages(),
+      package_data={'sina': ['mnoda.json']},
       description='Simulation INsight and Analysis',
       long_description=open('README.md').read(),
       entry_points={
@@ -38,6 +39,20 @@ setup(name='sina',
         'cli_tools': [
             'deepdiff',
             'texttable'
+        ],
+        'numpy': [
+            'numpy'
+        ],
+        'validation': [
+            'fastjsonschema',
+            'jsonschema'
+        ],
+        'fast_json': [
+            'orjson;python_version>="3.6"',
+            'ujson;python_version>="3"'
+        ],
+        'lz4': [
+            'lz4'
         ]
       },
       install_requires=[
@@ -0,0 +1,444 @@
+"""
+Contains an in-memory index of Relationships for fast graph queries.
+
+Provenance questions (what produced this run, what else came out of its
+ensemble) walk Relationships many times over. Rather than asking the database
+at every hop, an AdjacencyIndex reads every Relationship once, encodes the ids
+as integers, and stores, per predicate, the subject -> objects and
+object -> subjects adjacency in compressed sparse row (CSR) arrays. A hop is
+then a slice of an array.
+
+The index can be saved to a directory of .npy files (next to the database, for
+SQLite) which later runs memory-map rather than rebuild.
+
+Requires numpy.
+"""
+import os
+import json
+import shutil
+import logging
+import tempfile
+import threading
+from array import array
+from collections import defaultdict
+
+import six
+
+try:
+    import numpy as np
+    NUMPY_PRESENT = True
+except ImportError:
+    NUMPY_PRESENT = False
+
+import sina.dao as dao
+
+LOGGER = logging.getLogger(__name__)
+
+# Disable pylint checks due to ubiquitous use of id
+# pylint: disable=invalid-name,redefined-builtin
+
+# Appended to a database's path to name the directory its index is saved in
+INDEX_SUFFIX = ".adjacency"
+# Bumped whenever the saved layout changes, so old snapshots are rebuilt
+INDEX_VERSION = 2
+# How many Relationships may be added after a build before they're folded
+# into the arrays rather than kept in dicts
+COMPACT_THRESHOLD = 10000
+# Metadata file within a saved index
+META_FILENAME = "meta.json"
+
+
+class AdjacencyIndex(object):
+    """
+    An integer-encoded, in-memory snapshot of the Relationships in a backend.
+
+    The index is built (or loaded from path) the first time it's queried.
+    Relationships added afterwards through observe(), as the SQL DAOs do on
+    insert, are folded in without a rebuild, as are the Records removed
+    through forget(), as they do on delete. Anything else that may remove
+    Relationships should call invalidate().
+    """
+
+    def __init__(self, relationship_dao, path=None):
+        """
+        Create an index over a backend's Relationships. Nothing is read yet.
+
+        :param relationship_dao: The RelationshipDAO to build the index from.
+        :param path: The directory to save the index in and load it from. If
+                     None, the index is only kept in memory.
+
+        :raises ImportError: if numpy isn't available.
+        """
+        if not NUMPY_PRESENT:
+            msg = 'The adjacency index requires numpy, which could not be imported.'
+            LOGGER.error(msg)
+            raise ImportError(msg)
+        self.relationship_dao = relationship_dao
+        self.path = path
+        self._lock = threading.RLock()
+        self._clear()
+
+    def _clear(self):
+        """Forget everything, so the next query loads or rebuilds the index."""
+        self._loaded = False
+        self._ids = []
+        self._positions = {}
+        self._predicates = []
+        self._predicate_positions = {}
+        # (predicate position, 'out' or 'in') -> (offsets, targets)
+        self._csr = {}
+        # (predicate position, 'out' or 'in') -> {node: [neighbors]}
+        self._pending = defaultdict(lambda: defaultdict(list))
+        self._pending_count = 0
+        # Positions of forgotten ids whose edges are still in the arrays
+        self._dead = set()
+        # The backend's RelationshipDAO.generation() as of the last build
+        self._generation = None
+        self.relationship_count = 0
+
+    def load(self):
+        """
+        Make the index ready to query, if it isn't already.
+
+        A saved index is used if it was built at the backend's current
+        generation (see RelationshipDAO.generation()); otherwise, the index
+        is rebuilt (and saved, if it has a path).
+        """
+        with self._lock:
+            if self._loaded:
+                return
+            if self.path and os.path.isfile(os.path.join(self.path, META_FILENAME)):
+                if self._read():
+                    return
+                LOGGER.info('Adjacency index at %s is out of date. Rebuilding.', self.path)
+            self.rebuild()
+
+    def rebuild(self):
+        """Read every Relationship from the backend and build the index from them."""
+        with self._lock:
+            LOGGER.debug('Building adjacency index from %s.', self.relationship_dao)
+            self._clear()
+            # Taken first, so changes made while reading leave the index stale
+            self._generation = self.relationship_dao.generation()
+            subjects = defaultdict(lambda: array('l'))
+            objects = defaultdict(lambda: array('l'))
+            for relationship in self.relationship_dao.get_all():
+                predicate = self._encode_predicate(relationship.predicate)
+                subjects[predicate].append(self._encode(relationship.subject_id))
+                objects[predicate].append(self._encode(relationship.object_id))
+                self.relationship_count += 1
+            for predicate in subjects:
+                self._build_arrays(predicate, np.asarray(subjects[predicate]),
+                                   np.asarray(objects[predicate]))
+            self._loaded = True
+            if self.path:
+                self.save()
+
+    def observe(self, relationships):
+        """
+        Add newly inserted Relationships to the index.
+
+        Ignored until the index is loaded, since loading will pick them up.
+        Relationships the index already has are skipped.
+
+        :param relationships: An iterable of Relationships.
+        """
+        with self._lock:
+            if not self._loaded:
+                return
+            for relationship in relationships:
+                subject = self._encode(relationship.subject_id)
+                obj = self._encode(relationship.object_id)
+                predicate = self._encode_predicate(relationship.predicate)
+                if obj in self._neighbors(subject, predicate, 'out'):
+                    continue
+                self._pending[(predicate, 'out')][subject].append(obj)
+                self._pending[(predicate, 'in')][obj].append(subject)
+                self._pending_count += 1
+                self.relationship_count += 1
+            if self._pending_count >= COMPACT_THRESHOLD:
+                self._compact()
+
+    def forget(self, ids):
+        """
+        Remove the Relationships of deleted Records from the index.
+
+        Ignored until the index is loaded, since loading will pick up the
+        deletion. Each id's position is retired rather than reused, so a
+        Record later inserted with the same id starts without Relationships.
+
+        :param ids: An iterable of the ids of the deleted Records.
+        """
+        with self._lock:
+            if not self._loaded:
+                return
+            doomed = set(self._positions.pop(id) for id in ids if id in self._positions)
+            removed = 0
+            for node in doomed:
+                for predicate in range(len(self._predicates)):
+                    removed += len(self._neighbors(node, predicate, 'out'))
+                    # Those from another doomed node were counted as its own
+                    removed += sum(1 for source in self._neighbors(node, predicate, 'in')
+                                   if source not in doomed)
+            self._dead.update(doomed)
+            self.relationship_count -= removed
+
+    def invalidate(self):
+        """
+        Discard the index, including any saved copy, after Relationships are removed.
+
+        The next query rebuilds it.
+        """
+        with self._lock:
+            LOGGER.debug('Invalidating adjacency index.')
+            self._clear()
+            if self.path and os.path.isdir(self.path):
+                shutil.rmtree(self.path, ignore_errors=True)
+
+    def save(self):
+        """
+        Write the index to its path, replacing any copy already there.
+
+        :raises ValueError: if the index has no path.
+        """
+        with self._lock:
+            if not self.path:
+                msg = 'Cannot save an adjacency index that has no path.'
+                LOGGER.error(msg)
+                raise ValueError(msg)
+            self.load()
+            self._compact()
+            # Written to a fresh directory and swapped in, so any process
+            # with the old arrays memory-mapped keeps a consistent view.
+            parent = os.path.dirname(os.path.abspath(self.path))
+            staging = tempfile.mkdtemp(dir=parent, prefix='.adjacency_')
+            for (predicate, direction), (offsets, targets) in six.iteritems(self._csr):
+                stem = os.path.join(staging, "{}_{}".format(predicate, direction))
+                np.save(stem + "_offsets.npy", offsets)
+                np.save(stem + "_targets.npy", targets)
+            with open(os.path.join(staging, META_FILENAME), 'w') as meta_file:
+                # Retired positions are saved without an id
+                json.dump({"version": INDEX_VERSION,
+                           "ids": [id if self._positions.get(id) == position else None
+                                   for position, id in enumerate(self._ids)],
+                           "predicates": self._predicates,
+                           "generation": self._generation,
+                           "relationship_count": self.relationship_count}, meta_file)
+            if os.path.isdir(self.path):
+                shutil.rmtree(self.path)
+            os.rename(staging, self.path)
+            LOGGER.debug('Saved adjacency index of %i relationships to %s.',
+                         self.relationship_count, self.path)
+
+    def _read(self):
+        """
+        Memory-map a saved index.
+
+        :returns: False, leaving the index unloaded, if the saved index is
+                  from another version, or the backend can't tell (or says)
+                  its Relationships changed since it was built. True
+                  otherwise.
+        """
+        with open(os.path.join(self.path, META_FILENAME)) as meta_file:
+            meta = json.load(meta_file)
+        generation = self.relationship_dao.generation()
+        if (meta.get("version") != INDEX_VERSION or generation is None
+                or meta["generation"] != generation):
+            return False
+        self._ids = meta["ids"]
+        self._positions = {id: position for position, id in enumerate(self._ids)
+                           if id is not None}
+        self._generation = generation
+        self._predicates = meta["predicates"]
+        self._predicate_positions = {predicate: position for position, predicate
+                                     in enumerate(self._predicates)}
+        for predicate in range(len(self._predicates)):
+            for direction in ('out', 'in'):
+                stem = os.path.join(self.path, "{}_{}".format(predicate, direction))
+                self._csr[(predicate, direction)] = (
+                    np.load(stem + "_offsets.npy", mmap_mode='r'),
+                    np.load(stem + "_targets.npy", mmap_mode='r'))
+        self.relationship_count = meta["relationship_count"]
+        self._loaded = True
+        return True
+
+    def _encode(self, id):
+        """Return the integer standing in for an id, assigning one if needed."""
+        position = self._positions.get(id)
+        if position is None:
+            position = self._positions[id] = len(self._ids)
+            self._ids.append(id)
+        return position
+
+    def _encode_predicate(self, predicate):
+        """Return the integer standing in for a predicate, assigning one if needed."""
+        position = self._predicate_positions.get(predicate)
+        if position is None:
+            position = self._predicate_positions[predicate] = len(self._predicates)
+            self._predicates.append(predicate)
+        return position
+
+    def _build_arrays(self, predicate, subjects, objects):
+        """
+        Build the CSR arrays for one predicate, in both directions.
+
+        :param predicate: The predicate's position.
+        :param subjects: An array of the subject positions of its Relationships.
+        :param objects: An array of the matching object positions.
+        """
+        for direction, sources, targets in (('out', subjects, objects),
+                                            ('in', objects, subjects)):
+            order = np.argsort(sources, kind='stable')
+            offsets = np.zeros(len(self._ids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(sources, minlength=len(self._ids)), out=offsets[1:])
+            self._csr[(predicate, direction)] = (offsets,
+                                                 targets[order].astype(np.int32))
+
+    def _compact(self):
+        """Fold Relationships added or forgotten since the last build into the CSR arrays."""
+        if not self._pending_count and not self._dead:
+            return
+        LOGGER.debug('Compacting %i relationships into the adjacency index.',
+                     self._pending_count)
+        dead = np.array(sorted(self._dead), dtype=np.int_)
+        for predicate in range(len(self._predicates)):
+            subjects, objects = [], []
+            offsets, targets = self._csr.get((predicate, 'out'), (None, None))
+            if offsets is not None:
+                subjects.append(np.repeat(np.arange(len(offsets) - 1), np.diff(offsets)))
+                objects.append(np.asarray(targets, dtype=np.int_))
+            for subject, neighbors in six.iteritems(self._pending[(predicate, 'out')]):
+                subjects.append(np.full(len(neighbors), subject, dtype=np.int_))
+                objects.append(np.array(neighbors, dtype=np.int_))
+            if subjects:
+                subjects = np.concatenate(subjects)
+                objects = np.concatenate(objects)
+                kept = ~(np.isin(subjects, dead) | np.isin(objects, dead))
+                self._build_arrays(predicate, subjects[kept], objects[kept])
+        self._pending.clear()
+        self._pending_count = 0
+        self._dead.clear()
+
+    def _neighbors(self, node, predicate, direction):
+        """
+        Return the positions adjacent to a node along one predicate.
+
+        :param node: The node's position.
+        :param predicate: The predicate's position.
+        :param direction: 'out' for objects of node, 'in' for subjects.
+
+        :returns: A list of positions.
+        """
+        neighbors = []
+        offsets, targets = self._csr.get((predicate, direction), (None, None))
+        # Nodes added since the arrays were built have no row in them
+        if offsets is not None and node < len(offsets) - 1:
+            neighbors.extend(targets[offsets[node]:offsets[node + 1]].tolist())
+        pending = self._pending.get((predicate, direction))
+        if pending and node in pending:
+            neighbors.extend(pending[node])
+        if self._dead:
+            neighbors = [neighbor for neighbor in neighbors if neighbor not in self._dead]
+        return neighbors
+
+    def _expand(self, nodes, predicate, direction):
+        """
+        Return the positions adjacent to any of several nodes.
+
+        :param nodes: An iterable of node positions.
+        :param predicate: If not None, the predicate to follow.
+        :param direction: 'out', 'in', or 'both'.
+
+        :returns: A set of positions.
+        """
+        if predicate is None:
+            predicates = range(len(self._predicates))
+        elif predicate in self._predicate_positions:
+            predicates = [self._predicate_positions[predicate]]
+        else:
+            return set()
+        directions = ('out', 'in') if direction == 'both' else (direction,)
+        found = set()
+        for node in nodes:
+            for position in predicates:
+                for way in directions:
+                    found.update(self._neighbors(node, position, way))
+        return found
+
+    def neighbors(self, id, predicate=None, direction='out'):
+        """
+        Return the ids one Relationship away from an id.
+
+        :param id: The id to start from.
+        :param predicate: If provided, only follow Relationships with this
+                          predicate.
+        :param direction: 'out' for the objects of Relationships with id as
+                          subject, 'in' for the subjects of those with it as
+                          object, 'both' for either.
+
+        :returns: A set of ids.
+
+        :raises ValueError: if given an unknown direction.
+        """
+        return self.traverse([id], predicate=predicate, direction=direction,
+                             max_depth=1)
+
+    def traverse(self, start_ids, predicate=None, direction='out', max_depth=None):
+        """
+        Find every id reachable from some starting ids by following Relationships.
+
+        Gives the same answer as RelationshipDAO.traverse(), without going to
+        the backend. For example, every ancestor of a run:
+
+            index.traverse(["run_1"], predicate="contains", direction="in")
+
+        :param start_ids: An iterable of the ids to start from.
+        :param predicate: If provided, only follow Relationships with this
+                          predicate.
+        :param direction: 'out' to follow Relationships from subject to object,
+                          'in' for object to subject, 'both' for either.
+        :param max_depth: If provided, the most Relationships to follow from a
+                          starting id.
+
+        :returns: A set of the reachable ids.
+
+        :raises ValueError: if given an unknown direction.
+        """
+        dao.RelationshipDAO._validate_direction(direction)  # pylint: disable=protected-access
+        with self._lock:
+            self.load()
+            frontier = set(self._positions[id] for id in start_ids if id in self._positions)
+            expanded = set(frontier)
+            reachable = set()
+            depth = 0
+            while frontier and (max_depth is None or depth < max_depth):
+                depth += 1
+                found = self._expand(frontier, predicate, direction)
+                reachable.update(found)
+                frontier = found - expanded
+                expanded.update(frontier)
+            return set(self._ids[position] for position in reachable)
+
+    def siblings(self, id, predicate=None):
+        """
+        Return the ids that share a subject with an id.
+
+        For example, the other runs in a run's ensemble:
+
+            index.siblings("run_1", predicate="contains")
+
+        :param id: The id whose siblings to find.
+        :param predicate: If provided, only consider Relationships with this
+                          predicate.
+
+        :returns: A set of ids, not including id itself.
+        """
+        with self._lock:
+            self.load()
+            if id not in self._positions:
+                return set()
+            node = self._positions[id]
+            parents = self._expand([node], predicate, 'in')
+            found = self._expand(parents, predicate, 'out')
+            found.discard(node)
+            return set(self._ids[position] for position in found)
@@ -0,0 +1,376 @@
+"""
+Contains toplevel, abstract DAOs for accessing each type of object from asyncio.
+
+These mirror the DAOs in sina.dao, but their methods are coroutines, letting a
+single process (ex: a web service) overlap the I/O of many concurrent requests.
+Methods that return generators in sina.dao return lists here instead.
+
+Requires Python 3.5 or above.
+"""
+from abc import ABCMeta, abstractmethod
+import asyncio
+import logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+# Disable pylint checks due to ubiquitous use of id and type
+# pylint: disable=invalid-name,redefined-builtin
+
+class AsyncDAOFactory(object):
+    """Builds async DAOs used for interacting with Mnoda-based data objects."""
+
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def create_record_dao(self):
+        """
+        Create an async DAO for interacting with Records.
+
+        :returns: an AsyncRecordDAO for the AsyncDAOFactory's backend
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_relationship_dao(self):
+        """
+        Create an async DAO for interacting with Relationships.
+
+        :returns: an AsyncRelationshipDAO for the AsyncDAOFactory's backend
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_run_dao(self):
+        """
+        Create an async DAO for interacting with Runs.
+
+        :returns: an AsyncRunDAO for the AsyncDAOFactory's backend
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def close(self):
+        """Release the factory's resources (threads, connections, etc)."""
+        raise NotImplementedError
+
+
+class AsyncRecordDAO(object):
+    """The async DAO responsible for handling Records."""
+
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    async def get(self, id, data_fields=None, include_files=False):
+        """
+        Given an id, return the matching Record from the DAO's backend.
+
+        :param id: The id of the Record to return.
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Record. See sina.dao.RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: The matching Record.
+        """
+        raise NotImplementedError
+
+    async def get_many(self, iter_of_ids, data_fields=None, include_files=False):
+        """
+        Given an iterable of ids, retrieve each corresponding Record.
+
+        The Records are fetched concurrently. If a given DAO's backend can bulk
+        read more cleverly, this should be reimplemented there.
+
+        :param iter_of_ids: An iterable object of ids to find.
+        :param data_fields: The names of the only data to return, or None for
+                            whole Records. See sina.dao.RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: A list of found Records, in the order of iter_of_ids.
+        """
+        return list(await asyncio.gather(*[self.get(id, data_fields=data_fields,
+                                                    include_files=include_files)
+                                           for id in iter_of_ids]))
+
+    @abstractmethod
+    async def insert(self, record):
+        """
+        Given a Record, insert it into the DAO's backend.
+
+        :param record: A Record to insert
+        """
+        raise NotImplementedError
+
+    async def insert_many(self, list_to_insert):
+        """
+        Given a list of Records, insert each into the DAO's backend.
+
+        If a given DAO's backend can bulk insert more cleverly (bulk inserts),
+        this should be reimplemented there.
+
+        :param list_to_insert: A list of Records to insert
+        """
+        for item in list_to_insert:
+            await self.insert(item)
+
+    @abstractmethod
+    async def delete(self, id):
+        """
+        Given the id of a Record, delete all mention of it from the DAO's backend.
+
+        :param id: The id of the Record to delete.
+        """
+        raise NotImplementedError
+
+    async def delete_many(self, ids_to_delete):
+        """
+        Given a list of Record ids, delete all mentions of them from the DAO's backend.
+
+        If a given DAO's backend can bulk delete more cleverly, this should be
+        reimplemented there.
+
+        :param ids_to_delete: A list of the ids of Records to delete.
+        """
+        LOGGER.debug('Deleting %i records.', len(ids_to_delete))
+        for item in ids_to_delete:
+            await self.delete(item)
+
+    @abstractmethod
+    async def data_query(self, **kwargs):
+        """
+        Return the ids of all Records whose data fulfill some criteria.
+
+        See sina.dao.RecordDAO.data_query() for how criteria are expressed.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                         must fulfill.
+        :returns: A list of Record ids that fulfill all criteria.
+
+        :raises ValueError: if not supplied at least one criterion or given
+                            a criterion it does not support
+        """
+        raise NotImplementedError
+
+    async def get_given_data(self, **kwargs):
+        """Alias of data_query() to fit historical naming convention."""
+        return await self.data_query(**kwargs)
+
+    @abstractmethod
+    async def analyze(self):
+        """
+        Collect fresh statistics about the backend's data for query planning.
+
+        :returns: The updated sina.planner.StatisticsCatalog.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_all_of_type(self, type, ids_only=False):
+        """
+        Given a type of Record, return all Records of that type.
+
+        :param type: The type of Record to return
+        :param ids_only: whether to return only the ids of matching Records
+
+        :returns: A list of matching Records.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_given_document_uri(self, uri, accepted_ids_list=None, ids_only=False):
+        """
+        Return all records associated with documents whose uris match some arg.
+
+        :param uri: The uri to use as a search term, such as "foo.png"
+        :param accepted_ids_list: A list of ids to restrict the search to.
+                                  If not provided, all ids will be used.
+        :param ids_only: whether to return only the ids of matching Records
+
+        :returns: A list of matching Records
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_scalars(self, id, scalar_names):
+        """
+        Retrieve scalars for a given record id.
+
+        :param id: The record id to find scalars for
+        :param scalar_names: A list of the names of scalars to return
+
+        :return: A dict of scalars matching the Mnoda data specification
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_data_for_records(self, id_list, data_list):
+        """
+        Retrieve a subset of non-list data for each Record in a list of ids.
+
+        :param id_list: A list of the record ids to find data for
+        :param data_list: A list of the names of data fields to find
+
+        :returns: a dictionary of dictionaries containing the requested data,
+                 keyed by record_id and then data field name.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_files(self, id):
+        """
+        Retrieve files for a given record id.
+
+        :param id: The id of the record whose files to return.
+
+        :returns: A list of file JSON objects matching the Mnoda specification
+        """
+        raise NotImplementedError
+
+
+class AsyncRelationshipDAO(object):
+    """The async DAO responsible for handling Relationships."""
+
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    async def insert(self, relationship=None, subject_id=None,
+                     object_id=None, predicate=None):
+        """
+        Given a Relationship, insert it into the DAO's backend.
+
+        See sina.dao.RelationshipDAO.insert() for details.
+
+        :param subject_id: The id of the subject.
+        :param object_id: The id of the object.
+        :param predicate: A string describing the relationship.
+        :param relationship: A Relationship object to build entry from.
+
+        :raises: A ValueError if neither Relationship nor the subject_id,
+                 object_id, and predicate args are provided.
+        """
+        raise NotImplementedError
+
+    async def insert_many(self, list_to_insert):
+        """
+        Given a list of Relationships, insert each into the DAO's backend.
+
+        If a given DAO's backend can bulk insert more cleverly (bulk inserts),
+        this should be reimplemented there.
+
+        :param list_to_insert: A list of Relationships to insert
+        """
+        for item in list_to_insert:
+            await self.insert(item)
+
+    @abstractmethod
+    async def get(self, subject_id=None, object_id=None, predicate=None):
+        """
+        Given Relationship info, return matching Relationships (or empty list).
+
+        :param subject_id: the subject_id of Relationships to return
+        :param object_id: the object_id of Relationships to return
+        :param predicate: the predicate of Relationships to return
+
+        :returns: A list of Relationships fitting the criteria.
+
+        :raises ValueError: if none of the parameters are provided.
+        """
+        raise NotImplementedError
+
+
+class AsyncRunDAO(object):
+    """The async DAO responsible for handling Runs, a subtype of Record."""
+
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    async def get(self, id, data_fields=None, include_files=False):
+        """
+        Given id, return matching Run from the DAO's backend.
+
+        :param id: The id of the run to return.
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Run. See sina.dao.RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: The matching Run.
+        """
+        raise NotImplementedError
+
+    async def get_many(self, iter_of_ids, data_fields=None, include_files=False):
+        """
+        Given an iterable of ids, retrieve each corresponding run concurrently.
+
+        :param iter_of_ids: An iterable object of ids to find.
+        :param data_fields: The names of the only data to return, or None for
+                            whole Runs. See sina.dao.RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: A list of found Runs, in the order of iter_of_ids.
+        """
+        return list(await asyncio.gather(*[self.get(id, data_fields=data_fields,
+                                                    include_files=include_files)
+                                           for id in iter_of_ids]))
+
+    @abstractmethod
+    async def insert(self, run):
+        """
+        Given a Run, insert it into the DAO's backend.
+
+        :param run: A run to insert
+        """
+        raise NotImplementedError
+
+    async def insert_many(self, list_to_insert):
+        """
+        Given a list of Runs, insert each into the DAO's backend.
+
+        :param list_to_insert: A list of Runs to insert
+        """
+        for item in list_to_insert:
+            await self.insert(item)
+
+    @abstractmethod
+    async def delete(self, id):
+        """
+        Given the id of a Run, delete all mention of it from the DAO's backend.
+
+        :param id: The id of the Run to delete.
+        """
+        raise NotImplementedError
+
+    async def delete_many(self, ids_to_delete):
+        """
+        Given a list of Run ids, delete all mentions of them from the DAO's backend.
+
+        :param ids_to_delete: A list of the ids of Runs to delete.
+        """
+        LOGGER.debug('Deleting %i runs.', len(ids_to_delete))
+        for item in ids_to_delete:
+            await self.delete(item)
+
+    @abstractmethod
+    async def get_all(self, ids_only=False):
+        """
+        Return all Records with type 'run'.
+
+        :param ids_only: whether to return only the ids of matching Runs
+        :returns: A list of all Records which are Runs
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def data_query(self, **kwargs):
+        """
+        Return the ids of all Runs whose data fulfill some criteria.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                       must fulfill, as for AsyncRecordDAO.data_query().
+
+        :returns: A list of run ids fitting the criteria
+        """
+        raise NotImplementedError
+
+    async def get_given_data(self, **kwargs):
+        """Alias data_query()."""
+        return await self.data_query(**kwargs)
@@ -0,0 +1,245 @@
+"""
+Contains a write-behind wrapper for RecordDAOs, for producers inserting often.
+
+A simulation emitting a Record per timestep (from many ranks, or threads)
+would wait on a commit, or a round trip to the database, every time it called
+RecordDAO.insert(). A BufferedRecordDAO instead puts inserted Records on a
+bounded queue and returns at once. A background thread takes them off the
+queue and writes them with insert_many(), in batches of up to batch_size
+Records, or whatever has arrived within max_latency seconds of the first
+Record of the batch, so the backend only ever sees bulk writes.
+"""
+import time
+import logging
+import threading
+
+from six.moves import queue
+
+LOGGER = logging.getLogger(__name__)
+
+# How many Records to write at once, by default
+DEFAULT_BATCH_SIZE = 1000
+# How many seconds a Record may wait for its batch to fill, by default
+DEFAULT_MAX_LATENCY = 1.0
+# How many Records may be waiting to be written before insert() blocks, by default
+DEFAULT_MAX_QUEUED = 10000
+
+# Put on the queue to have the flusher write what it has at once...
+_FLUSH = object()
+# ...or to write what it has and stop.
+_STOP = object()
+
+
+class BufferedRecordDAO(object):
+    """
+    Wraps a RecordDAO, writing the Records inserted into it in the background.
+
+    Records are written by a thread of the BufferedRecordDAO's own, so the
+    wrapped DAO must be usable from a thread other than the one that created
+    it (for SQL, one from a factory created with pooled=True).
+
+    Anything other than inserting is passed on to the wrapped DAO, after a
+    flush(), so that reads see every Record inserted before them. Once done
+    inserting, close() the BufferedRecordDAO (or use it as a context manager)
+    to write the remaining Records and stop its thread::
+
+        with BufferedRecordDAO(factory.create_record_dao()) as record_dao:
+            for step in range(steps):
+                record_dao.insert(Record(id="step_{}".format(step), type="step"))
+
+    If writing a batch fails, its Records are passed, along with the error, to
+    error_callback. Without one, the error is logged, and raised from the
+    next flush() or close(). Either way, the wrapped DAO's session (if it has
+    one, as SQL DAOs do) is rolled back, and the BufferedRecordDAO carries on
+    with the Records after them.
+    """
+
+    def __init__(self, record_dao,  # pylint: disable=too-many-arguments
+                 batch_size=DEFAULT_BATCH_SIZE, max_latency=DEFAULT_MAX_LATENCY,
+                 max_queued=DEFAULT_MAX_QUEUED, error_callback=None, insert_kwargs=None):
+        """
+        Wrap a RecordDAO and start the thread writing to it.
+
+        :param record_dao: The RecordDAO to write Records with.
+        :param batch_size: The most Records to write with one insert_many().
+        :param max_latency: The most seconds to wait for a batch to fill
+                            before writing what's arrived.
+        :param max_queued: The most Records that may be waiting to be
+                           written. Once reached, inserting waits for room.
+        :param error_callback: If provided, called with the list of Records
+                               and the exception whenever writing a batch
+                               fails. It's called from the writing thread.
+        :param insert_kwargs: Keyword arguments for every insert_many(), ex:
+                              {"trusted": True} for the SQL backend.
+
+        :raises ValueError: if batch_size or max_queued is less than 1, or
+                            max_latency is negative.
+        """
+        if batch_size < 1 or max_queued < 1 or max_latency < 0:
+            msg = ('A BufferedRecordDAO needs a batch_size and max_queued of at least 1, '
+                   'and a max_latency of at least 0. Given {}, {}, and {}.'
+                   .format(batch_size, max_queued, max_latency))
+            LOGGER.error(msg)
+            raise ValueError(msg)
+        self.record_dao = record_dao
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.error_callback = error_callback
+        self.insert_kwargs = insert_kwargs or {}
+        # One slot is spared for a _FLUSH or _STOP.
+        self._queue = queue.Queue(maxsize=max_queued + 1)
+        self._error = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._write_batches,
+                                        name="sina-buffered-record-dao")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def insert(self, record):
+        """
+        Queue a Record to be written.
+
+        :param record: The Record to insert.
+
+        :raises ValueError: if the BufferedRecordDAO has been closed.
+        """
+        self._check_open()
+        self._queue.put(record)
+
+    def insert_many(self, list_to_insert):
+        """
+        Queue several Records to be written.
+
+        :param list_to_insert: An iterable of Records to insert.
+
+        :raises ValueError: if the BufferedRecordDAO has been closed.
+        """
+        self._check_open()
+        for record in list_to_insert:
+            self._queue.put(record)
+
+    @property
+    def pending(self):
+        """How many Records (approximately) are waiting to be written."""
+        return self._queue.qsize()
+
+    def flush(self):
+        """
+        Write every Record queued so far, waiting until they're written.
+
+        :raises Exception: the first error writing a batch since the last
+                           flush(), if there's no error_callback.
+        """
+        if not self._closed:
+            self._queue.put(_FLUSH)
+            self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """
+        Write every Record queued, then stop writing.
+
+        Closing again does nothing.
+
+        :raises Exception: the first error writing a batch since the last
+                           flush(), if there's no error_callback.
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._raise_error()
+
+    def __enter__(self):
+        """Use the BufferedRecordDAO until leaving the with block."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the BufferedRecordDAO, leaving any exception raised in the block be."""
+        if exc_type is None:
+            self.close()
+        else:
+            try:
+                self.close()
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception('Error writing Records while handling another error.')
+
+    def __getattr__(self, name):
+        """Flush, then pass on anything else to the wrapped RecordDAO."""
+        if name.startswith('_'):
+            raise AttributeError(name)
+        self.flush()
+        return getattr(self.record_dao, name)
+
+    def _check_open(self):
+        """Raise a ValueError if the BufferedRecordDAO has been closed."""
+        if self._closed:
+            msg = 'Cannot insert into a BufferedRecordDAO after closing it.'
+            LOGGER.error(msg)
+            raise ValueError(msg)
+
+    def _raise_error(self):
+        """Raise (and forget) the first error writing a batch, if any."""
+        error, self._error = self._error, None
+        if error is not None:
+            raise error  # pylint: disable=raising-bad-type
+
+    def _write_batches(self):
+        """Take Records off the queue and write them, until told to stop."""
+        while True:
+            item = self._queue.get()
+            taken = 1
+            batch = []
+            deadline = time.time() + self.max_latency
+            while item is not _FLUSH and item is not _STOP:
+                batch.append(item)
+                remaining = deadline - time.time()
+                if len(batch) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                taken += 1
+            if batch:
+                self._write(batch)
+            for _ in range(taken):
+                self._queue.task_done()
+            if item is _STOP:
+                return
+
+    def _write(self, batch):
+        """
+        Write a batch of Records, handling any error.
+
+        :param batch: The list of Records to write.
+        """
+        try:
+            self.record_dao.insert_many(batch, **self.insert_kwargs)
+        except Exception as error:  # pylint: disable=broad-except
+            self._roll_back()
+            if self.error_callback is not None:
+                try:
+                    self.error_callback(batch, error)
+                except Exception:  # pylint: disable=broad-except
+                    # Don't let it stop the writing thread
+                    LOGGER.exception('error_callback failed on a batch of %i Records.',
+                                     len(batch))
+            else:
+                LOGGER.error('Failed to write %i buffered Records: %s', len(batch), error)
+                if self._error is None:
+                    self._error = error
+
+    def _roll_back(self):
+        """
+        Roll back what a failed batch left of its transaction, if anything.
+
+        A SQL session whose commit failed refuses any more work until it's
+        rolled back, which would fail every batch after.
+        """
+        session = getattr(self.record_dao, 'session', None)
+        if session is not None:
+            try:
+                session.rollback()
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception('Failed to roll back after a failed batch.')
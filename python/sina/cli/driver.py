@@ -29,6 +29,7 @@ except ImportError:
     CASSANDRA_PRESENT = False
 
 from sina import utils
+import sina.codec as codec
 from sina.utils import import_many_jsons, import_json, parse_data_string, create_file
 import sina.datastores.sql as sql
 if CASSANDRA_PRESENT:
@@ -79,6 +80,8 @@ def setup_arg_parser():
     add_ingest_subparser(subparsers)
     add_export_subparser(subparsers)
     add_query_subparser(subparsers)
+    add_compress_subparser(subparsers)
+    add_maintain_subparser(subparsers)
     if CLI_TOOLS_PRESENT:
         add_compare_subparser(subparsers)
     return parser
@@ -114,6 +117,20 @@ def add_ingest_subparser(subparsers):
                                '--source-type is not provided. All URIs being '
                                'ingested in one command must share a type.',
                                choices=['json'])
+    parser_ingest.add_argument('--trusted', action='store_true',
+                               help='Skip checking each data and file entry of '
+                               'the records ingested. Only for sources known to '
+                               'be valid, such as those written by Sina.')
+    parser_ingest.add_argument('--validate', action='store_true',
+                               help='Check each source against the Mnoda schema '
+                               'before ingesting it, reporting where any '
+                               'problems are. Requires fastjsonschema or '
+                               'jsonschema.')
+    parser_ingest.add_argument('--compress-raw', type=str, dest='raw_compression',
+                               help='Compress the raw JSON of each record '
+                               'ingested. See "sina compress" for compressing '
+                               'records already in the database.',
+                               choices=list(codec.RAW_COMPRESSIONS))
 
 
 def add_export_subparser(subparsers):
@@ -124,23 +141,67 @@ def add_export_subparser(subparsers):
                        'information that is not importable with this tool; if '
                        'you want to produce complete Mnoda data, try '
                        '`sina import`ing to JSON or csv. See "sina export -h" '
-                       'for more information.'
-                       'Currently, the only supported export format is csv.')
+                       'for more information. '
+                       'Supported export formats are csv, json '
+                       '(newline-delimited) and npz.')
     required = parser_export.add_argument_group("required arguments")
     _add_common_args(parser=parser_export, required_group=required)
     parser_export.add_argument('--export-type', default='csv',
                                type=str, help='The type of export to run. '
-                               'Currently support: csv (default).',
-                               choices=['csv'])
+                               'Currently support: csv (default), json '
+                               '(newline-delimited, one object per record), '
+                               'and npz (requires numpy).',
+                               choices=list(utils.EXPORT_TYPES))
     parser_export.add_argument('--target', nargs='?', const='', type=str,
                                help='The filepath to write to. Defaults to: '
                                'output_{timestamp}')
     required.add_argument('-s', '--scalars', required=True, type=str,
                           help='A comma separated list of scalar names '
                                'to output.')
-    required.add_argument('-i', '--ids', required=True, type=str,
-                          help='A comma separated list of record ids to '
-                               'output.')
+    parser_export.add_argument('-i', '--ids', type=str,
+                               help='A comma separated list of record ids to '
+                               'output. At least one of --ids and --criteria '
+                               'is required.')
+    parser_export.add_argument('-c', '--criteria', type=str,
+                               help='Specify space-separated data criteria '
+                               'in the same format as "sina query --scalar". '
+                               'Records fulfilling *all* conditions are '
+                               'exported. If --ids is also given, only those '
+                               'records are considered.')
+
+
+def add_compress_subparser(subparsers):
+    """Add subparser for compressing the raws of records already in a backend."""
+    parser_compress = subparsers.add_parser(
+        'compress', help='compress, in place, the raw JSON of every record '
+                         'in a database. Raws are the largest part of most '
+                         'databases, and are decompressed transparently when '
+                         'read. Raws of records ingested later are compressed '
+                         'only if ingested with --compress-raw. See "sina '
+                         'compress -h" for more information.')
+    _add_common_args(parser=parser_compress)
+    parser_compress.add_argument('--method', type=str, default='zlib',
+                                 help='How to compress the raws: zlib (default), '
+                                 'lz4 (faster, but compresses less; requires lz4) '
+                                 'or none, to decompress them.',
+                                 choices=list(codec.RAW_COMPRESSIONS) + ['none'])
+
+
+def add_maintain_subparser(subparsers):
+    """Add subparser for tuning a SQL database for querying."""
+    parser_maintain = subparsers.add_parser(
+        'maintain', help='tune a sql database for querying: collect fresh statistics '
+                         'for query planning (both Sina\'s and SQLite\'s) and store '
+                         'them in the database, optionally reclaiming the space left '
+                         'by deletions. Reports the time spent and the size of each '
+                         'table. See "sina maintain -h" for more information.')
+    _add_common_args(parser=parser_maintain)
+    parser_maintain.add_argument('--vacuum', type=str, default=None,
+                                 help='How to reclaim unused space: full (rewrites the '
+                                 'whole database) or incremental (frees unused pages; '
+                                 'the first time, takes a full rewrite). By default, '
+                                 'space isn\'t reclaimed.',
+                                 choices=list(sql.VACUUM_MODES))
 
 
 def add_query_subparser(subparsers):
@@ -338,11 +399,15 @@ def ingest(args):
         msg = "\n".join(error_message)
         LOGGER.error(msg)
         raise ValueError(msg)
-    factory = _make_factory(args=args)
+    factory = _make_factory(args=args, raw_compression=args.raw_compression)
     if len(source_list) > 1:
-        import_many_jsons(factory=factory, json_list=source_list)
+        summary = import_many_jsons(factory=factory, json_list=source_list,
+                                    trusted=args.trusted, validate=args.validate)
     else:
-        import_json(factory=factory, json_path=source_list[0])
+        summary = import_json(factory=factory, json_path=source_list[0],
+                              trusted=args.trusted, validate=args.validate)
+    print('Records inserted: {inserted}, updated: {updated}, '
+          'skipped as unchanged: {skipped}'.format(**summary))
 
 
 def export(args):
@@ -354,12 +419,13 @@ def export(args):
 
     :raises ValueError: if there's an issue with flags (bad filetype, etc)
     """
-    LOGGER.info('Exporting ids=%s and scalars=%s from database_type=%s '
-                'to target=%s.', args.ids, args.scalars, args.database_type, args.target)
+    LOGGER.info('Exporting ids=%s, criteria=%s and scalars=%s from database_type=%s '
+                'to target=%s.', args.ids, args.criteria, args.scalars,
+                args.database_type, args.target)
     error_message = []
     error_message.extend(_check_common_args(args=args))
-    if not args.ids:
-        error_message.append('Require one or more record ids to export.')
+    if not args.ids and not args.criteria:
+        error_message.append('Require one or more record ids or criteria to export.')
     if not args.scalars:
         error_message.append('Require one or more scalar names to export.')
     if error_message:
@@ -368,12 +434,67 @@ def export(args):
         raise ValueError(msg)
 
     utils.export(factory=_make_factory(args=args),
-                 id_list=args.ids.split(','),
+                 id_list=args.ids.split(',') if args.ids else None,
+                 criteria=parse_data_string(args.criteria) if args.criteria else None,
                  scalar_names=args.scalars.split(','),
                  output_file=args.target,
                  output_type=args.export_type)
 
 
+def compress(args):
+    """
+    Run logic associated with compression subparser.
+
+    :params args: (ArgumentParser, req) Command line args that tell us what
+        database to use and how to compress it.
+
+    :raises ValueError: if there's an issue with flags (bad database type, etc)
+    """
+    LOGGER.info('Compressing raws in database=%s, database_type=%s with method=%s.',
+                args.database, args.database_type, args.method)
+    error_message = _check_common_args(args=args)
+    if error_message:
+        msg = "\n".join(error_message)
+        LOGGER.error(msg)
+        raise ValueError(msg)
+    record_dao = _make_factory(args=args).create_record_dao()
+    rewritten = record_dao.compress_raws(
+        compression=None if args.method == 'none' else args.method,
+        progress_callback=lambda done, total: LOGGER.info('Processed %i of %s records.',
+                                                          done, total or 'all'))
+    print('Records rewritten: {}'.format(rewritten))
+
+
+def maintain(args):
+    """
+    Run logic associated with maintenance subparser.
+
+    :params args: (ArgumentParser, req) Command line args that tell us what
+        database to use and whether to vacuum it.
+
+    :raises ValueError: if there's an issue with flags (bad database type, etc)
+    """
+    LOGGER.info('Maintaining database=%s, database_type=%s with vacuum=%s.',
+                args.database, args.database_type, args.vacuum)
+    error_message = _check_common_args(args=args)
+    if not error_message and args.database_type != 'sql':
+        error_message.append("Can only maintain sql databases.")
+    if error_message:
+        msg = "\n".join(error_message)
+        LOGGER.error(msg)
+        raise ValueError(msg)
+    report = _make_factory(args=args).optimize(vacuum=args.vacuum)
+    print('Time spent (seconds): {}'.format(
+        ', '.join('{}={:.3f}'.format(step, seconds)
+                  for step, seconds in sorted(report["seconds"].items()))))
+    print('Database size: {} -> {} bytes'.format(report["size_before"], report["size_after"]))
+    print('Tables:')
+    for name, size in sorted(report["tables"].items()):
+        print('  {}: {} rows, {}'.format(
+            name, size["rows"],
+            'size unknown' if size["bytes"] is None else '{} bytes'.format(size["bytes"])))
+
+
 def query(args):
     """
     Run logic associated with query subparser.
@@ -522,20 +643,23 @@ def _get_guessed_database_type(database_name):
     return None
 
 
-def _make_factory(args):
+def _make_factory(args, raw_compression=None):
     """
     Create a factory fitting the requirements expressed by args.
 
     :param args: The arguments passed into the parser.
+    :param raw_compression: How the factory should compress the raws of
+                            Records inserted, if at all.
 
     :returns: a factory satisfying the provided arguments
     """
     LOGGER.debug('Making %s factory.', args.database_type)
     if args.database_type == "cass":
         return cass.DAOFactory(node_ip_list=[args.database],
-                               keyspace=args.cass_keyspace)
+                               keyspace=args.cass_keyspace,
+                               raw_compression=raw_compression)
     elif args.database_type == "sql":
-        return sql.DAOFactory(args.database)
+        return sql.DAOFactory(args.database, raw_compression=raw_compression)
     else:
         # Note: database_type should be constrained to a list of choices
         # by the ArgumentParser. If you're seeing this error, then it's likely
@@ -570,6 +694,10 @@ def main():
             export(args)
         elif args.subparser_name == 'query':
             query(args)
+        elif args.subparser_name == 'compress':
+            compress(args)
+        elif args.subparser_name == 'maintain':
+            maintain(args)
         elif args.subparser_name == 'compare':
             compare_records(args)
         else:
@@ -0,0 +1,488 @@
+"""
+Contains the JSON codec used for Records' raws and other stored JSON.
+
+Every Record is serialized on insert and parsed on get, so Sina uses the
+fastest JSON library available: orjson, then ujson, then the standard
+library's json. The choice can be forced with the SINA_JSON_CODEC
+environment variable (one of CODECS) or use_codec().
+
+Everything should go through this module's functions rather than calling a
+library directly, so that the choice is respected everywhere. Functions
+ending in _bytes produce UTF-8 bytes, and loads() accepts bytes, so JSON
+read from or written to files needn't be decoded to str along the way.
+
+Codecs agree on the data they produce and accept, including NaN and
+infinities, which the JSON standard lacks: every codec writes them as the
+standard library does (NaN, Infinity) and reads them back. The one caveat
+is that canonical JSON (see canonical_dumps()) differs slightly between
+codecs in how it spells floats and non-ASCII characters. Anything that
+must not depend on the codec, such as Records' content hashes, uses
+stable_dumps_bytes() instead, which always goes through the standard
+library.
+
+Stored raws may also be compressed (see encode_raw()). Compressed raws are
+marked as such, so they can be stored alongside uncompressed ones, and
+decode_raw() reads either.
+"""
+import os
+import json
+import logging
+import math
+import zlib
+import base64
+
+import six
+
+try:
+    import orjson
+    ORJSON_PRESENT = True
+except ImportError:
+    ORJSON_PRESENT = False
+
+try:
+    import ujson
+    # ujson's Python 2 releases mangle non-ASCII text and accept any object
+    UJSON_PRESENT = not six.PY2
+except ImportError:
+    UJSON_PRESENT = False
+
+try:
+    import lz4.frame
+    LZ4_PRESENT = True
+except ImportError:
+    LZ4_PRESENT = False
+
+LOGGER = logging.getLogger(__name__)
+
+# Supported codecs, fastest first
+CODECS = ('orjson', 'ujson', 'json')
+# The environment variable naming the codec to use, if not the fastest
+CODEC_ENV_VAR = 'SINA_JSON_CODEC'
+
+# Supported compressions for stored raws
+RAW_COMPRESSIONS = ('zlib', 'lz4')
+# Compressed raws start with this (which JSON can't), then a byte naming
+# their compression, then the compressed JSON
+COMPRESSED_RAW_MARKER = b'\x00'
+_COMPRESSION_TAGS = {'zlib': b'z', 'lz4': b'4'}
+_COMPRESSIONS_BY_TAG = dict((tag, name) for name, tag in six.iteritems(_COMPRESSION_TAGS))
+# zlib's compression level. Raws shrink little further past 6, but take
+# much longer to compress.
+ZLIB_LEVEL = 6
+
+
+class _StdlibCodec(object):
+    """Encodes and decodes using the standard library's json."""
+
+    name = 'json'
+
+    @staticmethod
+    def dumps(obj):
+        """Serialize obj to a JSON str."""
+        return json.dumps(obj)
+
+    @staticmethod
+    def canonical_dumps(obj):
+        """Serialize obj to a JSON str with sorted keys and no whitespace."""
+        return json.dumps(obj, sort_keys=True, separators=(',', ':'))
+
+    def dumps_bytes(self, obj):
+        """Serialize obj to JSON as UTF-8 bytes."""
+        return self.dumps(obj).encode('utf-8')
+
+    def canonical_dumps_bytes(self, obj):
+        """Serialize obj to canonical JSON as UTF-8 bytes."""
+        return self.canonical_dumps(obj).encode('utf-8')
+
+    @staticmethod
+    def loads(data):
+        """Deserialize a JSON str or bytes."""
+        if isinstance(data, six.binary_type) and not six.PY2:
+            data = data.decode('utf-8')
+        return json.loads(data)
+
+
+class _UjsonCodec(_StdlibCodec):
+    """
+    Encodes and decodes using ujson.
+
+    Anything ujson can't encode (ex: circular references) is handed to the
+    standard library, so that it raises the usual errors.
+    """
+
+    name = 'ujson'
+
+    @staticmethod
+    def dumps(obj):
+        """Serialize obj to a JSON str."""
+        try:
+            return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+        except (TypeError, OverflowError):
+            return _StdlibCodec.dumps(obj)
+
+    @staticmethod
+    def canonical_dumps(obj):
+        """Serialize obj to a JSON str with sorted keys and no whitespace."""
+        try:
+            return ujson.dumps(obj, sort_keys=True, ensure_ascii=False,
+                               escape_forward_slashes=False)
+        except (TypeError, OverflowError):
+            return _StdlibCodec.canonical_dumps(obj)
+
+    @staticmethod
+    def loads(data):
+        """Deserialize a JSON str or bytes."""
+        return ujson.loads(data)
+
+
+class _OrjsonCodec(_StdlibCodec):
+    """
+    Encodes and decodes using orjson.
+
+    orjson only handles the JSON standard, so anything outside it (integers
+    beyond 64 bits, non-string keys, NaN and infinities) is handed to the
+    standard library. orjson writes NaN and infinities as null rather than
+    failing, so output containing null is checked for them.
+    """
+
+    name = 'orjson'
+
+    @staticmethod
+    def dumps_bytes(obj):
+        """Serialize obj to JSON as UTF-8 bytes."""
+        try:
+            dumped = orjson.dumps(obj)
+        except TypeError:
+            dumped = None
+        if dumped is None or (b'null' in dumped and _has_non_finite(obj)):
+            return _StdlibCodec.dumps(obj).encode('utf-8')
+        return dumped
+
+    @staticmethod
+    def canonical_dumps_bytes(obj):
+        """Serialize obj to canonical JSON as UTF-8 bytes."""
+        try:
+            dumped = orjson.dumps(obj, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            dumped = None
+        if dumped is None or (b'null' in dumped and _has_non_finite(obj)):
+            return _StdlibCodec.canonical_dumps(obj).encode('utf-8')
+        return dumped
+
+    def dumps(self, obj):
+        """Serialize obj to a JSON str."""
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def canonical_dumps(self, obj):
+        """Serialize obj to a JSON str with sorted keys and no whitespace."""
+        return self.canonical_dumps_bytes(obj).decode('utf-8')
+
+    @staticmethod
+    def loads(data):
+        """Deserialize a JSON str or bytes."""
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return _StdlibCodec.loads(data)
+
+
+def _has_non_finite(obj):
+    """
+    Check whether an object holds NaN or an infinity anywhere within it.
+
+    :param obj: The object to check. Must not contain circular references.
+
+    :returns: True if it does, else False.
+    """
+    if isinstance(obj, float):
+        return math.isnan(obj) or math.isinf(obj)
+    if isinstance(obj, dict):
+        return any(_has_non_finite(value) for value in six.itervalues(obj))
+    if isinstance(obj, (list, tuple)):
+        return any(_has_non_finite(value) for value in obj)
+    return False
+
+
+_AVAILABLE = {'orjson': (ORJSON_PRESENT, _OrjsonCodec),
+              'ujson': (UJSON_PRESENT, _UjsonCodec),
+              'json': (True, _StdlibCodec)}
+_ACTIVE = _StdlibCodec()
+
+
+def use_codec(name=None):
+    """
+    Choose the codec used for all JSON handled by Sina.
+
+    :param name: The codec's name (one of CODECS), or None to use the fastest
+                 one installed.
+
+    :returns: The name of the codec now in use.
+
+    :raises ValueError: if the name isn't that of a supported codec.
+    :raises ImportError: if the named codec's library isn't installed.
+    """
+    global _ACTIVE  # pylint: disable=global-statement
+    if name is None:
+        name = next(codec for codec in CODECS if _AVAILABLE[codec][0])
+    if name not in _AVAILABLE:
+        msg = ('Unknown JSON codec {}. Supported codecs are: {}'
+               .format(name, ', '.join(CODECS)))
+        LOGGER.error(msg)
+        raise ValueError(msg)
+    present, codec_class = _AVAILABLE[name]
+    if not present:
+        msg = 'The {0} JSON codec requires {0}, which could not be imported.'.format(name)
+        LOGGER.error(msg)
+        raise ImportError(msg)
+    LOGGER.debug('Using the %s JSON codec', name)
+    _ACTIVE = codec_class()
+    return name
+
+
+def codec_name():
+    """
+    Get the name of the codec in use.
+
+    :returns: The codec's name, one of CODECS.
+    """
+    return _ACTIVE.name
+
+
+def dumps(obj):
+    """
+    Serialize an object to a JSON string.
+
+    :param obj: The object to serialize.
+
+    :returns: The JSON as a str.
+
+    :raises TypeError: if obj contains something JSON can't represent.
+    """
+    return _ACTIVE.dumps(obj)
+
+
+def dumps_bytes(obj):
+    """
+    Serialize an object to JSON, encoded as UTF-8 bytes.
+
+    :param obj: The object to serialize.
+
+    :returns: The JSON as bytes.
+
+    :raises TypeError: if obj contains something JSON can't represent.
+    """
+    return _ACTIVE.dumps_bytes(obj)
+
+
+def canonical_dumps(obj):
+    """
+    Serialize an object to canonical JSON: sorted keys, no whitespace.
+
+    Equal objects give equal canonical JSON (under the same codec).
+
+    :param obj: The object to serialize.
+
+    :returns: The JSON as a str.
+
+    :raises TypeError: if obj contains something JSON can't represent.
+    :raises ValueError: if obj contains a circular reference.
+    """
+    return _ACTIVE.canonical_dumps(obj)
+
+
+def canonical_dumps_bytes(obj):
+    """
+    Serialize an object to canonical JSON, encoded as UTF-8 bytes.
+
+    :param obj: The object to serialize.
+
+    :returns: The JSON as bytes.
+
+    :raises TypeError: if obj contains something JSON can't represent.
+    :raises ValueError: if obj contains a circular reference.
+    """
+    return _ACTIVE.canonical_dumps_bytes(obj)
+
+
+def stable_dumps_bytes(obj):
+    """
+    Serialize an object to canonical JSON that doesn't depend on the codec.
+
+    Always uses the standard library (sorted keys, no whitespace, non-ASCII
+    characters escaped), whichever codec is in use, so the result is the
+    same everywhere Sina runs. Slower than canonical_dumps_bytes(); meant
+    for what's hashed, not what's stored.
+
+    :param obj: The object to serialize.
+
+    :returns: The JSON as ASCII bytes.
+
+    :raises TypeError: if obj contains something JSON can't represent.
+    :raises ValueError: if obj contains a circular reference.
+    """
+    return _StdlibCodec.canonical_dumps(obj).encode('ascii')
+
+
+def loads(data):
+    """
+    Deserialize JSON.
+
+    :param data: The JSON, as a str or UTF-8 bytes.
+
+    :returns: The deserialized object.
+
+    :raises ValueError: if data isn't valid JSON.
+    """
+    return _ACTIVE.loads(data)
+
+
+def load(file_):
+    """
+    Deserialize the JSON in a file.
+
+    :param file_: A file object, ideally opened in binary mode, which saves
+                  decoding its contents to a str before parsing.
+
+    :returns: The deserialized object.
+
+    :raises ValueError: if the file's contents aren't valid JSON.
+    """
+    return _ACTIVE.loads(file_.read())
+
+
+def check_raw_compression(compression):
+    """
+    Check that stored raws can be compressed a given way.
+
+    :param compression: The compression, one of RAW_COMPRESSIONS, or None
+                        for none.
+
+    :raises ValueError: if the compression isn't supported.
+    :raises ImportError: if the compression's library isn't installed.
+    """
+    if compression is None:
+        return
+    if compression not in RAW_COMPRESSIONS:
+        msg = ('Unknown raw compression {}. Supported compressions are: {}'
+               .format(compression, ', '.join(RAW_COMPRESSIONS)))
+        LOGGER.error(msg)
+        raise ValueError(msg)
+    if compression == 'lz4' and not LZ4_PRESENT:
+        msg = 'lz4 compression requires lz4, which could not be imported.'
+        LOGGER.error(msg)
+        raise ImportError(msg)
+
+
+def encode_raw(raw_json, compression=None, as_text=False):
+    """
+    Prepare a Record's serialized raw for storage, compressing it if asked.
+
+    :param raw_json: The raw as a JSON string.
+    :param compression: How to compress it, one of RAW_COMPRESSIONS, or None
+                        to leave it be.
+    :param as_text: Whether the raw is stored in a column that only accepts
+                    text. If so, compressed raws are base64-encoded (after
+                    their marker), costing a third of the space saved.
+
+    :returns: The raw as it should be stored: raw_json itself if not
+              compressed, else bytes (or a str, if as_text).
+    """
+    if compression is None:
+        return raw_json
+    check_raw_compression(compression)
+    payload = raw_json.encode('utf-8')
+    payload = (zlib.compress(payload, ZLIB_LEVEL) if compression == 'zlib'
+               else lz4.frame.compress(payload))
+    if as_text:
+        return (COMPRESSED_RAW_MARKER + _COMPRESSION_TAGS[compression]
+                + base64.b64encode(payload)).decode('ascii')
+    return COMPRESSED_RAW_MARKER + _COMPRESSION_TAGS[compression] + payload
+
+
+def decode_raw(stored):
+    """
+    Deserialize a raw as stored, whether compressed or not.
+
+    :param stored: The raw as stored, see encode_raw().
+
+    :returns: The raw, as a dict.
+    """
+    return loads(_decompress_raw(stored))
+
+
+def raw_json(stored):
+    """
+    Get the JSON of a raw as stored, whether compressed or not.
+
+    :param stored: The raw as stored, see encode_raw().
+
+    :returns: The raw as a JSON string.
+    """
+    json_ = _decompress_raw(stored)
+    return json_ if isinstance(json_, six.text_type) else json_.decode('utf-8')
+
+
+def raw_compression(stored):
+    """
+    Find how a stored raw is compressed.
+
+    :param stored: The raw as stored, see encode_raw().
+
+    :returns: The compression, one of RAW_COMPRESSIONS, or None if the raw
+              isn't compressed.
+    """
+    return _split_stored_raw(stored)[0]
+
+
+def _split_stored_raw(stored):
+    """
+    Split a stored raw into its compression and payload.
+
+    :param stored: The raw as stored, see encode_raw().
+
+    :returns: The compression (None if uncompressed) and the payload (the
+              compressed bytes, or the stored raw itself if uncompressed).
+
+    :raises ValueError: if the raw is marked with an unknown compression.
+    """
+    marker = COMPRESSED_RAW_MARKER.decode('ascii')
+    if isinstance(stored, six.text_type):
+        if not stored.startswith(marker):
+            return None, stored
+        tag, payload = stored[1:2].encode('ascii'), base64.b64decode(stored[2:])
+    else:
+        # Some drivers return blobs as buffers or memoryviews. (On Python 2,
+        # bytes() of a memoryview gives its repr.)
+        stored = stored.tobytes() if isinstance(stored, memoryview) else bytes(stored)
+        if not stored.startswith(COMPRESSED_RAW_MARKER):
+            return None, stored
+        tag, payload = stored[1:2], stored[2:]
+    if tag not in _COMPRESSIONS_BY_TAG:
+        msg = 'Stored raw is marked with unknown compression {!r}'.format(tag)
+        LOGGER.error(msg)
+        raise ValueError(msg)
+    return _COMPRESSIONS_BY_TAG[tag], payload
+
+
+def _decompress_raw(stored):
+    """
+    Decompress a stored raw if needed.
+
+    :param stored: The raw as stored, see encode_raw().
+
+    :returns: The raw's JSON, as a str or UTF-8 bytes.
+    """
+    compression, payload = _split_stored_raw(stored)
+    if compression is None:
+        return payload
+    check_raw_compression(compression)
+    return (zlib.decompress(payload) if compression == 'zlib'
+            else lz4.frame.decompress(payload))
+
+
+try:
+    use_codec(os.environ.get(CODEC_ENV_VAR) or None)
+except (ValueError, ImportError):
+    LOGGER.warning('Ignoring %s; using the fastest JSON codec available instead.',
+                   CODEC_ENV_VAR)
+    use_codec()
@@ -7,11 +7,16 @@ and Relationships, it will not differ between backends, e.g., Cassandra and sql.
 """
 from abc import ABCMeta, abstractmethod
 import logging
+from collections import OrderedDict
 
 import sina.model
 
 LOGGER = logging.getLogger(__name__)
 
+# Directions RelationshipDAO.traverse() can follow Relationships in: from
+# subject to object, object to subject, or either way.
+TRAVERSAL_DIRECTIONS = ('out', 'in', 'both')
+
 
 # Disable pylint checks due to ubiquitous use of id and type
 # pylint: disable=invalid-name,redefined-builtin
@@ -56,17 +61,28 @@ class RecordDAO(object):
     __metaclass__ = ABCMeta
 
     @abstractmethod
-    def get(self, id):
+    def get(self, id, data_fields=None, include_files=False):
         """
         Given the id of a Record, return matching Record or None.
 
+        By default, the whole Record is returned. Given data_fields, only
+        those data are returned (and the files, if include_files), in a
+        Record otherwise holding just its id and type. See
+        sina.model.project_record(). Backends able to should read only the
+        pieces asked for, rather than the whole Record.
+
         :param id: The id of the Record to return.
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Record.
+        :param include_files: Whether to return the Record's files along with
+                              data_fields. Ignored when returning the whole
+                              Record.
 
         :returns: The matching Record or None.
         """
         raise NotImplementedError
 
-    def get_many(self, iter_of_ids):
+    def get_many(self, iter_of_ids, data_fields=None, include_files=False):
         """
         Given an iterable of ids, retrieve each corresponding Record.
 
@@ -74,12 +90,15 @@ class RecordDAO(object):
         this should be reimplemented there.
 
         :param iter_of_ids: An iterable object of ids to find.
+        :param data_fields: The names of the only data to return, or None for
+                            whole Records. See get().
+        :param include_files: Whether to return files along with data_fields.
 
         :returns: A generator of found records
         """
         LOGGER.debug('Getting many records with iter: %s', iter_of_ids)
         for id in iter_of_ids:
-            record = self.get(id)
+            record = self.get(id, data_fields=data_fields, include_files=include_files)
             yield record
 
     @abstractmethod
@@ -129,6 +148,76 @@ class RecordDAO(object):
         for item in ids_to_delete:
             self.delete(item)
 
+    def delete_given_data(self, **kwargs):
+        """
+        Delete every Record whose data fulfill some criteria.
+
+        Criteria are given as for data_query(), ex:
+
+            # Delete every Record from a bad batch of 12-volume runs
+            delete_given_data(volume=12, batch="bad")
+
+        This implementation gathers the ids with data_query() and passes them
+        to delete_many(). Backends that can do better should reimplement it.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                       must fulfill.
+
+        :returns: The number of Records deleted.
+
+        :raises ValueError: if not supplied at least one criterion or given
+                            a criterion it does not support
+        """
+        ids_to_delete = list(self.data_query(**kwargs))
+        self.delete_many(ids_to_delete)
+        return len(ids_to_delete)
+
+    @abstractmethod
+    def replace_many(self, list_to_replace):
+        """
+        Given a list of Records already in the backend, replace their contents.
+
+        Each Record's type, raw, data, and files are swapped for those of the
+        Record given with its id. Relationships involving the Records are left
+        alone.
+
+        :param list_to_replace: A list of Records to replace the stored ones with
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_content_hashes(self, ids):
+        """
+        Given some Record ids, return the content hashes stored for those Records.
+
+        Hashes are those of Record.content_hash(), recorded on insertion.
+
+        :param ids: An iterable of ids of Records to look up.
+
+        :returns: A dict of id: hash for every given id that names a Record.
+                  The hash is None for Records stored without one.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def compress_raws(self, compression='zlib', progress_callback=None):
+        """
+        Rewrite the raws of every stored Record, compressing them a given way.
+
+        Raws are read however they're stored, so this is only needed to
+        shrink (or decompress) Records stored before a factory's
+        raw_compression was set.
+
+        :param compression: How to compress the raws, one of
+                            codec.RAW_COMPRESSIONS, or None to decompress them.
+        :param progress_callback: If provided, called periodically with the
+                                  number of Records processed so far and the
+                                  total (None if unknown).
+
+        :returns: The number of raws rewritten.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def data_query(self, **kwargs):
         """
@@ -153,10 +242,46 @@ class RecordDAO(object):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def explain_query(self, **kwargs):
+        """
+        Return the plan data_query() would follow for some criteria.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                       must fulfill, as for data_query().
+
+        :returns: A sina.planner.QueryPlan. print() it for a human-readable
+                  explanation.
+
+        :raises ValueError: if not supplied at least one criterion or given
+                            a criterion it does not support
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def analyze(self):
+        """
+        Collect fresh statistics about the backend's data for query planning.
+
+        :returns: The updated sina.planner.StatisticsCatalog.
+        """
+        raise NotImplementedError
+
     def get_given_data(self, **kwargs):
         """Alias of data_query() to fit historical naming convention."""
         return self.data_query(**kwargs)
 
+    @abstractmethod
+    def get_all(self, ids_only=False):
+        """
+        Return every Record in the DAO's backend.
+
+        :param ids_only: whether to return only the ids of the Records
+
+        :returns: A generator of all Records (or, if ids_only, their ids).
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def get_all_of_type(self, type, ids_only=False):
         """
@@ -357,6 +482,188 @@ class RelationshipDAO(object):
             return self._get_given_object_id(object_id, predicate)
         return self._get_given_predicate(predicate)
 
+    @abstractmethod
+    def get_all(self):
+        """
+        Return every Relationship in the DAO's backend.
+
+        :returns: A generator of Relationships.
+        """
+        raise NotImplementedError
+
+    def count(self):
+        """
+        Return how many Relationships the DAO's backend holds.
+
+        This implementation counts what get_all() returns. Backends that can
+        do better should reimplement it.
+
+        :returns: The number of Relationships.
+        """
+        return sum(1 for _ in self.get_all())
+
+    def generation(self):
+        """
+        Return a marker that changes whenever the backend's Relationships do.
+
+        Lets copies of the Relationships kept elsewhere (such as a saved
+        AdjacencyIndex) tell whether they're out of date. This implementation
+        returns None, meaning the backend can't tell. Backends that can should
+        reimplement it.
+
+        :returns: The marker, or None.
+        """
+        return None
+
+    def get_many(self, subject_ids=None, object_ids=None, predicate=None):
+        """
+        Given many ids, return the Relationships each is part of, grouped by id.
+
+        Exactly one of subject_ids and object_ids must be given. This is the
+        bulk form of get(), letting a backend fetch the Relationships of
+        thousands of Records in a few round trips rather than one apiece.
+
+        :param subject_ids: An iterable of ids to find Relationships with as
+                            their subject.
+        :param object_ids: An iterable of ids to find Relationships with as
+                           their object.
+        :param predicate: If provided, only return Relationships with this
+                          predicate.
+
+        :returns: An OrderedDict mapping each given id, in the order given, to
+                  a (possibly empty) list of its Relationships.
+
+        :raises ValueError: if not given exactly one of subject_ids and
+                            object_ids.
+        """
+        if (subject_ids is None) == (object_ids is None):
+            msg = "Must supply exactly one of subject_ids or object_ids"
+            LOGGER.error(msg)
+            raise ValueError(msg)
+        key = 'subject_id' if subject_ids is not None else 'object_id'
+        grouped = OrderedDict((id, []) for id in
+                              (subject_ids if subject_ids is not None else object_ids))
+        LOGGER.debug('Getting relationships for %i %ss with predicate=%s.',
+                     len(grouped), key, predicate)
+        if grouped:
+            for relationship in self._get_many_given(key, list(grouped), predicate):
+                grouped[getattr(relationship, key)].append(relationship)
+        return grouped
+
+    def _get_many_given(self, key, ids, predicate=None):
+        """
+        Find the Relationships whose subject or object is any of several ids.
+
+        This implementation calls get() once per id. Backends that can do
+        better should reimplement it.
+
+        :param key: 'subject_id' or 'object_id', whichever the ids are.
+        :param ids: A list of unique ids.
+        :param predicate: If not None, the predicate Relationships must have.
+
+        :returns: An iterable of Relationships.
+        """
+        getter = (self._get_given_subject_id if key == 'subject_id'
+                  else self._get_given_object_id)
+        for id in ids:
+            for relationship in getter(id, predicate) or []:
+                if predicate is None or relationship.predicate == predicate:
+                    yield relationship
+
+    def traverse(self, start_ids, predicate=None, direction='out',
+                 max_depth=None, include_edges=False):
+        """
+        Find every id reachable from some starting ids by following Relationships.
+
+        For example, to find every Run contained (at any depth) in a study:
+
+            traverse(["study_1"], predicate="contains")
+
+        A starting id is only included in the result if it's reachable from
+        a starting id (itself included) through at least one Relationship.
+
+        This implementation expands one level at a time through get_many().
+        Backends that can do better should reimplement it.
+
+        :param start_ids: An iterable of the ids to start from.
+        :param predicate: If provided, only follow Relationships with this
+                          predicate.
+        :param direction: 'out' to follow Relationships from subject to object,
+                          'in' for object to subject, 'both' for either.
+        :param max_depth: If provided, the most Relationships to follow from a
+                          starting id.
+        :param include_edges: Whether to also return the Relationships followed.
+
+        :returns: A set of the reachable ids or, if include_edges, a tuple of
+                  that set and a list of the Relationships followed.
+
+        :raises ValueError: if given an unknown direction.
+        """
+        self._validate_direction(direction)
+        LOGGER.debug('Traversing relationships from %s with predicate=%s, '
+                     'direction=%s, and max_depth=%s.', start_ids, predicate,
+                     direction, max_depth)
+        frontier = set(start_ids)
+        expanded = set(frontier)
+        reachable = set()
+        edges = {}
+        depth = 0
+        while frontier and (max_depth is None or depth < max_depth):
+            depth += 1
+            next_frontier = set()
+            for relationship in self._expand_frontier(frontier, predicate, direction):
+                edges[(relationship.subject_id, relationship.predicate,
+                       relationship.object_id)] = relationship
+                neighbors = []
+                if direction != 'in' and relationship.subject_id in frontier:
+                    neighbors.append(relationship.object_id)
+                if direction != 'out' and relationship.object_id in frontier:
+                    neighbors.append(relationship.subject_id)
+                for neighbor in neighbors:
+                    reachable.add(neighbor)
+                    if neighbor not in expanded:
+                        expanded.add(neighbor)
+                        next_frontier.add(neighbor)
+            frontier = next_frontier
+        if include_edges:
+            return reachable, list(edges.values())
+        return reachable
+
+    @staticmethod
+    def _validate_direction(direction):
+        """
+        Make sure a traversal direction is one we support.
+
+        :param direction: The direction to check.
+
+        :raises ValueError: if it isn't in TRAVERSAL_DIRECTIONS.
+        """
+        if direction not in TRAVERSAL_DIRECTIONS:
+            msg = ("Given direction {} not recognized. Must be one of: {}"
+                   .format(direction, ", ".join(TRAVERSAL_DIRECTIONS)))
+            LOGGER.error(msg)
+            raise ValueError(msg)
+
+    def _expand_frontier(self, frontier, predicate, direction):
+        """
+        Return the Relationships leading out of a set of ids, for traverse().
+
+        :param frontier: The set of ids to expand.
+        :param predicate: If not None, the predicate Relationships must have.
+        :param direction: 'out' for Relationships whose subject is in the
+                          frontier, 'in' for those whose object is, 'both'
+                          for either.
+
+        :returns: An iterable of Relationships.
+        """
+        ids = list(frontier)
+        if direction != 'in':
+            for relationship in self._get_many_given('subject_id', ids, predicate):
+                yield relationship
+        if direction != 'out':
+            for relationship in self._get_many_given('object_id', ids, predicate):
+                yield relationship
+
     @abstractmethod
     def _get_given_subject_id(self, subject_id, predicate=None):
         """
@@ -414,17 +721,20 @@ class RunDAO(object):
         self.record_dao = record_dao
 
     @abstractmethod
-    def get(self, id):
+    def get(self, id, data_fields=None, include_files=False):
         """
         Given id, return matching Run from the DAO's backend, or None.
 
         :param id: The id of the run to return.
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Run. See RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
 
         :returns: The matching Run or None.
         """
         raise NotImplementedError
 
-    def get_many(self, iter_of_ids):
+    def get_many(self, iter_of_ids, data_fields=None, include_files=False):
         """
         Given an iterable of ids, retrieve each corresponding run from backend.
 
@@ -432,11 +742,14 @@ class RunDAO(object):
         this should be reimplemented there.
 
         :param iter_of_ids: An iterable object of ids to find.
+        :param data_fields: The names of the only data to return, or None for
+                            whole Runs. See RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
 
         :returns: A generator of found runs
         """
         for id in iter_of_ids:
-            yield self.get(id)
+            yield self.get(id, data_fields=data_fields, include_files=include_files)
 
     @abstractmethod
     def insert(self, run):
@@ -484,6 +797,17 @@ class RunDAO(object):
         for item in ids_to_delete:
             self.delete(item)
 
+    @abstractmethod
+    def replace_many(self, list_to_replace):
+        """
+        Given a list of Runs already in the backend, replace their contents.
+
+        See RecordDAO.replace_many(); the Run metadata is replaced as well.
+
+        :param list_to_replace: A list of Runs to replace the stored ones with
+        """
+        raise NotImplementedError
+
     def get_all(self, ids_only=False):
         """
         Return all Records with type 'run'.
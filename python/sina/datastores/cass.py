@@ -5,15 +5,21 @@ import logging
 # Used for temporary implementation of LIKE-ish functionality
 import fnmatch
 from collections import defaultdict
-import json
 
 import six
 
 # Disable pylint check due to its issue with virtual environments
 from cassandra.cqlengine.query import DoesNotExist, BatchQuery  # pylint: disable=import-error
+from cassandra.cqlengine import connection  # pylint: disable=import-error
+from cassandra.concurrent import (execute_concurrent,  # pylint: disable=import-error
+                                  execute_concurrent_with_args)
+from cassandra.query import (BatchStatement, BatchType,  # pylint: disable=import-error
+                             SimpleStatement)
 
+import sina.codec as codec
 import sina.dao as dao
 import sina.model as model
+import sina.planner as planner
 import sina.datastores.cass_schema as schema
 import sina.utils as utils
 
@@ -22,6 +28,42 @@ import sina.utils as utils
 
 LOGGER = logging.getLogger(__name__)
 
+# How many Relationship lookups get_many() and traverse() may have in flight
+LOOKUP_CONCURRENCY = 100
+
+# How many Records purge() gathers the keys of (and deletes) per round
+PURGE_CHUNK_SIZE = 500
+# The most deletions purge() puts in one batch. Every batch targets a single
+# partition; this keeps them under Cassandra's batch size warning.
+PURGE_BATCH_SIZE = 50
+
+# Tables keyed by Record id alone holding a Record's contents, whose
+# partitions replace_many() removes
+CONTENT_TABLES = (schema.DocumentFromRecord,
+                  schema.ScalarDataFromRecord, schema.StringDataFromRecord,
+                  schema.ScalarListDataFromRecord, schema.StringListDataFromRecord)
+# Tables keyed by Record id alone, whose partitions a Record's deletion removes
+ID_PARTITIONED_TABLES = (schema.Record,) + CONTENT_TABLES
+
+# Tables partitioned by something other than Record id, paired with the
+# id-partitioned table mirroring them: (mirror, mirror key, mirror columns to
+# read, table, table primary key). A Record's rows in the table are found by
+# reading its partition of the mirror. The data tables come first.
+CONTENT_MIRRORED_TABLES = (
+    (schema.ScalarDataFromRecord, 'id', ('name', 'value'),
+     schema.RecordFromScalarData, ('name', 'value', 'id')),
+    (schema.StringDataFromRecord, 'id', ('name', 'value'),
+     schema.RecordFromStringData, ('name', 'value', 'id')),
+    (schema.ScalarListDataFromRecord, 'id', ('name', 'value'),
+     schema.RecordFromScalarListData, ('name', 'value', 'id')),
+    (schema.StringListDataFromRecord, 'id', ('name', 'value'),
+     schema.RecordFromStringListData, ('name', 'value', 'id')))
+MIRRORED_TABLES = CONTENT_MIRRORED_TABLES + (
+    (schema.ObjectFromSubject, 'subject_id', ('predicate', 'object_id'),
+     schema.SubjectFromObject, ('object_id', 'predicate', 'subject_id')),
+    (schema.SubjectFromObject, 'object_id', ('predicate', 'subject_id'),
+     schema.ObjectFromSubject, ('subject_id', 'predicate', 'object_id')))
+
 TABLE_LOOKUP = {
     "scalar": {"record_table": schema.RecordFromScalarData,
                "data_table": schema.ScalarDataFromRecord},
@@ -37,30 +79,53 @@ TABLE_LOOKUP = {
 class RecordDAO(dao.RecordDAO):
     """The DAO specifically responsible for handling Records in Cassandra."""
 
+    def __init__(self, statistics=None, raw_compression=None):
+        """
+        Initialize RecordDAO.
+
+        :param statistics: The StatisticsCatalog used to plan data queries.
+                           Normally shared by all DAOs from the same factory;
+                           if None, the DAO starts its own, empty one.
+        :param raw_compression: How to compress the raws of Records inserted,
+                                one of codec.RAW_COMPRESSIONS, or None not to.
+                                The raw column holds text, so compressed raws
+                                are base64-encoded.
+        """
+        codec.check_raw_compression(raw_compression)
+        self.statistics = (statistics if statistics is not None
+                           else planner.StatisticsCatalog())
+        self.raw_compression = raw_compression
+        # CQL string -> PreparedStatement, for purge()
+        self._prepared = {}
+
     # pylint: disable=arguments-differ
-    # Args differ because SQL doesn't support force_overwrite yet, also because
-    # its insert() is functionally a helper to its insert_many, so it needs
-    # extra logic. SIBO-661 and SIBO-307
-    def insert(self, record, force_overwrite=False):
+    # Args differ because force_overwrite isn't part of the generic DAO yet,
+    # also because SQL's insert() is functionally a helper to its insert_many,
+    # so it needs extra logic. SIBO-661 and SIBO-307
+    def insert(self, record, force_overwrite=False, trusted=False):
         """
         Given a Record, insert it into the current Cassandra database.
 
         :param record: A Record to insert
         :param force_overwrite: Whether to forcibly overwrite a preexisting
                                 record that shares this record's id.
+        :param trusted: Whether the Record is known to be valid, so its data
+                        and files needn't be checked entry by entry. See
+                        Record.validate_and_serialize().
         :raises LWTException: If force_overwrite is False and an entry with the
                               id exists.
         """
         LOGGER.debug('Inserting %s into Cassandra with force_overwrite=%s.',
                      record, force_overwrite)
-        is_valid, warnings = record.is_valid()
+        is_valid, warnings, raw_json = record.validate_and_serialize(trusted=trusted)
         if not is_valid:
             raise ValueError(warnings)
         create = (schema.Record.create if force_overwrite
                   else schema.Record.if_not_exists().create)
         create(id=record.id,
                type=record.type,
-               raw=json.dumps(record.raw))
+               raw=codec.encode_raw(raw_json, self.raw_compression, as_text=True),
+               content_hash=record.content_hash(raw_json))
         if record.data:
             self._insert_data(id=record.id,
                               data=record.data,
@@ -72,7 +137,8 @@ class RecordDAO(dao.RecordDAO):
 
     # pylint: disable=arguments-differ,too-many-branches,too-many-locals
     # This method is going away in SIBO-661
-    def insert_many(self, list_to_insert, force_overwrite=False, _type_managed=False):
+    def insert_many(self, list_to_insert, force_overwrite=False, _type_managed=False,
+                    trusted=False):
         """
         Given a list of Records, insert each into Cassandra.
 
@@ -87,6 +153,7 @@ class RecordDAO(dao.RecordDAO):
                               AND insert_many is called from a method that has
                               special handling for this type. See Run's
                               insert_many()
+        :param trusted: Whether the Records are known to be valid. See insert().
         """
         LOGGER.debug('Inserting %i records to Cassandra with'
                      'force_overwrite=%s and _type_managed=%s.',
@@ -105,14 +172,15 @@ class RecordDAO(dao.RecordDAO):
 
         for record in list_to_insert:
             # Insert the Record itself
-            is_valid, warnings = record.is_valid()
+            is_valid, warnings, raw_json = record.validate_and_serialize(trusted=trusted)
             if not is_valid:
                 raise ValueError(warnings)
             create = (schema.Record.create if force_overwrite
                       else schema.Record.if_not_exists().create)
             create(id=record.id,
                    type=record.type,
-                   raw=json.dumps(record.raw))
+                   raw=codec.encode_raw(raw_json, self.raw_compression, as_text=True),
+                   content_hash=record.content_hash(raw_json))
             if record.data:
                 string_from_rec_batch = []
                 scalar_from_rec_batch = []
@@ -265,15 +333,218 @@ class RecordDAO(dao.RecordDAO):
         """
         Delete a list of Records from the Cassandra backend.
 
-        Removes everything: their data, relationships, files. Relies on
-        Cassandra's batching, one batch encompassing all Records. If you want
-        to do one batch per Record, use delete() in a loop.
+        Removes everything: their data, relationships, files. See purge(),
+        which this wraps; unlike delete(), it isn't atomic.
 
         :param ids_to_delete: A list of ids of Records to delete
         """
-        with BatchQuery() as batch:
-            for id in ids_to_delete:
-                self._setup_batch_delete(batch, id)
+        self.purge(ids_to_delete)
+
+    def purge(self, ids_to_delete, progress_callback=None, _extra_tables=()):
+        """
+        Delete many Records from the Cassandra backend as quickly as possible.
+
+        Works PURGE_CHUNK_SIZE Records at a time. The keys of each chunk's
+        data and Relationship entries are read concurrently; the deletions are
+        then grouped by partition into unlogged batches of prepared
+        statements, which are also sent concurrently.
+
+        A purge isn't atomic. If one fails partway, the Records it was
+        deleting may be left partially deleted; purging them again finishes
+        the job.
+
+        :param ids_to_delete: An iterable of ids of Records to delete
+        :param progress_callback: If provided, called after each chunk with
+                                  the number of Records deleted so far and
+                                  the total to delete (None if ids_to_delete
+                                  has no len()).
+        :param _extra_tables: Further tables keyed only by Record id to
+                              delete from. See RunDAO.delete_many()
+
+        :returns: The number of Records deleted.
+        """
+        total = len(ids_to_delete) if hasattr(ids_to_delete, '__len__') else None
+        LOGGER.debug('Purging %s records.', total if total is not None else 'streamed')
+        session = connection.get_session()
+        deleted = 0
+        for id_chunk in utils.chunked(ids_to_delete, PURGE_CHUNK_SIZE):
+            deletions = self._gather_purge_deletions(session, id_chunk,
+                                                     ID_PARTITIONED_TABLES + tuple(_extra_tables),
+                                                     MIRRORED_TABLES)
+            execute_concurrent(session, self._batch_by_partition(session, deletions),
+                               concurrency=LOOKUP_CONCURRENCY, raise_on_first_error=True)
+            deleted += len(id_chunk)
+            if progress_callback is not None:
+                progress_callback(deleted, total)
+        return deleted
+
+    # pylint: disable=arguments-differ
+    # Args differ for the same reason as insert_many()
+    def replace_many(self, list_to_replace, _type_managed=False, trusted=False):
+        """
+        Given a list of Records already in Cassandra, replace their contents.
+
+        Each Record's data, files, and Run entry are deleted as purge() would,
+        then it's inserted again with force_overwrite. Relationships involving
+        it are untouched. Like purge(), this isn't atomic.
+
+        :param list_to_replace: A list of Records to replace the stored ones with
+        :param _type_managed: Passed on to insert_many()
+        :param trusted: Whether the Records are known to be valid. See insert().
+        """
+        LOGGER.debug('Replacing %i records.', len(list_to_replace))
+        # Validate everything before deleting anything
+        for record in list_to_replace:
+            is_valid, warnings, _ = record.validate_and_serialize(trusted=trusted)
+            if not is_valid:
+                raise ValueError(warnings)
+        session = connection.get_session()
+        for record_chunk in utils.chunked(list_to_replace, PURGE_CHUNK_SIZE):
+            deletions = self._gather_purge_deletions(
+                session, [record.id for record in record_chunk],
+                CONTENT_TABLES + (schema.Run,),
+                CONTENT_MIRRORED_TABLES)
+            execute_concurrent(session, self._batch_by_partition(session, deletions),
+                               concurrency=LOOKUP_CONCURRENCY, raise_on_first_error=True)
+        self.insert_many(list_to_replace, force_overwrite=True, _type_managed=_type_managed,
+                         trusted=True)
+
+    def get_content_hashes(self, ids):
+        """
+        Given some Record ids, return the content hashes stored for those Records.
+
+        The Records are read concurrently.
+
+        :param ids: An iterable of ids of Records to look up.
+
+        :returns: A dict of id: hash for every given id that names a Record.
+                  The hash is None for Records stored without one.
+        """
+        ids = list(ids)
+        statement = ('SELECT content_hash FROM {} WHERE id = %s'
+                     .format(schema.Record.column_family_name()))
+        results = execute_concurrent_with_args(connection.get_session(), statement,
+                                               [(id,) for id in ids],
+                                               concurrency=LOOKUP_CONCURRENCY,
+                                               raise_on_first_error=True)
+        hashes = {}
+        for id, (_, rows) in zip(ids, results):
+            for row in rows:
+                hashes[id] = row['content_hash']
+        return hashes
+
+    def compress_raws(self, compression='zlib', progress_callback=None):
+        """
+        Rewrite the raws of every stored Record, compressing them a given way.
+
+        Records are read a page of PURGE_CHUNK_SIZE at a time, and the raws
+        needing it rewritten concurrently. Raws already stored the requested
+        way are left be, so an interrupted run can simply be restarted.
+
+        :param compression: How to compress the raws, one of
+                            codec.RAW_COMPRESSIONS, or None to decompress them.
+        :param progress_callback: If provided, called after each page with
+                                  the number of Records processed so far and
+                                  None (counting Records up front would mean
+                                  reading them all twice).
+
+        :returns: The number of raws rewritten.
+        """
+        codec.check_raw_compression(compression)
+        LOGGER.info('Rewriting raws with compression=%s.', compression)
+        session = connection.get_session()
+        table = schema.Record.column_family_name()
+        cql = 'UPDATE {} SET raw = ? WHERE id = ?'.format(table)
+        if cql not in self._prepared:
+            self._prepared[cql] = session.prepare(cql)
+        rows = session.execute(SimpleStatement('SELECT id, raw FROM {}'.format(table),
+                                               fetch_size=PURGE_CHUNK_SIZE))
+        processed = rewritten = 0
+        for row_chunk in utils.chunked(rows, PURGE_CHUNK_SIZE):
+            updates = [(codec.encode_raw(codec.raw_json(row['raw']), compression, as_text=True),
+                        row['id'])
+                       for row in row_chunk if codec.raw_compression(row['raw']) != compression]
+            execute_concurrent_with_args(session, self._prepared[cql], updates,
+                                         concurrency=LOOKUP_CONCURRENCY,
+                                         raise_on_first_error=True)
+            processed += len(row_chunk)
+            rewritten += len(updates)
+            if progress_callback is not None:
+                progress_callback(processed, None)
+        return rewritten
+
+    @staticmethod
+    def _gather_purge_deletions(session, ids, id_tables, mirrored_tables):
+        """
+        Find every row that deleting some Records must remove.
+
+        :param session: The Cassandra session to read with.
+        :param ids: A list of the Records' ids.
+        :param id_tables: The tables whose partitions keyed by those ids
+                          should be removed entirely.
+        :param mirrored_tables: Entries of MIRRORED_TABLES whose rows
+                                involving the Records should be removed.
+
+        :returns: A set of (table, key columns, key values) triples, one per
+                  deletion. The first key column is always the partition key.
+        """
+        deletions = set()
+        for table in id_tables:
+            deletions.update((table, ('id',), (id,)) for id in ids)
+        for mirror, mirror_key, columns, table, table_key in mirrored_tables:
+            deletions.update((mirror, (mirror_key,), (id,)) for id in ids)
+            statement = ('SELECT {} FROM {} WHERE {} = %s'
+                         .format(', '.join(columns), mirror.column_family_name(), mirror_key))
+            results = execute_concurrent_with_args(session, statement,
+                                                   [(id,) for id in ids],
+                                                   concurrency=LOOKUP_CONCURRENCY,
+                                                   raise_on_first_error=True)
+            for id, (_, rows) in zip(ids, results):
+                for row in rows:
+                    found = dict(row)
+                    found[mirror_key] = id
+                    entries = found.get('value')
+                    if isinstance(entries, list):
+                        # List data is indexed once per distinct entry
+                        for entry in set(entries):
+                            found['value'] = entry
+                            deletions.add((table, table_key,
+                                           tuple(found[column] for column in table_key)))
+                    else:
+                        deletions.add((table, table_key,
+                                       tuple(found[column] for column in table_key)))
+        return deletions
+
+    def _batch_by_partition(self, session, deletions):
+        """
+        Group deletions into single-partition, unlogged batches.
+
+        :param session: The Cassandra session the statements will run on.
+        :param deletions: An iterable of (table, key columns, key values)
+                          triples, as from _gather_purge_deletions().
+
+        :returns: A list of (statement, parameters) pairs to execute.
+        """
+        partitions = defaultdict(list)
+        for table, key_columns, key_values in deletions:
+            partitions[(table, key_columns, key_values[0])].append(key_values)
+        statements = []
+        for (table, key_columns, _), rows in six.iteritems(partitions):
+            cql = 'DELETE FROM {} WHERE {}'.format(
+                table.column_family_name(),
+                ' AND '.join('{} = ?'.format(column) for column in key_columns))
+            if cql not in self._prepared:
+                self._prepared[cql] = session.prepare(cql)
+            prepared = self._prepared[cql]
+            if len(rows) == 1:
+                statements.append((prepared, rows[0]))
+                continue
+            for batch_rows in utils.chunked(rows, PURGE_BATCH_SIZE):
+                batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+                for row in batch_rows:
+                    batch.add(prepared, row)
+                statements.append((batch, None))
+        return statements
 
     def _setup_batch_delete(self, batch, record_id):
         """
@@ -323,10 +594,7 @@ class RecordDAO(dao.RecordDAO):
              .batch(batch).delete())
         schema.SubjectFromObject.objects(object_id=record_id).batch(batch).delete()
 
-    # Disable pylint checks -- including R0914=too-many-locals -- to if and
-    # until the team decides to refactor the code
-    def data_query(self,  # pylint: disable=too-many-branches,too-many-branches,R0914
-                   **kwargs):
+    def data_query(self, **kwargs):
         """
         Return the ids of all Records whose data fulfill some criteria.
 
@@ -348,45 +616,98 @@ class RecordDAO(dao.RecordDAO):
                             a criterion it does not support.
         """
         LOGGER.debug('Finding all records fulfilling criteria: %s', kwargs.items())
-        # No kwargs is bad usage. Bad kwargs are caught in sort_and_standardize_criteria().
-        # We will always have at least one entry in one of scalar, string, scalarlist, etc.
-        if not kwargs.items():
-            raise ValueError("You must supply at least one criterion.")
-        scalar, string, scalarlist, stringlist = utils.sort_and_standardize_criteria(kwargs)
-        result_ids = []
-
-        # String and scalar values can be passed directly to _apply_ranges_to_query
-        for criteria, table_type in ((scalar, "scalar"),
-                                     (string, "string")):
-            if criteria:
-                result_ids.append(self._apply_ranges_to_query(criteria,
-                                                              table_type))
+        # No kwargs is bad usage. Bad kwargs are caught in build_plan().
+        # Each step produces ids in sorted order, so we can intersect them
+        # as streams.
+        query_plan = self.explain_query(**kwargs)
+        for id in planner.execute_plan(query_plan, self._run_plan_step):
+            yield id
 
+    def explain_query(self, **kwargs):
+        """
+        Return the plan data_query() would follow for some criteria.
+
+        Criteria are ordered by their estimated selectivity (see analyze()),
+        and small intermediate results are passed to later scalar and string
+        criteria as IN filters on their DataFromRecord tables. print() the
+        returned plan for a human-readable explanation.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                       must fulfill, as for data_query().
+
+        :returns: A planner.QueryPlan.
+
+        :raises ValueError: if not supplied at least one criterion or given
+                            a criterion it does not support
+        """
+        return planner.build_plan(self.statistics, kwargs,
+                                  restrictable_kinds=("scalar", "string"))
+
+    def _run_plan_step(self, step, accepted_ids=None):
+        """
+        Return the ids of the Records fulfilling one step of a QueryPlan.
+
+        :param step: The planner.PlanStep to run.
+        :param accepted_ids: If not None, a list of ids to restrict the step to.
+                             Only supported for scalar and string data.
+
+        :returns: An iterable of matching ids, in sorted order.
+
+        :raises ValueError: if given an unsupported list operation.
+        """
+        if step.kind in ("scalar", "string"):
+            return self._apply_ranges_to_query([(step.name, step.criterion)],
+                                               step.kind,
+                                               accepted_ids=accepted_ids)
         # Different types of list criteria require different logic
-        for criteria, table_type in ((scalarlist, "scalarlist"),
-                                     (stringlist, "stringlist")):
-            for criterion in criteria:
-                # Unpack the criterion
-                datum_name, list_criteria = criterion
-                # Figure out which function to use
-                if list_criteria.operation == utils.ListQueryOperation.ALL:
-                    query_func = self._apply_has_all_to_query
-                elif list_criteria.operation == utils.ListQueryOperation.ANY:
-                    query_func = self._apply_has_any_to_query
-                elif list_criteria.operation == utils.ListQueryOperation.ONLY:
-                    query_func = self._apply_has_only_to_query
+        list_criteria = step.criterion
+        if list_criteria.operation == utils.ListQueryOperation.ALL:
+            query_func = self._apply_has_all_to_query
+        elif list_criteria.operation == utils.ListQueryOperation.ANY:
+            query_func = self._apply_has_any_to_query
+        elif list_criteria.operation == utils.ListQueryOperation.ONLY:
+            query_func = self._apply_has_only_to_query
+        else:
+            raise ValueError("Currently, only {} list operations are supported. "
+                             "Given {}".format((utils.ListQueryOperation.ALL,
+                                                utils.ListQueryOperation.ANY,
+                                                utils.ListQueryOperation.ONLY),
+                                               list_criteria.operation))
+        return query_func(table=step.kind,
+                          datum_name=step.name,
+                          datum_criteria=list_criteria.entries)
+
+    def analyze(self):
+        """
+        Collect fresh statistics about the data in the keyspace.
+
+        The statistics are used to plan data queries (see explain_query()).
+        As a keyspace is often written to by many clients at once, they
+        aren't updated on insert; analyze again after significant ingestion.
+
+        Note that this reads every DataFromRecord table in full.
+
+        :returns: The updated planner.StatisticsCatalog.
+        """
+        LOGGER.info('Analyzing data for query planning.')
+        all_stats = []
+        for kind, tables in six.iteritems(TABLE_LOOKUP):
+            values = defaultdict(list)
+            counts = defaultdict(int)
+            for name, value in (tables["data_table"].objects.all()
+                                .values_list('name', 'value')):
+                counts[name] += 1
+                if kind.endswith("list"):
+                    # Cassandra stores empty lists as null
+                    values[name].extend(value or [])
                 else:
-                    raise ValueError("Currently, only {} list operations are supported. "
-                                     "Given {}".format((utils.ListQueryOperation.ALL,
-                                                        utils.ListQueryOperation.ANY,
-                                                        utils.ListQueryOperation.ONLY),
-                                                       list_criteria.operation))
-                result_ids.append(query_func(table=table_type,
-                                             datum_name=datum_name,
-                                             datum_criteria=list_criteria.entries))
-        # If we have more than one set of data, we need to find the intersect.
-        for id in utils.intersect_lists(result_ids):
-            yield id
+                    values[name].append(value)
+            all_stats.extend(planner.DatumStatistics.from_values(name, kind,
+                                                                 values[name],
+                                                                 count=count)
+                             for name, count in six.iteritems(counts))
+        self.statistics.replace(all_stats, complete=True)
+        return self.statistics
 
     def _apply_has_all_to_query(self, datum_name, datum_criteria, table):
         """
@@ -399,7 +720,7 @@ class RecordDAO(dao.RecordDAO):
         :param datum_criteria: The criteria to apply to the query
         :param table: The name of the table, to look up in TABLE_LOOKUP (module-level var).
 
-        :returns: a generator of ids fitting the criteria
+        :returns: a sorted list of ids fitting the criteria
         """
         # Initially, it seemed as though _apply_ranges_to_query was all that was
         # needed here, but there's an important caveat: _apply_ranges relies on
@@ -412,7 +733,7 @@ class RecordDAO(dao.RecordDAO):
                                                                       name=datum_name,
                                                                       criteria=criterion)
                                    .values_list('id', flat=True)))
-        return set.intersection(*result_sets)
+        return sorted(set.intersection(*result_sets))
 
     def _apply_has_any_to_query(self, datum_name, datum_criteria, table):
         """
@@ -425,7 +746,7 @@ class RecordDAO(dao.RecordDAO):
         :param datum_criteria: The criteria to apply to the query
         :param table: The name of the table, to look up in TABLE_LOOKUP (module-level var).
 
-        :returns: a set of ids fitting the criteria
+        :returns: a sorted list of ids fitting the criteria
         """
         rec_table = TABLE_LOOKUP[table]["record_table"]
         # Cassandra has no OR operator. Ordinarily we'd chain queries as generators,
@@ -438,7 +759,7 @@ class RecordDAO(dao.RecordDAO):
                                                      criterion).values_list('id', flat=True)
             for id in ids:
                 distinct_ids.add(id)
-        return distinct_ids
+        return sorted(distinct_ids)
 
     def _apply_has_only_to_query(self, datum_name, datum_criteria, table):
         """
@@ -458,7 +779,7 @@ class RecordDAO(dao.RecordDAO):
         :param datum_criteria: The criteria to apply to the query
         :param table: The name of the table, to look up in TABLE_LOOKUP (module-level var).
 
-        :returns: a set of ids fitting the criteria
+        :returns: a sorted list of ids fitting the criteria
         """
         included_ids = set(self._apply_has_all_to_query(datum_name, datum_criteria, table))
         # If this query proves popular but nonperformant, we may want to make a
@@ -474,9 +795,9 @@ class RecordDAO(dao.RecordDAO):
         for id in excluded_ids:
             if id in included_ids:
                 included_ids.remove(id)
-        return included_ids
+        return sorted(included_ids)
 
-    def _apply_ranges_to_query(self, data, table):
+    def _apply_ranges_to_query(self, data, table, accepted_ids=None):
         """
         Return the ids of all Records whose data fulfill table-specific AND criteria.
 
@@ -494,35 +815,47 @@ class RecordDAO(dao.RecordDAO):
         queries (but handling less data overall). If this acts slow, it's
         probably network/query overhead.
 
+        Ids are yielded in sorted order. Within a single (name, value)
+        partition slice, rows are already clustered by id, so an exact-match
+        criterion on its own streams straight from Cassandra; anything else is
+        sorted client-side once the (already narrowed) ids are in hand.
+
         :param data: A list of (name, criteria) pairs to apply to the query object
         :param table: The name of the table, to look up in TABLE_LOOKUP (module-level var)
+        :param accepted_ids: If not None, a list of ids to restrict the search
+                             to. Every criterion is then applied as a filter
+                             on those ids' partitions.
 
-        :returns: a generator of ids fitting the criteria
+        :returns: a generator of ids fitting the criteria, in sorted order
         """
         rec_table = TABLE_LOOKUP[table]["record_table"]
         data_table = TABLE_LOOKUP[table]["data_table"]
-        query = rec_table.objects
-        # Cassandra requires a list for the in-predicate
-        filtered_ids = list(self._configure_query_for_criteria(query,
-                                                               name=data[0][0],
-                                                               criteria=data[0][1])
-                            .values_list('id', flat=True))
-
+        if accepted_ids is not None:
+            # Cassandra requires a list for the in-predicate
+            filtered_ids = list(accepted_ids)
+            remaining_data = data
+        else:
+            query = (self._configure_query_for_criteria(rec_table.objects,
+                                                        name=data[0][0],
+                                                        criteria=data[0][1])
+                     .values_list('id', flat=True))
+            first_criteria = data[0][1]
+            if len(data) == 1 and (not isinstance(first_criteria, utils.DataRange) or
+                                   first_criteria.is_single_value()):
+                for id in query:
+                    yield id
+                return
+            filtered_ids = list(query)
+            remaining_data = data[1:]
         # Only do the next part if there's more criteria and at least one id
-        for counter, (name, criteria) in enumerate(data[1:]):
-            if filtered_ids:
-                query = (self._configure_query_for_criteria(data_table.objects, name, criteria)
-                         .filter(id__in=filtered_ids))
-                if counter < (len(data[1:]) - 1):
-                    # Cassandra requires a list for the id__in attribute
-                    filtered_ids = list(query.values_list('id', flat=True).all())
-                else:
-                    # We are on the last iteration, no need for a list, use a generator
-                    filtered_ids = query.values_list('id', flat=True)
-            else:
+        for name, criteria in remaining_data:
+            if not filtered_ids:
                 break
+            query = (self._configure_query_for_criteria(data_table.objects, name, criteria)
+                     .filter(id__in=filtered_ids))
+            filtered_ids = list(query.values_list('id', flat=True).all())
 
-        for id in filtered_ids:
+        for id in sorted(filtered_ids):
             yield id
 
     @staticmethod
@@ -559,18 +892,44 @@ class RecordDAO(dao.RecordDAO):
                     query = query.filter(value__lt=criteria.max)
         return query
 
-    def get(self, id):
+    def get(self, id, data_fields=None, include_files=False):
         """
         Given a id, return match (if any) from Cassandra database.
 
+        Records are always read whole; given data_fields, they're trimmed
+        down afterwards.
+
         :param id: The id of the record to return
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Record. See dao.RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
 
         :returns: A record matching that id or None
         """
         LOGGER.debug('Getting record with id=%s', id)
         query = schema.Record.objects.filter(id=id).get()
-        return model.generate_record_from_json(
-            json_input=json.loads(query.raw))
+        record = model.generate_record_from_json(
+            json_input=codec.decode_raw(query.raw))
+        if data_fields is not None:
+            return model.project_record(record, data_fields, include_files)
+        return record
+
+    def get_all(self, ids_only=False):
+        """
+        Return every Record in the Cassandra database.
+
+        :param ids_only: whether to return only the ids of the Records
+
+        :returns: A generator of all Records (or, if ids_only, their ids)
+        """
+        LOGGER.debug('Getting all records.')
+        query = schema.Record.objects.values_list('id', flat=True)
+        if ids_only:
+            for id in query:
+                yield str(id)
+        else:
+            for record in self.get_many(str(id) for id in query):
+                yield record
 
     def get_all_of_type(self, type, ids_only=False):
         """
@@ -896,6 +1255,56 @@ class RelationshipDAO(dao.RelationshipDAO):
             query = query.filter(predicate=predicate)
         return self._build_relationships(query.allow_filtering().all())
 
+    def get_all(self):
+        """
+        Return every Relationship in Cassandra.
+
+        :returns: A generator of Relationships.
+        """
+        LOGGER.debug('Getting all relationships.')
+        # Through the driver, which pages, rather than cqlengine, which
+        # would cap the results at its default limit.
+        rows = connection.get_session().execute(
+            'SELECT subject_id, predicate, object_id FROM {}'
+            .format(schema.ObjectFromSubject.column_family_name()))
+        for row in rows:
+            yield model.Relationship(subject_id=row['subject_id'], predicate=row['predicate'],
+                                     object_id=row['object_id'])
+
+    def _get_many_given(self, key, ids, predicate=None):
+        """
+        Find the Relationships whose subject or object is any of several ids.
+
+        Rather than querying one id at a time, issues the lookups
+        concurrently, keyed on the query tables' partition keys.
+
+        :param key: 'subject_id' or 'object_id', whichever the ids are.
+        :param ids: A list of unique ids.
+        :param predicate: If not None, the predicate Relationships must have.
+
+        :returns: An iterable of Relationships.
+        """
+        table = (schema.ObjectFromSubject if key == 'subject_id'
+                 else schema.SubjectFromObject)
+        statement = ('SELECT subject_id, predicate, object_id FROM {} WHERE {} = %s'
+                     .format(table.column_family_name(), key))
+        if predicate:
+            # predicate is a clustering column in both tables
+            statement += ' AND predicate = %s'
+            parameters = [(id, predicate) for id in ids]
+        else:
+            parameters = [(id,) for id in ids]
+        results = execute_concurrent_with_args(connection.get_session(), statement,
+                                               parameters,
+                                               concurrency=LOOKUP_CONCURRENCY,
+                                               raise_on_first_error=True)
+        # cqlengine makes the session return each row as a dict
+        for _, rows in results:
+            for row in rows:
+                yield model.Relationship(subject_id=row['subject_id'],
+                                         predicate=row['predicate'],
+                                         object_id=row['object_id'])
+
     def _get_given_predicate(self, predicate):
         """
         Given predicate, return all Relationships with that predicate.
@@ -915,14 +1324,16 @@ class RunDAO(dao.RunDAO):
     """DAO responsible for handling Runs, (Record subtype), in Cassandra."""
 
     # pylint: disable=arguments-differ
-    # Args differ because SQL doesn't support force_overwrite yet, SIBO-307
-    def insert(self, run, force_overwrite=False):
+    # Args differ because force_overwrite isn't part of the generic DAO yet, SIBO-307
+    def insert(self, run, force_overwrite=False, trusted=False):
         """
         Given a Run, import it into the current Cassandra database.
 
         :param run: A Run to import
         :param force_overwrite: Whether to forcibly overwrite a preexisting
                                 run that shares this run's id.
+        :param trusted: Whether the Run is known to be valid. See
+                        RecordDAO.insert().
         """
         LOGGER.debug('Inserting %s into Cassandra with force_overwrite=%s', run, force_overwrite)
         create = (schema.Run.create if force_overwrite
@@ -931,7 +1342,7 @@ class RunDAO(dao.RunDAO):
                application=run.application,
                user=run.user,
                version=run.version)
-        self.record_dao.insert(record=run, force_overwrite=force_overwrite)
+        self.record_dao.insert(record=run, force_overwrite=force_overwrite, trusted=trusted)
 
     @staticmethod
     def _insert_sans_rec(run, force_overwrite=False):
@@ -956,9 +1367,9 @@ class RunDAO(dao.RunDAO):
                version=run.version)
 
     # pylint: disable=arguments-differ
-    # Args differ because SQL doesn't support force_overwrite yet, SIBO-307.
+    # Args differ because force_overwrite isn't part of the generic DAO yet, SIBO-307.
     # This method will be going away in SIBO-661
-    def insert_many(self, list_to_insert, force_overwrite=False):
+    def insert_many(self, list_to_insert, force_overwrite=False, trusted=False):
         """
         Given a list of Runs, insert each into Cassandra.
 
@@ -970,12 +1381,15 @@ class RunDAO(dao.RunDAO):
 
         :param force_overwrite: Whether to forcibly overwrite a preexisting run
                                 that shares this run's id.
+        :param trusted: Whether the Runs are known to be valid. See
+                        RecordDAO.insert().
         """
         LOGGER.debug('Inserting %i runs into Cassandra with '
                      'force_overwrite=%s.', len(list_to_insert), force_overwrite)
         self.record_dao.insert_many(list_to_insert=list_to_insert,
                                     force_overwrite=force_overwrite,
-                                    _type_managed=True)
+                                    _type_managed=True,
+                                    trusted=trusted)
         for item in list_to_insert:
             self._insert_sans_rec(item, force_overwrite)
 
@@ -1001,30 +1415,46 @@ class RunDAO(dao.RunDAO):
         """
         Delete a list of Runs from the Cassandra backend.
 
-        Removes everything: their data, relationships, files. Relies on
-        Cassandra's batching, one batch encompassing all Runs. If you want
-        to do one batch per Run, use delete() in a loop.
+        Removes everything: their data, relationships, files. See
+        RecordDAO.purge(), which this wraps; unlike delete(), it isn't atomic.
 
         :param ids_to_delete: A list of ids of Runs to delete
         """
-        with BatchQuery() as batch:
-            for id in ids_to_delete:
-                schema.Run.objects(id=id).batch(batch).delete()
-                # See delete() above for explanation of this:
-                # pylint: disable=protected-access
-                self.record_dao._setup_batch_delete(batch, id)
+        self.record_dao.purge(ids_to_delete, _extra_tables=(schema.Run,))
+
+    # pylint: disable=arguments-differ
+    # Args differ for the same reason as insert()
+    def replace_many(self, list_to_replace, trusted=False):
+        """
+        Given a list of Runs already in Cassandra, replace their contents.
+
+        See RecordDAO.replace_many(); the Run metadata is replaced as well.
+
+        :param list_to_replace: A list of Runs to replace the stored ones with
+        :param trusted: Whether the Runs are known to be valid. See
+                        RecordDAO.insert().
+        """
+        self.record_dao.replace_many(list_to_replace, _type_managed=True, trusted=trusted)
+        for item in list_to_replace:
+            self._insert_sans_rec(item, force_overwrite=True)
 
-    def get(self, id):
+    def get(self, id, data_fields=None, include_files=False):
         """
         Given a run's id, return match (if any) from Cassandra database.
 
         :param id: The id of some run
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Run. See RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
 
         :returns: A run matching that identifier or None
         """
         LOGGER.debug('Getting run with id: %s', id)
         record = schema.Record.filter(id=id).get()
-        return model.generate_run_from_json(json_input=json.loads(record.raw))
+        run = model.generate_run_from_json(json_input=codec.decode_raw(record.raw))
+        if data_fields is not None:
+            return model.project_record(run, data_fields, include_files)
+        return run
 
 
 class DAOFactory(dao.DAOFactory):
@@ -1036,17 +1466,26 @@ class DAOFactory(dao.DAOFactory):
 
     supports_parallel_ingestion = True
 
-    def __init__(self, keyspace, node_ip_list=None):
+    def __init__(self, keyspace, node_ip_list=None, raw_compression=None):
         """
         Initialize a Factory with a path to its backend.
 
         :param keyspace: The keyspace to connect to.
         :param node_ip_list: A list of ips belonging to nodes on the target
                             Cassandra instance. If None, connects to localhost.
+        :param raw_compression: How to compress the raws of Records inserted,
+                                one of codec.RAW_COMPRESSIONS, or None not to.
+                                See RecordDAO.compress_raws() to compress
+                                those already stored.
         """
+        codec.check_raw_compression(raw_compression)
         self.keyspace = keyspace
         self.node_ip_list = node_ip_list
+        self.raw_compression = raw_compression
         schema.form_connection(keyspace, node_ip_list=self.node_ip_list)
+        # The keyspace may already hold data, so nothing is known about it
+        # until RecordDAO.analyze() is run.
+        self.statistics = planner.StatisticsCatalog()
 
     def create_record_dao(self):
         """
@@ -1054,7 +1493,7 @@ class DAOFactory(dao.DAOFactory):
 
         :returns: a RecordDAO
         """
-        return RecordDAO()
+        return RecordDAO(statistics=self.statistics, raw_compression=self.raw_compression)
 
     def create_relationship_dao(self):
         """
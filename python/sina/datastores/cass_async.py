@@ -0,0 +1,500 @@
+"""
+Contains asyncio implementations of our Cassandra DAOs.
+
+Reads by primary key (Records, Runs, files, and Relationships by subject or
+object) are issued through the Cassandra driver's own asynchronous futures,
+so any number can be in flight at once without occupying a thread. Everything
+else is run on a thread pool by the matching synchronous DAO from
+sina.datastores.cass, whose cqlengine connection is safe to share between
+threads.
+
+Requires Python 3.5 or above.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import logging
+import types
+
+# Disable pylint check due to its issue with virtual environments
+from cassandra.cqlengine import connection  # pylint: disable=import-error
+
+import sina.async_dao as async_dao
+import sina.codec as codec
+import sina.model as model
+import sina.datastores.cass as cass
+import sina.datastores.cass_schema as schema
+
+LOGGER = logging.getLogger(__name__)
+
+# Disable pylint checks due to ubiquitous use of id and type
+# pylint: disable=invalid-name,redefined-builtin
+
+
+def execute_async(statement, parameters=None):
+    """
+    Execute a CQL statement, returning an asyncio future for its rows.
+
+    Bridges the driver's ResponseFuture, whose callbacks run on the driver's
+    own threads, to the current event loop. All pages of results are fetched.
+
+    :param statement: The CQL statement to execute.
+    :param parameters: The statement's parameters, if any.
+
+    :returns: An asyncio future for the list of rows returned. cqlengine
+              makes the session return each row as a dict keyed by column.
+    """
+    loop = asyncio.get_event_loop()
+    result = loop.create_future()
+    rows = []
+    response_future = connection.get_session().execute_async(statement, parameters)
+
+    def _set_result(value):
+        """Resolve the asyncio future, unless it's been cancelled."""
+        if not result.done():
+            result.set_result(value)
+
+    def _set_exception(exc):
+        """Fail the asyncio future, unless it's been cancelled."""
+        if not result.done():
+            result.set_exception(exc)
+
+    def _on_page(page):
+        """Collect a page of rows, then fetch the next or finish."""
+        rows.extend(page)
+        if response_future.has_more_pages:
+            response_future.start_fetching_next_page()
+        else:
+            loop.call_soon_threadsafe(_set_result, rows)
+
+    def _on_error(exc):
+        """Pass a failure on to the event loop."""
+        loop.call_soon_threadsafe(_set_exception, exc)
+
+    response_future.add_callbacks(_on_page, _on_error)
+    return result
+
+
+async def _get_raw(id):
+    """
+    Return the raw JSON of the Record with some id.
+
+    :param id: The id of the Record.
+
+    :returns: The Record's raw, as a dict.
+
+    :raises DoesNotExist: if there's no such Record.
+    """
+    rows = await execute_async('SELECT raw FROM {} WHERE id = %s'
+                               .format(schema.Record.column_family_name()), (id,))
+    if not rows:
+        raise schema.Record.DoesNotExist('No Record with id {}'.format(id))
+    return codec.decode_raw(rows[0]['raw'])
+
+
+class AsyncRecordDAO(async_dao.AsyncRecordDAO):
+    """The async DAO specifically responsible for handling Records in Cassandra."""
+
+    def __init__(self, factory):
+        """
+        Initialize AsyncRecordDAO.
+
+        :param factory: The AsyncDAOFactory whose thread pool to use.
+        """
+        self.factory = factory
+        self._record_dao = factory.sync_factory.create_record_dao()
+
+    def _run(self, method_name, *args, **kwargs):
+        """Run a method of a synchronous RecordDAO on the factory's thread pool."""
+        return self.factory.run_blocking(getattr(self._record_dao, method_name),
+                                         *args, **kwargs)
+
+    async def get(self, id, data_fields=None, include_files=False):
+        """
+        Given an id, return the matching Record from the Cassandra database.
+
+        :param id: The id of the Record to return.
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Record. See sina.dao.RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: The matching Record.
+
+        :raises DoesNotExist: if there's no such Record.
+        """
+        LOGGER.debug('Getting record with id=%s', id)
+        record = model.generate_record_from_json(json_input=await _get_raw(id))
+        if data_fields is not None:
+            return model.project_record(record, data_fields, include_files)
+        return record
+
+    async def insert(self, record, force_overwrite=False):
+        """
+        Given a Record, insert it into the current Cassandra database.
+
+        :param record: A Record to insert
+        :param force_overwrite: Whether to forcibly overwrite a preexisting
+                                record that shares this record's id.
+        """
+        await self._run('insert', record, force_overwrite=force_overwrite)
+
+    async def insert_many(self, list_to_insert, force_overwrite=False):
+        """
+        Given a list of Records, batch insert them into Cassandra.
+
+        :param list_to_insert: A list of Records to insert
+        :param force_overwrite: Whether to forcibly overwrite preexisting records.
+        """
+        await self._run('insert_many', list_to_insert, force_overwrite=force_overwrite)
+
+    async def delete(self, id):
+        """
+        Given the id of a Record, delete all mention of it from Cassandra.
+
+        :param id: The id of the Record to delete.
+        """
+        await self._run('delete', id)
+
+    async def delete_many(self, ids_to_delete):
+        """
+        Given a list of Record ids, delete all mentions of them from Cassandra.
+
+        :param ids_to_delete: A list of the ids of Records to delete.
+        """
+        await self._run('delete_many', ids_to_delete)
+
+    async def data_query(self, **kwargs):
+        """
+        Return the ids of all Records whose data fulfill some criteria.
+
+        See sina.datastores.cass.RecordDAO.data_query() for details.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                         must fulfill.
+        :returns: A list of Record ids that fulfill all criteria.
+
+        :raises ValueError: if not supplied at least one criterion or given
+                            a criterion it does not support
+        """
+        return await self._run('data_query', **kwargs)
+
+    async def analyze(self):
+        """
+        Collect fresh statistics about the data in the keyspace.
+
+        :returns: The updated planner.StatisticsCatalog.
+        """
+        return await self._run('analyze')
+
+    async def get_all_of_type(self, type, ids_only=False):
+        """
+        Given a type of Record, return all Records of that type.
+
+        :param type: The type of Record to return
+        :param ids_only: whether to return only the ids of matching Records
+
+        :returns: A list of matching Records.
+        """
+        return await self._run('get_all_of_type', type, ids_only=ids_only)
+
+    async def get_given_document_uri(self, uri, accepted_ids_list=None, ids_only=False):
+        """
+        Return all records associated with documents whose uris match some arg.
+
+        :param uri: The uri to use as a search term, such as "foo.png"
+        :param accepted_ids_list: A list of ids to restrict the search to.
+                                  If not provided, all ids will be used.
+        :param ids_only: whether to return only the ids of matching Records
+
+        :returns: A list of matching Records
+        """
+        return await self._run('get_given_document_uri', uri,
+                               accepted_ids_list=accepted_ids_list,
+                               ids_only=ids_only)
+
+    async def get_scalars(self, id, scalar_names):
+        """
+        Retrieve scalars for a given record id.
+
+        :param id: The record id to find scalars for
+        :param scalar_names: A list of the names of scalars to return
+
+        :return: A dict of scalars matching the Mnoda data specification
+        """
+        return await self._run('get_scalars', id, scalar_names)
+
+    async def get_data_for_records(self, id_list, data_list):
+        """
+        Retrieve a subset of non-list data for each Record in a list of ids.
+
+        :param id_list: A list of the record ids to find data for
+        :param data_list: A list of the names of data fields to find
+
+        :returns: a dictionary of dictionaries containing the requested data,
+                 keyed by record_id and then data field name.
+        """
+        return await self._run('get_data_for_records', id_list, data_list)
+
+    async def get_files(self, id):
+        """
+        Retrieve files for a given record id.
+
+        Files are returned in the alphabetical order of their URIs
+
+        :param id: The record id to find files for
+        :return: A list of file JSON objects matching the Mnoda specification
+        """
+        LOGGER.debug('Getting files for record id=%s', id)
+        rows = await execute_async('SELECT uri, mimetype, tags FROM {} WHERE id = %s'
+                                   .format(schema.DocumentFromRecord.column_family_name()),
+                                   (id,))
+        return [{'uri': row['uri'], 'mimetype': row['mimetype'],
+                 'tags': set(row['tags'] or ())}
+                for row in rows]
+
+
+class AsyncRelationshipDAO(async_dao.AsyncRelationshipDAO):
+    """The async DAO responsible for handling Relationships in Cassandra."""
+
+    def __init__(self, factory):
+        """
+        Initialize AsyncRelationshipDAO.
+
+        :param factory: The AsyncDAOFactory whose thread pool to use.
+        """
+        self.factory = factory
+        self._relationship_dao = factory.sync_factory.create_relationship_dao()
+
+    def _run(self, method_name, *args, **kwargs):
+        """Run a method of a synchronous RelationshipDAO on the factory's thread pool."""
+        return self.factory.run_blocking(getattr(self._relationship_dao, method_name),
+                                         *args, **kwargs)
+
+    async def insert(self, relationship=None, subject_id=None,
+                     object_id=None, predicate=None):
+        """
+        Given some Relationship, import it into the Cassandra database.
+
+        :param relationship: A Relationship object to build entry from.
+        :param subject_id: The id of the subject.
+        :param object_id: The id of the object.
+        :param predicate: A string describing the relationship.
+
+        :raises: A ValueError if neither Relationship nor the subject_id,
+                 object_id, and predicate args are provided.
+        """
+        await self._run('insert', relationship=relationship, subject_id=subject_id,
+                        object_id=object_id, predicate=predicate)
+
+    async def insert_many(self, list_to_insert):
+        """
+        Given a list of Relationships, batch insert them into Cassandra.
+
+        :param list_to_insert: A list of Relationships to insert
+        """
+        await self._run('insert_many', list_to_insert)
+
+    async def get(self, subject_id=None, object_id=None, predicate=None):
+        """
+        Given Relationship info, return matching Relationships (or empty list).
+
+        Lookups by subject or object id read their query tables directly;
+        lookups by predicate alone need a full scan and use the thread pool.
+
+        :param subject_id: the subject_id of Relationships to return
+        :param object_id: the object_id of Relationships to return
+        :param predicate: the predicate of Relationships to return
+
+        :returns: A list of Relationships fitting the criteria.
+
+        :raises ValueError: if none of the parameters are provided.
+        """
+        if not (subject_id or object_id or predicate):
+            raise ValueError("Must supply subject_id, object_id, or predicate")
+        if subject_id:
+            table, key, value = schema.ObjectFromSubject, 'subject_id', subject_id
+        elif object_id:
+            table, key, value = schema.SubjectFromObject, 'object_id', object_id
+        else:
+            return await self._run('get', predicate=predicate)
+        statement = ('SELECT subject_id, predicate, object_id FROM {} WHERE {} = %s'
+                     .format(table.column_family_name(), key))
+        parameters = [value]
+        if predicate:
+            # predicate is a clustering column in both tables
+            statement += ' AND predicate = %s'
+            parameters.append(predicate)
+        rows = await execute_async(statement, parameters)
+        return [model.Relationship(subject_id=row['subject_id'], predicate=row['predicate'],
+                                   object_id=row['object_id'])
+                for row in rows]
+
+
+class AsyncRunDAO(async_dao.AsyncRunDAO):
+    """The async DAO responsible for handling Runs in Cassandra."""
+
+    def __init__(self, factory):
+        """
+        Initialize AsyncRunDAO.
+
+        :param factory: The AsyncDAOFactory whose thread pool to use.
+        """
+        self.factory = factory
+        self._run_dao = factory.sync_factory.create_run_dao()
+
+    def _run(self, method_name, *args, **kwargs):
+        """Run a method of a synchronous RunDAO on the factory's thread pool."""
+        return self.factory.run_blocking(getattr(self._run_dao, method_name),
+                                         *args, **kwargs)
+
+    async def get(self, id, data_fields=None, include_files=False):
+        """
+        Given a run's id, return the matching Run from the Cassandra database.
+
+        :param id: The id of the run to return.
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Run. See sina.dao.RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: The matching Run.
+
+        :raises DoesNotExist: if there's no such Run.
+        """
+        LOGGER.debug('Getting run with id: %s', id)
+        run = model.generate_run_from_json(json_input=await _get_raw(id))
+        if data_fields is not None:
+            return model.project_record(run, data_fields, include_files)
+        return run
+
+    async def insert(self, run, force_overwrite=False):
+        """
+        Given a Run, insert it into the Cassandra database.
+
+        :param run: A Run to insert
+        :param force_overwrite: Whether to forcibly overwrite a preexisting run
+                                that shares this run's id.
+        """
+        await self._run('insert', run, force_overwrite=force_overwrite)
+
+    async def insert_many(self, list_to_insert, force_overwrite=False):
+        """
+        Given a list of Runs, insert each into the Cassandra database.
+
+        :param list_to_insert: A list of Runs to insert
+        :param force_overwrite: Whether to forcibly overwrite preexisting runs.
+        """
+        await self._run('insert_many', list_to_insert, force_overwrite=force_overwrite)
+
+    async def delete(self, id):
+        """
+        Given the id of a Run, delete all mention of it from the Cassandra database.
+
+        :param id: The id of the Run to delete.
+        """
+        await self._run('delete', id)
+
+    async def delete_many(self, ids_to_delete):
+        """
+        Given a list of Run ids, delete all mentions of them from Cassandra.
+
+        :param ids_to_delete: A list of the ids of Runs to delete.
+        """
+        await self._run('delete_many', ids_to_delete)
+
+    async def get_all(self, ids_only=False):
+        """
+        Return all Records with type 'run'.
+
+        :param ids_only: whether to return only the ids of matching Runs
+        :returns: A list of all Records which are Runs
+        """
+        return await self._run('get_all', ids_only=ids_only)
+
+    async def data_query(self, **kwargs):
+        """
+        Return the ids of all Runs whose data fulfill some criteria.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                       must fulfill, as for AsyncRecordDAO.data_query().
+
+        :returns: A list of run ids fitting the criteria
+        """
+        return await self._run('data_query', **kwargs)
+
+
+class AsyncDAOFactory(async_dao.AsyncDAOFactory):
+    """
+    Build async Cassandra-backed DAOs for interacting with Mnoda-based objects.
+
+    Includes Records, Relationships, etc.
+    """
+
+    def __init__(self, keyspace, node_ip_list=None, max_workers=None):
+        """
+        Initialize a Factory with a path to its backend.
+
+        :param keyspace: The keyspace to connect to.
+        :param node_ip_list: A list of ips belonging to nodes on the target
+                            Cassandra instance. If None, connects to localhost.
+        :param max_workers: The most threads to run blocking calls on at once.
+                            If None, uses ThreadPoolExecutor's default.
+        """
+        self.sync_factory = cass.DAOFactory(keyspace, node_ip_list=node_ip_list)
+        self.statistics = self.sync_factory.statistics
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def run_blocking(self, func, *args, **kwargs):
+        """
+        Call a blocking function on the thread pool.
+
+        Generators returned by the function are collected into lists.
+
+        :param func: The function to call.
+        :param args: Positional arguments for the function.
+        :param kwargs: Keyword arguments for the function.
+
+        :returns: An asyncio future for the function's result.
+        """
+        return asyncio.get_event_loop().run_in_executor(
+            self._executor, functools.partial(_call_collecting, func, args, kwargs))
+
+    def create_record_dao(self):
+        """
+        Create an async DAO for interacting with records.
+
+        :returns: an AsyncRecordDAO
+        """
+        return AsyncRecordDAO(factory=self)
+
+    def create_relationship_dao(self):
+        """
+        Create an async DAO for interacting with relationships.
+
+        :returns: an AsyncRelationshipDAO
+        """
+        return AsyncRelationshipDAO(factory=self)
+
+    def create_run_dao(self):
+        """
+        Create an async DAO for interacting with runs.
+
+        :returns: an AsyncRunDAO
+        """
+        return AsyncRunDAO(factory=self)
+
+    def close(self):
+        """Wait for pending calls to finish, then shut down the thread pool."""
+        self._executor.shutdown(wait=True)
+
+    def __repr__(self):
+        """Return a string representation of an async Cassandra DAOFactory."""
+        return ('Async Cassandra DAOFactory <keyspace={}, node_ip_list={}>'
+                .format(self.sync_factory.keyspace, self.sync_factory.node_ip_list))
+
+
+def _call_collecting(func, args, kwargs):
+    """Call func, collecting a returned generator into a list."""
+    result = func(*args, **kwargs)
+    if isinstance(result, types.GeneratorType):
+        result = list(result)
+    return result
@@ -53,12 +53,14 @@ class Record(Model):
     """
     Toplevel object in the Mnoda schema.
 
-    Stores the raw form of the record.
+    Stores the raw form of the record, plus its content hash (used to skip
+    unchanged records on re-ingestion).
     """
 
     id = columns.Text(primary_key=True)
     type = columns.Text()
     raw = columns.Text()
+    content_hash = columns.Text()
 
 
 class DocumentFromRecord(Model):
@@ -0,0 +1,1094 @@
+"""
+Contains a pure-Python, in-memory implementation of our DAOs.
+
+Nothing goes through SQL (or touches disk), making this the quickest backend
+for small, hot working sets, like those of notebooks and tests. Contents are
+lost along with the factory unless saved to a Mnoda JSON file or another
+backend; see DAOFactory.
+
+Each Record's raw is kept serialized (and, optionally, compressed), along
+with indexes for answering queries without reading raws:
+
+* For each datum name of each kind, an inverted index of value -> ids, its
+  distinct values kept sorted so ranges are found by bisection. List data
+  are indexed by entry.
+* An inverted index of file URIs -> ids, sorted the same way for prefixes.
+* An index of type -> ids.
+* Adjacency maps of Relationships by subject, object, and predicate.
+"""
+import re
+import copy
+import logging
+import numbers
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+
+import six
+
+import sina.codec as codec
+import sina.dao as dao
+import sina.model as model
+import sina.planner as planner
+import sina.utils as utils
+
+LOGGER = logging.getLogger(__name__)
+
+# Disable pylint checks due to ubiquitous use of id and type
+# pylint: disable=invalid-name,redefined-builtin
+
+# How many Records to move at a time when loading from or saving to another backend
+COPY_CHUNK_SIZE = 1000
+
+
+class _ValueIndex(object):
+    """An inverted index of values -> ids, its distinct values kept sorted."""
+
+    def __init__(self):
+        """Create an empty index."""
+        # Each value -> the set of ids having it
+        self.ids = {}
+        # The distinct values, ascending
+        self.values = []
+        # The ids having any value (or, for list data, an empty list)
+        self.records = set()
+        # How many values (or list entries) are indexed
+        self.entries = 0
+
+    def add(self, id, values):
+        """
+        Index an id's value(s).
+
+        :param id: The id having the values.
+        :param values: A list of the values (ex: a list datum's entries).
+        """
+        self.records.add(id)
+        self.entries += len(values)
+        for value in values:
+            ids = self.ids.get(value)
+            if ids is None:
+                ids = self.ids[value] = set()
+                insort(self.values, value)
+            ids.add(id)
+
+    def remove(self, id, values):
+        """
+        Stop indexing an id's value(s).
+
+        :param id: The id having the values.
+        :param values: The list of values given to add().
+        """
+        self.records.discard(id)
+        self.entries -= len(values)
+        for value in values:
+            ids = self.ids.get(value)
+            if ids is None:
+                continue
+            ids.discard(id)
+            if not ids:
+                del self.ids[value]
+                del self.values[bisect_left(self.values, value)]
+
+    def find(self, criterion):
+        """
+        Find the ids with a value meeting a criterion.
+
+        :param criterion: A single value or DataRange.
+
+        :returns: A set of the matching ids.
+        """
+        if not isinstance(criterion, utils.DataRange):
+            return set(self.ids.get(criterion, ()))
+        start, end = 0, len(self.values)
+        if criterion.min_is_finite():
+            start = (bisect_left if criterion.min_inclusive
+                     else bisect_right)(self.values, criterion.min)
+        if criterion.max_is_finite():
+            end = (bisect_right if criterion.max_inclusive
+                   else bisect_left)(self.values, criterion.max)
+        return self._ids_of(self.values[start:end])
+
+    def find_prefixed(self, prefix):
+        """
+        Find the ids with a (string) value starting with a prefix.
+
+        :param prefix: The prefix.
+
+        :returns: A set of the matching ids.
+        """
+        end = start = bisect_left(self.values, prefix)
+        while end < len(self.values) and self.values[end].startswith(prefix):
+            end += 1
+        return self._ids_of(self.values[start:end])
+
+    def _ids_of(self, values):
+        """Return the set of ids having any of some values."""
+        matches = set()
+        for value in values:
+            matches.update(self.ids[value])
+        return matches
+
+    def statistics(self, name, kind):
+        """
+        Summarize the index for the query planner.
+
+        :param name: The name of the datum indexed.
+        :param kind: The kind of datum indexed, one of planner.KINDS.
+
+        :returns: A planner.DatumStatistics.
+        """
+        stats = planner.DatumStatistics(
+            name, kind, count=len(self.records), distinct=len(self.values),
+            entries=self.entries if kind.endswith("list") else None)
+        if self.values:
+            stats.min, stats.max = self.values[0], self.values[-1]
+            if kind.startswith("scalar"):
+                stats.histogram = [0] * planner.HISTOGRAM_BUCKETS
+                for value in self.values:
+                    stats.histogram[stats.bucket_index(value)] += len(self.ids[value])
+        return stats
+
+
+class _Store(object):
+    """Everything held by one factory, shared by its DAOs."""
+
+    def __init__(self):
+        """Create an empty store."""
+        # Each Record's id -> its type, stored raw, and content hash
+        self.types = {}
+        self.raws = {}
+        self.hashes = {}
+        # Each Record's id -> its data and files, as in its raw
+        self.data = {}
+        self.files = {}
+        self.by_type = defaultdict(set)
+        # (kind, name) -> the _ValueIndex of that datum
+        self.indexes = defaultdict(_ValueIndex)
+        self.uris = _ValueIndex()
+        # Each subject -> a set of (predicate, object) pairs, and so on
+        self.subjects = defaultdict(set)
+        self.objects = defaultdict(set)
+        self.predicates = defaultdict(set)
+
+    def add_record(self, id, type, stored_raw, raw_json, content_hash):
+        """
+        Store and index a Record. Any already stored with its id must be removed first.
+
+        :param id: The Record's id.
+        :param type: The Record's type.
+        :param stored_raw: The raw to keep, as from codec.encode_raw().
+        :param raw_json: The raw, serialized.
+        :param content_hash: The Record's content hash.
+
+        :returns: A list of the (kind, name, value) of each datum indexed.
+        """
+        # Our own copy of the contents, independent of the Record given
+        contents = codec.loads(raw_json)
+        self.types[id] = type
+        self.raws[id] = stored_raw
+        self.hashes[id] = content_hash
+        self.by_type[type].add(id)
+        self.data[id] = contents.get("data", {})
+        self.files[id] = contents.get("files", [])
+        indexed = []
+        for name, datum in six.iteritems(self.data[id]):
+            kind = _kind_of(datum["value"])
+            if kind is not None:
+                self.indexes[(kind, name)].add(id, _indexed_values(datum["value"]))
+                indexed.append((kind, name, datum["value"]))
+        self.uris.add(id, [entry["uri"] for entry in self.files[id]])
+        return indexed
+
+    def remove_record(self, id):
+        """
+        Remove a Record (but not its Relationships) and its index entries.
+
+        :param id: The Record's id. Nothing happens if there's no such Record.
+        """
+        if id not in self.raws:
+            return
+        type = self.types.pop(id)
+        self.by_type[type].discard(id)
+        if not self.by_type[type]:
+            del self.by_type[type]
+        del self.raws[id]
+        del self.hashes[id]
+        for name, datum in six.iteritems(self.data.pop(id)):
+            kind = _kind_of(datum["value"])
+            if kind is not None:
+                index = self.indexes[(kind, name)]
+                index.remove(id, _indexed_values(datum["value"]))
+                if not index.records:
+                    del self.indexes[(kind, name)]
+        self.uris.remove(id, [entry["uri"] for entry in self.files.pop(id)])
+
+    def add_relationship(self, subject_id, predicate, object_id):
+        """Store a Relationship, if it isn't already."""
+        self.subjects[subject_id].add((predicate, object_id))
+        self.objects[object_id].add((predicate, subject_id))
+        self.predicates[predicate].add((subject_id, object_id))
+
+    def remove_relationships(self, id):
+        """
+        Remove every Relationship an id is the subject or object of.
+
+        :param id: The id.
+        """
+        for predicate, object_id in self.subjects.pop(id, ()):
+            _discard(self.objects, object_id, (predicate, id))
+            _discard(self.predicates, predicate, (id, object_id))
+        for predicate, subject_id in self.objects.pop(id, ()):
+            _discard(self.subjects, subject_id, (predicate, id))
+            _discard(self.predicates, predicate, (subject_id, id))
+
+
+def _discard(adjacency, key, pair):
+    """Remove a pair from an adjacency map, dropping the key once it has none."""
+    pairs = adjacency.get(key)
+    if pairs is not None:
+        pairs.discard(pair)
+        if not pairs:
+            del adjacency[key]
+
+
+def _kind_of(value):
+    """
+    Find which kind of datum a value is indexed as, as the SQL backend decides.
+
+    :param value: A datum's value.
+
+    :returns: One of planner.KINDS, or None for values that aren't queryable.
+    """
+    if isinstance(value, list):
+        if all(isinstance(entry, numbers.Real) for entry in value):
+            return "scalarlist"
+        if all(isinstance(entry, six.string_types) for entry in value):
+            return "stringlist"
+        return None
+    if isinstance(value, numbers.Real):
+        return "scalar"
+    if isinstance(value, six.string_types):
+        return "string"
+    return None
+
+
+def _indexed_values(value):
+    """
+    Return the values to index for a datum.
+
+    :param value: The datum's value.
+
+    :returns: A list of the value (or, for lists, its entries). NaNs are left
+              out, as they can't be sorted and match no criterion.
+    """
+    values = value if isinstance(value, list) else [value]
+    # NaN is the only value unequal to itself
+    return [entry for entry in values if entry == entry]  # pylint: disable=comparison-with-itself
+
+
+class RecordDAO(dao.RecordDAO):
+    """The DAO responsible for handling Records held in memory."""
+
+    def __init__(self, store, statistics=None, raw_compression=None):
+        """
+        Initialize RecordDAO with the store it shares with its factory.
+
+        :param store: The factory's _Store.
+        :param statistics: The StatisticsCatalog used to plan data queries.
+                           Normally shared by all DAOs from the same factory;
+                           if None, the DAO starts its own, empty one.
+        :param raw_compression: How to compress the raws of Records inserted,
+                                one of codec.RAW_COMPRESSIONS, or None not to.
+        """
+        codec.check_raw_compression(raw_compression)
+        self.store = store
+        self.statistics = (statistics if statistics is not None
+                           else planner.StatisticsCatalog())
+        self.raw_compression = raw_compression
+
+    def _stored_raw(self, id):
+        """
+        Return a Record's stored raw.
+
+        :param id: The Record's id.
+
+        :raises ValueError: if there's no such Record.
+        """
+        stored = self.store.raws.get(id)
+        if stored is None:
+            msg = 'No Record found with id={}'.format(id)
+            LOGGER.error(msg)
+            raise ValueError(msg)
+        return stored
+
+    def get(self, id, data_fields=None, include_files=False):
+        """
+        Given an id, return the matching Record.
+
+        Given data_fields, the Record is built from those data alone, without
+        reading its raw.
+
+        :param id: The id of the Record to return.
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Record. See dao.RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: The matching Record.
+
+        :raises ValueError: if there's no such Record.
+        """
+        LOGGER.debug('Getting record with id=%s', id)
+        stored = self._stored_raw(id)
+        if data_fields is None:
+            return model.generate_record_from_json(json_input=codec.decode_raw(stored))
+        data = self.store.data[id]
+        return model.Record(id=id, type=self.store.types[id],
+                            data={name: copy.deepcopy(data[name])
+                                  for name in data_fields if name in data},
+                            files=(copy.deepcopy(self.store.files[id]) if include_files
+                                   else None))
+
+    # pylint: disable=arguments-differ
+    # Args differ to match the SQL and Cassandra backends
+    def insert(self, record, force_overwrite=False, trusted=False):
+        """
+        Given a Record, insert it.
+
+        :param record: A Record to insert
+        :param force_overwrite: Whether to overwrite a preexisting Record that
+                                shares this Record's id.
+        :param trusted: Whether the Record is known to be valid, so its data
+                        and files needn't be checked entry by entry. See
+                        Record.validate_and_serialize().
+
+        :raises ValueError: if the Record is invalid, or one already has its
+                            id (and not force_overwrite).
+        """
+        LOGGER.debug('Inserting %s into memory with force_overwrite=%s.',
+                     record, force_overwrite)
+        self.insert_many([record], force_overwrite=force_overwrite, trusted=trusted)
+
+    # pylint: disable=arguments-differ
+    # Args differ for the same reason as insert()
+    def insert_many(self, list_to_insert, force_overwrite=False, trusted=False):
+        """
+        Given a list of Records, insert them.
+
+        Every Record is checked before any are inserted, so either all are or
+        none are. With force_overwrite, preexisting Records sharing an id with
+        one given have their contents replaced; Relationships involving them
+        are untouched.
+
+        :param list_to_insert: A list of Records to insert
+        :param force_overwrite: Whether to overwrite preexisting Records that
+                                share ids with those given.
+        :param trusted: Whether the Records are known to be valid. See insert().
+
+        :raises ValueError: if any Record is invalid, or (without
+                            force_overwrite) shares an id with a stored
+                            Record or another given.
+        """
+        LOGGER.debug('Inserting %i records into memory with force_overwrite=%s.',
+                     len(list_to_insert), force_overwrite)
+        serialized = []
+        seen = set()
+        for record in list_to_insert:
+            is_valid, warnings, raw_json = record.validate_and_serialize(trusted=trusted)
+            if not is_valid:
+                raise ValueError(warnings)
+            if not force_overwrite and (record.id in self.store.raws or record.id in seen):
+                msg = 'A Record with id={} already exists.'.format(record.id)
+                LOGGER.error(msg)
+                raise ValueError(msg)
+            seen.add(record.id)
+            serialized.append((record, raw_json))
+        for record, raw_json in serialized:
+            # The old data of a Record being overwritten can't be taken back
+            # out of the statistics, so they're left partial instead
+            overwriting = record.id in self.store.raws
+            if overwriting:
+                self.statistics.mark_partial()
+            self.store.remove_record(record.id)
+            indexed = self.store.add_record(record.id, record.type,
+                                            codec.encode_raw(raw_json, self.raw_compression),
+                                            raw_json, record.content_hash(raw_json))
+            if not overwriting:
+                for kind, name, value in indexed:
+                    self.statistics.observe(kind=kind, name=name, value=value)
+
+    # pylint: disable=arguments-differ
+    # Args differ for the same reason as insert()
+    def replace_many(self, list_to_replace, trusted=False):
+        """
+        Given a list of Records already stored, replace their contents.
+
+        An overwriting insert_many(). Relationships involving the Records are
+        untouched.
+
+        :param list_to_replace: A list of Records to replace the stored ones with
+        :param trusted: Whether the Records are known to be valid. See insert().
+        """
+        LOGGER.debug('Replacing %i records.', len(list_to_replace))
+        self.insert_many(list_to_replace, force_overwrite=True, trusted=trusted)
+
+    def delete(self, id):
+        """
+        Given the id of a Record, delete it, its data, and its Relationships.
+
+        :param id: The id of the Record to delete.
+        """
+        LOGGER.debug('Deleting record with id: %s', id)
+        self.delete_many([id])
+
+    def delete_many(self, ids_to_delete):
+        """
+        Given a list of Record ids, delete them, their data, and their Relationships.
+
+        Ids naming no Record are ignored.
+
+        :param ids_to_delete: A list of the ids of Records to delete.
+        """
+        LOGGER.debug('Deleting %i records.', len(ids_to_delete))
+        for id in ids_to_delete:
+            self.store.remove_record(id)
+            self.store.remove_relationships(id)
+        self.statistics.mark_partial()
+
+    def get_content_hashes(self, ids):
+        """
+        Given some Record ids, return the content hashes stored for those Records.
+
+        :param ids: An iterable of ids of Records to look up.
+
+        :returns: A dict of id: hash for every given id that names a Record.
+        """
+        return {id: self.store.hashes[id] for id in ids if id in self.store.hashes}
+
+    def compress_raws(self, compression='zlib', progress_callback=None):
+        """
+        Rewrite the raws of every stored Record, compressing them a given way.
+
+        Raws already stored the requested way are left be.
+
+        :param compression: How to compress the raws, one of
+                            codec.RAW_COMPRESSIONS, or None to decompress them.
+        :param progress_callback: If provided, called once done with the
+                                  number of Records processed and the total.
+
+        :returns: The number of raws rewritten.
+        """
+        codec.check_raw_compression(compression)
+        LOGGER.info('Rewriting raws with compression=%s.', compression)
+        raws = self.store.raws
+        rewritten = [id for id, stored in six.iteritems(raws)
+                     if codec.raw_compression(stored) != compression]
+        for id in rewritten:
+            raws[id] = codec.encode_raw(codec.raw_json(raws[id]), compression)
+        if progress_callback is not None:
+            progress_callback(len(raws), len(raws))
+        return len(rewritten)
+
+    def data_query(self, **kwargs):
+        """
+        Return the ids of all Records whose data fulfill some criteria.
+
+        Criteria are given as for dao.RecordDAO.data_query(). Each is answered
+        from its datum's index.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                       must fulfill.
+
+        :returns: A generator of Record ids that fulfill all criteria, sorted.
+
+        :raises ValueError: if not supplied at least one criterion or given
+                            a criterion it does not support
+        """
+        LOGGER.debug('Finding all records fulfilling criteria: %s', kwargs.items())
+        query_plan = self.explain_query(**kwargs)
+        for id in planner.execute_plan(query_plan, self._run_plan_step):
+            yield id
+
+    def explain_query(self, **kwargs):
+        """
+        Return the plan data_query() would follow for some criteria.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                       must fulfill, as for data_query().
+
+        :returns: A planner.QueryPlan.
+
+        :raises ValueError: if not supplied at least one criterion or given
+                            a criterion it does not support
+        """
+        return planner.build_plan(self.statistics, kwargs)
+
+    def _run_plan_step(self, step, accepted_ids=None):
+        """
+        Return the ids of the Records fulfilling one step of a QueryPlan.
+
+        :param step: The planner.PlanStep to run.
+        :param accepted_ids: If not None, a list of ids to restrict the step to.
+
+        :returns: An iterator of matching ids, in sorted order.
+
+        :raises ValueError: if given an unsupported list operation.
+        """
+        index = self.store.indexes.get((step.kind, step.name))
+        if index is None:
+            matches = set()
+        elif step.kind in ("scalar", "string"):
+            matches = index.find(step.criterion)
+        else:
+            matches = _list_matches(index, step.criterion)
+        if accepted_ids is not None:
+            matches.intersection_update(accepted_ids)
+        return iter(sorted(matches))
+
+    def analyze(self):
+        """
+        Collect fresh statistics about the data held for query planning.
+
+        Statistics are kept up to date as Records are inserted, but deletions
+        are only accounted for by analyzing again.
+
+        :returns: The updated planner.StatisticsCatalog.
+        """
+        LOGGER.info('Analyzing data for query planning.')
+        self.statistics.replace([index.statistics(name, kind) for (kind, name), index
+                                 in six.iteritems(self.store.indexes)], complete=True)
+        return self.statistics
+
+    def get_all(self, ids_only=False):
+        """
+        Return every Record held.
+
+        :param ids_only: whether to return only the ids of the Records
+
+        :returns: A generator of all Records (or, if ids_only, their ids),
+                  sorted by id.
+        """
+        LOGGER.debug('Getting all records.')
+        return self._from_ids(sorted(self.store.raws), ids_only)
+
+    def _from_ids(self, ids, ids_only=False):
+        """
+        Turn ids into a generator of the Records (or the ids themselves).
+
+        :param ids: A list of ids, taken as is so later changes don't disturb it.
+        :param ids_only: Whether to return ids rather than Records.
+
+        :returns: A generator of Records or ids, in the order given.
+        """
+        for id in ids:
+            yield id if ids_only else self.get(id)
+
+    def get_all_of_type(self, type, ids_only=False):
+        """
+        Given a type of Record, return all Records of that type.
+
+        :param type: The type of Record to return, ex: run
+        :param ids_only: whether to return only the ids of matching Records
+
+        :returns: A generator of matching Records (or, if ids_only, their
+                  ids), sorted by id.
+        """
+        LOGGER.debug('Getting all records of type %s.', type)
+        return self._from_ids(sorted(self.store.by_type.get(type, ())), ids_only)
+
+    def get_given_document_uri(self, uri, accepted_ids_list=None, ids_only=False):
+        """
+        Return all Records associated with documents whose uris match some arg.
+
+        Supports the use of % as a wildcard character. A uri without one, or
+        with only a trailing one, is looked up in the URI index directly.
+
+        :param uri: The uri to use as a search term, such as "foo.png"
+        :param accepted_ids_list: A list of ids to restrict the search to.
+                                  If not provided, all ids will be used.
+        :param ids_only: whether to return only the ids of matching Records
+
+        :returns: A generator of matching Records (or, if ids_only, their
+                  ids), sorted by id and without duplicates.
+        """
+        LOGGER.debug('Getting all records related to uri=%s.', uri)
+        uris = self.store.uris
+        if '%' not in uri:
+            matches = uris.find(uri)
+        elif '%' not in uri[:-1]:
+            matches = uris.find_prefixed(uri[:-1])
+        else:
+            pattern = re.compile('.*'.join(re.escape(part) for part in uri.split('%')) + '$',
+                                 re.DOTALL)
+            matches = set(id for value in uris.values if pattern.match(value)
+                          for id in uris.ids[value])
+        if accepted_ids_list is not None:
+            matches.intersection_update(accepted_ids_list)
+        return self._from_ids(sorted(matches), ids_only)
+
+    def get_scalars(self, id, scalar_names):
+        """
+        LEGACY: retrieve scalars for a given record id.
+
+        :param id: The record id to find scalars for
+        :param scalar_names: A list of the names of scalars to return
+
+        :return: A dict of scalars matching the Mnoda data specification
+        """
+        LOGGER.debug('Getting scalars=%s for record id=%s', scalar_names, id)
+        data = self.store.data.get(id, {})
+        scalars = {}
+        for name in scalar_names:
+            datum = data.get(name)
+            if datum is not None and _kind_of(datum["value"]) == "scalar":
+                scalars[name] = {'value': datum['value'],
+                                 'units': datum.get('units'),
+                                 'tags': copy.copy(datum.get('tags'))}
+        return scalars
+
+    def get_data_for_records(self, id_list, data_list):
+        """
+        Retrieve a subset of data for Records in id_list.
+
+        See dao.RecordDAO.get_data_for_records(). As for the SQL backend,
+        only scalar and string data are found.
+
+        :param id_list: A list of the record ids to find data for
+        :param data_list: A list of the names of data fields to find
+
+        :returns: a dictionary of dictionaries containing the requested data,
+                 keyed by record_id and then data field name.
+        """
+        LOGGER.debug('Getting data in %s for record ids in %s', data_list, id_list)
+        found = defaultdict(lambda: defaultdict(dict))
+        for id in id_list:
+            data = self.store.data.get(id, {})
+            for name in data_list:
+                datum = data.get(name)
+                if datum is not None and _kind_of(datum["value"]) in ("scalar", "string"):
+                    datapoint = {"value": datum["value"]}
+                    if datum.get("units"):
+                        datapoint["units"] = datum["units"]
+                    if datum.get("tags"):
+                        datapoint["tags"] = list(datum["tags"])
+                    found[id][name] = datapoint
+        return found
+
+    def get_files(self, id):
+        """
+        Retrieve files for a given record id.
+
+        Files are returned in the alphabetical order of their URIs
+
+        :param id: The record id to find files for
+        :return: A list of file JSON objects matching the Mnoda specification
+        """
+        LOGGER.debug('Getting files for record id=%s', id)
+        return [{'uri': entry['uri'], 'mimetype': entry.get('mimetype'),
+                 'tags': copy.copy(entry.get('tags'))}
+                for entry in sorted(self.store.files.get(id, []),
+                                    key=lambda entry: entry['uri'])]
+
+
+def _list_matches(index, criterion):
+    """
+    Find the Records whose list datum fulfills a ListCriteria.
+
+    :param index: The list datum's _ValueIndex.
+    :param criterion: The ListCriteria.
+
+    :returns: A set of the Records' ids.
+
+    :raises ValueError: if given an unsupported list operation.
+    """
+    operation = criterion.operation
+    found = [index.find(entry) for entry in criterion.entries]
+    if operation == utils.ListQueryOperation.ANY:
+        return set().union(*found)
+    if operation not in (utils.ListQueryOperation.ALL, utils.ListQueryOperation.ONLY):
+        raise ValueError("Currently, only [{}, {}, {}] list "
+                         "operations are supported. Given {}"
+                         .format(utils.ListQueryOperation.ALL,
+                                 utils.ListQueryOperation.ANY,
+                                 utils.ListQueryOperation.ONLY,
+                                 operation))
+    matches = found[0].intersection(*found[1:])
+    if operation == utils.ListQueryOperation.ONLY:
+        ranges = [entry if isinstance(entry, utils.DataRange)
+                  else utils.DataRange(entry, entry, max_inclusive=True)
+                  for entry in criterion.entries]
+        for excluded in utils.invert_ranges(ranges):
+            matches.difference_update(index.find(excluded))
+    return matches
+
+
+class RelationshipDAO(dao.RelationshipDAO):
+    """The DAO responsible for handling Relationships held in memory."""
+
+    def __init__(self, store):
+        """
+        Initialize RelationshipDAO with the store it shares with its factory.
+
+        :param store: The factory's _Store.
+        """
+        self.store = store
+
+    def insert(self, relationship=None, subject_id=None, object_id=None, predicate=None):
+        """
+        Given some Relationship, insert it.
+
+        This can create an entry from either an existing relationship object
+        or from its components (subject id, object id, predicate). If all four
+        are provided, the Relationship will be used. A Relationship already
+        held is left be.
+
+        :param subject_id: The id of the subject.
+        :param object_id: The id of the object.
+        :param predicate: A string describing the relationship.
+        :param relationship: A Relationship object to build entry from.
+        """
+        subj, obj, pred = self._validate_insert(relationship=relationship,
+                                                subject_id=subject_id,
+                                                object_id=object_id,
+                                                predicate=predicate)
+        self.store.add_relationship(subj, pred, obj)
+
+    def insert_many(self, list_to_insert):
+        """
+        Given a list of Relationships, insert them.
+
+        Every Relationship is validated before any are inserted. Those
+        already held (including repeats within the list) are skipped.
+
+        :param list_to_insert: A list of Relationships to insert
+
+        :raises ValueError: if any entry isn't a valid Relationship, in which
+                            case none are inserted.
+        """
+        LOGGER.debug('Inserting %i relationships.', len(list_to_insert))
+        validated = [self._validate_insert(subject_id=relationship.subject_id,
+                                           object_id=relationship.object_id,
+                                           predicate=relationship.predicate)
+                     for relationship in list_to_insert]
+        for subj, obj, pred in validated:
+            self.store.add_relationship(subj, pred, obj)
+
+    @staticmethod
+    def _build(triples):
+        """
+        Build Relationships from (subject_id, predicate, object_id) triples.
+
+        :param triples: An iterable of triples.
+
+        :returns: A list of Relationships, sorted by subject, predicate, then object.
+        """
+        return [model.Relationship(subject_id=subj, predicate=pred, object_id=obj)
+                for subj, pred, obj in sorted(triples)]
+
+    def _get_given_subject_id(self, subject_id, predicate=None):
+        """
+        Given record id, return all Relationships with that id as subject.
+
+        :param subject_id: The subject_id of Relationships to return
+        :param predicate: Optionally, the Relationship predicate to filter on.
+
+        :returns: A list of Relationships fitting the criteria.
+        """
+        LOGGER.debug('Getting relationships related to subject_id=%s and '
+                     'predicate=%s.', subject_id, predicate)
+        return self._build((subject_id, pred, obj)
+                           for pred, obj in self.store.subjects.get(subject_id, ())
+                           if predicate is None or pred == predicate)
+
+    def _get_given_object_id(self, object_id, predicate=None):
+        """
+        Given record id, return all Relationships with that id as object.
+
+        :param object_id: The object_id of Relationships to return
+        :param predicate: Optionally, the Relationship predicate to filter on.
+
+        :returns: A list of Relationships fitting the criteria.
+        """
+        LOGGER.debug('Getting relationships related to object_id=%s and '
+                     'predicate=%s.', object_id, predicate)
+        return self._build((subj, pred, object_id)
+                           for pred, subj in self.store.objects.get(object_id, ())
+                           if predicate is None or pred == predicate)
+
+    def _get_given_predicate(self, predicate):
+        """
+        Given predicate, return all Relationships with that predicate.
+
+        :param predicate: The predicate describing Relationships to return
+
+        :returns: A list of Relationships fitting the criteria
+        """
+        LOGGER.debug('Getting relationships related to predicate=%s.', predicate)
+        return self._build((subj, predicate, obj)
+                           for subj, obj in self.store.predicates.get(predicate, ()))
+
+    def get_all(self):
+        """
+        Return every Relationship held.
+
+        :returns: A generator of Relationships, sorted by subject.
+        """
+        LOGGER.debug('Getting all relationships.')
+        for relationship in self._build((subj, pred, obj)
+                                        for subj, pairs in six.iteritems(self.store.subjects)
+                                        for pred, obj in pairs):
+            yield relationship
+
+    def count(self):
+        """Return how many Relationships are held."""
+        return sum(len(pairs) for pairs in six.itervalues(self.store.subjects))
+
+
+class RunDAO(dao.RunDAO):
+    """The DAO responsible for handling Runs (a Record subtype) held in memory."""
+
+    # pylint: disable=arguments-differ
+    # Args differ to match the SQL and Cassandra backends
+    def insert(self, run, force_overwrite=False, trusted=False):
+        """
+        Given a Run, insert it.
+
+        :param run: A Run to insert
+        :param force_overwrite: Whether to overwrite a preexisting Run that
+                                shares this Run's id.
+        :param trusted: Whether the Run is known to be valid. See
+                        RecordDAO.insert().
+        """
+        self.record_dao.insert_many([run], force_overwrite=force_overwrite, trusted=trusted)
+
+    # pylint: disable=arguments-differ
+    # Args differ for the same reason as insert()
+    def insert_many(self, list_to_insert, force_overwrite=False, trusted=False):
+        """
+        Given a list of Runs, insert them.
+
+        See RecordDAO.insert_many(); a Run's metadata is kept in its raw.
+
+        :param list_to_insert: A list of Runs to insert
+        :param force_overwrite: Whether to overwrite preexisting Runs that
+                                share ids with those given.
+        :param trusted: Whether the Runs are known to be valid. See
+                        RecordDAO.insert().
+        """
+        self.record_dao.insert_many(list_to_insert, force_overwrite=force_overwrite,
+                                    trusted=trusted)
+
+    def get(self, id, data_fields=None, include_files=False):
+        """
+        Given a run's id, return the matching Run.
+
+        :param id: The id of some run
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Run. See RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: The matching Run.
+
+        :raises ValueError: if there's no such Run.
+        """
+        LOGGER.debug('Getting run with id: %s', id)
+        run = model.generate_run_from_json(
+            codec.decode_raw(self.record_dao._stored_raw(id)))  # pylint: disable=protected-access
+        if data_fields is not None:
+            return model.project_record(run, data_fields, include_files)
+        return run
+
+    def delete(self, id):
+        """
+        Given the id of a Run, delete it, its data, and its Relationships.
+
+        :param id: The id of the Run to delete.
+        """
+        self.record_dao.delete(id)
+
+    def delete_many(self, ids_to_delete):
+        """
+        Given a list of Run ids, delete them, their data, and their Relationships.
+
+        :param ids_to_delete: A list of the ids of Runs to delete.
+        """
+        self.record_dao.delete_many(ids_to_delete)
+
+    # pylint: disable=arguments-differ
+    # Args differ for the same reason as insert()
+    def replace_many(self, list_to_replace, trusted=False):
+        """
+        Given a list of Runs already stored, replace their contents.
+
+        :param list_to_replace: A list of Runs to replace the stored ones with
+        :param trusted: Whether the Runs are known to be valid. See
+                        RecordDAO.insert().
+        """
+        self.insert_many(list_to_replace, force_overwrite=True, trusted=trusted)
+
+
+class DAOFactory(dao.DAOFactory):
+    """
+    Build DAOs for interacting with Mnoda-based objects held in memory.
+
+    Every DAO the factory creates shares its contents, which last as long as
+    the factory does. They can be loaded from (and saved to) a Mnoda JSON
+    file or any other backend, ex::
+
+        factory = sina.datastores.memory.DAOFactory()
+        factory.load_from(sina.datastores.sql.DAOFactory("somefile.sqlite"))
+        ...
+        factory.save_json("somefile.json")
+
+    Like a SQL factory without pooling, it should only be used from one thread.
+    """
+
+    def __init__(self, raw_compression=None):
+        """
+        Initialize an empty factory.
+
+        :param raw_compression: How to compress the raws of Records inserted,
+                                one of codec.RAW_COMPRESSIONS, or None not to.
+                                Trades speed for memory.
+
+        :raises ValueError: for an unknown raw_compression.
+        :raises ImportError: for lz4 compression without lz4.
+        """
+        codec.check_raw_compression(raw_compression)
+        self.raw_compression = raw_compression
+        self.store = _Store()
+        # Statistics are kept complete from the start, as for a new SQL database
+        self.statistics = planner.StatisticsCatalog(complete=True)
+
+    def create_record_dao(self):
+        """
+        Create a DAO for interacting with records.
+
+        :returns: a RecordDAO
+        """
+        return RecordDAO(self.store, statistics=self.statistics,
+                         raw_compression=self.raw_compression)
+
+    def create_relationship_dao(self):
+        """
+        Create a DAO for interacting with relationships.
+
+        :returns: a RelationshipDAO
+        """
+        return RelationshipDAO(self.store)
+
+    def create_run_dao(self):
+        """
+        Create a DAO for interacting with runs.
+
+        :returns: a RunDAO
+        """
+        return RunDAO(record_dao=self.create_record_dao())
+
+    def load_json(self, json_path, trusted=False, validate=False):
+        """
+        Import a Mnoda JSON document.
+
+        Just like importing into any other backend; see utils.import_json().
+
+        :param json_path: The filepath to the json to import.
+        :param trusted: Whether the document is known to be valid.
+        :param validate: Whether to check the document against the Mnoda
+                         schema before importing it.
+
+        :returns: A dict of the number of Records inserted, updated, and skipped.
+        """
+        return utils.import_json(self, json_path, trusted=trusted, validate=validate)
+
+    def save_json(self, json_path):
+        """
+        Write everything held to a Mnoda JSON document.
+
+        Records are written in order of their ids, followed by every
+        Relationship. The document can be read back with load_json() or
+        ingested into any other backend.
+
+        :param json_path: The filepath to write to.
+        """
+        LOGGER.info('Saving %i records to %s.', len(self.store.raws), json_path)
+        document = {"records": [codec.decode_raw(self.store.raws[id])
+                                for id in sorted(self.store.raws)],
+                    "relationships": [{"subject": relationship.subject_id,
+                                       "predicate": relationship.predicate,
+                                       "object": relationship.object_id}
+                                      for relationship
+                                      in self.create_relationship_dao().get_all()]}
+        with open(json_path, 'wb') as json_file:
+            json_file.write(codec.dumps_bytes(document))
+
+    def load_from(self, factory):
+        """
+        Copy everything from another backend, ex: an existing SQL database.
+
+        Loading is incremental, as for utils.import_json().
+
+        :param factory: The DAOFactory of the backend to copy from.
+
+        :returns: A dict of the number of Records inserted, updated, and skipped.
+        """
+        return copy_contents(factory, self)
+
+    def save_to(self, factory):
+        """
+        Copy everything held into another backend, ex: a SQL database.
+
+        Saving is incremental, as for utils.import_json(): Records the backend
+        already holds are only rewritten if they've changed.
+
+        :param factory: The DAOFactory of the backend to copy to.
+
+        :returns: A dict of the number of Records inserted, updated, and skipped.
+        """
+        return copy_contents(self, factory)
+
+    def __repr__(self):
+        """Return a string representation of a memory DAOFactory."""
+        return 'Memory DAOFactory <records={}>'.format(len(self.store.raws))
+
+
+def copy_contents(source, target):
+    """
+    Copy every Record and Relationship from one backend to another.
+
+    Runs are inserted as Runs. As for utils.import_json(), Records the target
+    already holds are compared by content hash: unchanged ones are skipped,
+    and changed ones have their contents replaced. Relationships already
+    present are left be.
+
+    :param source: The DAOFactory of the backend to copy from.
+    :param target: The DAOFactory of the backend to copy to.
+
+    :returns: A dict of the number of Records inserted, updated, and skipped.
+    """
+    LOGGER.info('Copying the contents of %s to %s.', source, target)
+    source_dao = source.create_record_dao()
+    target_daos = {"record": target.create_record_dao(), "run": target.create_run_dao()}
+    summary = dict.fromkeys(utils.INGEST_OUTCOMES, 0)
+    # Gathered up front, so no cursor is left open as we read and write
+    ids = list(source_dao.get_all(ids_only=True))
+    for id_chunk in utils.chunked(ids, COPY_CHUNK_SIZE):
+        stored_hashes = target_daos["record"].get_content_hashes(id_chunk)
+        new = {"record": [], "run": []}
+        changed = {"record": [], "run": []}
+        for record in source_dao.get_many(id_chunk):
+            # Records typed "run" without a Run's metadata can only be copied as Records
+            kind = "run" if record.type == "run" and "application" in record.raw else "record"
+            if kind == "run":
+                record = model.convert_record_to_run(record)
+            if record.id not in stored_hashes:
+                new[kind].append(record)
+            elif stored_hashes[record.id] != record.content_hash():
+                changed[kind].append(record)
+            else:
+                summary['skipped'] += 1
+        for kind, target_dao in six.iteritems(target_daos):
+            target_dao.insert_many(new[kind], trusted=True)
+            target_dao.replace_many(changed[kind], trusted=True)
+            summary['inserted'] += len(new[kind])
+            summary['updated'] += len(changed[kind])
+    target.create_relationship_dao().insert_many(
+        list(source.create_relationship_dao().get_all()))
+    return summary
@@ -0,0 +1,1290 @@
+"""
+Contains a read-only, memory-mapped snapshot backend.
+
+Large archives that are mostly read can be exported from another backend
+(SQL or Cassandra) into a snapshot: a directory of NumPy arrays that's
+memory-mapped rather than loaded, so opening one is near-instant and reads
+only touch the pages they need. Within a snapshot, each Record is identified
+by its position in the sorted list of ids.
+
+* Each datum name has its own columns: the positions of the Records that
+  have it, their values, and those values sorted alongside the Records'
+  positions, so range queries are binary searches.
+* Strings (string data and string list entries) are dictionary-encoded
+  against one sorted dictionary, so they're searched as ranges of codes.
+  Units, tags, and mimetypes are dictionary-encoded as well.
+* List data are flattened, with an offset per Record into the entries.
+* Raws are concatenated into one file, found through an id -> offset table.
+* Relationships are sorted by subject, and again by object.
+
+Statistics for the query planner are gathered while building, so a snapshot
+can plan data queries as soon as it's opened.
+
+Snapshots are read-only: to pick up changes, build a new one. See
+create_snapshot().
+
+Requires numpy.
+"""
+import os
+import re
+import json
+import shutil
+import logging
+import numbers
+import tempfile
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from functools import reduce
+
+import six
+
+try:
+    import numpy as np
+    NUMPY_PRESENT = True
+except ImportError:
+    NUMPY_PRESENT = False
+
+import sina.codec as codec
+import sina.dao as dao
+import sina.model as model
+import sina.planner as planner
+import sina.utils as utils
+
+LOGGER = logging.getLogger(__name__)
+
+# Disable pylint checks due to ubiquitous use of id, type, min, and max
+# pylint: disable=invalid-name,redefined-builtin
+
+# Bumped whenever the layout changes, so old snapshots are refused
+SNAPSHOT_VERSION = 1
+# Metadata file within a snapshot
+META_FILENAME = "meta.json"
+# File within a snapshot holding every raw, back to back
+RAWS_FILENAME = "raws.bin"
+# Stands in for missing units, tags, and mimetypes in dictionary-encoded columns
+NO_CODE = -1
+# How many Records to read from the source backend at a time while building
+BUILD_CHUNK_SIZE = 1000
+
+
+def create_snapshot(factory, path, raw_compression=None):
+    """
+    Build a snapshot of everything in a backend.
+
+    Every Record (and its raw, data, files, and content hash) and every
+    Relationship is read from the factory's backend. The snapshot is written
+    to a fresh directory alongside path and then moved into place, replacing
+    any snapshot already there.
+
+    :param factory: The DAOFactory of the backend to take a snapshot of.
+    :param path: The directory to write the snapshot to.
+    :param raw_compression: How to compress the raws in the snapshot, one of
+                            codec.RAW_COMPRESSIONS, or None not to.
+
+    :returns: A DAOFactory for the new snapshot.
+
+    :raises ValueError: if path exists but isn't a snapshot, or for an
+                        unknown raw_compression.
+    :raises ImportError: if numpy isn't available.
+    """
+    _check_numpy()
+    codec.check_raw_compression(raw_compression)
+    if os.path.exists(path) and not os.path.isfile(os.path.join(path, META_FILENAME)):
+        msg = 'Will not replace {}, which is not a snapshot.'.format(path)
+        LOGGER.error(msg)
+        raise ValueError(msg)
+    LOGGER.info('Building snapshot of %s at %s.', factory, path)
+    parent = os.path.dirname(os.path.abspath(path))
+    staging = tempfile.mkdtemp(dir=parent, prefix='.snapshot_')
+    try:
+        builder = _SnapshotBuilder(staging, raw_compression)
+        record_dao = factory.create_record_dao()
+        for id_chunk in utils.chunked(sorted(record_dao.get_all(ids_only=True)),
+                                      BUILD_CHUNK_SIZE):
+            hashes = record_dao.get_content_hashes(id_chunk)
+            for record in record_dao.get_many(id_chunk):
+                builder.add_record(record, hashes.get(record.id))
+        builder.add_relationships(factory.create_relationship_dao().get_all())
+        builder.finish()
+    except Exception:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.rename(staging, path)
+    return DAOFactory(path)
+
+
+def _check_numpy():
+    """
+    Check that numpy, which snapshots are made of, is available.
+
+    :raises ImportError: if it isn't.
+    """
+    if not NUMPY_PRESENT:
+        msg = 'Snapshots require numpy, which could not be imported.'
+        LOGGER.error(msg)
+        raise ImportError(msg)
+
+
+def _read_only(action):
+    """
+    Refuse to change a snapshot.
+
+    :param action: What was attempted, ex: "insert Records".
+
+    :raises NotImplementedError: always.
+    """
+    msg = 'Snapshots are read-only; cannot {}. Build a new snapshot instead.'.format(action)
+    LOGGER.error(msg)
+    raise NotImplementedError(msg)
+
+
+def _load(path, name):
+    """
+    Memory-map an array saved in a snapshot.
+
+    :param path: The snapshot's directory.
+    :param name: The array's name, without the .npy extension.
+
+    :returns: The array.
+    """
+    return np.load(os.path.join(path, name + ".npy"), mmap_mode='r')
+
+
+def _save(path, name, values, dtype):
+    """
+    Save an array to a snapshot.
+
+    :param path: The snapshot's directory.
+    :param name: The array's name, without the .npy extension.
+    :param values: The array, or anything numpy can build one from.
+    :param dtype: The type to store the array's entries as.
+    """
+    np.save(os.path.join(path, name + ".npy"), np.asarray(values, dtype=dtype))
+
+
+def _save_strings(path, name, strings):
+    """
+    Save a list of strings to a snapshot, for reading with _StringTable.
+
+    :param path: The snapshot's directory.
+    :param name: The name to store the strings under.
+    :param strings: The list of strings.
+    """
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(entry) for entry in encoded], out=offsets[1:])
+    _save(path, name + "_bytes", bytearray(b''.join(encoded)), np.uint8)
+    _save(path, name + "_offsets", offsets, np.int64)
+
+
+class _StringTable(object):
+    """A memory-mapped list of strings, stored as UTF-8 bytes plus offsets."""
+
+    def __init__(self, path, name):
+        """
+        Open strings saved by _save_strings().
+
+        :param path: The snapshot's directory.
+        :param name: The name the strings were saved under.
+        """
+        self._bytes = _load(path, name + "_bytes")
+        self._offsets = _load(path, name + "_offsets")
+
+    def __len__(self):
+        """Return the number of strings."""
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        """Return the string at an index."""
+        return (self._bytes[self._offsets[index]:self._offsets[index + 1]]
+                .tobytes().decode('utf-8'))
+
+    def find(self, value):
+        """
+        Find a string in the table, which must be sorted.
+
+        :param value: The string to find.
+
+        :returns: Its index, or None if it isn't there.
+        """
+        index = bisect_left(self, value)
+        if index < len(self) and self[index] == value:
+            return index
+        return None
+
+
+class _Permuted(object):
+    """A read-only view of a sequence in another order, for bisecting."""
+
+    def __init__(self, sequence, order):
+        """
+        Create the view.
+
+        :param sequence: The sequence to view.
+        :param order: An array of indices into sequence, in the order to view.
+        """
+        self._sequence = sequence
+        self._order = order
+
+    def __len__(self):
+        """Return the length of the sequence."""
+        return len(self._order)
+
+    def __getitem__(self, index):
+        """Return the index-th entry in the view's order."""
+        return self._sequence[self._order[index]]
+
+
+class _Column(object):
+    """The arrays holding one datum name of one kind."""
+
+    def __init__(self, snapshot, name, kind, stem):
+        """
+        Memory-map a column's arrays.
+
+        :param snapshot: The _Snapshot the column belongs to.
+        :param name: The name of the datum.
+        :param kind: The kind of datum, one of planner.KINDS.
+        :param stem: The prefix the column's arrays are saved under.
+        """
+        path = snapshot.path
+        self.snapshot = snapshot
+        self.name = name
+        self.kind = kind
+        self.is_list = kind.endswith("list")
+        self.is_string = kind.startswith("string")
+        # The positions of the Records having the datum, ascending
+        self.records = _load(path, stem + "_records")
+        # Their values (string codes for strings). For lists, every entry,
+        # those of records[i] running from offsets[i] to offsets[i + 1].
+        self.values = _load(path, stem + "_values")
+        self.offsets = _load(path, stem + "_offsets") if self.is_list else None
+        self.units = _load(path, stem + "_units")
+        self.tags = _load(path, stem + "_tags")
+        # The values sorted, and the position of the Record each belongs to
+        self.sorted_values = _load(path, stem + "_sorted_values")
+        self.sorted_records = _load(path, stem + "_sorted_records")
+
+    def find(self, position):
+        """
+        Find a Record in the column.
+
+        :param position: The Record's position.
+
+        :returns: The Record's index in the column, or None if it hasn't the datum.
+        """
+        index = int(np.searchsorted(self.records, position))
+        if index < len(self.records) and self.records[index] == position:
+            return index
+        return None
+
+    def datum(self, index):
+        """
+        Rebuild a datum.
+
+        :param index: The index in the column of the Record whose datum to rebuild.
+
+        :returns: The datum, as in a Record's data.
+        """
+        if self.is_list:
+            values = self.values[self.offsets[index]:self.offsets[index + 1]]
+            value = ([self.snapshot.strings[code] for code in values] if self.is_string
+                     else values.tolist())
+        else:
+            value = (self.snapshot.strings[self.values[index]] if self.is_string
+                     else self.values[index].item())
+        datum = {"value": value}
+        if self.units[index] != NO_CODE:
+            datum["units"] = self.snapshot.units[self.units[index]]
+        if self.tags[index] != NO_CODE:
+            datum["tags"] = list(self.snapshot.tags[self.tags[index]])
+        return datum
+
+    def positions_in(self, criterion):
+        """
+        Find the Records with a value (or, for lists, an entry) meeting a criterion.
+
+        :param criterion: A single value or DataRange.
+
+        :returns: A sorted array of the Records' positions.
+        """
+        if not isinstance(criterion, utils.DataRange):
+            criterion = utils.DataRange(criterion, criterion, max_inclusive=True)
+        low, high = criterion.min, criterion.max
+        low_side = 'left' if criterion.min_inclusive else 'right'
+        high_side = 'right' if criterion.max_inclusive else 'left'
+        if self.is_string:
+            # Match the codes of the strings within the range instead
+            strings = self.snapshot.strings
+            low = (None if low is None
+                   else (bisect_left if low_side == 'left' else bisect_right)(strings, low))
+            high = (None if high is None
+                    else (bisect_left if high_side == 'left' else bisect_right)(strings, high))
+            low_side = high_side = 'left'
+        start = (0 if low is None
+                 else int(np.searchsorted(self.sorted_values, low, side=low_side)))
+        end = (len(self.sorted_values) if high is None
+               else int(np.searchsorted(self.sorted_values, high, side=high_side)))
+        return np.unique(self.sorted_records[start:max(start, end)])
+
+    def statistics(self):
+        """
+        Summarize the column for the query planner.
+
+        :returns: The column's planner.DatumStatistics.
+        """
+        values = self.sorted_values
+        stats = planner.DatumStatistics(
+            self.name, self.kind, count=len(self.records),
+            entries=len(values) if self.is_list else None,
+            distinct=int(np.count_nonzero(np.diff(values))) + 1 if len(values) else 0)
+        if len(values):
+            stats.min, stats.max = values[0].item(), values[-1].item()
+            if self.is_string:
+                stats.min = self.snapshot.strings[stats.min]
+                stats.max = self.snapshot.strings[stats.max]
+            else:
+                # Bucketing mirrors planner.DatumStatistics.bucket_index()
+                stats.histogram = [0] * planner.HISTOGRAM_BUCKETS
+                if stats.max == stats.min:
+                    stats.histogram[0] = len(values)
+                else:
+                    buckets = ((values - stats.min) * planner.HISTOGRAM_BUCKETS
+                               / (stats.max - stats.min)).astype(np.int64)
+                    stats.histogram = np.bincount(
+                        np.clip(buckets, 0, planner.HISTOGRAM_BUCKETS - 1),
+                        minlength=planner.HISTOGRAM_BUCKETS).tolist()
+        return stats
+
+
+class _Snapshot(object):
+    """An open snapshot, shared by the DAOs of one factory."""
+
+    def __init__(self, path):
+        """
+        Open the snapshot at a path.
+
+        Only the metadata is read; arrays are memory-mapped, and each datum's
+        columns only when first used.
+
+        :param path: The snapshot's directory.
+
+        :raises ValueError: if there's no snapshot there, or it's from an
+                            incompatible version of Sina.
+        :raises ImportError: if numpy isn't available.
+        """
+        _check_numpy()
+        self.path = path
+        meta_path = os.path.join(path, META_FILENAME)
+        if not os.path.isfile(meta_path):
+            msg = 'No snapshot found at {}.'.format(path)
+            LOGGER.error(msg)
+            raise ValueError(msg)
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+        if meta.get("version") != SNAPSHOT_VERSION:
+            msg = ('Snapshot at {} has version {}, but this version of Sina reads {}. '
+                   'Build it again.'.format(path, meta.get("version"), SNAPSHOT_VERSION))
+            LOGGER.error(msg)
+            raise ValueError(msg)
+        self.type_names = meta["types"]
+        self.units = meta["units"]
+        self.tags = meta["tags"]
+        self.mimetypes = meta["mimetypes"]
+        self.predicates = meta["predicates"]
+        self.column_names = {kind: {name: index for index, name in enumerate(names)}
+                             for kind, names in six.iteritems(meta["data"])}
+        self.statistics = planner.StatisticsCatalog()
+        self.statistics.replace((planner.DatumStatistics(**stats)
+                                 for stats in meta["statistics"]), complete=True)
+        self._columns = {}
+        self.ids = _StringTable(path, "ids")
+        self.types = _load(path, "types")
+        self.hashes = _load(path, "hashes")
+        self.raw_offsets = _load(path, "raw_offsets")
+        raws_path = os.path.join(path, RAWS_FILENAME)
+        # An empty file can't be memory-mapped
+        self.raws = (np.memmap(raws_path, dtype=np.uint8, mode='r')
+                     if os.path.getsize(raws_path) else np.zeros(0, dtype=np.uint8))
+        self.strings = _StringTable(path, "strings")
+        self.file_records = _load(path, "file_records")
+        self.file_uris = _StringTable(path, "file_uris")
+        self.file_mimetypes = _load(path, "file_mimetypes")
+        self.file_tags = _load(path, "file_tags")
+        self.file_uri_order = _load(path, "file_uri_order")
+        self.nodes = _StringTable(path, "nodes")
+        self.relationships = {name: _load(path, "relationship_" + name)
+                              for name in ("subjects", "predicates", "objects",
+                                           "object_order", "sorted_objects")}
+
+    def __repr__(self):
+        """Return a comprehensive (debug) representation of a _Snapshot."""
+        return '_Snapshot <path={}>'.format(self.path)
+
+    def column(self, kind, name):
+        """
+        Return the column holding one datum name of one kind.
+
+        :param kind: The kind of datum, one of planner.KINDS.
+        :param name: The name of the datum.
+
+        :returns: The _Column, or None if no Record has such a datum.
+        """
+        key = (kind, name)
+        if key not in self._columns:
+            index = self.column_names[kind].get(name)
+            self._columns[key] = (None if index is None
+                                  else _Column(self, name, kind, "{}_{}".format(kind, index)))
+        return self._columns[key]
+
+    def columns(self):
+        """Return every column in the snapshot."""
+        return [self.column(kind, name) for kind in planner.KINDS
+                for name in self.column_names[kind]]
+
+    def position(self, id):
+        """
+        Find a Record's position.
+
+        :param id: The Record's id.
+
+        :returns: The position.
+
+        :raises ValueError: if there's no such Record.
+        """
+        position = self.ids.find(id)
+        if position is None:
+            msg = 'No Record found with id={}'.format(id)
+            LOGGER.error(msg)
+            raise ValueError(msg)
+        return position
+
+    def positions(self, ids):
+        """
+        Find the positions of whichever of some ids name Records.
+
+        :param ids: An iterable of ids.
+
+        :returns: A sorted array of positions, without duplicates.
+        """
+        found = (self.ids.find(id) for id in ids)
+        return np.unique(np.fromiter((position for position in found if position is not None),
+                                     dtype=np.int64))
+
+    def raw(self, position):
+        """
+        Read a Record's raw.
+
+        :param position: The Record's position.
+
+        :returns: The raw, decoded.
+        """
+        stored = self.raws[self.raw_offsets[position]:self.raw_offsets[position + 1]]
+        return codec.decode_raw(stored.tobytes())
+
+    def type_of(self, position):
+        """Return the type of the Record at a position."""
+        return self.type_names[self.types[position]]
+
+    def data(self, position, names):
+        """
+        Read some of a Record's data from the columns.
+
+        :param position: The Record's position.
+        :param names: The names of the data to read.
+
+        :returns: A dict of names to data, for those the Record has.
+        """
+        data = {}
+        for name in names:
+            for kind in planner.KINDS:
+                column = self.column(kind, name)
+                index = column.find(position) if column is not None else None
+                if index is not None:
+                    data[name] = column.datum(index)
+                    break
+        return data
+
+    def files(self, position):
+        """
+        Read a Record's files.
+
+        :param position: The Record's position.
+
+        :returns: A list of the files, in the order the Record listed them.
+                  As in a Record, mimetype and tags are only given if set.
+        """
+        start = int(np.searchsorted(self.file_records, position, side='left'))
+        end = int(np.searchsorted(self.file_records, position, side='right'))
+        files = []
+        for index in range(start, end):
+            entry = {"uri": self.file_uris[index]}
+            if self.file_mimetypes[index] != NO_CODE:
+                entry["mimetype"] = self.mimetypes[self.file_mimetypes[index]]
+            if self.file_tags[index] != NO_CODE:
+                entry["tags"] = list(self.tags[self.file_tags[index]])
+            files.append(entry)
+        return files
+
+
+class _SnapshotBuilder(object):
+    """Gathers a backend's contents and writes them out as a snapshot."""
+
+    def __init__(self, path, raw_compression=None):
+        """
+        Start building a snapshot.
+
+        :param path: The (empty) directory to write the snapshot to.
+        :param raw_compression: How to compress raws, as for create_snapshot().
+        """
+        self.path = path
+        self.raw_compression = raw_compression
+        self.ids = []
+        self.types = array('i')
+        self.hashes = []
+        # A list, as Python 2's array has no 64-bit typecode
+        self.raw_offsets = [0]
+        self._raws_file = open(os.path.join(path, RAWS_FILENAME), 'wb')
+        # Dictionaries of what's encoded as codes, each value -> code
+        self.type_codes = {}
+        self.unit_codes = {}
+        self.tag_codes = {}
+        self.mimetype_codes = {}
+        self.predicate_codes = {}
+        # (kind, name) -> lists of records, values, units, tags, and, for
+        # lists, entry counts
+        self.columns = defaultdict(lambda: defaultdict(list))
+        self.files = []
+        self.relationships = []
+
+    @staticmethod
+    def _code(codes, value):
+        """Return the code for a value, assigning one if needed."""
+        if value is None:
+            return NO_CODE
+        return codes.setdefault(value, len(codes))
+
+    def _tags_code(self, tags):
+        """Return the code for a list of tags, assigning one if needed."""
+        return NO_CODE if tags is None else self._code(self.tag_codes, json.dumps(tags))
+
+    def add_record(self, record, content_hash=None):
+        """
+        Add a Record. Records must be added in order of their ids.
+
+        :param record: The Record.
+        :param content_hash: The Record's stored content hash, if any.
+        """
+        position = len(self.ids)
+        self.ids.append(record.id)
+        self.types.append(self._code(self.type_codes, record.type))
+        self.hashes.append(content_hash or "")
+        stored = codec.encode_raw(codec.canonical_dumps(record.raw), self.raw_compression)
+        stored = stored.encode('utf-8') if isinstance(stored, six.text_type) else stored
+        self._raws_file.write(stored)
+        self.raw_offsets.append(self.raw_offsets[-1] + len(stored))
+        for name, datum in six.iteritems(record.data):
+            kind = _kind_of(datum["value"])
+            if kind is None:
+                continue
+            column = self.columns[(kind, name)]
+            column["records"].append(position)
+            if kind.endswith("list"):
+                column["values"].extend(datum["value"])
+                column["counts"].append(len(datum["value"]))
+            else:
+                column["values"].append(datum["value"])
+            column["units"].append(self._code(self.unit_codes, datum.get("units")))
+            column["tags"].append(self._tags_code(datum.get("tags")))
+        for entry in record.files:
+            self.files.append((position, entry["uri"],
+                               self._code(self.mimetype_codes, entry.get("mimetype")),
+                               self._tags_code(entry.get("tags"))))
+
+    def add_relationships(self, relationships):
+        """
+        Add Relationships.
+
+        :param relationships: An iterable of Relationships.
+        """
+        for relationship in relationships:
+            self.relationships.append((relationship.subject_id, relationship.predicate,
+                                       relationship.object_id))
+
+    def finish(self):
+        """Write out everything added."""
+        self._raws_file.close()
+        path = self.path
+        _save_strings(path, "ids", self.ids)
+        _save(path, "types", self.types, np.int32)
+        _save(path, "hashes", [content_hash.encode('ascii') for content_hash in self.hashes],
+              'S64')
+        _save(path, "raw_offsets", self.raw_offsets, np.int64)
+        strings = sorted(set(value for (kind, _), column in six.iteritems(self.columns)
+                             if kind.startswith("string") for value in column["values"]))
+        _save_strings(path, "strings", strings)
+        string_codes = {string: code for code, string in enumerate(strings)}
+        names = {kind: [] for kind in planner.KINDS}
+        for (kind, name), column in sorted(six.iteritems(self.columns)):
+            stem = "{}_{}".format(kind, len(names[kind]))
+            names[kind].append(name)
+            self._write_column(stem, kind, column, string_codes)
+        self._write_files()
+        self._write_relationships()
+        meta = {"version": SNAPSHOT_VERSION,
+                "types": _by_code(self.type_codes),
+                "units": _by_code(self.unit_codes),
+                "tags": [json.loads(tags) for tags in _by_code(self.tag_codes)],
+                "mimetypes": _by_code(self.mimetype_codes),
+                "predicates": _by_code(self.predicate_codes),
+                "data": names,
+                "statistics": []}
+        with open(os.path.join(path, META_FILENAME), 'w') as meta_file:
+            json.dump(meta, meta_file)
+        # Statistics are read back from the written columns
+        meta["statistics"] = [column.statistics().to_json()
+                              for column in _Snapshot(path).columns()]
+        with open(os.path.join(path, META_FILENAME), 'w') as meta_file:
+            json.dump(meta, meta_file)
+        LOGGER.debug('Wrote snapshot of %i records and %i relationships to %s.',
+                     len(self.ids), len(self.relationships), path)
+
+    def _write_column(self, stem, kind, column, string_codes):
+        """
+        Write the arrays holding one datum name of one kind.
+
+        :param stem: The prefix to save the arrays under.
+        :param kind: The kind of datum, one of planner.KINDS.
+        :param column: The column's lists, as gathered by add_record().
+        :param string_codes: The dictionary encoding strings, string -> code.
+        """
+        path = self.path
+        records = np.asarray(column["records"], dtype=np.int32)
+        if kind.startswith("string"):
+            values = np.asarray([string_codes[value] for value in column["values"]],
+                                dtype=np.int32)
+        else:
+            values = np.asarray(column["values"], dtype=np.float64)
+        entry_records = records
+        if kind.endswith("list"):
+            counts = np.asarray(column["counts"], dtype=np.int64)
+            offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            _save(path, stem + "_offsets", offsets, np.int64)
+            entry_records = np.repeat(records, counts)
+        order = np.argsort(values, kind='stable')
+        _save(path, stem + "_records", records, np.int32)
+        _save(path, stem + "_values", values, values.dtype)
+        _save(path, stem + "_units", column["units"], np.int32)
+        _save(path, stem + "_tags", column["tags"], np.int32)
+        _save(path, stem + "_sorted_values", values[order], values.dtype)
+        _save(path, stem + "_sorted_records", entry_records[order], np.int32)
+
+    def _write_files(self):
+        """Write the arrays holding every Record's files."""
+        path = self.path
+        _save(path, "file_records", [entry[0] for entry in self.files], np.int32)
+        uris = [entry[1] for entry in self.files]
+        _save_strings(path, "file_uris", uris)
+        _save(path, "file_mimetypes", [entry[2] for entry in self.files], np.int32)
+        _save(path, "file_tags", [entry[3] for entry in self.files], np.int32)
+        _save(path, "file_uri_order", sorted(range(len(uris)), key=uris.__getitem__), np.int64)
+
+    def _write_relationships(self):
+        """Write the arrays holding every Relationship, sorted by subject and by object."""
+        path = self.path
+        nodes = sorted(set(node for subject, _, object_id in self.relationships
+                           for node in (subject, object_id)))
+        _save_strings(path, "nodes", nodes)
+        node_codes = {node: code for code, node in enumerate(nodes)}
+        subjects = np.asarray([node_codes[entry[0]] for entry in self.relationships],
+                              dtype=np.int32)
+        predicates = np.asarray([self._code(self.predicate_codes, entry[1])
+                                 for entry in self.relationships], dtype=np.int32)
+        objects = np.asarray([node_codes[entry[2]] for entry in self.relationships],
+                             dtype=np.int32)
+        order = np.lexsort((objects, predicates, subjects))
+        subjects, predicates, objects = subjects[order], predicates[order], objects[order]
+        object_order = np.lexsort((subjects, predicates, objects))
+        _save(path, "relationship_subjects", subjects, np.int32)
+        _save(path, "relationship_predicates", predicates, np.int32)
+        _save(path, "relationship_objects", objects, np.int32)
+        _save(path, "relationship_object_order", object_order, np.int64)
+        _save(path, "relationship_sorted_objects", objects[object_order], np.int32)
+
+
+def _kind_of(value):
+    """
+    Find which kind of datum a value is stored as, as the SQL backend decides.
+
+    :param value: A datum's value.
+
+    :returns: One of planner.KINDS, or None for values that aren't queryable.
+    """
+    if isinstance(value, list):
+        if all(isinstance(entry, numbers.Real) for entry in value):
+            return "scalarlist"
+        if all(isinstance(entry, six.string_types) for entry in value):
+            return "stringlist"
+        return None
+    if isinstance(value, numbers.Real):
+        return "scalar"
+    if isinstance(value, six.string_types):
+        return "string"
+    return None
+
+
+def _by_code(codes):
+    """Turn a dictionary of value -> code into a list of values, indexed by code."""
+    return [value for value, _ in sorted(six.iteritems(codes), key=lambda item: item[1])]
+
+
+class RecordDAO(dao.RecordDAO):
+    """The DAO responsible for reading Records from a snapshot."""
+
+    def __init__(self, snapshot):
+        """
+        Initialize RecordDAO with the snapshot it reads.
+
+        :param snapshot: The factory's open _Snapshot.
+        """
+        self.snapshot = snapshot
+        self.statistics = snapshot.statistics
+
+    def get(self, id, data_fields=None, include_files=False):
+        """
+        Given an id, return the matching Record from the snapshot.
+
+        Given data_fields, only those data (and the files, if include_files)
+        are read, from their columns rather than the raw.
+
+        :param id: The id of the Record to return.
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Record. See dao.RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: The matching Record.
+
+        :raises ValueError: if there's no such Record.
+        """
+        LOGGER.debug('Getting record with id=%s', id)
+        position = self.snapshot.position(id)
+        if data_fields is None:
+            return model.generate_record_from_json(json_input=self.snapshot.raw(position))
+        return model.Record(id=id, type=self.snapshot.type_of(position),
+                            data=self.snapshot.data(position, data_fields),
+                            files=self.snapshot.files(position) if include_files else None)
+
+    def get_all(self, ids_only=False):
+        """
+        Return every Record in the snapshot.
+
+        :param ids_only: whether to return only the ids of the Records
+
+        :returns: A generator of all Records (or, if ids_only, their ids),
+                  sorted by id.
+        """
+        return self._from_positions(six.moves.range(len(self.snapshot.ids)), ids_only)
+
+    def _from_positions(self, positions, ids_only=False):
+        """
+        Turn Records' positions into the Records (or their ids).
+
+        :param positions: An iterable of positions.
+        :param ids_only: Whether to return ids rather than Records.
+
+        :returns: A generator of Records or ids, in the order of positions.
+        """
+        for position in positions:
+            id = self.snapshot.ids[position]
+            yield id if ids_only else self.get(id)
+
+    def get_all_of_type(self, type, ids_only=False):
+        """
+        Given a type of Record, return all Records of that type.
+
+        :param type: The type of Record to return, ex: run
+        :param ids_only: whether to return only the ids of matching Records
+
+        :returns: A generator of matching Records (or, if ids_only, their
+                  ids), sorted by id.
+        """
+        LOGGER.debug('Getting all records of type %s.', type)
+        if type not in self.snapshot.type_names:
+            return self._from_positions((), ids_only)
+        code = self.snapshot.type_names.index(type)
+        return self._from_positions(np.flatnonzero(self.snapshot.types == code), ids_only)
+
+    def get_given_document_uri(self, uri, accepted_ids_list=None, ids_only=False):
+        """
+        Return all Records associated with documents whose uris match some arg.
+
+        Supports the use of % as a wildcard character. A uri without one, or
+        with only a trailing one, is found by binary search.
+
+        :param uri: The uri to use as a search term, such as "foo.png"
+        :param accepted_ids_list: A list of ids to restrict the search to.
+                                  If not provided, all ids will be used.
+        :param ids_only: whether to return only the ids of matching Records
+
+        :returns: A generator of matching Records (or, if ids_only, their
+                  ids), without duplicates.
+        """
+        LOGGER.debug('Getting all records related to uri=%s.', uri)
+        snapshot = self.snapshot
+        by_uri = _Permuted(snapshot.file_uris, snapshot.file_uri_order)
+        if '%' not in uri[:-1]:
+            prefix = uri[:-1] if uri.endswith('%') else uri
+            start = bisect_left(by_uri, prefix)
+            end = start
+            if uri.endswith('%'):
+                while end < len(by_uri) and by_uri[end].startswith(prefix):
+                    end += 1
+            else:
+                end = bisect_right(by_uri, prefix)
+            matches = snapshot.file_uri_order[start:end]
+        else:
+            pattern = re.compile('.*'.join(re.escape(part) for part in uri.split('%')) + '$',
+                                 re.DOTALL)
+            matches = [index for index in six.moves.range(len(snapshot.file_uris))
+                       if pattern.match(snapshot.file_uris[index])]
+        positions = np.unique(snapshot.file_records[np.asarray(matches, dtype=np.int64)])
+        if accepted_ids_list is not None:
+            positions = np.intersect1d(positions, snapshot.positions(accepted_ids_list))
+        return self._from_positions(positions, ids_only)
+
+    def data_query(self, **kwargs):
+        """
+        Return the ids of all Records whose data fulfill some criteria.
+
+        Criteria are given as for dao.RecordDAO.data_query(). Each is a binary
+        search of its datum's sorted column.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                       must fulfill.
+
+        :returns: A generator of Record ids that fulfill all criteria, sorted.
+
+        :raises ValueError: if not supplied at least one criterion or given
+                            a criterion it does not support
+        """
+        LOGGER.debug('Finding all records fulfilling criteria: %s', kwargs.items())
+        return planner.execute_plan(self.explain_query(**kwargs), self._run_plan_step)
+
+    def explain_query(self, **kwargs):
+        """
+        Return the plan data_query() would follow for some criteria.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                       must fulfill, as for data_query().
+
+        :returns: A planner.QueryPlan.
+
+        :raises ValueError: if not supplied at least one criterion or given
+                            a criterion it does not support
+        """
+        return planner.build_plan(self.statistics, kwargs)
+
+    def _run_plan_step(self, step, accepted_ids=None):
+        """
+        Return the ids of the Records fulfilling one step of a QueryPlan.
+
+        :param step: The planner.PlanStep to run.
+        :param accepted_ids: If not None, a list of ids to restrict the step to.
+
+        :returns: A generator of matching ids, in sorted order.
+        """
+        column = self.snapshot.column(step.kind, step.name)
+        if column is None:
+            positions = np.zeros(0, dtype=np.int64)
+        elif not step.kind.endswith("list"):
+            positions = column.positions_in(step.criterion)
+        else:
+            positions = _list_positions(column, step.criterion)
+        if accepted_ids is not None:
+            positions = np.intersect1d(positions, self.snapshot.positions(accepted_ids))
+        return self._from_positions(positions, ids_only=True)
+
+    def analyze(self):
+        """
+        Collect fresh statistics about the snapshot's data.
+
+        Snapshots gather statistics as they're built, so this is only needed
+        if they've been replaced.
+
+        :returns: The updated planner.StatisticsCatalog.
+        """
+        self.statistics.replace([column.statistics() for column in self.snapshot.columns()],
+                                complete=True)
+        return self.statistics
+
+    def get_scalars(self, id, scalar_names):
+        """
+        LEGACY: retrieve scalars for a given record id.
+
+        :param id: The record id to find scalars for
+        :param scalar_names: A list of the names of scalars to return
+
+        :return: A dict of scalars matching the Mnoda data specification
+        """
+        LOGGER.debug('Getting scalars=%s for record id=%s', scalar_names, id)
+        position = self.snapshot.ids.find(id)
+        scalars = {}
+        for name in scalar_names if position is not None else ():
+            column = self.snapshot.column("scalar", name)
+            index = column.find(position) if column is not None else None
+            if index is not None:
+                datum = column.datum(index)
+                scalars[name] = {'value': datum['value'],
+                                 'units': datum.get('units'),
+                                 'tags': datum.get('tags')}
+        return scalars
+
+    def get_data_for_records(self, id_list, data_list):
+        """
+        Retrieve a subset of data for Records in id_list.
+
+        See dao.RecordDAO.get_data_for_records(). As for the SQL backend,
+        only scalar and string data are found.
+
+        :param id_list: A list of the record ids to find data for
+        :param data_list: A list of the names of data fields to find
+
+        :returns: a dictionary of dictionaries containing the requested data,
+                 keyed by record_id and then data field name.
+        """
+        LOGGER.debug('Getting data in %s for record ids in %s', data_list, id_list)
+        data = defaultdict(lambda: defaultdict(dict))
+        positions = self.snapshot.positions(id_list)
+        for name in data_list:
+            for kind in ("scalar", "string"):
+                column = self.snapshot.column(kind, name)
+                if column is None:
+                    continue
+                indices = np.searchsorted(column.records, positions)
+                for position, index in zip(positions, indices):
+                    if index < len(column.records) and column.records[index] == position:
+                        data[self.snapshot.ids[position]][name] = column.datum(index)
+        return data
+
+    def get_files(self, id):
+        """
+        Retrieve files for a given record id.
+
+        Files are returned in the alphabetical order of their URIs
+
+        :param id: The record id to find files for
+        :return: A list of file JSON objects matching the Mnoda specification
+        """
+        LOGGER.debug('Getting files for record id=%s', id)
+        files = self.snapshot.files(self.snapshot.position(id))
+        return [{'uri': entry['uri'], 'mimetype': entry.get('mimetype'),
+                 'tags': entry.get('tags')}
+                for entry in sorted(files, key=lambda entry: entry['uri'])]
+
+    def get_content_hashes(self, ids):
+        """
+        Given some Record ids, return the content hashes stored for those Records.
+
+        :param ids: An iterable of ids of Records to look up.
+
+        :returns: A dict of id: hash for every given id that names a Record.
+        """
+        hashes = {}
+        for id in ids:
+            position = self.snapshot.ids.find(id)
+            if position is not None:
+                hashes[id] = self.snapshot.hashes[position].decode('ascii') or None
+        return hashes
+
+    def insert(self, record):
+        """Refuse to insert a Record, as snapshots are read-only."""
+        _read_only('insert Records')
+
+    def insert_many(self, list_to_insert):
+        """Refuse to insert Records, as snapshots are read-only."""
+        _read_only('insert Records')
+
+    def delete(self, id):
+        """Refuse to delete a Record, as snapshots are read-only."""
+        _read_only('delete Records')
+
+    def delete_many(self, ids_to_delete):
+        """Refuse to delete Records, as snapshots are read-only."""
+        _read_only('delete Records')
+
+    def delete_given_data(self, **kwargs):
+        """Refuse to delete Records, as snapshots are read-only."""
+        _read_only('delete Records')
+
+    def replace_many(self, list_to_replace):
+        """Refuse to replace Records, as snapshots are read-only."""
+        _read_only('replace Records')
+
+    def compress_raws(self, compression='zlib', progress_callback=None):
+        """Refuse to rewrite raws, as snapshots are read-only. See create_snapshot()."""
+        _read_only('rewrite raws')
+
+
+def _list_positions(column, criterion):
+    """
+    Find the Records whose list datum fulfills a ListCriteria.
+
+    :param column: The list datum's _Column.
+    :param criterion: The ListCriteria.
+
+    :returns: A sorted array of the Records' positions.
+    """
+    found = [column.positions_in(entry) for entry in criterion.entries]
+    if criterion.operation == utils.ListQueryOperation.ANY:
+        return reduce(np.union1d, found)
+    positions = reduce(np.intersect1d, found)
+    if criterion.operation == utils.ListQueryOperation.ONLY:
+        ranges = [entry if isinstance(entry, utils.DataRange)
+                  else utils.DataRange(entry, entry, max_inclusive=True)
+                  for entry in criterion.entries]
+        for excluded in utils.invert_ranges(ranges):
+            positions = np.setdiff1d(positions, column.positions_in(excluded),
+                                     assume_unique=True)
+    return positions
+
+
+class RelationshipDAO(dao.RelationshipDAO):
+    """The DAO responsible for reading Relationships from a snapshot."""
+
+    def __init__(self, snapshot):
+        """
+        Initialize RelationshipDAO with the snapshot it reads.
+
+        :param snapshot: The factory's open _Snapshot.
+        """
+        self.snapshot = snapshot
+
+    def _build(self, indices):
+        """
+        Build the Relationships at some indices of the subject-sorted arrays.
+
+        :param indices: An iterable of indices.
+
+        :returns: A list of Relationships.
+        """
+        nodes = self.snapshot.nodes
+        subjects, predicates, objects = (self.snapshot.relationships[name] for name
+                                         in ("subjects", "predicates", "objects"))
+        return [model.Relationship(subject_id=nodes[subjects[index]],
+                                   predicate=self.snapshot.predicates[predicates[index]],
+                                   object_id=nodes[objects[index]])
+                for index in indices]
+
+    def _with_predicate(self, indices, predicate):
+        """
+        Narrow indices of Relationships to those with a predicate.
+
+        :param indices: An array of indices of the subject-sorted arrays.
+        :param predicate: The predicate, or None not to narrow.
+
+        :returns: The narrowed array.
+        """
+        if predicate is None:
+            return indices
+        if predicate not in self.snapshot.predicates:
+            return indices[:0]
+        code = self.snapshot.predicates.index(predicate)
+        return indices[self.snapshot.relationships["predicates"][indices] == code]
+
+    def get_all(self):
+        """
+        Return every Relationship in the snapshot.
+
+        :returns: A generator of Relationships, sorted by subject.
+        """
+        for chunk in utils.chunked(six.moves.range(self.count()), BUILD_CHUNK_SIZE):
+            for relationship in self._build(chunk):
+                yield relationship
+
+    def count(self):
+        """Return how many Relationships the snapshot holds."""
+        return len(self.snapshot.relationships["subjects"])
+
+    def _get_given_subject_id(self, subject_id, predicate=None):
+        """
+        Given a subject id, return all Relationships with that id as subject.
+
+        :param subject_id: The subject_id of Relationships to return
+        :param predicate: Optionally, the Relationship predicate to filter on.
+
+        :returns: A list of Relationships fitting the criteria.
+        """
+        return self._get_given_node(subject_id, "subjects", predicate)
+
+    def _get_given_object_id(self, object_id, predicate=None):
+        """
+        Given an object id, return all Relationships with that id as object.
+
+        :param object_id: The object_id of Relationships to return
+        :param predicate: Optionally, the Relationship predicate to filter on.
+
+        :returns: A list of Relationships fitting the criteria.
+        """
+        return self._get_given_node(object_id, "sorted_objects", predicate)
+
+    def _get_given_node(self, node, sorted_name, predicate=None):
+        """
+        Return the Relationships a node is the subject (or object) of.
+
+        :param node: The node's id.
+        :param sorted_name: "subjects" to find Relationships with node as
+                            subject, or "sorted_objects" for those with it as
+                            object.
+        :param predicate: Optionally, the Relationship predicate to filter on.
+
+        :returns: A list of Relationships.
+        """
+        code = self.snapshot.nodes.find(node)
+        if code is None:
+            return []
+        nodes = self.snapshot.relationships[sorted_name]
+        indices = np.arange(np.searchsorted(nodes, code, side='left'),
+                            np.searchsorted(nodes, code, side='right'))
+        if sorted_name == "sorted_objects":
+            indices = self.snapshot.relationships["object_order"][indices]
+        return self._build(self._with_predicate(indices, predicate))
+
+    def _get_given_predicate(self, predicate):
+        """
+        Given a predicate, return all Relationships with that predicate.
+
+        :param predicate: The predicate describing Relationships to return
+
+        :returns: A list of Relationships fitting the criteria
+        """
+        return self._build(self._with_predicate(np.arange(self.count()), predicate))
+
+    def _get_many_given(self, key, ids, predicate=None):
+        """
+        Find the Relationships whose subject or object is any of several ids.
+
+        :param key: 'subject_id' or 'object_id', whichever the ids are.
+        :param ids: A list of unique ids.
+        :param predicate: If not None, the predicate Relationships must have.
+
+        :returns: A list of Relationships.
+        """
+        codes = [code for code in (self.snapshot.nodes.find(id) for id in ids)
+                 if code is not None]
+        nodes = self.snapshot.relationships["subjects" if key == 'subject_id' else "objects"]
+        indices = np.flatnonzero(np.isin(nodes, codes))
+        return self._build(self._with_predicate(indices, predicate))
+
+    def insert(self, relationship=None, subject_id=None, object_id=None, predicate=None):
+        """Refuse to insert a Relationship, as snapshots are read-only."""
+        _read_only('insert Relationships')
+
+    def insert_many(self, list_to_insert):
+        """Refuse to insert Relationships, as snapshots are read-only."""
+        _read_only('insert Relationships')
+
+
+class RunDAO(dao.RunDAO):
+    """The DAO responsible for reading Runs from a snapshot."""
+
+    def __init__(self, snapshot, record_dao):
+        """
+        Initialize RunDAO with the snapshot it reads.
+
+        :param snapshot: The factory's open _Snapshot.
+        :param record_dao: A RecordDAO for the same snapshot.
+        """
+        super(RunDAO, self).__init__(record_dao=record_dao)
+        self.snapshot = snapshot
+
+    def get(self, id, data_fields=None, include_files=False):
+        """
+        Given a run's id, return the matching Run from the snapshot.
+
+        :param id: The id of the run to return.
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Run. See dao.RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: The matching Run.
+
+        :raises ValueError: if there's no such Run.
+        """
+        LOGGER.debug('Getting run with id: %s', id)
+        run = model.generate_run_from_json(self.snapshot.raw(self.snapshot.position(id)))
+        if data_fields is not None:
+            return model.project_record(run, data_fields, include_files)
+        return run
+
+    def insert(self, run):
+        """Refuse to insert a Run, as snapshots are read-only."""
+        _read_only('insert Runs')
+
+    def insert_many(self, list_to_insert):
+        """Refuse to insert Runs, as snapshots are read-only."""
+        _read_only('insert Runs')
+
+    def delete(self, id):
+        """Refuse to delete a Run, as snapshots are read-only."""
+        _read_only('delete Runs')
+
+    def delete_many(self, ids_to_delete):
+        """Refuse to delete Runs, as snapshots are read-only."""
+        _read_only('delete Runs')
+
+    def replace_many(self, list_to_replace):
+        """Refuse to replace Runs, as snapshots are read-only."""
+        _read_only('replace Runs')
+
+
+class DAOFactory(dao.DAOFactory):
+    """
+    Build DAOs for reading a snapshot.
+
+    See create_snapshot() for building one.
+    """
+
+    def __init__(self, path):
+        """
+        Open the snapshot at a path.
+
+        :param path: The snapshot's directory.
+
+        :raises ValueError: if there's no snapshot there, or it's from an
+                            incompatible version of Sina.
+        :raises ImportError: if numpy isn't available.
+        """
+        self.path = path
+        self.snapshot = _Snapshot(path)
+
+    def create_record_dao(self):
+        """
+        Create a DAO for interacting with records.
+
+        :returns: a RecordDAO
+        """
+        return RecordDAO(self.snapshot)
+
+    def create_relationship_dao(self):
+        """
+        Create a DAO for interacting with relationships.
+
+        :returns: a RelationshipDAO
+        """
+        return RelationshipDAO(self.snapshot)
+
+    def create_run_dao(self):
+        """
+        Create a DAO for interacting with runs.
+
+        :returns: a RunDAO
+        """
+        return RunDAO(self.snapshot, record_dao=self.create_record_dao())
+
+    def __repr__(self):
+        """Return a string representation of a snapshot DAOFactory."""
+        return 'Snapshot DAOFactory <path={}>'.format(self.path)
@@ -1,20 +1,25 @@
 """Contains SQL-specific implementations of our DAOs."""
 import os
+import json
+import math
+import time
 import numbers
 import logging
-import json
+import sqlite3
+import threading
 from collections import defaultdict
-from functools import reduce   # pylint: disable=redefined-builtin
 
 import six
 
 # Disable pylint check due to its issue with virtual environments
 import sqlalchemy  # pylint: disable=import-error
 
+import sina.codec as codec
 import sina.dao as dao
 import sina.model as model
+import sina.planner as planner
+import sina.adjacency
 import sina.datastores.sql_schema as schema
-from sina.utils import sort_and_standardize_criteria
 from sina import utils
 
 # Disable redefined-builtin, invalid-name due to ubiquitous use of id
@@ -32,18 +37,294 @@ PARAM_OFFSETS = {schema.ScalarData: "",
                  schema.ListScalarDataEntry: "_2",
                  schema.ListStringDataEntry: "_3"}
 
+# How many rows to pull at a time when streaming ids out of a query
+STREAM_CHUNK_SIZE = 1000
+# How many ids to look up per IN clause, kept well under the ~999
+# variables-per-statement limit some SQLite builds enforce
+IN_CHUNK_SIZE = 500
+
+# How DAOFactory.optimize() can reclaim the space left unused by deletions
+VACUUM_MODES = ('full', 'incremental')
+# What PRAGMA auto_vacuum reports for a database in incremental mode
+_AUTO_VACUUM_INCREMENTAL = 2
+
+# How Records' raws can be stored. "full" keeps the entire raw; "remainder"
+# keeps only what the data and document tables can't give back, leaving a
+# stand-in code for each datum (and a bare uri for each file) found there.
+RAW_STORAGE_MODES = ('full', 'remainder')
+# Marks a raw as a remainder, giving the version of its format
+REMAINDER_KEY = '__sina_remainder__'
+REMAINDER_VERSION = 1
+# Stand-in codes for data stripped from a remainder: rebuild from the data
+# tables as is, or converting the value(s) back to ints (stored as floats)
+_FROM_TABLES = 0
+_FROM_TABLES_AS_INTS = 1
+# Ints beyond this can't be stored as floats exactly
+_MAX_EXACT_INT = 2 ** 53
+
+# Every column holding a Record id: those referencing Record.id, children
+# first, then Record.id itself. delete_many() clears them in this order.
+RECORD_ID_COLUMNS = ([column for table in reversed(schema.Base.metadata.sorted_tables)
+                      for column in table.columns
+                      if column.references(schema.Record.__table__.c.id)]
+                     + [schema.Record.__table__.c.id])
+# The tables holding a Record's contents (its data, files, and hash), which
+# an overwriting insert diffs against the Record being inserted
+CONTENT_TABLES = [column.table for column in RECORD_ID_COLUMNS
+                  if column.table not in (schema.Record.__table__,
+                                          schema.Relationship.__table__,
+                                          schema.Run.__table__)]
+
+# The tables holding Records' data, which refer to each datum's name by the
+# id the DataName table gives it
+DATA_TABLES = [table for table in schema.Base.metadata.sorted_tables
+               if 'name_id' in table.columns]
+
+# Connections kept open by a pooled factory, and how many more it may open
+# under load. Sized for utils.MAX_THREADS.
+POOL_SIZE = utils.MAX_THREADS
+POOL_MAX_OVERFLOW = 4
+# Seconds a pooled connection waits on another's write lock before failing
+POOLED_BUSY_TIMEOUT = 30
+
+
+class _UntilCommit(object):
+    """
+    Hold what each thread's open transaction has done, until it commits.
+
+    Keeps in-memory state in step with the database: what a transaction did
+    is handed on once it commits, and dropped if it rolls back (or is ended
+    any other way).
+    """
+
+    def __init__(self, sessions, on_commit, new):
+        """
+        Start holding nothing, following the transactions of some sessions.
+
+        :param sessions: The session, or the sessionmaker or scoped_session
+                         making the sessions, whose transactions to follow.
+        :param on_commit: Called with what a transaction held once it commits.
+        :param new: Called to make an empty container to hold things in.
+        """
+        self._on_commit = on_commit
+        self._new = new
+        self._local = threading.local()
+        sqlalchemy.event.listen(sessions, 'after_commit', self._committed)
+        sqlalchemy.event.listen(sessions, 'after_transaction_end', self._ended)
+
+    def pending(self):
+        """Return the container of what this thread's transaction has done."""
+        if not hasattr(self._local, 'pending'):
+            self._local.pending = self._new()
+        return self._local.pending
+
+    def _committed(self, _):
+        """Hand on what a transaction that just committed held."""
+        pending = self.pending()
+        self._local.pending = self._new()
+        self._on_commit(pending)
+
+    def _ended(self, _, transaction):
+        """Drop anything still held by a transaction that just ended."""
+        if transaction.parent is None:
+            self._local.pending = self._new()
+
+
+class DataNameCache(object):
+    """
+    Translates between datum names and the ids standing in for them in SQL.
+
+    The data tables refer to each datum's name by its id in the DataName
+    table. The cache keeps the names and ids seen so far in memory, reading
+    any others from the database, so DAOs can translate between them without
+    a query. One cache should serve every DAO using the same database (and
+    may, from any thread).
+
+    Names added to the DataName table are only cached for the thread that
+    added them until its transaction commits, so a rollback (which frees
+    their ids for other names) can't leave the cache holding stale ids.
+    """
+
+    def __init__(self, sessions):
+        """
+        Start with an empty cache, following the transactions of some sessions.
+
+        :param sessions: The session, or the sessionmaker or scoped_session
+                         making the sessions, that will be used to look up
+                         names. Its commits and rollbacks are followed.
+        """
+        self._ids = {}
+        self._names = {}
+        self._lock = threading.Lock()
+        # Names each thread has added in the transaction it has open
+        self._added = _UntilCommit(sessions, self._cache, dict)
+
+    def ids_of(self, session, names, create=False):
+        """
+        Return the ids of some datum names.
+
+        :param session: The session to read (and add) names with.
+        :param names: An iterable of datum names.
+        :param create: Whether to add names the database lacks to the
+                       DataName table. Does not commit(), caller needs to
+                       do that.
+
+        :returns: A dict of name: id for each name the database has (which,
+                  if create, is every name given).
+        """
+        ids = {}
+        missing = []
+        added = self._added.pending()
+        with self._lock:
+            for name in set(names):
+                id = self._ids.get(name, added.get(name))
+                if id is None:
+                    missing.append(name)
+                else:
+                    ids[name] = id
+        if missing:
+            table = schema.DataName.__table__
+            for name_chunk in utils.chunked(missing, IN_CHUNK_SIZE):
+                if create:
+                    session.execute(table.insert().prefix_with("OR IGNORE"),
+                                    [{"name": name} for name in name_chunk])
+                found = dict(tuple(row) for row in session.execute(
+                    sqlalchemy.select([table.c.name, table.c.id])
+                    .where(table.c.name.in_(name_chunk))))
+                ids.update(found)
+                if create:
+                    # Some may be this transaction's own, so wait for the commit
+                    added.update(found)
+                else:
+                    self._cache(found)
+        return ids
+
+    def names_of(self, session, ids):
+        """
+        Return the datum names some ids stand for.
+
+        :param session: The session to read names with.
+        :param ids: An iterable of ids from the DataName table.
+
+        :returns: A dict of id: name for each id the database has.
+        """
+        names = {}
+        missing = []
+        with self._lock:
+            for id in set(ids):
+                name = self._names.get(id)
+                if name is None:
+                    missing.append(id)
+                else:
+                    names[id] = name
+        if missing:
+            added = self._added.pending()
+            names.update((id, name) for name, id in six.iteritems(added) if id in missing)
+            missing = [id for id in missing if id not in names]
+            table = schema.DataName.__table__
+            for id_chunk in utils.chunked(missing, IN_CHUNK_SIZE):
+                found = dict(tuple(row) for row in session.execute(
+                    sqlalchemy.select([table.c.name, table.c.id])
+                    .where(table.c.id.in_(id_chunk))))
+                names.update((id, name) for name, id in six.iteritems(found))
+                self._cache(found)
+        return names
+
+    def _cache(self, ids):
+        """
+        Remember names and their ids for every thread.
+
+        :param ids: A dict of name: id.
+        """
+        with self._lock:
+            self._ids.update(ids)
+            self._names.update((id, name) for name, id in six.iteritems(ids))
+
+
+class CommittedStatistics(object):
+    """
+    Pass the data of inserted Records on to a StatisticsCatalog, once committed.
+
+    Data are observed as their rows are built, but only reach the catalog
+    once the transaction inserting them commits; those of a transaction that
+    rolls back are dropped. One should serve every DAO sharing the catalog
+    (and may, from any thread).
+    """
+
+    def __init__(self, sessions, catalog):
+        """
+        Start observing nothing, following the transactions of some sessions.
+
+        :param sessions: The session, or the sessionmaker or scoped_session
+                         making the sessions, that Records are inserted with.
+        :param catalog: The StatisticsCatalog to update.
+        """
+        self.catalog = catalog
+        self._observed = _UntilCommit(sessions, self._observe_all, list)
+
+    def observe(self, kind, name, value):
+        """
+        Observe a datum being inserted, for the catalog once it's committed.
+
+        :param kind: The kind of datum, one of planner.KINDS.
+        :param name: The name of the datum.
+        :param value: The value inserted, or a list of entries for lists.
+        """
+        self._observed.pending().append((kind, name, value))
+
+    def _observe_all(self, observed):
+        """Update the catalog with the data a transaction committed."""
+        for kind, name, value in observed:
+            self.catalog.observe(kind=kind, name=name, value=value)
+
 
 class RecordDAO(dao.RecordDAO):
     """The DAO specifically responsible for handling Records in SQL."""
 
-    def __init__(self, session):
-        """Initialize RecordDAO with session for its SQL database."""
+    def __init__(self, session,  # pylint: disable=too-many-arguments
+                 statistics=None, adjacency=None, raw_compression=None, raw_storage='full',
+                 names=None, observer=None):
+        """
+        Initialize RecordDAO with session for its SQL database.
+
+        :param session: The session to use.
+        :param statistics: The StatisticsCatalog used to plan data queries.
+                           Normally shared by all DAOs from the same factory;
+                           if None, the DAO starts its own, empty one.
+        :param adjacency: The factory's AdjacencyIndex, if it keeps one.
+                          Deleting Records updates it.
+        :param raw_compression: How to compress the raws of Records inserted,
+                                one of codec.RAW_COMPRESSIONS, or None not to.
+                                Raws are read back however they were stored.
+        :param raw_storage: How much of the raws of Records inserted to store,
+                            one of RAW_STORAGE_MODES. "remainder" leaves out
+                            data and files the tables already hold, and
+                            rebuilds them from there on reading.
+        :param names: The DataNameCache translating datum names for the
+                      data tables. Normally shared by all DAOs from the same
+                      factory; if None, the DAO starts its own.
+        :param observer: The CommittedStatistics passing inserted data on to
+                         statistics. Normally shared by all DAOs from the same
+                         factory; if None, the DAO starts its own.
+
+        :raises ValueError: if given an unknown raw_storage.
+        """
+        codec.check_raw_compression(raw_compression)
+        _check_raw_storage(raw_storage)
         self.session = session
+        self.names = names if names is not None else DataNameCache(session)
+        self.statistics = (statistics if statistics is not None
+                           else planner.StatisticsCatalog())
+        self.observer = (observer if observer is not None
+                         else CommittedStatistics(session, self.statistics))
+        self.adjacency = adjacency
+        self.raw_compression = raw_compression
+        self.raw_storage = raw_storage
 
     # pylint: disable=arguments-differ
     # Args differ because called_from_child is analogous to Cassandra's
     # insert_many() _type_managed; this will be revisited in SIBO-661
-    def insert(self, record, called_from_child=False):
+    def insert(self, record, called_from_child=False, force_overwrite=False, trusted=False):
         """
         Given a Record, insert it into the current SQL database.
 
@@ -51,41 +332,275 @@ class RecordDAO(dao.RecordDAO):
         :param called_from_child: Whether a child of Record (such as Run) is
                                   calling this. Used to skip committing in
                                   order to preserve atomicity.
+        :param force_overwrite: Whether to overwrite a preexisting Record that
+                                shares this Record's id. See insert_many().
+        :param trusted: Whether the Record is known to be valid, so its data
+                        and files needn't be checked entry by entry. See
+                        Record.validate_and_serialize().
         """
-        LOGGER.debug('Inserting %s into SQL.', record)
-        is_valid, warnings = record.is_valid()
+        LOGGER.debug('Inserting %s into SQL with force_overwrite=%s.', record, force_overwrite)
+        if force_overwrite:
+            self.insert_many([record], called_from_child=called_from_child,
+                             force_overwrite=True, trusted=trusted)
+            return
+        is_valid, warnings, raw_json = record.validate_and_serialize(trusted=trusted)
         if not is_valid:
             raise ValueError(warnings)
         self.session.add(schema.Record(id=record.id,
                                        type=record.type,
-                                       raw=json.dumps(record.raw)))
-        if record.data:
-            self._insert_data(record.id, record.data)
-        if record.files:
-            self._insert_files(record.id, record.files)
+                                       raw=self._stored_raw(record, raw_json)))
+        self._insert_contents(record, raw_json)
 
         # If called from child, child is responsible for committing.
         if not called_from_child:
             self.session.commit()
 
-    def _insert_data(self, id, data):
+    # pylint: disable=arguments-differ
+    # Args differ for the same reason as insert()
+    def insert_many(self, list_to_insert, called_from_child=False, force_overwrite=False,
+                    trusted=False):
         """
-        Insert data entries into the ScalarData and StringData tables.
+        Given a list of Records, insert them into the current SQL database.
+
+        All are inserted in a single transaction.
+
+        With force_overwrite, preexisting Records sharing an id with one given
+        are overwritten rather than raising an error. Their Record row is
+        upserted, and their data and file rows are diffed against the new
+        ones: stale rows are deleted, changed and new ones upserted, and
+        unchanged ones left be. Relationships involving them are untouched.
+
+        :param list_to_insert: A list of Records to insert
+        :param called_from_child: Whether a child of Record (such as Run) is
+                                  calling this. Used to skip committing in
+                                  order to preserve atomicity.
+        :param force_overwrite: Whether to overwrite preexisting Records that
+                                share ids with those given.
+        :param trusted: Whether the Records are known to be valid. See insert().
+        """
+        LOGGER.debug('Inserting %i records into SQL with force_overwrite=%s.',
+                     len(list_to_insert), force_overwrite)
+        if force_overwrite:
+            for record_chunk in utils.chunked(list_to_insert, IN_CHUNK_SIZE):
+                self._overwrite_chunk(record_chunk, clear_runs=not called_from_child,
+                                      trusted=trusted)
+        else:
+            for record in list_to_insert:
+                self.insert(record, called_from_child=True, trusted=trusted)
+        if not called_from_child:
+            self.session.commit()
+
+    def _overwrite_chunk(self, records, clear_runs, trusted=False):
+        """
+        Upsert a list of Records, diffing their contents against those stored.
+
+        Does not commit(), caller needs to do that.
+
+        :param records: The Records to upsert, at most IN_CHUNK_SIZE of them.
+        :param clear_runs: Whether to delete the Records' Run rows (ex: because
+                           they're being overwritten by non-Run Records).
+        :param trusted: Whether the Records are known to be valid. See insert().
+        """
+        ids = []
+        record_rows = []
+        content_rows = {table: {} for table in CONTENT_TABLES}
+        # The old data of Records being overwritten can't be taken back out of
+        # the statistics, so those are left partial rather than observing anew
+        record_table = schema.Record.__table__
+        stored_ids = set(row[0] for row in self.session.execute(
+            sqlalchemy.select([record_table.c.id])
+            .where(record_table.c.id.in_([record.id for record in records]))))
+        for record in records:
+            is_valid, warnings, raw_json = record.validate_and_serialize(trusted=trusted)
+            if not is_valid:
+                raise ValueError(warnings)
+            ids.append(record.id)
+            record_rows.append({'id': record.id,
+                                'type': record.type,
+                                'raw': self._stored_raw(record, raw_json)})
+            overwriting = record.id in stored_ids
+            if overwriting:
+                self.statistics.mark_partial()
+            for kind, row in self._content_rows(record, raw_json, observe=not overwriting):
+                key = tuple(row[column.name] for column in kind.__table__.primary_key)
+                content_rows[kind.__table__][key] = row
+            stored_ids.add(record.id)
+        _upsert(self.session, schema.Record.__table__, record_rows)
+        if clear_runs:
+            run_table = schema.Run.__table__
+            self.session.execute(run_table.delete().where(run_table.c.id.in_(ids)))
+        for table in CONTENT_TABLES:
+            primary_key = list(table.primary_key)
+            stored = {tuple(row[column.name] for column in primary_key): row
+                      for row in self.session.execute(
+                          table.select().where(table.c.id.in_(ids)))}
+            stale = [dict(('key_' + column.name, row[column.name]) for column in primary_key)
+                     for key, row in six.iteritems(stored) if key not in content_rows[table]]
+            if stale:
+                self.session.execute(
+                    table.delete().where(sqlalchemy.and_(
+                        *[column == sqlalchemy.bindparam('key_' + column.name)
+                          for column in primary_key])),
+                    stale)
+            _upsert(self.session, table,
+                    [row for key, row in six.iteritems(content_rows[table])
+                     if key not in stored
+                     or any(stored[key][name] != value for name, value in six.iteritems(row))])
+
+    def _stored_raw(self, record, raw_json):
+        """
+        Build what's stored as a Record's raw, per the DAO's raw settings.
+
+        :param record: The Record being stored.
+        :param raw_json: The Record's serialized raw.
+
+        :returns: The (possibly partial, possibly compressed) raw to store.
+        """
+        if self.raw_storage == 'remainder':
+            raw_json = codec.canonical_dumps(_raw_remainder(record.raw))
+        return _encoded_raw(raw_json, self.raw_compression)
+
+    def _insert_contents(self, record, raw_json):
+        """
+        Insert a Record's data, files, and content hash.
 
         Does not commit(), caller needs to do that.
 
+        :param record: The Record whose contents to insert.
+        :param raw_json: The Record's serialized raw.
+        """
+        for kind, row in self._content_rows(record, raw_json):
+            self.session.add(kind(**row))
+
+    def _content_rows(self, record, raw_json, observe=True):
+        """
+        Build the rows holding a Record's data, files, and content hash.
+
+        :param record: The Record whose rows to build.
+        :param raw_json: The Record's serialized raw, from
+                         Record.validate_and_serialize().
+        :param observe: Whether the DAO's statistics should observe the data.
+
+        :returns: A generator of (schema class, row dict) pairs, each dict
+                  giving a value for each of its table's columns.
+        """
+        if record.data:
+            for row in self._data_rows(record.id, record.data, observe=observe):
+                yield row
+        if record.files:
+            for row in self._file_rows(record.id, record.files):
+                yield row
+        yield schema.RecordHash, {'id': record.id, 'hash': record.content_hash(raw_json)}
+
+    # pylint: disable=arguments-differ
+    # Args differ for the same reason as insert()
+    def replace_many(self, list_to_replace, called_from_child=False, trusted=False):
+        """
+        Given a list of Records already in the database, replace their contents.
+
+        An overwriting insert_many(), so only rows that changed are touched.
+        Relationships involving the Records are untouched.
+
+        :param list_to_replace: A list of Records to replace the stored ones with
+        :param called_from_child: Whether a child of Record (such as Run) is
+                                  calling this. Used to skip committing in
+                                  order to preserve atomicity.
+        :param trusted: Whether the Records are known to be valid. See insert().
+        """
+        LOGGER.debug('Replacing %i records.', len(list_to_replace))
+        self.insert_many(list_to_replace, called_from_child=called_from_child,
+                         force_overwrite=True, trusted=trusted)
+
+    def get_content_hashes(self, ids):
+        """
+        Given some Record ids, return the content hashes stored for those Records.
+
+        :param ids: An iterable of ids of Records to look up.
+
+        :returns: A dict of id: hash for every given id that names a Record.
+                  The hash is None for Records stored without one.
+        """
+        hashes = {}
+        for id_chunk in utils.chunked(ids, IN_CHUNK_SIZE):
+            query = (self.session.query(schema.Record.id, schema.RecordHash.hash)
+                     .outerjoin(schema.RecordHash, schema.Record.id == schema.RecordHash.id)
+                     .filter(schema.Record.id.in_(id_chunk)))
+            hashes.update(query)
+        return hashes
+
+    def compress_raws(self, compression='zlib', progress_callback=None):
+        """
+        Rewrite the raws of every stored Record, compressing them a given way.
+
+        Works STREAM_CHUNK_SIZE Records at a time, committing after each
+        chunk, so an interrupted run can simply be restarted. Raws already
+        stored the requested way are left be. If any are rewritten, the
+        database is then vacuumed so the space saved is returned to the
+        filesystem.
+
+        :param compression: How to compress the raws, one of
+                            codec.RAW_COMPRESSIONS, or None to decompress them.
+        :param progress_callback: If provided, called after each chunk with
+                                  the number of Records processed so far and
+                                  the total number of Records.
+
+        :returns: The number of raws rewritten.
+        """
+        codec.check_raw_compression(compression)
+        LOGGER.info('Rewriting raws with compression=%s.', compression)
+        table = schema.Record.__table__
+        total = self.session.query(sqlalchemy.func.count(table.c.id)).scalar()
+        update = (table.update()
+                  .where(table.c.id == sqlalchemy.bindparam('key_id'))
+                  .values(raw=sqlalchemy.bindparam('raw')))
+        processed = rewritten = 0
+        last_id = None
+        while True:
+            # Paging by id rather than streaming one query, as we write as we go
+            query = sqlalchemy.select([table.c.id, table.c.raw])
+            if last_id is not None:
+                query = query.where(table.c.id > last_id)
+            rows = self.session.execute(query.order_by(table.c.id)
+                                        .limit(STREAM_CHUNK_SIZE)).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            updates = [{'key_id': id, 'raw': _encoded_raw(codec.raw_json(raw), compression)}
+                       for id, raw in rows if codec.raw_compression(raw) != compression]
+            if updates:
+                self.session.execute(update, updates)
+            self.session.commit()
+            processed += len(rows)
+            rewritten += len(updates)
+            if progress_callback is not None:
+                progress_callback(processed, total)
+        if rewritten:
+            self.session.execute('VACUUM')
+        return rewritten
+
+    def _data_rows(self, id, data, observe=True):
+        """
+        Build the rows holding a Record's data.
+
+        Unless told otherwise, each datum is also observed by the DAO's
+        statistics, which see it once the insertion is committed.
+
         :param id: The Record ID to associate the data to.
-        :param data: The dictionary of data to insert.
+        :param data: The dictionary of data to build rows for.
+        :param observe: Whether the statistics should observe the data.
+
+        :returns: A generator of (schema class, row dict) pairs.
         """
-        LOGGER.debug('Inserting %i data entries to Record ID %s.', len(data), id)
+        LOGGER.debug('Building rows for %i data entries of Record ID %s.', len(data), id)
+        name_ids = self.names.ids_of(self.session, data, create=True)
         for datum_name, datum in data.items():
             if isinstance(datum['value'], list):
                 # Store info such as units and tags in master table
                 # Note: SQL doesn't support maps, so we have to convert the
                 # tags to a string (if they exist).
-                # Using json.dumps() instead of str() (or join()) gives
+                # Using codec.dumps() instead of str() (or join()) gives
                 # valid JSON
-                tags = (json.dumps(datum['tags']) if 'tags' in datum else None)
+                tags = (codec.dumps(datum['tags']) if 'tags' in datum else None)
                 # Check if empty list
                 if datum:
                     kind_master = (schema.ListScalarDataMaster
@@ -95,12 +610,17 @@ class RecordDAO(dao.RecordDAO):
                 else:
                     # Default to Scalar table
                     kind_master = schema.ListScalarDataMaster
-                self.session.add(kind_master(id=id,
-                                             name=datum_name,
-                                             # units might be None, always use
-                                             # get()
-                                             units=datum.get('units'),
-                                             tags=tags))
+                yield kind_master, {'id': id,
+                                    'name_id': name_ids[datum_name],
+                                    # units might be None, always use get()
+                                    'units': datum.get('units'),
+                                    'tags': tags}
+                if observe:
+                    self.observer.observe(kind=("scalarlist"
+                                                if kind_master is schema.ListScalarDataMaster
+                                                else "stringlist"),
+                                          name=datum_name,
+                                          value=datum['value'])
 
                 # Store list entries in entry table
                 for index, entry in enumerate(datum['value']):
@@ -108,38 +628,44 @@ class RecordDAO(dao.RecordDAO):
                     kind = (schema.ListScalarDataEntry
                             if isinstance(entry, numbers.Real)
                             else schema.ListStringDataEntry)
-                    self.session.add(kind(id=id,
-                                          name=datum_name,
-                                          index=index,
-                                          value=entry))
+                    yield kind, {'id': id,
+                                 'name_id': name_ids[datum_name],
+                                 'index': index,
+                                 'value': entry}
             elif isinstance(datum['value'], (numbers.Number, six.string_types)):
-                tags = (json.dumps(datum['tags']) if 'tags' in datum else None)
+                tags = (codec.dumps(datum['tags']) if 'tags' in datum else None)
                 # Check if it's a scalar
                 kind = (schema.ScalarData if isinstance(datum['value'], numbers.Real)
                         else schema.StringData)
-                self.session.add(kind(id=id,
-                                      name=datum_name,
-                                      value=datum['value'],
-                                      # units might be None, always use get()
-                                      units=datum.get('units'),
-                                      tags=tags))
+                yield kind, {'id': id,
+                             'name_id': name_ids[datum_name],
+                             'value': datum['value'],
+                             # units might be None, always use get()
+                             'units': datum.get('units'),
+                             'tags': tags}
+                if observe:
+                    self.observer.observe(kind=("scalar" if kind is schema.ScalarData
+                                                else "string"),
+                                          name=datum_name,
+                                          value=datum['value'])
 
-    def _insert_files(self, id, files):
+    @staticmethod
+    def _file_rows(id, files):
         """
-        Insert files into the Document table.
-
-        Does not commit(), caller needs to do that.
+        Build the rows holding a Record's files.
 
         :param id: The Record ID to associate the files to.
-        :param files: The list of files to insert.
+        :param files: The list of files to build rows for.
+
+        :returns: A generator of (schema class, row dict) pairs.
         """
-        LOGGER.debug('Inserting %i files to record id=%s.', len(files), id)
+        LOGGER.debug('Building rows for %i files of record id=%s.', len(files), id)
         for entry in files:
-            tags = (json.dumps(entry['tags']) if 'tags' in entry else None)
-            self.session.add(schema.Document(id=id,
-                                             uri=entry['uri'],
-                                             mimetype=entry.get('mimetype'),
-                                             tags=tags))
+            yield schema.Document, {'id': id,
+                                    'uri': entry['uri'],
+                                    'mimetype': entry.get('mimetype'),
+                                    'tags': (codec.dumps(entry['tags'])
+                                             if 'tags' in entry else None)}
 
     def delete(self, id):
         """
@@ -153,22 +679,174 @@ class RecordDAO(dao.RecordDAO):
         :param id: The id of the Record to delete.
         """
         LOGGER.debug('Deleting record with id: %s', id)
-        self.session.query(schema.Record).filter(schema.Record.id == id).delete()
-        self.session.commit()
+        self.delete_many([id])
 
     def delete_many(self, ids_to_delete):
         """
         Given a list of Record ids, delete all mentions of them from the SQL database.
 
+        Rather than leaving it to cascades, every table's rows are deleted
+        directly, IN_CHUNK_SIZE ids per statement, in a single transaction.
+        Afterwards, the session is cleared of everything it had loaded.
+
         :param ids_to_delete: A list of the ids of Records to delete.
         """
-        LOGGER.debug('Deleting records with ids in: %s', ids_to_delete)
-        (self.session.query(schema.Record).filter(schema.Record.id.in_(ids_to_delete))
-         .delete(synchronize_session='fetch'))
+        LOGGER.debug('Deleting %i records.', len(ids_to_delete))
+        for id_chunk in utils.chunked(ids_to_delete, IN_CHUNK_SIZE):
+            self._delete_where(lambda column, ids=id_chunk: column.in_(ids))
+        self._finish_delete(ids_to_delete)
+
+    def delete_given_data(self, **kwargs):
+        """
+        Delete every Record whose data fulfill some criteria.
+
+        Criteria are given as for data_query(). The matching ids are gathered
+        in a temporary table and deleted from there, so they're only pulled
+        into Python when there's an adjacency index to update.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                       must fulfill.
+
+        :returns: The number of Records deleted.
+
+        :raises ValueError: if not supplied at least one criterion or given
+                            a criterion it does not support
+        """
+        LOGGER.debug('Deleting all records fulfilling criteria: %s', kwargs.items())
+        query_plan = self.explain_query(**kwargs)
+        connection = self.session.connection()
+        doomed = _temporary_id_table("sina_doomed_ids")
+        doomed.create(connection)
+        try:
+            seeded = False
+            for step in query_plan.steps:
+                for keep, queries in self._plan_step_filters(step):
+                    if keep:
+                        self._keep_ids_in(doomed, queries, seeded)
+                        seeded = True
+                    else:
+                        for query in queries:
+                            self.session.execute(
+                                doomed.delete().where(doomed.c.id.in_(query.statement)))
+            count = self.session.execute(
+                sqlalchemy.select([sqlalchemy.func.count()]).select_from(doomed)).scalar()
+            doomed_ids = sqlalchemy.select([doomed.c.id])
+            deleted = ([row[0] for row in self.session.execute(doomed_ids)]
+                       if self.adjacency is not None else [])
+            self._delete_where(lambda column: column.in_(doomed_ids))
+        finally:
+            doomed.drop(connection)
+        self._finish_delete(deleted)
+        return count
+
+    def _delete_where(self, condition):
+        """
+        Delete the rows of every table whose Record id column meets a condition.
+
+        Children are deleted before the Records themselves. Does not commit(),
+        caller needs to do that.
+
+        :param condition: A function taking a column and returning the
+                          clause rows to delete must meet.
+        """
+        for column in RECORD_ID_COLUMNS:
+            self.session.execute(column.table.delete().where(condition(column)))
+
+    def _finish_delete(self, ids):
+        """
+        Commit a deletion and update anything it made out of date.
+
+        :param ids: The ids of the deleted Records.
+        """
         self.session.commit()
+        # The deletes bypassed the ORM, so anything it loaded for the deleted
+        # Records would otherwise stay in the identity map
+        self.session.expunge_all()
+        self.statistics.mark_partial()
+        if self.adjacency is not None:
+            self.adjacency.forget(ids)
+
+    def _plan_step_filters(self, step):
+        """
+        Break one step of a QueryPlan into queries whose ids to keep or drop.
+
+        :param step: The planner.PlanStep to break down.
+
+        :returns: A list of (keep, queries) pairs. If keep, only ids returned
+                  by at least one of the queries fulfill the step. Otherwise,
+                  no id returned by any of them does.
+
+        :raises ValueError: if given an unsupported list operation.
+        """
+        if step.kind in ("scalar", "string"):
+            table = schema.ScalarData if step.kind == "scalar" else schema.StringData
+            return [(True, [self._criterion_query(table, step.name, step.criterion)])]
+        entries = step.criterion.entries
+        table = self._pick_list_table(step.name, entries)
+        operation = step.criterion.operation
+        if operation == utils.ListQueryOperation.ANY:
+            return [(True, [self._criterion_query(table, step.name, entry)
+                            for entry in entries])]
+        filters = [(True, [self._criterion_query(table, step.name, entry)])
+                   for entry in entries]
+        if operation == utils.ListQueryOperation.ONLY:
+            ranges = [x if isinstance(x, utils.DataRange)
+                      else utils.DataRange(x, x, max_inclusive=True)
+                      for x in entries]
+            filters.append((False, [self._criterion_query(table, step.name, excluded)
+                                    for excluded in utils.invert_ranges(ranges)]))
+        elif operation != utils.ListQueryOperation.ALL:
+            raise ValueError("Currently, only [{}, {}, {}] list "
+                             "operations are supported. Given {}"
+                             .format(utils.ListQueryOperation.ALL,
+                                     utils.ListQueryOperation.ANY,
+                                     utils.ListQueryOperation.ONLY,
+                                     operation))
+        return filters
+
+    def _criterion_query(self, table, name, criterion):
+        """
+        Build a query for the ids of Records with a datum meeting one criterion.
+
+        :param table: The table the datum is in.
+        :param name: The name of the datum.
+        :param criterion: A single value or DataRange.
+
+        :returns: A query selecting the matching ids.
+        """
+        return self._apply_ranges_to_query(self.session.query(table.id),
+                                           [(name, criterion)], table)
+
+    def _keep_ids_in(self, id_table, queries, seeded):
+        """
+        Narrow a temporary table of ids to those returned by any of some queries.
 
-    # Disable pylint checks to if and until team decides to refactor the method
-    def data_query(self, **kwargs):  # pylint: disable=too-many-branches,too-many-locals
+        :param id_table: The temporary table of ids to narrow.
+        :param queries: The queries selecting ids to keep.
+        :param seeded: Whether id_table has been filled yet. If not, it's
+                       filled with every id the queries return.
+        """
+        if not seeded:
+            for query in queries:
+                self.session.execute(id_table.insert().prefix_with("OR IGNORE")
+                                     .from_select(["id"], query.statement))
+        elif len(queries) == 1:
+            self.session.execute(
+                id_table.delete().where(~id_table.c.id.in_(queries[0].statement)))
+        else:
+            # Each query reuses the same parameter names, so they can't
+            # be combined into one statement; gather their union first.
+            connection = self.session.connection()
+            union = _temporary_id_table("sina_kept_ids")
+            union.create(connection)
+            try:
+                self._keep_ids_in(union, queries, seeded=False)
+                self.session.execute(id_table.delete().where(
+                    ~id_table.c.id.in_(sqlalchemy.select([union.c.id]))))
+            finally:
+                union.drop(connection)
+
+    def data_query(self, **kwargs):
         """
         Return the ids of all Records whose data fulfill some criteria.
 
@@ -190,73 +868,361 @@ class RecordDAO(dao.RecordDAO):
                             a criterion it does not support
         """
         LOGGER.debug('Finding all records fulfilling criteria: %s', kwargs.items())
-        # No kwargs is bad usage. Bad kwargs are caught in sort_criteria().
-        if not kwargs.items():
-            raise ValueError("You must supply at least one criterion.")
-        (scalar_criteria,
-         string_criteria,
-         scalarlist,
-         stringlist) = sort_and_standardize_criteria(kwargs)
-        result_ids = []
-
-        if scalar_criteria:
-            scalar_query = self.session.query(schema.ScalarData.id)
-            scalar_query = self._apply_ranges_to_query(scalar_query,
-                                                       scalar_criteria,
-                                                       schema.ScalarData)
-        if string_criteria:
-            string_query = self.session.query(schema.StringData.id)
-            string_query = self._apply_ranges_to_query(string_query,
-                                                       string_criteria,
-                                                       schema.StringData)
-        #  If we have more than one set of data, we need to perform a union
-        if scalar_criteria and string_criteria:
-            and_query = scalar_query.intersect(string_query)
-            result_ids.append(str(x[0]) for x in and_query.all())
-        # Otherwise, just find which one has something to return
-        elif scalar_criteria:
-            result_ids.append(str(x[0]) for x in scalar_query.all())
-        elif string_criteria:
-            result_ids.append(str(x[0]) for x in string_query.all())
-        for criteria, _ in ((scalarlist, "scalarlist"),
-                            (stringlist, "stringlist")):
-            for criterion in criteria:
-                # Unpack the criterion
-                datum_name, list_criteria = criterion
-                # has_all queries are broken up and treated like a scalar or string
-                if (list_criteria.operation in
-                        [utils.ListQueryOperation.ALL,
-                         utils.ListQueryOperation.ANY,
-                         utils.ListQueryOperation.ONLY]):
-                    ids = self.get_list(datum_name=datum_name,
-                                        list_of_contents=list_criteria.entries,
-                                        ids_only=True,
-                                        operation=list_criteria.operation)
-                    result_ids.append(ids)
-                else:
-                    raise ValueError("Currently, only [{}, {}, {}] list "
-                                     "operations are supported. Given {}"
-                                     .format(utils.ListQueryOperation.ALL,
-                                             utils.ListQueryOperation.ANY,
-                                             utils.ListQueryOperation.ONLY,
-                                             list_criteria.operation))
-        # If we have more than one set of data, we need to find the intersect.
-        for id in utils.intersect_lists(result_ids):
+        # No kwargs is bad usage. Bad kwargs are caught in build_plan().
+        # Each step produces ids in sorted order, letting us intersect them
+        # as streams rather than holding every result in memory.
+        query_plan = self.explain_query(**kwargs)
+        for id in planner.execute_plan(query_plan, self._run_plan_step):
             yield id
 
-    def get(self, id):
+    def explain_query(self, **kwargs):
+        """
+        Return the plan data_query() would follow for some criteria.
+
+        Criteria are ordered by their estimated selectivity (see analyze()),
+        and small intermediate results are passed to later criteria as IN
+        filters. print() the returned plan for a human-readable explanation.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                       must fulfill, as for data_query().
+
+        :returns: A planner.QueryPlan.
+
+        :raises ValueError: if not supplied at least one criterion or given
+                            a criterion it does not support
+        """
+        return planner.build_plan(self.statistics, kwargs)
+
+    def _run_plan_step(self, step, accepted_ids=None):
+        """
+        Return the ids of the Records fulfilling one step of a QueryPlan.
+
+        :param step: The planner.PlanStep to run.
+        :param accepted_ids: If not None, a list of ids to restrict the step to.
+
+        :returns: A generator of matching ids, in sorted order.
+
+        :raises ValueError: if given an unsupported list operation.
+        """
+        if step.kind in ("scalar", "string"):
+            table = schema.ScalarData if step.kind == "scalar" else schema.StringData
+            query = self.session.query(table.id)
+            if accepted_ids is not None:
+                query = query.filter(table.id.in_(accepted_ids))
+            query = self._apply_ranges_to_query(query, [(step.name, step.criterion)], table)
+            return self._stream_ordered_ids(query, table)
+        list_criteria = step.criterion
+        if (list_criteria.operation not in
+                [utils.ListQueryOperation.ALL,
+                 utils.ListQueryOperation.ANY,
+                 utils.ListQueryOperation.ONLY]):
+            raise ValueError("Currently, only [{}, {}, {}] list "
+                             "operations are supported. Given {}"
+                             .format(utils.ListQueryOperation.ALL,
+                                     utils.ListQueryOperation.ANY,
+                                     utils.ListQueryOperation.ONLY,
+                                     list_criteria.operation))
+        return self.get_list(datum_name=step.name,
+                             list_of_contents=list_criteria.entries,
+                             ids_only=True,
+                             operation=list_criteria.operation,
+                             accepted_ids_list=accepted_ids)
+
+    def analyze(self):
+        """
+        Collect fresh statistics about the data in the database.
+
+        The statistics are used to plan data queries (see explain_query()).
+        They're also kept up to date as Records are inserted through this
+        factory, but deletions (and insertions by anyone else) are only
+        accounted for by analyzing again.
+
+        The statistics are also stored in the database, so factories opening
+        it later start with them.
+
+        :returns: The updated planner.StatisticsCatalog.
+        """
+        LOGGER.info('Analyzing data for query planning.')
+        func = sqlalchemy.func
+        all_stats = []
+        for kind, table, master in (("scalar", schema.ScalarData, None),
+                                    ("string", schema.StringData, None),
+                                    ("scalarlist", schema.ListScalarDataEntry,
+                                     schema.ListScalarDataMaster),
+                                    ("stringlist", schema.ListStringDataEntry,
+                                     schema.ListStringDataMaster)):
+            # For lists, count the records from the master table; the entry
+            # table holds many rows per record (and none for empty lists).
+            record_counts = {}
+            if master is not None:
+                record_counts = {name: count for name, (_, count) in self._named_rows(
+                    self.session.query(master.name_id, func.count(master.id))
+                    .group_by(master.name_id))}
+            kind_stats = {}
+            summaries = self._named_rows(
+                self.session.query(table.name_id,
+                                   func.count(table.id),
+                                   func.min(table.value),
+                                   func.max(table.value),
+                                   func.count(sqlalchemy.distinct(table.value)))
+                .group_by(table.name_id))
+            for name, (_, count, min, max, distinct) in summaries:
+                kind_stats[name] = planner.DatumStatistics(
+                    name, kind,
+                    count=record_counts.get(name, count) if master is not None else count,
+                    min=min, max=max, distinct=distinct,
+                    entries=count if master is not None else None)
+            for name, count in record_counts.items():
+                if name not in kind_stats:
+                    kind_stats[name] = planner.DatumStatistics(name, kind, count=count,
+                                                               distinct=0, entries=0)
+            if kind.startswith("scalar"):
+                self._analyze_histograms(table, kind_stats)
+            all_stats.extend(kind_stats.values())
+        self.statistics.replace(all_stats, complete=True)
+        self._save_statistics(all_stats)
+        return self.statistics
+
+    def _save_statistics(self, all_stats):
+        """
+        Store statistics in the database, replacing any stored before.
+
+        :param all_stats: A list of planner.DatumStatistics.
+        """
+        self.session.query(schema.DatumStatistics).delete()
+        if all_stats:
+            self.session.execute(schema.DatumStatistics.__table__.insert(),
+                                 [{"kind": stats.kind, "name": stats.name,
+                                   "stats": json.dumps(stats.to_json())}
+                                  for stats in all_stats])
+        self.session.commit()
+
+    def _analyze_histograms(self, table, kind_stats):
+        """
+        Fill in histograms for the statistics of a scalar table.
+
+        Bucketing mirrors planner.DatumStatistics.bucket_index().
+
+        :param table: The ScalarData or ListScalarDataEntry table.
+        :param kind_stats: A dict of datum name: DatumStatistics to update.
+        """
+        for stats in kind_stats.values():
+            stats.histogram = [0] * planner.HISTOGRAM_BUCKETS
+            if stats.min is not None and stats.min == stats.max:
+                stats.histogram[0] = stats.entries if stats.entries is not None else stats.count
+        query = sqlalchemy.text(
+            "SELECT data.name_id, "
+            "MIN(CAST((data.value - bounds.low) * :buckets / (bounds.high - bounds.low) "
+            "AS INTEGER), :last_bucket) AS bucket, COUNT(*) "
+            "FROM {table} AS data JOIN "
+            "(SELECT name_id, MIN(value) AS low, MAX(value) AS high FROM {table} "
+            "GROUP BY name_id) AS bounds ON data.name_id = bounds.name_id "
+            "WHERE bounds.high > bounds.low "
+            "GROUP BY data.name_id, bucket".format(table=table.__tablename__))
+        for name, (_, bucket, count) in self._named_rows(self.session.execute(
+                query, {"buckets": planner.HISTOGRAM_BUCKETS,
+                        "last_bucket": planner.HISTOGRAM_BUCKETS - 1})):
+            kind_stats[name].histogram[bucket] = count
+
+    def _named_rows(self, rows):
+        """
+        Pair each of some rows with the name of the datum it holds.
+
+        :param rows: An iterable of rows with a name_id column.
+
+        :returns: A list of (datum name, row) pairs.
+        """
+        rows = list(rows)
+        names = self.names.names_of(self.session, set(row.name_id for row in rows))
+        return [(names[row.name_id], row) for row in rows]
+
+    @staticmethod
+    def _stream_ordered_ids(query, table):
+        """
+        Stream the ids returned by a query, sorted ascending.
+
+        :param query: A query selecting the id column of <table>.
+        :param table: The table the query is against.
+
+        :returns: A generator of ids (as strings), in sorted order.
+        """
+        for row in query.order_by(table.id).yield_per(STREAM_CHUNK_SIZE):
+            yield str(row[0])
+
+    def get(self, id, data_fields=None, include_files=False):
         """
         Given a id, return match (if any) from SQL database.
 
         :param id: The id of the Record to return
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Record. See get_many().
+        :param include_files: Whether to return files along with data_fields.
 
         :returns: A Record matching id or None
         """
         LOGGER.debug('Getting record with id=%s', id)
+        if data_fields is not None:
+            return next(self.get_many([id], data_fields=data_fields,
+                                      include_files=include_files))
         query = (self.session.query(schema.Record)
                  .filter(schema.Record.id == id).one())
         return model.generate_record_from_json(
-            json_input=json.loads(query.raw))
+            json_input=self._full_raws({id: codec.decode_raw(query.raw)})[id])
+
+    def get_many(self, iter_of_ids, data_fields=None, include_files=False):
+        """
+        Given an iterable of ids, retrieve each corresponding Record.
+
+        Records are read IN_CHUNK_SIZE at a time, rather than one by one.
+
+        Given data_fields, raws aren't read at all. Only those data (and the
+        files, if include_files) are read, from the data and document tables,
+        so values come back as the tables hold them (as with
+        get_data_for_records()) and data kept only in raws are skipped. Files
+        come back in the order the Record lists them, as from
+        model.project_record(), so the raws are read when they're included.
+
+        :param iter_of_ids: An iterable object of ids to find.
+        :param data_fields: The names of the only data to return, or None for
+                            whole Records.
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: A generator of found Records, in the order their ids were
+                  given.
+
+        :raises NoResultFound: if any id has no Record, as for get().
+        """
+        LOGGER.debug('Getting many records with iter: %s', iter_of_ids)
+        table = schema.Record.__table__
+        if data_fields is None:
+            columns, chunk_size = [table.c.id, table.c.raw], IN_CHUNK_SIZE
+        else:
+            # Leave room in each query for the names
+            columns, chunk_size = [table.c.id, table.c.type], IN_CHUNK_SIZE // 2
+        for id_chunk in utils.chunked(iter_of_ids, chunk_size):
+            rows = {row.id: row for row in self.session.execute(
+                sqlalchemy.select(columns).where(table.c.id.in_(id_chunk)))}
+            _check_all_found(id_chunk, rows, 'Record')
+            if data_fields is None:
+                raws = self._full_raws({id: codec.decode_raw(row.raw)
+                                        for id, row in six.iteritems(rows)})
+                for id in id_chunk:
+                    yield model.generate_record_from_json(json_input=raws[id])
+            else:
+                data, files = self._table_contents(id_chunk, data_fields, include_files)
+                files = (self._raw_files(id_chunk, files) if include_files
+                         else defaultdict(list))
+                for id in id_chunk:
+                    yield model.Record(id=id, type=rows[id].type, data=data[id],
+                                       files=files[id])
+
+    def _full_raws(self, raws):
+        """
+        Rebuild Records' full raws from any that were stored as remainders.
+
+        The data and files left out of a remainder are read back from their
+        tables in bulk, IN_CHUNK_SIZE Records at a time.
+
+        :param raws: A dict of Record ids to their stored raws, decoded.
+
+        :returns: The dict, with each remainder replaced by the full raw.
+        """
+        remainder_ids = [id for id, raw in six.iteritems(raws) if REMAINDER_KEY in raw]
+        for id_chunk in utils.chunked(remainder_ids, IN_CHUNK_SIZE):
+            data, files = self._table_contents(id_chunk)
+            for id in id_chunk:
+                raws[id] = _filled_remainder(raws[id], data[id], files[id])
+        return raws
+
+    def _raw_files(self, ids, files):
+        """
+        Put Records' files in the order their raws list them.
+
+        :param ids: The ids of the Records, at most IN_CHUNK_SIZE.
+        :param files: The Records' files as read by _table_contents(), which
+                      fill in those a remainder left out.
+
+        :returns: A defaultdict of Record ids to lists of their files.
+        """
+        table = schema.Record.__table__
+        ordered = defaultdict(list)
+        for row in self.session.execute(
+                sqlalchemy.select([table.c.id, table.c.raw]).where(table.c.id.in_(ids))):
+            entries = codec.decode_raw(row.raw).get('files') or []
+            ordered[row.id] = [files[row.id][entry] if isinstance(entry, six.string_types)
+                               else entry for entry in entries]
+        return ordered
+
+    def _table_contents(self, ids, data_fields=None, include_files=True):
+        """
+        Read Records' data and files from their tables, in bulk.
+
+        :param ids: The ids of the Records to read, at most IN_CHUNK_SIZE (or
+                    half that, given data_fields).
+        :param data_fields: The names of the only data to read, or None for
+                            all of it.
+        :param include_files: Whether to read the files.
+
+        :returns: A tuple of two defaultdicts keyed by Record id: the first
+                  of dicts of data names to data, the second of dicts of file
+                  uris to file entries (empty if not include_files).
+        """
+        data = defaultdict(dict)
+        files = defaultdict(dict)
+        name_chunks = ([None] if data_fields is None
+                       else utils.chunked(data_fields, IN_CHUNK_SIZE // 2))
+        for names in name_chunks:
+            name_ids = None
+            if names is not None:
+                name_ids = list(self.names.ids_of(self.session, names).values())
+                if not name_ids:
+                    # None of these names are in the database
+                    continue
+            for table in (schema.ScalarData.__table__, schema.StringData.__table__):
+                for name, row in self._named_rows(self.session.execute(_select_data(
+                        table, [table.c.value, table.c.units, table.c.tags], ids, name_ids))):
+                    data[row.id][name] = _rebuilt_datum(row.value, row)
+            for master, entries in ((schema.ListScalarDataMaster.__table__,
+                                     schema.ListScalarDataEntry.__table__),
+                                    (schema.ListStringDataMaster.__table__,
+                                     schema.ListStringDataEntry.__table__)):
+                values = defaultdict(list)
+                for row in self.session.execute(
+                        _select_data(entries, [entries.c.value], ids, name_ids)
+                        .order_by(entries.c.id, entries.c.name_id, entries.c.index)):
+                    values[(row.id, row.name_id)].append(row.value)
+                for name, row in self._named_rows(self.session.execute(_select_data(
+                        master, [master.c.units, master.c.tags], ids, name_ids))):
+                    data[row.id][name] = _rebuilt_datum(values[(row.id, row.name_id)], row)
+        if include_files:
+            table = schema.Document.__table__
+            for row in self.session.execute(
+                    sqlalchemy.select([table.c.id, table.c.uri, table.c.mimetype, table.c.tags])
+                    .where(table.c.id.in_(ids))):
+                files[row.id][row.uri] = _rebuilt_file(row)
+        return data, files
+
+    def get_all(self, ids_only=False):
+        """
+        Return every Record in the SQL database.
+
+        Ids are streamed STREAM_CHUNK_SIZE at a time, in sorted order.
+
+        :param ids_only: whether to return only the ids of the Records
+
+        :returns: A generator of all Records (or, if ids_only, their ids)
+        """
+        LOGGER.debug('Getting all records.')
+        ids = self._stream_ordered_ids(self.session.query(schema.Record.id), schema.Record)
+        if ids_only:
+            for id in ids:
+                yield id
+        else:
+            # Ids are buffered a chunk ahead so the stream's cursor isn't
+            # left open across get_many()'s own queries
+            for id_chunk in utils.chunked(ids, STREAM_CHUNK_SIZE):
+                for record in self.get_many(id_chunk):
+                    yield record
 
     def get_all_of_type(self, type, ids_only=False):
         """
@@ -281,11 +1247,12 @@ class RecordDAO(dao.RecordDAO):
                 yield record
 
     # Disable the pylint check to if and until the team decides to refactor the method
-    def get_list(self,  # pylint: disable=too-many-branches
+    def get_list(self,  # pylint: disable=too-many-branches,too-many-arguments
                  datum_name,
                  list_of_contents,
                  operation,
-                 ids_only=False):
+                 ids_only=False,
+                 accepted_ids_list=None):
         """
         Given a list datum's name and values, return Records where the datum contains those values.
 
@@ -302,60 +1269,36 @@ class RecordDAO(dao.RecordDAO):
                                  single values ("egg", 12) or DataRanges.
         :pram operation: What kind of ListQueryOperation to do.
         :param ids_only: Whether to only return ids rather than full Records.
+        :param accepted_ids_list: A list of ids to restrict the search to.
+                                  If not provided, all ids will be used.
         :returns: A generator of ids of matching Records or the Records
-                  themselves (see ids_only).
+                  themselves (see ids_only), sorted by id.
         :raises ValueError: if given an empty list_of_contents
         :raises TypeError: if given a list that isn't all strings xor scalars.
         """
         LOGGER.info('Finding Records where datum %s contains %s: %s', datum_name,
                     operation.value.split('.')[0], list_of_contents)
-        if not list_of_contents:
-            raise ValueError("Must supply at least one entry in "
-                             "list_of_contents for {}".format(datum_name))
-
-        list_of_record_ids_sets = []
-
-        if all(isinstance(x, numbers.Real) or
-               (isinstance(x, utils.DataRange) and x.is_numeric_range())
-               for x in list_of_contents):
-            numeric = True
-            list_of_record_ids_sets.extend(
-                self._list_query(table=schema.ListScalarDataEntry,
-                                 datum_name=datum_name,
-                                 list_of_contents=list_of_contents))
-        elif all(isinstance(x, six.string_types) or
-                 (isinstance(x, utils.DataRange) and x.is_lexographic_range())
-                 for x in list_of_contents):
-            numeric = False
-            list_of_record_ids_sets.extend(
-                self._list_query(table=schema.ListStringDataEntry,
-                                 datum_name=datum_name,
-                                 list_of_contents=list_of_contents))
-        else:
-            raise TypeError("list_of_contents must be only strings or only scalars")
-        # This reduce "ands" together all the sets (one per criterion),
-        # creating one set that adheres to all our individual criterion sets.
+        table = self._pick_list_table(datum_name, list_of_contents)
+        # Every per-criterion query yields ids in sorted order, so they're
+        # combined as streams rather than as sets.
+        id_streams = self._list_query(table=table,
+                                      datum_name=datum_name,
+                                      list_of_contents=list_of_contents,
+                                      accepted_ids_list=accepted_ids_list)
         if operation == utils.ListQueryOperation.ALL:
-            record_ids = reduce((lambda x, y: x & y), list_of_record_ids_sets)
+            record_ids = utils.intersect_ordered(id_streams)
         elif operation == utils.ListQueryOperation.ANY:
-            record_ids = set.union(*list_of_record_ids_sets)
+            record_ids = utils.union_ordered(id_streams)
         elif operation == utils.ListQueryOperation.ONLY:
-            record_ids = reduce((lambda x, y: x & y), list_of_record_ids_sets)
             ranges = [x if isinstance(x, utils.DataRange)
                       else utils.DataRange(x, x, max_inclusive=True)
                       for x in list_of_contents]
-            if numeric:
-                excluded_ids = self._list_query(table=schema.ListScalarDataEntry,
-                                                datum_name=datum_name,
-                                                list_of_contents=utils.invert_ranges(ranges))
-            else:
-                excluded_ids = self._list_query(table=schema.ListStringDataEntry,
-                                                datum_name=datum_name,
-                                                list_of_contents=utils.invert_ranges(ranges))
-            for set_ids in excluded_ids:
-                for id_ in set_ids:
-                    if id_ in record_ids:
-                        record_ids.remove(id_)
+            excluded_ids = self._list_query(table=table,
+                                            datum_name=datum_name,
+                                            list_of_contents=utils.invert_ranges(ranges),
+                                            accepted_ids_list=accepted_ids_list)
+            record_ids = utils.difference_ordered(utils.intersect_ordered(id_streams),
+                                                  utils.union_ordered(excluded_ids))
         if ids_only:
             for record_id in record_ids:
                 yield record_id
@@ -363,28 +1306,59 @@ class RecordDAO(dao.RecordDAO):
             for record in self.get_many(record_ids):
                 yield record
 
-    def _list_query(self, table, datum_name, list_of_contents):
+    @staticmethod
+    def _pick_list_table(datum_name, list_of_contents):
         """
-        For each criterion, execute a query and add the set result to a list.
+        Return the table holding entries of a list datum with the given contents.
+
+        :param datum_name: The name of the datum
+        :param list_of_contents: The values the datum must contain. Can be
+                                 single values ("egg", 12) or DataRanges.
+
+        :returns: ListScalarDataEntry or ListStringDataEntry.
+
+        :raises ValueError: if given an empty list_of_contents
+        :raises TypeError: if given a list that isn't all strings xor scalars.
+        """
+        if not list_of_contents:
+            raise ValueError("Must supply at least one entry in "
+                             "list_of_contents for {}".format(datum_name))
+        if all(isinstance(x, numbers.Real) or
+               (isinstance(x, utils.DataRange) and x.is_numeric_range())
+               for x in list_of_contents):
+            return schema.ListScalarDataEntry
+        if all(isinstance(x, six.string_types) or
+               (isinstance(x, utils.DataRange) and x.is_lexographic_range())
+               for x in list_of_contents):
+            return schema.ListStringDataEntry
+        raise TypeError("list_of_contents must be only strings or only scalars")
+
+    def _list_query(self, table, datum_name, list_of_contents, accepted_ids_list=None):
+        """
+        For each criterion, build a query and add its (sorted) result to a list.
 
         :param table: Which table to query on: ListScalarDataEntry or
                       ListStringDataEntry.
         :param datum_name: The name of the datum
         :param list_of_contents: All the values datum_name must contain. Can be
                                  single values ("egg", 12) or DataRanges.
-        :returns: A list of sets of record ids, where each set is the result
-                  set of one query with one criterion.
+        :param accepted_ids_list: A list of ids to restrict the search to.
+                                  If not provided, all ids will be used.
+        :returns: A list of generators of record ids, where each generator
+                  yields the results of one query with one criterion, in
+                  sorted order.
         """
         criteria_tuples = [(datum_name, x) for x in list_of_contents]
-        list_of_record_ids_sets = []
+        list_of_record_id_streams = []
         for criterion in criteria_tuples:
             scalar_list_query = self.session.query(table.id)
-            records_list = self._apply_ranges_to_query(query=scalar_list_query,
-                                                       table=table,
-                                                       data=[criterion]).all()
-            list_of_record_ids_sets.append(set(str(record_id[0])
-                                               for record_id in records_list))
-        return list_of_record_ids_sets
+            if accepted_ids_list is not None:
+                scalar_list_query = scalar_list_query.filter(table.id.in_(accepted_ids_list))
+            records_query = self._apply_ranges_to_query(query=scalar_list_query,
+                                                        table=table,
+                                                        data=[criterion])
+            list_of_record_id_streams.append(self._stream_ordered_ids(records_query, table))
+        return list_of_record_id_streams
 
     def get_given_document_uri(self, uri, accepted_ids_list=None, ids_only=False):
         """
@@ -459,9 +1433,11 @@ class RecordDAO(dao.RecordDAO):
         # causes their parameters to merge and overwrite any shared names.
         # Here, we guarantee our params will have unique names per table.
         offset = PARAM_OFFSETS[table]
+        # A name the database lacks matches nothing, its id being NULL
+        name_ids = self.names.ids_of(self.session, (name for name, _ in data))
         for index, (name, criteria) in enumerate(data):
             range_components.append((name, criteria, index))
-            search_args["name{}{}".format(index, offset)] = name
+            search_args["name{}{}".format(index, offset)] = name_ids.get(name)
             if not isinstance(criteria, utils.DataRange):
                 search_args["eq{}{}".format(index, offset)] = criteria
             elif criteria.is_single_value():
@@ -516,7 +1492,7 @@ class RecordDAO(dao.RecordDAO):
 
         Example clause as raw SQL:
 
-        WHERE ScalarData.name=:scalar_name0 AND ScalarData.value<right_num0
+        WHERE ScalarData.name_id IS :name0 AND ScalarData.value < :max0
 
         :param name: The name of the value we apply the criteria to
         :param criteria: The criteria used to build the query.
@@ -546,7 +1522,7 @@ class RecordDAO(dao.RecordDAO):
         else:
             raise ValueError("Given a bad table for data query: {}".format(table))
 
-        conditions = ["({table}.name IS :name{index}{offset} AND {table}.value"
+        conditions = ["({table}.name_id IS :name{index}{offset} AND {table}.value"
                       .format(table=tablename, index=index, offset=offset)]
         if not isinstance(criteria, utils.DataRange):
             conditions.append(" = :eq{}{}".format(index, offset))
@@ -593,23 +1569,27 @@ class RecordDAO(dao.RecordDAO):
         """
         LOGGER.debug('Getting data in %s for record ids in %s', data_list, id_list)
         data = defaultdict(lambda: defaultdict(dict))
+        name_ids = self.names.ids_of(self.session, data_list)
+        if not name_ids:
+            return data
+        names = {id: name for name, id in six.iteritems(name_ids)}
         query_tables = [schema.ScalarData, schema.StringData]
         for query_table in query_tables:
             query = (self.session.query(query_table.id,
-                                        query_table.name,
+                                        query_table.name_id,
                                         query_table.value,
                                         query_table.units,
                                         query_table.tags)
                      .filter(query_table.id.in_(id_list))
-                     .filter(query_table.name.in_(data_list)))
+                     .filter(query_table.name_id.in_(list(names))))
             for result in query:
                 datapoint = {"value": result.value}
                 if result.units:
                     datapoint["units"] = result.units
                 if result.tags:
                     # Convert from string to ks
-                    datapoint["tags"] = json.loads(result.tags)
-                data[result.id][result.name] = datapoint
+                    datapoint["tags"] = codec.loads(result.tags)
+                data[result.id][names[result.name_id]] = datapoint
         return data
 
     def get_scalars(self, id, scalar_names):
@@ -631,18 +1611,21 @@ class RecordDAO(dao.RecordDAO):
         # never return stringdata
         LOGGER.debug('Getting scalars=%s for record id=%s', scalar_names, id)
         scalars = {}
-        query = (self.session.query(schema.ScalarData.name, schema.ScalarData.value,
+        name_ids = self.names.ids_of(self.session, scalar_names)
+        if not name_ids:
+            return scalars
+        names = {id: name for name, id in six.iteritems(name_ids)}
+        query = (self.session.query(schema.ScalarData.name_id, schema.ScalarData.value,
                                     schema.ScalarData.units, schema.ScalarData.tags)
                  .filter(schema.ScalarData.id == id)
-                 .filter(schema.ScalarData.name.in_(scalar_names))
-                 .order_by(schema.ScalarData.name.asc()).all())
-        for entry in query:
+                 .filter(schema.ScalarData.name_id.in_(list(names))).all())
+        for entry in sorted(query, key=lambda entry: names[entry[0]]):
             # SQL doesn't handle maps. so tags are stored as JSON lists.
             # This converts them to Python.
-            tags = json.loads(entry[3]) if entry[3] else None
-            scalars[entry[0]] = {'value': entry[1],
-                                 'units': entry[2],
-                                 'tags': tags}
+            tags = codec.loads(entry[3]) if entry[3] else None
+            scalars[names[entry[0]]] = {'value': entry[1],
+                                        'units': entry[2],
+                                        'tags': tags}
         return scalars
 
     def get_files(self, id):
@@ -661,7 +1644,7 @@ class RecordDAO(dao.RecordDAO):
                  .order_by(schema.Document.uri.asc()).all())
         files = []
         for entry in query:
-            tags = json.loads(entry[2]) if entry[2] else None
+            tags = codec.loads(entry[2]) if entry[2] else None
             files.append({'uri': entry[0], 'mimetype': entry[1], 'tags': tags})
         return files
 
@@ -669,9 +1652,16 @@ class RecordDAO(dao.RecordDAO):
 class RelationshipDAO(dao.RelationshipDAO):
     """The DAO responsible for handling Relationships in SQL."""
 
-    def __init__(self, session):
-        """Initialize RelationshipDAO with session for its SQL database."""
+    def __init__(self, session, adjacency=None):
+        """
+        Initialize RelationshipDAO with session for its SQL database.
+
+        :param session: The session to use.
+        :param adjacency: The factory's AdjacencyIndex, if it keeps one.
+                          Inserted Relationships are added to it.
+        """
         self.session = session
+        self.adjacency = adjacency
 
     def insert(self, relationship=None, subject_id=None,
                object_id=None, predicate=None):
@@ -695,6 +1685,39 @@ class RelationshipDAO(dao.RelationshipDAO):
                                              object_id=obj,
                                              predicate=pred))
         self.session.commit()
+        if self.adjacency is not None:
+            self.adjacency.observe([model.Relationship(subject_id=subj, object_id=obj,
+                                                       predicate=pred)])
+
+    def insert_many(self, list_to_insert):
+        """
+        Given a list of Relationships, insert them into a SQL database.
+
+        Every Relationship is validated before any are written, then all are
+        written in one transaction. Relationships already in the database
+        (including repeats within the list) are skipped.
+
+        :param list_to_insert: A list (or other iterable) of Relationships to
+                               insert
+
+        :raises ValueError: if any entry isn't a valid Relationship, in which
+                            case none are inserted.
+        """
+        rows = []
+        for relationship in list_to_insert:
+            # Checked by component: OR IGNORE would also skip a missing one
+            subj, obj, pred = self._validate_insert(subject_id=relationship.subject_id,
+                                                    object_id=relationship.object_id,
+                                                    predicate=relationship.predicate)
+            rows.append({"subject_id": subj, "object_id": obj, "predicate": pred})
+        LOGGER.debug('Inserting %i relationships.', len(rows))
+        if rows:
+            # executemany() with SQLite's conflict clause, skipping the ORM
+            self.session.execute(schema.Relationship.__table__.insert()
+                                 .prefix_with("OR IGNORE"), rows)
+        self.session.commit()
+        if self.adjacency is not None:
+            self.adjacency.observe(model.Relationship(**row) for row in rows)
 
     # Note that get() is implemented by its parent.
 
@@ -756,6 +1779,116 @@ class RelationshipDAO(dao.RelationshipDAO):
 
         return self._build_relationships(query.all())
 
+    def get_all(self):
+        """
+        Return every Relationship in the SQL database.
+
+        :returns: A generator of Relationships.
+        """
+        LOGGER.debug('Getting all relationships.')
+        query = self.session.query(schema.Relationship.subject_id,
+                                   schema.Relationship.predicate,
+                                   schema.Relationship.object_id)
+        for subject_id, predicate, object_id in query.yield_per(STREAM_CHUNK_SIZE):
+            yield model.Relationship(subject_id=subject_id, predicate=predicate,
+                                     object_id=object_id)
+
+    def count(self):
+        """
+        Return how many Relationships the SQL database holds.
+
+        :returns: The number of Relationships.
+        """
+        return self.session.query(sqlalchemy.func.count()).select_from(
+            schema.Relationship).scalar()
+
+    def generation(self):
+        """
+        Return a number that changes whenever the database's Relationships do.
+
+        It's kept by triggers on the Relationship table, so changes made by
+        any writer are counted.
+
+        :returns: The number of changes made to the Relationship table.
+        """
+        return self.session.query(schema.RelationshipGeneration.generation).scalar()
+
+    def _get_many_given(self, key, ids, predicate=None):
+        """
+        Find the Relationships whose subject or object is any of several ids.
+
+        Ids are looked up IN_CHUNK_SIZE at a time, one query per chunk.
+
+        :param key: 'subject_id' or 'object_id', whichever the ids are.
+        :param ids: A list of unique ids.
+        :param predicate: If not None, the predicate Relationships must have.
+
+        :returns: An iterable of Relationships.
+        """
+        column = getattr(schema.Relationship, key)
+        for id_chunk in utils.chunked(ids, IN_CHUNK_SIZE):
+            query = (self.session.query(schema.Relationship.subject_id,
+                                        schema.Relationship.predicate,
+                                        schema.Relationship.object_id)
+                     .filter(column.in_(id_chunk)))
+            if predicate is not None:
+                query = query.filter(schema.Relationship.predicate == predicate)
+            for subject_id, pred, object_id in query:
+                yield model.Relationship(subject_id=subject_id, predicate=pred,
+                                         object_id=object_id)
+
+    def traverse(self, start_ids, predicate=None, direction='out',
+                 max_depth=None, include_edges=False):
+        """
+        Find every id reachable from some starting ids by following Relationships.
+
+        Done in a single query, using a recursive common table expression.
+        See dao.RelationshipDAO.traverse() for details.
+
+        :param start_ids: An iterable of the ids to start from.
+        :param predicate: If provided, only follow Relationships with this
+                          predicate.
+        :param direction: 'out' to follow Relationships from subject to object,
+                          'in' for object to subject, 'both' for either.
+        :param max_depth: If provided, the most Relationships to follow from a
+                          starting id.
+        :param include_edges: Whether to also return the Relationships followed.
+
+        :returns: A set of the reachable ids or, if include_edges, a tuple of
+                  that set and a list of the Relationships followed.
+
+        :raises ValueError: if given an unknown direction.
+        """
+        self._validate_direction(direction)
+        LOGGER.debug('Traversing relationships from %s with predicate=%s, '
+                     'direction=%s, and max_depth=%s.', start_ids, predicate,
+                     direction, max_depth)
+        start_ids = list(set(start_ids))
+        reachable = set()
+        edges = []
+        if not start_ids or (max_depth is not None and max_depth < 1):
+            return (reachable, edges) if include_edges else reachable
+        query = sqlalchemy.text(_build_traversal_query(direction=direction,
+                                                       has_predicate=predicate is not None,
+                                                       has_max_depth=max_depth is not None,
+                                                       include_edges=include_edges))
+        query = query.bindparams(sqlalchemy.bindparam('start_ids', expanding=True))
+        result = self.session.execute(query, {'start_ids': start_ids, 'predicate': predicate,
+                                              'max_depth': max_depth})
+        # Python 2's sqlite3 only describes a WITH statement's columns when it
+        # finds rows, so there's nothing to fetch without them
+        if not result.returns_rows:
+            return (reachable, edges) if include_edges else reachable
+        # Ids come back with a NULL predicate, edges with their own
+        for subject_id, edge_predicate, object_id in result:
+            if edge_predicate is None:
+                reachable.add(subject_id)
+            else:
+                edges.append(model.Relationship(subject_id=subject_id,
+                                                predicate=edge_predicate,
+                                                object_id=object_id))
+        return (reachable, edges) if include_edges else reachable
+
 
 class RunDAO(dao.RunDAO):
     """DAO responsible for handling Runs, (Record subtype), in SQL."""
@@ -766,31 +1899,107 @@ class RunDAO(dao.RunDAO):
         self.session = session
         self.record_dao = record_dao
 
-    def insert(self, run):
+    # pylint: disable=arguments-differ
+    # Args differ because force_overwrite isn't part of the generic DAO yet, SIBO-307
+    def insert(self, run, force_overwrite=False, trusted=False):
         """
         Given a Run, import it into the current SQL database.
 
         :param run: A Run to import
+        :param force_overwrite: Whether to overwrite a preexisting Run that
+                                shares this Run's id.
+        :param trusted: Whether the Run is known to be valid. See
+                        RecordDAO.insert().
+        """
+        self.insert_many([run], force_overwrite=force_overwrite, trusted=trusted)
+
+    # pylint: disable=arguments-differ
+    # Args differ for the same reason as insert()
+    def insert_many(self, list_to_insert, force_overwrite=False, trusted=False):
+        """
+        Given a list of Runs, insert them into the current SQL database.
+
+        All are inserted in a single transaction. See RecordDAO.insert_many()
+        for force_overwrite; the Run metadata is upserted as well.
+
+        :param list_to_insert: A list of Runs to insert
+        :param force_overwrite: Whether to overwrite preexisting Runs that
+                                share ids with those given.
+        :param trusted: Whether the Runs are known to be valid. See
+                        RecordDAO.insert().
         """
-        self.record_dao.insert(run, called_from_child=True)
-        self.session.add(schema.Run(id=run.id,
-                                    application=run.application,
-                                    user=run.user,
-                                    version=run.version))
+        self.record_dao.insert_many(list_to_insert, called_from_child=True,
+                                    force_overwrite=force_overwrite, trusted=trusted)
+        run_rows = [{'id': run.id,
+                     'application': run.application,
+                     'user': run.user,
+                     'version': run.version} for run in list_to_insert]
+        if force_overwrite:
+            _upsert(self.session, schema.Run.__table__, run_rows)
+        else:
+            self.session.add_all(schema.Run(**row) for row in run_rows)
         self.session.commit()
 
-    def get(self, id):
+    def get(self, id, data_fields=None, include_files=False):
         """
         Given a run's id, return match (if any) from the SQL database.
 
         :param id: The id of some run
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Run. See RecordDAO.get_many().
+        :param include_files: Whether to return files along with data_fields.
 
         :returns: A run matching that identifier or None
         """
         LOGGER.debug('Getting run with id: %s', id)
+        if data_fields is not None:
+            return next(self.get_many([id], data_fields=data_fields,
+                                      include_files=include_files))
         record = (self.session.query(schema.Record)
                   .filter(schema.Record.id == id).one())
-        return model.generate_run_from_json(json.loads(record.raw))
+        # The record DAO rebuilds raws stored as remainders
+        raws = self.record_dao._full_raws(  # pylint: disable=protected-access
+            {id: codec.decode_raw(record.raw)})
+        return model.generate_run_from_json(raws[id])
+
+    def get_many(self, iter_of_ids, data_fields=None, include_files=False):
+        """
+        Given an iterable of ids, retrieve each corresponding run.
+
+        Given data_fields, the Runs are read in bulk, only those data (and
+        the files, if include_files) read from the tables holding them. See
+        RecordDAO.get_many().
+
+        :param iter_of_ids: An iterable object of ids to find.
+        :param data_fields: The names of the only data to return, or None for
+                            whole Runs.
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: A generator of found Runs, in the order their ids were given.
+
+        :raises NoResultFound: if any id has no Run, as for get().
+        """
+        if data_fields is None:
+            for run in super(RunDAO, self).get_many(iter_of_ids):
+                yield run
+            return
+        table = schema.Run.__table__
+        for id_chunk in utils.chunked(iter_of_ids, IN_CHUNK_SIZE // 2):
+            rows = {row.id: row for row in self.session.execute(
+                table.select().where(table.c.id.in_(id_chunk)))}
+            # The record DAO reads the data and files
+            # pylint: disable=protected-access
+            data, files = self.record_dao._table_contents(id_chunk, data_fields, include_files)
+            files = (self.record_dao._raw_files(id_chunk, files) if include_files
+                     else defaultdict(list))
+            for id in id_chunk:
+                if id in rows:
+                    yield model.Run(id=id, application=rows[id].application,
+                                    user=rows[id].user, version=rows[id].version,
+                                    data=data[id], files=files[id])
+                else:
+                    # Runs inserted as Records have no Run row, only a raw
+                    yield model.project_record(self.get(id), data_fields, include_files)
 
     def delete(self, id):
         """
@@ -811,6 +2020,475 @@ class RunDAO(dao.RunDAO):
         """
         self.record_dao.delete_many(ids_to_delete)
 
+    # pylint: disable=arguments-differ
+    # Args differ for the same reason as insert()
+    def replace_many(self, list_to_replace, trusted=False):
+        """
+        Given a list of Runs already in the database, replace their contents.
+
+        See RecordDAO.replace_many(); the Run metadata is replaced as well.
+
+        :param list_to_replace: A list of Runs to replace the stored ones with
+        :param trusted: Whether the Runs are known to be valid. See
+                        RecordDAO.insert().
+        """
+        self.insert_many(list_to_replace, force_overwrite=True, trusted=trusted)
+
+
+def _build_traversal_query(direction, has_predicate, has_max_depth, include_edges):
+    """
+    Build the SQL for RelationshipDAO.traverse().
+
+    The query walks the Relationship table from :start_ids, optionally only
+    along :predicate and up to :max_depth Relationships deep. It returns one
+    (id, NULL, NULL) row per reachable id and, if include_edges, one
+    (subject_id, predicate, object_id) row per Relationship followed.
+
+    :param direction: One of dao.TRAVERSAL_DIRECTIONS.
+    :param has_predicate: Whether to filter on :predicate.
+    :param has_max_depth: Whether to stop at :max_depth.
+    :param include_edges: Whether to return the Relationships followed.
+
+    :returns: The SQL, as a string.
+    """
+    predicate_filter = " AND rel.predicate = :predicate" if has_predicate else ""
+    # Relationships are followed from the id in one column (where the walk
+    # has already been) to the id in the other.
+    if direction == 'out':
+        steps = [("subject_id", "object_id")]
+    elif direction == 'in':
+        steps = [("object_id", "subject_id")]
+    else:
+        steps = [("subject_id", "object_id"), ("object_id", "subject_id")]
+
+    # Seed the walk with the starting ids' neighbors, then recurse. Without a
+    # max_depth, depth isn't tracked, so that UNION can stop the walk on cycles.
+    depth = ", 1" if has_max_depth else ""
+    seed = " UNION ".join("SELECT rel.{} AS id{} FROM Relationship AS rel "
+                          "WHERE rel.{} IN :start_ids{}"
+                          .format(to_col, depth, from_col, predicate_filter)
+                          for from_col, to_col in steps)
+    neighbor = ("CASE WHEN rel.subject_id = walk.id THEN rel.object_id "
+                "ELSE rel.subject_id END" if direction == 'both'
+                else "rel.{}".format(steps[0][1]))
+    touches = ("walk.id IN (rel.subject_id, rel.object_id)" if direction == 'both'
+               else "rel.{} = walk.id".format(steps[0][0]))
+    if has_max_depth:
+        columns = "walk(id, depth)"
+        recurse = ("SELECT {}, walk.depth + 1 FROM walk JOIN Relationship AS rel ON {}{} "
+                   "WHERE walk.depth < :max_depth"
+                   .format(neighbor, touches, predicate_filter))
+    else:
+        columns = "walk(id)"
+        recurse = ("SELECT {} FROM walk JOIN Relationship AS rel ON {}{}"
+                   .format(neighbor, touches, predicate_filter))
+    sql = ("WITH RECURSIVE {} AS (SELECT * FROM ({}) UNION {}) "
+           "SELECT DISTINCT id, NULL, NULL FROM walk".format(columns, seed, recurse))
+    if include_edges:
+        # Relationships followed are those leading out of the starting ids,
+        # or out of reachable ids not yet at the maximum depth.
+        expanded = ("SELECT id FROM walk WHERE depth < :max_depth" if has_max_depth
+                    else "SELECT id FROM walk")
+        touched = " OR ".join("rel.{col} IN :start_ids OR rel.{col} IN ({expanded})"
+                              .format(col=from_col, expanded=expanded)
+                              for from_col, _ in steps)
+        sql += (" UNION ALL SELECT rel.subject_id, rel.predicate, rel.object_id "
+                "FROM Relationship AS rel WHERE ({}){}".format(touched, predicate_filter))
+    return sql
+
+
+def _check_raw_storage(raw_storage):
+    """
+    Check that a mode of storing raws is supported.
+
+    :param raw_storage: The mode, which should be one of RAW_STORAGE_MODES.
+
+    :raises ValueError: if it isn't.
+    """
+    if raw_storage not in RAW_STORAGE_MODES:
+        msg = ('Unknown raw_storage "{}". Supported modes are: {}'
+               .format(raw_storage, ', '.join(RAW_STORAGE_MODES)))
+        LOGGER.error(msg)
+        raise ValueError(msg)
+
+
+def _check_all_found(ids, found, kind):
+    """
+    Check that a bulk read found something for every id.
+
+    :param ids: The ids read.
+    :param found: A dict (or other container) of the ids found.
+    :param kind: What was read, for the error message (ex: "Record").
+
+    :raises NoResultFound: if any id wasn't found, like Query.one() would.
+    """
+    missing = [id for id in ids if id not in found]
+    if missing:
+        msg = 'No {} found with id={}'.format(kind, missing[0])
+        LOGGER.error(msg)
+        raise sqlalchemy.orm.exc.NoResultFound(msg)
+
+
+def _select_data(table, columns, ids, name_ids=None):
+    """
+    Build a query for some of the data of some Records.
+
+    :param table: The data table to query.
+    :param columns: The columns to select, besides the id and name_id.
+    :param ids: The ids of the Records whose data to select.
+    :param name_ids: The DataName ids of the data to select, or None for all.
+
+    :returns: The query, selecting the id, name_id, and columns.
+    """
+    query = (sqlalchemy.select([table.c.id, table.c.name_id] + columns)
+             .where(table.c.id.in_(ids)))
+    if name_ids is not None:
+        query = query.where(table.c.name_id.in_(name_ids))
+    return query
+
+
+def _encoded_raw(raw_json, compression):
+    """
+    Prepare a serialized raw for the Record table, as codec.encode_raw() does.
+
+    Compressed raws are bytes, which on Python 2 are str, so sqlite3 would
+    bind them as TEXT and fail to decode them on reading. There, they're
+    bound as BLOBs instead.
+
+    :param raw_json: The raw as a JSON string.
+    :param compression: How to compress it, one of codec.RAW_COMPRESSIONS,
+                        or None to leave it be.
+
+    :returns: The raw as it should be bound.
+    """
+    stored = codec.encode_raw(raw_json, compression)
+    return sqlite3.Binary(stored) if six.PY2 and compression is not None else stored
+
+
+def _raw_remainder(raw):
+    """
+    Build the remainder of a Record's raw, leaving out what the tables hold.
+
+    A datum is left out (replaced by a stand-in code) only if the data tables
+    give it back exactly: it has nothing but a value, units, and tags, its
+    units are a string, its tags a list of strings, and its value is a
+    string, finite float, or int a float can represent (or a list of one of
+    those kinds). A file is left out (replaced by its uri) only if it has
+    nothing but a uri, mimetype, and tags, all strings (or list of strings).
+    Everything else is kept as is.
+
+    :param raw: The Record's full raw.
+
+    :returns: The remainder, a new dict.
+    """
+    remainder = dict(raw)
+    remainder[REMAINDER_KEY] = REMAINDER_VERSION
+    if raw.get('data'):
+        remainder['data'] = {name: _datum_code(datum)
+                             for name, datum in six.iteritems(raw['data'])}
+    if raw.get('files'):
+        uris = [entry.get('uri') for entry in raw['files']]
+        remainder['files'] = [entry['uri'] if _is_plain_file(entry)
+                              and uris.count(entry['uri']) == 1
+                              else entry for entry in raw['files']]
+    return remainder
+
+
+def _datum_code(datum):
+    """
+    Find the stand-in code for a datum, if it can be left out of a remainder.
+
+    :param datum: A datum from a Record's raw.
+
+    :returns: _FROM_TABLES or _FROM_TABLES_AS_INTS if the datum can be left
+              out, otherwise the datum itself.
+    """
+    if (not isinstance(datum, dict) or 'value' not in datum
+            or not set(datum).issubset(('value', 'units', 'tags'))
+            or not isinstance(datum.get('units', ''), six.string_types)
+            or not _is_string_list(datum.get('tags', []))):
+        return datum
+    values = datum['value'] if isinstance(datum['value'], list) else [datum['value']]
+    if all(isinstance(value, six.string_types) for value in values):
+        return _FROM_TABLES
+    if all(type(value) is float  # pylint: disable=unidiomatic-typecheck
+           and not (math.isinf(value) or math.isnan(value))
+           and not (value == 0 and math.copysign(1, value) < 0) for value in values):
+        return _FROM_TABLES
+    if all(isinstance(value, six.integer_types) and not isinstance(value, bool)
+           and abs(value) <= _MAX_EXACT_INT for value in values):
+        return _FROM_TABLES_AS_INTS
+    return datum
+
+
+def _is_plain_file(entry):
+    """
+    Check whether a file entry can be left out of a remainder.
+
+    :param entry: A file entry from a Record's raw.
+
+    :returns: Whether the document table gives back the entry exactly.
+    """
+    return (isinstance(entry, dict)
+            and isinstance(entry.get('uri'), six.string_types)
+            and set(entry).issubset(('uri', 'mimetype', 'tags'))
+            and isinstance(entry.get('mimetype', ''), six.string_types)
+            and _is_string_list(entry.get('tags', [])))
+
+
+def _is_string_list(value):
+    """Return whether value is a list of strings."""
+    return (isinstance(value, list)
+            and all(isinstance(entry, six.string_types) for entry in value))
+
+
+def _rebuilt_datum(value, row):
+    """
+    Rebuild a datum left out of a remainder.
+
+    :param value: The datum's value (or list of values), from its table.
+    :param row: The datum's row (or list master row), giving units and tags.
+
+    :returns: The datum, as in a raw.
+    """
+    datum = {'value': value}
+    if row.units is not None:
+        datum['units'] = row.units
+    if row.tags is not None:
+        datum['tags'] = codec.loads(row.tags)
+    return datum
+
+
+def _rebuilt_file(row):
+    """
+    Rebuild a file entry left out of a remainder.
+
+    :param row: The file's row in the document table.
+
+    :returns: The file entry, as in a raw.
+    """
+    entry = {'uri': row.uri}
+    if row.mimetype is not None:
+        entry['mimetype'] = row.mimetype
+    if row.tags is not None:
+        entry['tags'] = codec.loads(row.tags)
+    return entry
+
+
+def _filled_remainder(remainder, data, files):
+    """
+    Fill the data and files left out of a remainder back in.
+
+    :param remainder: The remainder of a Record's raw.
+    :param data: The Record's data as rebuilt from the data tables, a dict
+                 of names to data.
+    :param files: The Record's files as rebuilt from the document table, a
+                  dict of uris to file entries.
+
+    :returns: The Record's full raw.
+    """
+    raw = dict(remainder)
+    del raw[REMAINDER_KEY]
+    if 'data' in raw:
+        raw['data'] = {}
+        for name, datum in six.iteritems(remainder['data']):
+            if datum == _FROM_TABLES_AS_INTS:
+                datum = data[name]
+                datum['value'] = ([int(value) for value in datum['value']]
+                                  if isinstance(datum['value'], list)
+                                  else int(datum['value']))
+            elif datum == _FROM_TABLES:
+                datum = data[name]
+            raw['data'][name] = datum
+    if 'files' in raw:
+        raw['files'] = [files[entry] if isinstance(entry, six.string_types) else entry
+                        for entry in remainder['files']]
+    return raw
+
+
+def _upsert(session, table, rows):
+    """
+    Insert rows into a table, updating those whose primary key is already taken.
+
+    Uses SQLite's INSERT ... ON CONFLICT DO UPDATE (SQLite 3.24+). Unlike
+    INSERT OR REPLACE, this updates rows in place rather than deleting them,
+    so nothing cascades from the rows replaced.
+
+    :param session: The session to execute with.
+    :param table: The Table to upsert into.
+    :param rows: A list of dicts, each giving a value for every column.
+    """
+    if not rows:
+        return
+    primary_key = [column.name for column in table.primary_key]
+    others = [column.name for column in table.columns if column.name not in primary_key]
+    statement = 'INSERT INTO "{}" ({}) VALUES ({}) ON CONFLICT ({}) DO {}'.format(
+        table.name,
+        ', '.join('"{}"'.format(column.name) for column in table.columns),
+        ', '.join(':{}'.format(column.name) for column in table.columns),
+        ', '.join('"{}"'.format(name) for name in primary_key),
+        ('UPDATE SET ' + ', '.join('"{0}" = excluded."{0}"'.format(name) for name in others)
+         if others else 'NOTHING'))
+    session.execute(sqlalchemy.text(statement), rows)
+
+
+def _temporary_id_table(name):
+    """
+    Describe a temporary table of Record ids.
+
+    The table is only visible to the connection that creates it.
+
+    :param name: The name of the table.
+
+    :returns: An (uncreated) sqlalchemy Table with one column, id.
+    """
+    return sqlalchemy.Table(name, sqlalchemy.MetaData(),
+                            sqlalchemy.Column('id', sqlalchemy.String(255), primary_key=True),
+                            prefixes=['TEMPORARY'])
+
+
+def _incremental_vacuum(connection):
+    """
+    Free a database's unused pages, switching it to incremental auto-vacuum if need be.
+
+    :param connection: A connection to the database.
+    """
+    if connection.execute("PRAGMA auto_vacuum").scalar() != _AUTO_VACUUM_INCREMENTAL:
+        LOGGER.info('Switching database to incremental auto-vacuum; this takes a VACUUM.')
+        connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        connection.execute("VACUUM")
+    else:
+        connection.execute("PRAGMA incremental_vacuum")
+
+
+def _table_sizes(connection):
+    """
+    Measure each of Sina's tables.
+
+    Sizes come from SQLite's dbstat table, which not every build includes.
+
+    :param connection: A connection to the database.
+
+    :returns: A dict of table name: {"rows": number of rows, "bytes": bytes
+              taken by the table and its indexes, or None if unknown}.
+    """
+    sizes = None
+    try:
+        owners = dict(tuple(row) for row in connection.execute(
+            "SELECT name, tbl_name FROM sqlite_master WHERE type IN ('table', 'index')"))
+        sizes = defaultdict(int)
+        for name, size in connection.execute(
+                "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"):
+            sizes[owners.get(name, name)] += size
+    except sqlalchemy.exc.OperationalError:
+        LOGGER.debug('SQLite was built without dbstat; table sizes are unknown.')
+    return {table.name: {"rows": connection.execute(
+        sqlalchemy.select([sqlalchemy.func.count()]).select_from(table)).scalar(),
+                         "bytes": sizes.get(table.name) if sizes is not None else None}
+            for table in schema.Base.metadata.sorted_tables}
+
+
+def _encode_data_names(engine):
+    """
+    Move the datum names out of an older database's data tables.
+
+    Databases made before the DataName table existed keep each datum's name
+    in every data row. Their names are copied into DataName, then each data
+    table is rebuilt with name ids in their place, all in one transaction.
+    Databases already using DataName are left be.
+
+    :param engine: The engine for the database, its tables already created.
+    """
+    with engine.begin() as connection:
+        columns = [row[1] for row in connection.execute('PRAGMA table_info("ScalarData")')]
+        if 'name' not in columns:
+            return
+        LOGGER.info('Moving datum names into the DataName table. This happens once.')
+        connection.execute('INSERT OR IGNORE INTO DataName (name) {}'.format(
+            ' UNION '.join('SELECT name FROM "{}"'.format(table.name)
+                           for table in DATA_TABLES)))
+        for table in DATA_TABLES:
+            old_name = 'sina_old_' + table.name
+            # The new table's indexes will take the old ones' names
+            for (index,) in connection.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? "
+                    "AND sql IS NOT NULL", (table.name,)).fetchall():
+                connection.execute('DROP INDEX "{}"'.format(index))
+            connection.execute('ALTER TABLE "{}" RENAME TO "{}"'.format(table.name, old_name))
+            table.create(connection)
+            others = [column.name for column in table.columns if column.name != 'name_id']
+            connection.execute(
+                'INSERT INTO "{table}" (name_id, {columns}) '
+                'SELECT DataName.id, {old_columns} FROM "{old}" AS old '
+                'JOIN DataName ON DataName.name = old.name'.format(
+                    table=table.name, old=old_name,
+                    columns=', '.join('"{}"'.format(name) for name in others),
+                    old_columns=', '.join('old."{}"'.format(name) for name in others)))
+            connection.execute('DROP TABLE "{}"'.format(old_name))
+
+
+def create_sqlite_engine(db_path=None, pooled=False, **kwargs):
+    """
+    Create an engine for a SQLite database, creating any tables it lacks.
+
+    Tables added to the schema since an existing database was made (such as
+    RecordHash) are created alongside its old ones. A database from before
+    datum names were moved to the DataName table has its data tables
+    rewritten to match (see _encode_data_names()).
+
+    Connections made by the engine after the tables are created have foreign
+    key support enabled.
+
+    A pooled engine keeps a pool of connections that can be handed to any
+    thread, and puts the database in write-ahead logging (WAL) mode so that
+    readers never block the writer (or vice versa). Writers wait up to
+    POOLED_BUSY_TIMEOUT seconds for each other rather than failing.
+
+    :param db_path: Path to the database. If None, will use an in-memory
+                    database.
+    :param pooled: Whether to create a pooled engine. Requires a db_path.
+    :param kwargs: Further arguments for sqlalchemy.create_engine().
+
+    :returns: A tuple of the engine and whether the database was created.
+
+    :raises ValueError: if asked to pool an in-memory database.
+    """
+    if pooled:
+        if not db_path:
+            msg = ("A pooled engine requires a db_path; an in-memory database "
+                   "can't be shared between connections.")
+            LOGGER.error(msg)
+            raise ValueError(msg)
+        kwargs.setdefault('poolclass', sqlalchemy.pool.QueuePool)
+        kwargs.setdefault('pool_size', POOL_SIZE)
+        kwargs.setdefault('max_overflow', POOL_MAX_OVERFLOW)
+        # Connections are checked out by one thread at a time, but not always
+        # the thread that created them.
+        kwargs.setdefault('connect_args', {'check_same_thread': False,
+                                           'timeout': POOLED_BUSY_TIMEOUT})
+    if db_path:
+        engine = sqlalchemy.create_engine(SQLITE + db_path, **kwargs)
+        is_new = not os.path.exists(db_path)
+    else:
+        engine = sqlalchemy.create_engine('sqlite:///', **kwargs)
+        is_new = True
+    schema.Base.metadata.create_all(engine)
+    if not is_new:
+        _encode_data_names(engine)
+
+    def configure_on_connect(connection, _):
+        """Activate foreign key support (and WAL, if pooled) on connection creation."""
+        connection.execute('pragma foreign_keys=ON')
+        if pooled:
+            connection.execute('pragma journal_mode=WAL')
+
+    sqlalchemy.event.listen(engine, 'connect', configure_on_connect)
+    if pooled:
+        # Don't hand out the connection that created the tables, which missed
+        # the configuration above.
+        engine.dispose()
+    return engine, is_new
+
 
 class DAOFactory(dao.DAOFactory):
     """
@@ -819,31 +2497,125 @@ class DAOFactory(dao.DAOFactory):
     Includes Records, Relationships, etc.
     """
 
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, pooled=False,  # pylint: disable=too-many-arguments
+                 adjacency_index=False, raw_compression=None, raw_storage='full'):
         """
         Initialize a Factory with a path to its backend.
 
         Currently supports only SQLite.
 
+        By default, every DAO the factory creates shares one session, so the
+        factory (and its DAOs) should only be used from one thread. A pooled
+        factory instead gives each thread its own session, drawing on a pool
+        of connections to a database in WAL mode, so DAOs can be used from
+        many threads at once (ex: by utils.import_many_jsons()).
+
         :param db_path: Path to the database to use as a backend. If None, will
                         use an in-memory database.
+        :param pooled: Whether to give each thread its own session. Requires
+                       a db_path.
+        :param adjacency_index: Whether to keep an AdjacencyIndex of the
+                                database's Relationships, available as
+                                .adjacency. For a file database, it's saved
+                                alongside it (at db_path + INDEX_SUFFIX).
+                                Requires numpy.
+        :param raw_compression: How to compress the raws of Records inserted,
+                                one of codec.RAW_COMPRESSIONS, or None not to.
+                                See RecordDAO.compress_raws() to compress
+                                those already stored.
+        :param raw_storage: How much of the raws of Records inserted to store,
+                            one of RAW_STORAGE_MODES. See RecordDAO.
+
+        :raises ValueError: if asked to pool an in-memory database, or for an
+                            unknown raw_compression or raw_storage.
+        :raises ImportError: if asked for an adjacency index without numpy, or
+                             for lz4 compression without lz4.
         """
+        codec.check_raw_compression(raw_compression)
+        _check_raw_storage(raw_storage)
         self.db_path = db_path
-        if db_path:
-            engine = sqlalchemy.create_engine(SQLITE + db_path)
-            if not os.path.exists(db_path):
-                schema.Base.metadata.create_all(engine)
+        self.pooled = pooled
+        self.raw_compression = raw_compression
+        self.raw_storage = raw_storage
+        self.engine, is_new = create_sqlite_engine(db_path, pooled=pooled)
+        # A new database's statistics can be kept complete from the start.
+        # Otherwise, they're partial until RecordDAO.analyze() is run.
+        self.statistics = planner.StatisticsCatalog(complete=is_new)
+        session = sqlalchemy.orm.sessionmaker(bind=self.engine)
+        self.names = DataNameCache(session)
+        self.observer = CommittedStatistics(session, self.statistics)
+        if pooled:
+            # Proxies to a session local to the calling thread
+            self.session = sqlalchemy.orm.scoped_session(session)
+            self.supports_parallel_ingestion = True
         else:
-            engine = sqlalchemy.create_engine('sqlite:///')
-            schema.Base.metadata.create_all(engine)
+            self.session = session()
+        if not is_new:
+            # Start from those stored by the last analyze, if any. As the
+            # database may have changed since, they stay partial.
+            self.statistics.replace(
+                (planner.DatumStatistics(**json.loads(row.stats))
+                 for row in self.session.query(schema.DatumStatistics)), complete=False)
+        self.adjacency = None
+        if adjacency_index:
+            self.adjacency = sina.adjacency.AdjacencyIndex(
+                RelationshipDAO(session=self.session),
+                path=db_path + sina.adjacency.INDEX_SUFFIX if db_path else None)
+
+    def optimize(self, vacuum=None):
+        """
+        Tune the database for querying, reporting what was done.
 
-        def configure_on_connect(connection, _):
-            """Activate foreign key support on connection creation."""
-            connection.execute('pragma foreign_keys=ON')
+        Collects fresh statistics for Sina's query planner, stored in the
+        database (see RecordDAO.analyze()), then has SQLite collect its own
+        (ANALYZE), which it uses to plan the queries Sina generates, and make
+        any other optimizations it sees fit (PRAGMA optimize). Optionally
+        finishes by reclaiming the space left unused by deletions:
 
-        sqlalchemy.event.listen(engine, 'connect', configure_on_connect)
-        session = sqlalchemy.orm.sessionmaker(bind=engine)
-        self.session = session()
+        * "full" VACUUMs the database, rewriting it entirely.
+        * "incremental" frees unused pages without rewriting the rest. The
+          first time, the database is switched to incremental auto-vacuum,
+          which takes a full VACUUM.
+
+        :param vacuum: How to vacuum the database, one of VACUUM_MODES, or
+                       None not to.
+
+        :returns: A dict of "seconds", the time spent on each step; "tables",
+                  the number of rows and bytes (None if SQLite can't tell)
+                  of each table, indexes included; and "size_before" and
+                  "size_after", the size of the database file in bytes (None
+                  for an in-memory database).
+
+        :raises ValueError: if given an unknown vacuum mode.
+        """
+        if vacuum is not None and vacuum not in VACUUM_MODES:
+            msg = 'Unknown vacuum mode {}. Choose from {}.'.format(vacuum, VACUUM_MODES)
+            LOGGER.error(msg)
+            raise ValueError(msg)
+        LOGGER.info('Optimizing database %s.', self.db_path)
+        report = {"seconds": {}, "size_before": self._file_size()}
+
+        def timed(step, function):
+            """Run one step, noting how long it took."""
+            start = time.time()
+            function()
+            report["seconds"][step] = time.time() - start
+
+        timed("statistics", self.create_record_dao().analyze)
+        with self.engine.connect() as connection:
+            timed("analyze", lambda: connection.execute("ANALYZE"))
+            timed("optimize", lambda: connection.execute("PRAGMA optimize"))
+            if vacuum == "full":
+                timed("vacuum", lambda: connection.execute("VACUUM"))
+            elif vacuum == "incremental":
+                timed("vacuum", lambda: _incremental_vacuum(connection))
+            report["tables"] = _table_sizes(connection)
+        report["size_after"] = self._file_size()
+        return report
+
+    def _file_size(self):
+        """Return the size of the database file in bytes, or None if in memory."""
+        return os.path.getsize(self.db_path) if self.db_path else None
 
     def create_record_dao(self):
         """
@@ -851,7 +2623,10 @@ class DAOFactory(dao.DAOFactory):
 
         :returns: a RecordDAO
         """
-        return RecordDAO(session=self.session)
+        return RecordDAO(session=self.session, statistics=self.statistics,
+                         adjacency=self.adjacency, raw_compression=self.raw_compression,
+                         raw_storage=self.raw_storage, names=self.names,
+                         observer=self.observer)
 
     def create_relationship_dao(self):
         """
@@ -859,7 +2634,7 @@ class DAOFactory(dao.DAOFactory):
 
         :returns: a RelationshipDAO
         """
-        return RelationshipDAO(session=self.session)
+        return RelationshipDAO(session=self.session, adjacency=self.adjacency)
 
     def create_run_dao(self):
         """
@@ -872,4 +2647,6 @@ class DAOFactory(dao.DAOFactory):
 
     def __repr__(self):
         """Return a string representation of a SQL DAOFactory."""
+        if self.pooled:
+            return 'SQL DAOFactory <db_path={}, pooled=True>'.format(self.db_path)
         return 'SQL DAOFactory <db_path={}>'.format(self.db_path)
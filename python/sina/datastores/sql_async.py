@@ -0,0 +1,467 @@
+"""
+Contains asyncio implementations of our SQL DAOs.
+
+SQLite offers no asynchronous interface, so each call is run on a thread pool
+by the matching synchronous DAO from sina.datastores.sql, using a session of
+its own. Calls from concurrent tasks therefore overlap rather than queueing
+behind a single shared session.
+
+Requires Python 3.5 or above.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import logging
+import types
+
+import sqlalchemy
+from sqlalchemy.pool import StaticPool
+
+import sina.async_dao as async_dao
+import sina.planner as planner
+import sina.datastores.sql as sql
+
+LOGGER = logging.getLogger(__name__)
+
+# Disable pylint checks due to ubiquitous use of id and type
+# pylint: disable=invalid-name,redefined-builtin
+
+
+class AsyncRecordDAO(async_dao.AsyncRecordDAO):
+    """The async DAO specifically responsible for handling Records in SQL."""
+
+    def __init__(self, factory):
+        """
+        Initialize AsyncRecordDAO.
+
+        :param factory: The AsyncDAOFactory whose thread pool and sessions to use.
+        """
+        self.factory = factory
+
+    def _run(self, method_name, *args, **kwargs):
+        """Run a method of a synchronous RecordDAO on the factory's thread pool."""
+        return self.factory.run_in_session(self.factory.build_record_dao,
+                                           method_name, *args, **kwargs)
+
+    async def get(self, id, data_fields=None, include_files=False):
+        """
+        Given an id, return the matching Record from the SQL database.
+
+        :param id: The id of the Record to return.
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Record. See sina.dao.RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: The matching Record.
+        """
+        return await self._run('get', id, data_fields=data_fields, include_files=include_files)
+
+    async def get_many(self, iter_of_ids, data_fields=None, include_files=False):
+        """
+        Given an iterable of ids, retrieve each corresponding Record.
+
+        The Records are read by one task rather than one task per id.
+
+        :param iter_of_ids: An iterable object of ids to find.
+        :param data_fields: The names of the only data to return, or None for
+                            whole Records. See sina.dao.RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: A list of found Records, in the order of iter_of_ids.
+        """
+        return await self._run('get_many', list(iter_of_ids), data_fields=data_fields,
+                               include_files=include_files)
+
+    async def insert(self, record):
+        """
+        Given a Record, insert it into the SQL database.
+
+        :param record: A Record to insert
+        """
+        await self._run('insert', record)
+
+    async def insert_many(self, list_to_insert):
+        """
+        Given a list of Records, insert them into the SQL database in one transaction.
+
+        :param list_to_insert: A list of Records to insert
+        """
+        await self._run('insert_many', list_to_insert)
+
+    async def delete(self, id):
+        """
+        Given the id of a Record, delete all mention of it from the SQL database.
+
+        :param id: The id of the Record to delete.
+        """
+        await self._run('delete', id)
+
+    async def delete_many(self, ids_to_delete):
+        """
+        Given a list of Record ids, delete all mentions of them from the SQL database.
+
+        :param ids_to_delete: A list of the ids of Records to delete.
+        """
+        await self._run('delete_many', ids_to_delete)
+
+    async def data_query(self, **kwargs):
+        """
+        Return the ids of all Records whose data fulfill some criteria.
+
+        See sina.datastores.sql.RecordDAO.data_query() for details.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                         must fulfill.
+        :returns: A list of Record ids that fulfill all criteria.
+
+        :raises ValueError: if not supplied at least one criterion or given
+                            a criterion it does not support
+        """
+        return await self._run('data_query', **kwargs)
+
+    async def analyze(self):
+        """
+        Collect fresh statistics about the data in the database.
+
+        :returns: The updated planner.StatisticsCatalog.
+        """
+        return await self._run('analyze')
+
+    async def get_all_of_type(self, type, ids_only=False):
+        """
+        Given a type of Record, return all Records of that type.
+
+        :param type: The type of Record to return
+        :param ids_only: whether to return only the ids of matching Records
+
+        :returns: A list of matching Records.
+        """
+        return await self._run('get_all_of_type', type, ids_only=ids_only)
+
+    async def get_given_document_uri(self, uri, accepted_ids_list=None, ids_only=False):
+        """
+        Return all records associated with documents whose uris match some arg.
+
+        :param uri: The uri to use as a search term, such as "foo.png"
+        :param accepted_ids_list: A list of ids to restrict the search to.
+                                  If not provided, all ids will be used.
+        :param ids_only: whether to return only the ids of matching Records
+
+        :returns: A list of matching Records
+        """
+        return await self._run('get_given_document_uri', uri,
+                               accepted_ids_list=accepted_ids_list,
+                               ids_only=ids_only)
+
+    async def get_scalars(self, id, scalar_names):
+        """
+        Retrieve scalars for a given record id.
+
+        :param id: The record id to find scalars for
+        :param scalar_names: A list of the names of scalars to return
+
+        :return: A dict of scalars matching the Mnoda data specification
+        """
+        return await self._run('get_scalars', id, scalar_names)
+
+    async def get_data_for_records(self, id_list, data_list):
+        """
+        Retrieve a subset of non-list data for each Record in a list of ids.
+
+        :param id_list: A list of the record ids to find data for
+        :param data_list: A list of the names of data fields to find
+
+        :returns: a dictionary of dictionaries containing the requested data,
+                 keyed by record_id and then data field name.
+        """
+        return await self._run('get_data_for_records', id_list, data_list)
+
+    async def get_files(self, id):
+        """
+        Retrieve files for a given record id.
+
+        :param id: The id of the record whose files to return.
+
+        :returns: A list of file JSON objects matching the Mnoda specification
+        """
+        return await self._run('get_files', id)
+
+
+class AsyncRelationshipDAO(async_dao.AsyncRelationshipDAO):
+    """The async DAO responsible for handling Relationships in SQL."""
+
+    def __init__(self, factory):
+        """
+        Initialize AsyncRelationshipDAO.
+
+        :param factory: The AsyncDAOFactory whose thread pool and sessions to use.
+        """
+        self.factory = factory
+
+    def _run(self, method_name, *args, **kwargs):
+        """Run a method of a synchronous RelationshipDAO on the factory's thread pool."""
+        return self.factory.run_in_session(self.factory.build_relationship_dao,
+                                           method_name, *args, **kwargs)
+
+    async def insert(self, relationship=None, subject_id=None,
+                     object_id=None, predicate=None):
+        """
+        Given some Relationship, import it into the SQL database.
+
+        :param relationship: A Relationship object to build entry from.
+        :param subject_id: The id of the subject.
+        :param object_id: The id of the object.
+        :param predicate: A string describing the relationship.
+
+        :raises: A ValueError if neither Relationship nor the subject_id,
+                 object_id, and predicate args are provided.
+        """
+        await self._run('insert', relationship=relationship, subject_id=subject_id,
+                        object_id=object_id, predicate=predicate)
+
+    async def insert_many(self, list_to_insert):
+        """
+        Given a list of Relationships, insert each into the SQL database.
+
+        :param list_to_insert: A list of Relationships to insert
+        """
+        await self._run('insert_many', list_to_insert)
+
+    async def get(self, subject_id=None, object_id=None, predicate=None):
+        """
+        Given Relationship info, return matching Relationships (or empty list).
+
+        :param subject_id: the subject_id of Relationships to return
+        :param object_id: the object_id of Relationships to return
+        :param predicate: the predicate of Relationships to return
+
+        :returns: A list of Relationships fitting the criteria.
+
+        :raises ValueError: if none of the parameters are provided.
+        """
+        return await self._run('get', subject_id=subject_id, object_id=object_id,
+                               predicate=predicate)
+
+
+class AsyncRunDAO(async_dao.AsyncRunDAO):
+    """The async DAO responsible for handling Runs in SQL."""
+
+    def __init__(self, factory):
+        """
+        Initialize AsyncRunDAO.
+
+        :param factory: The AsyncDAOFactory whose thread pool and sessions to use.
+        """
+        self.factory = factory
+
+    def _run(self, method_name, *args, **kwargs):
+        """Run a method of a synchronous RunDAO on the factory's thread pool."""
+        return self.factory.run_in_session(self.factory.build_run_dao,
+                                           method_name, *args, **kwargs)
+
+    async def get(self, id, data_fields=None, include_files=False):
+        """
+        Given a run's id, return the matching Run from the SQL database.
+
+        :param id: The id of the run to return.
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Run. See sina.dao.RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: The matching Run.
+        """
+        return await self._run('get', id, data_fields=data_fields, include_files=include_files)
+
+    async def get_many(self, iter_of_ids, data_fields=None, include_files=False):
+        """
+        Given an iterable of ids, retrieve each corresponding Run.
+
+        :param iter_of_ids: An iterable object of ids to find.
+        :param data_fields: The names of the only data to return, or None for
+                            whole Runs. See sina.dao.RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: A list of found Runs, in the order of iter_of_ids.
+        """
+        return await self._run('get_many', list(iter_of_ids), data_fields=data_fields,
+                               include_files=include_files)
+
+    async def insert(self, run):
+        """
+        Given a Run, insert it into the SQL database.
+
+        :param run: A Run to insert
+        """
+        await self._run('insert', run)
+
+    async def insert_many(self, list_to_insert):
+        """
+        Given a list of Runs, insert each into the SQL database.
+
+        :param list_to_insert: A list of Runs to insert
+        """
+        await self._run('insert_many', list_to_insert)
+
+    async def delete(self, id):
+        """
+        Given the id of a Run, delete all mention of it from the SQL database.
+
+        :param id: The id of the Run to delete.
+        """
+        await self._run('delete', id)
+
+    async def delete_many(self, ids_to_delete):
+        """
+        Given a list of Run ids, delete all mentions of them from the SQL database.
+
+        :param ids_to_delete: A list of the ids of Runs to delete.
+        """
+        await self._run('delete_many', ids_to_delete)
+
+    async def get_all(self, ids_only=False):
+        """
+        Return all Records with type 'run'.
+
+        :param ids_only: whether to return only the ids of matching Runs
+        :returns: A list of all Records which are Runs
+        """
+        return await self._run('get_all', ids_only=ids_only)
+
+    async def data_query(self, **kwargs):
+        """
+        Return the ids of all Runs whose data fulfill some criteria.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                       must fulfill, as for AsyncRecordDAO.data_query().
+
+        :returns: A list of run ids fitting the criteria
+        """
+        return await self._run('data_query', **kwargs)
+
+
+class AsyncDAOFactory(async_dao.AsyncDAOFactory):
+    """
+    Build async SQL-backed DAOs for interacting with Mnoda-based objects.
+
+    Includes Records, Relationships, etc.
+    """
+
+    def __init__(self, db_path=None, max_workers=None):
+        """
+        Initialize a Factory with a path to its backend.
+
+        Currently supports only SQLite.
+
+        :param db_path: Path to the database to use as a backend. If None, will
+                        use an in-memory database. An in-memory database
+                        lives on a single connection, so calls to it are run
+                        one at a time.
+        :param max_workers: The most threads to run calls on at once. If None,
+                            uses ThreadPoolExecutor's default.
+        """
+        self.db_path = db_path
+        if db_path:
+            engine, is_new = sql.create_sqlite_engine(db_path, pooled=True)
+        else:
+            # Each thread would otherwise get its own, empty, in-memory db
+            engine, is_new = sql.create_sqlite_engine(
+                poolclass=StaticPool, connect_args={'check_same_thread': False})
+            max_workers = 1
+        self.statistics = planner.StatisticsCatalog(complete=is_new)
+        self._sessionmaker = sqlalchemy.orm.sessionmaker(bind=engine)
+        self.names = sql.DataNameCache(self._sessionmaker)
+        self.observer = sql.CommittedStatistics(self._sessionmaker, self.statistics)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def build_record_dao(self, session):
+        """
+        Build a synchronous RecordDAO around a session.
+
+        :param session: The session for the DAO to use.
+
+        :returns: a sina.datastores.sql.RecordDAO
+        """
+        return sql.RecordDAO(session=session, statistics=self.statistics, names=self.names,
+                             observer=self.observer)
+
+    def build_relationship_dao(self, session):
+        """
+        Build a synchronous RelationshipDAO around a session.
+
+        :param session: The session for the DAO to use.
+
+        :returns: a sina.datastores.sql.RelationshipDAO
+        """
+        return sql.RelationshipDAO(session=session)
+
+    def build_run_dao(self, session):
+        """
+        Build a synchronous RunDAO around a session.
+
+        :param session: The session for the DAO to use.
+
+        :returns: a sina.datastores.sql.RunDAO
+        """
+        return sql.RunDAO(session=session, record_dao=self.build_record_dao(session))
+
+    def run_in_session(self, build_dao, method_name, *args, **kwargs):
+        """
+        Call a method of a synchronous DAO on the thread pool.
+
+        The DAO is given a new session, closed once the call completes.
+        Generators returned by the method are collected into lists while the
+        session is open.
+
+        :param build_dao: A function taking a session and returning the DAO.
+        :param method_name: The name of the method to call.
+        :param args: Positional arguments for the method.
+        :param kwargs: Keyword arguments for the method.
+
+        :returns: An asyncio future for the method's result.
+        """
+        return asyncio.get_event_loop().run_in_executor(
+            self._executor, functools.partial(self._call_in_session, build_dao,
+                                              method_name, args, kwargs))
+
+    def _call_in_session(self, build_dao, method_name, args, kwargs):
+        """Make a call described by run_in_session(). Runs on the thread pool."""
+        session = self._sessionmaker()
+        try:
+            result = getattr(build_dao(session), method_name)(*args, **kwargs)
+            if isinstance(result, types.GeneratorType):
+                result = list(result)
+            return result
+        finally:
+            session.close()
+
+    def create_record_dao(self):
+        """
+        Create an async DAO for interacting with records.
+
+        :returns: an AsyncRecordDAO
+        """
+        return AsyncRecordDAO(factory=self)
+
+    def create_relationship_dao(self):
+        """
+        Create an async DAO for interacting with relationships.
+
+        :returns: an AsyncRelationshipDAO
+        """
+        return AsyncRelationshipDAO(factory=self)
+
+    def create_run_dao(self):
+        """
+        Create an async DAO for interacting with runs.
+
+        :returns: an AsyncRunDAO
+        """
+        return AsyncRunDAO(factory=self)
+
+    def close(self):
+        """Wait for pending calls to finish, then shut down the thread pool."""
+        self._executor.shutdown(wait=True)
+
+    def __repr__(self):
+        """Return a string representation of an async SQL DAOFactory."""
+        return 'Async SQL DAOFactory <db_path={}>'.format(self.db_path)
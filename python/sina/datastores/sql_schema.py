@@ -3,7 +3,7 @@ from __future__ import print_function
 
 # Disable pylint checks due to its issue with virtual environments
 from sqlalchemy import (Column, ForeignKey, String, Text, Float,  # pylint: disable=import-error
-                        Integer)
+                        Integer, DDL, event)
 from sqlalchemy.ext.declarative import declarative_base  # pylint: disable=import-error
 from sqlalchemy.schema import Index  # pylint: disable=import-error
 
@@ -38,6 +38,33 @@ class Record(Base):
                 .format(self.id, self.type))
 
 
+class RecordHash(Base):
+    """
+    Implementation of RecordHash table.
+
+    Stores the content hash of each Record, used to skip unchanged Records
+    on re-ingestion. Kept apart from the Record table so databases created
+    before it existed gain it without a migration.
+    """
+
+    __tablename__ = 'RecordHash'
+    id = Column(String(255),
+                ForeignKey(Record.id, ondelete='CASCADE',
+                           deferrable=True, initially='DEFERRED'),
+                primary_key=True)
+    hash = Column(String(64), nullable=False)
+
+    def __init__(self, id, hash):
+        """Create RecordHash table entry with id, hash."""
+        self.id = id
+        self.hash = hash
+
+    def __repr__(self):
+        """Return a string representation of a sql schema RecordHash."""
+        return ('SQL Schema RecordHash <id={}, hash={}>'
+                .format(self.id, self.hash))
+
+
 class Relationship(Base):
     """
     Implementation of Relationship table.
@@ -70,6 +97,67 @@ class Relationship(Base):
                                        self.predicate))
 
 
+class RelationshipGeneration(Base):
+    """
+    Implementation of RelationshipGeneration table.
+
+    Holds a single counter, bumped by triggers on the Relationship table
+    whenever a Relationship is inserted, updated, or deleted (by anyone), so
+    copies of the Relationships kept elsewhere, such as a saved adjacency
+    index, can tell whether they're out of date.
+    """
+
+    __tablename__ = 'RelationshipGeneration'
+    id = Column(Integer(), primary_key=True)
+    generation = Column(Integer(), nullable=False)
+
+    def __init__(self, id, generation):
+        """Create RelationshipGeneration table entry with id, generation."""
+        self.id = id
+        self.generation = generation
+
+    def __repr__(self):
+        """Return a string representation of a sql schema RelationshipGeneration."""
+        return ('SQL Schema RelationshipGeneration <generation={}>'
+                .format(self.generation))
+
+
+# Run after every create_all(), so databases made before the counter existed
+# gain it (and its triggers) when they're next opened.
+event.listen(Base.metadata, 'after_create', DDL(
+    'INSERT OR IGNORE INTO RelationshipGeneration (id, generation) VALUES (0, 0)'))
+for _change in ('INSERT', 'UPDATE', 'DELETE'):
+    event.listen(Base.metadata, 'after_create', DDL(
+        'CREATE TRIGGER IF NOT EXISTS relationship_generation_{} AFTER {} ON Relationship '
+        'BEGIN UPDATE RelationshipGeneration SET generation = generation + 1; END'
+        .format(_change.lower(), _change)))
+
+
+class DataName(Base):
+    """
+    Implementation of DataName table.
+
+    Stores each datum name once, along with the integer id the data tables
+    use in its place. This keeps long, often-repeated names out of their rows
+    and indexes, and lets them match names by comparing integers. Names are
+    never removed, even once no Record uses them.
+    """
+
+    __tablename__ = 'DataName'
+    id = Column(Integer(), primary_key=True)
+    name = Column(String(255), nullable=False, unique=True)
+
+    def __init__(self, name, id=None):
+        """Create DataName table entry with name, and optionally id."""
+        self.name = name
+        self.id = id
+
+    def __repr__(self):
+        """Return a string representation of a sql schema DataName."""
+        return ('SQL Schema DataName <id={}, name={}>'
+                .format(self.id, self.name))
+
+
 class ScalarData(Base):
     """
     Implementation of a table to store scalar-type data.
@@ -89,28 +177,28 @@ class ScalarData(Base):
                            deferrable=True, initially='DEFERRED'),
                 nullable=False,
                 primary_key=True)
-    name = Column(String(255), nullable=False, primary_key=True)
+    name_id = Column(Integer(), ForeignKey(DataName.id), nullable=False, primary_key=True)
     value = Column(Float(), nullable=False)
     tags = Column(Text(), nullable=True)
     units = Column(String(255), nullable=True)
-    Index('record_scalar_idx', id, name)
+    Index('record_scalar_idx', id, name_id)
 
     # Disable the pylint check if and until the team decides to refactor the code
-    def __init__(self, id, name, value,   # pylint: disable=too-many-arguments
+    def __init__(self, id, name_id, value,   # pylint: disable=too-many-arguments
                  tags=None, units=None):
-        """Create entry from id, name, and value, and optionally tags/units."""
+        """Create entry from id, name_id, and value, and optionally tags/units."""
         self.id = id
-        self.name = name
+        self.name_id = name_id
         self.value = value
         self.units = units
         self.tags = tags
 
     def __repr__(self):
         """Return a string representation of a sql schema ScalarData entry."""
-        return ('SQL Schema ScalarData: <id={}, name={}, value={}, tags={},'
+        return ('SQL Schema ScalarData: <id={}, name_id={}, value={}, tags={},'
                 'units={}>'
                 .format(self.id,
-                        self.name,
+                        self.name_id,
                         self.value,
                         self.tags,
                         self.units))
@@ -139,30 +227,30 @@ class ListScalarDataMaster(Base):
                            deferrable=True, initially='DEFERRED'),
                 nullable=False,
                 primary_key=True)
-    name = Column(String(255), nullable=False, primary_key=True)
+    name_id = Column(Integer(), ForeignKey(DataName.id), nullable=False, primary_key=True)
     tags = Column(Text(), nullable=True)
     units = Column(String(255), nullable=True)
 
-    def __init__(self, id, name, tags=None, units=None):
+    def __init__(self, id, name_id, tags=None, units=None):
         """
         Create a ListScalarDataMaster entry with the given args.
 
         :param id: The record id associated with this value.
-        :param name: The name of the datum associated with this value.
+        :param name_id: The id of the datum's name in the DataName table.
         :param tags: A list of tags to store.
         :param units: The associated units of the value.
         """
         self.id = id
-        self.name = name
+        self.name_id = name_id
         self.tags = tags
         self.units = units
 
     def __repr__(self):
         """Return a string repr. of a sql schema ListScalarDataMaster entry."""
-        return ('SQL Schema ListScalarDataMaster: <id={}, name={}, tags={}, '
+        return ('SQL Schema ListScalarDataMaster: <id={}, name_id={}, tags={}, '
                 'units={}>'
                 .format(self.id,
-                        self.name,
+                        self.name_id,
                         self.tags,
                         self.units))
 
@@ -184,31 +272,31 @@ class ListScalarDataEntry(Base):
                            deferrable=True, initially='DEFERRED'),
                 nullable=False,
                 primary_key=True)
-    name = Column(String(255), nullable=False, primary_key=True)
+    name_id = Column(Integer(), ForeignKey(DataName.id), nullable=False, primary_key=True)
     index = Column(Integer(), nullable=False, primary_key=True)
     value = Column(Float(), nullable=False)
-    Index('record_scalar_list_idx', id, name, index)
+    Index('record_scalar_list_idx', id, name_id, index)
 
-    def __init__(self, id, name, value, index):
+    def __init__(self, id, name_id, value, index):
         """
         Create a ListScalarDataEntry entry with the given args.
 
         :param id: The record id associated with this value.
-        :param name: The name of the datum associated with this value.
+        :param name_id: The id of the datum's name in the DataName table.
         :param index: The location in the scalar list of the value.
         :param value: The value to store.
         """
         self.id = id
-        self.name = name
+        self.name_id = name_id
         self.index = index
         self.value = value
 
     def __repr__(self):
         """Return a string repr. of a sql schema ListScalarDataEntry entry."""
-        return ('SQL Schema ListScalarDataEntry: <id={}, name={}, index={}, '
+        return ('SQL Schema ListScalarDataEntry: <id={}, name_id={}, index={}, '
                 'value={}>'
                 .format(self.id,
-                        self.name,
+                        self.name_id,
                         self.index,
                         self.value))
 
@@ -234,17 +322,17 @@ class StringData(Base):
                 ForeignKey(Record.id, ondelete='CASCADE',
                            deferrable=True, initially='DEFERRED'),
                 primary_key=True)
-    name = Column(String(255), nullable=False, primary_key=True)
+    name_id = Column(Integer(), ForeignKey(DataName.id), nullable=False, primary_key=True)
     value = Column(String(255), nullable=False)
     tags = Column(Text(), nullable=True)
     units = Column(String(255), nullable=True)
 
     # Disable the pylint check if and until the team decides to refactor the code
-    def __init__(self, id, name, value,  # pylint: disable=too-many-arguments
+    def __init__(self, id, name_id, value,  # pylint: disable=too-many-arguments
                  tags=None, units=None):
-        """Create entry from id, name, and value, and optionally tags/units."""
+        """Create entry from id, name_id, and value, and optionally tags/units."""
         self.id = id
-        self.name = name
+        self.name_id = name_id
         self.value = value
         # Arguably, string-based values don't need units. But because the
         # value vs. scalar implementation is hidden from the user, we need
@@ -254,10 +342,10 @@ class StringData(Base):
 
     def __repr__(self):
         """Return a string representation of a sql schema StringData entry."""
-        return ('SQL Schema StringData: <id={}, name={}, value={}, tags={}, '
+        return ('SQL Schema StringData: <id={}, name_id={}, value={}, tags={}, '
                 'units={}>'
                 .format(self.id,
-                        self.name,
+                        self.name_id,
                         self.value,
                         self.tags,
                         self.units))
@@ -288,21 +376,21 @@ class ListStringDataMaster(Base):
                            deferrable=True, initially='DEFERRED'),
                 nullable=False,
                 primary_key=True)
-    name = Column(String(255), nullable=False, primary_key=True)
+    name_id = Column(Integer(), ForeignKey(DataName.id), nullable=False, primary_key=True)
     tags = Column(Text(), nullable=True)
     units = Column(String(255), nullable=True)
 
-    def __init__(self, id, name, tags=None, units=None):
+    def __init__(self, id, name_id, tags=None, units=None):
         """
         Create a ListStringDataMaster entry with the given args.
 
         :param id: The record id associated with this value.
-        :param name: The name of the datum associated with this value.
+        :param name_id: The id of the datum's name in the DataName table.
         :param tags: A list of tags to store.
         :param units: The associated units of the value.
         """
         self.id = id
-        self.name = name
+        self.name_id = name_id
         # Arguably, string-based values don't need units. But because the
         # value vs. scalar implementation is hidden from the user, we need
         # to guarantee their availability in any "value"
@@ -311,10 +399,10 @@ class ListStringDataMaster(Base):
 
     def __repr__(self):
         """Return a string repr. of a sql schema ListStringDataMaster entry."""
-        return ('SQL Schema ListStringDataMaster: <id={}, name={}, tags={}, '
+        return ('SQL Schema ListStringDataMaster: <id={}, name_id={}, tags={}, '
                 'units={}>'
                 .format(self.id,
-                        self.name,
+                        self.name_id,
                         self.tags,
                         self.units))
 
@@ -336,30 +424,30 @@ class ListStringDataEntry(Base):
                            deferrable=True, initially='DEFERRED'),
                 nullable=False,
                 primary_key=True)
-    name = Column(String(255), nullable=False, primary_key=True)
+    name_id = Column(Integer(), ForeignKey(DataName.id), nullable=False, primary_key=True)
     index = Column(Integer(), nullable=False, primary_key=True)
     value = Column(String(255), nullable=False)
 
-    def __init__(self, id, name, index, value):
+    def __init__(self, id, name_id, index, value):
         """
         Create a ListStringDataEntry entry with the given args.
 
         :param id: The record id associated with this value.
-        :param name: The name of the datum associated with this value.
+        :param name_id: The id of the datum's name in the DataName table.
         :param index: The location in the scalar list of the value.
         :param value: The value to store.
         """
         self.id = id
-        self.name = name
+        self.name_id = name_id
         self.index = index
         self.value = value
 
     def __repr__(self):
         """Return a string repr. of a sql schema ListStringDataEntry entry."""
-        return ('SQL Schema ListStringDataEntry: <id={}, name={}, index={}, '
+        return ('SQL Schema ListStringDataEntry: <id={}, name_id={}, index={}, '
                 'value={}>'
                 .format(self.id,
-                        self.name,
+                        self.name_id,
                         self.index,
                         self.value))
 
@@ -429,3 +517,29 @@ class Run(Base):
                                      self.application,
                                      self.user,
                                      self.version))
+
+
+class DatumStatistics(Base):
+    """
+    Implementation of DatumStatistics table.
+
+    Stores the statistics the query planner keeps about each datum name, as
+    of the last time the database was analyzed, so they outlive the factory
+    that collected them. Not linked to any Record.
+    """
+
+    __tablename__ = 'DatumStatistics'
+    kind = Column(String(255), primary_key=True)
+    name = Column(String(255), primary_key=True)
+    stats = Column(Text(), nullable=False)
+
+    def __init__(self, kind, name, stats):
+        """Create DatumStatistics table entry with kind, name, and JSON stats."""
+        self.kind = kind
+        self.name = name
+        self.stats = stats
+
+    def __repr__(self):
+        """Return a string representation of a sql schema DatumStatistics."""
+        return ('SQL Schema DatumStatistics <kind={}, name={}>'
+                .format(self.kind, self.name))
@@ -0,0 +1,973 @@
+"""
+Contains DAOs for a SQL database split across several SQLite files.
+
+A single SQLite file has one writer and one page cache, so very large
+databases (tens of GB) slow down. A sharded database instead spreads Records
+across several SQLite files, or shards, each its own SQL backend (see
+sina.datastores.sql), chosen by a hash of the Record's id:
+
+* Writes are split up by shard and made in parallel, one writer per shard.
+* Queries (and other reads touching many Records) are fanned out to every
+  shard concerned at once, and their results merged.
+* Relationships between two Records in the same shard are kept there.
+  Relationships crossing shards (or involving ids with no Record) are kept
+  in a separate routing database.
+
+A sharded database is a directory holding the shards, the routing database,
+and a manifest recording how many shards there are. The number of shards is
+fixed when the directory is created.
+
+Fanning out uses a pool of threads; sqlite3 releases the GIL while it runs
+statements, so shards are read (and written) truly in parallel. The pool
+and every shard's connections are released by DAOFactory.close().
+"""
+import os
+import json
+import zlib
+import logging
+import threading
+from collections import defaultdict
+from multiprocessing.pool import ThreadPool
+
+import six
+
+import sina.dao as dao
+import sina.model as model
+import sina.planner as planner
+import sina.datastores.sql as sql
+import sina.datastores.sql_schema as schema
+from sina import utils
+
+LOGGER = logging.getLogger(__name__)
+
+# Disable pylint checks due to ubiquitous use of id and type
+# pylint: disable=invalid-name,redefined-builtin
+
+# The files out of which the manifest, shards, and routing database are named
+MANIFEST_FILENAME = "shards.json"
+SHARD_FILENAME = "shard_{:03d}.sqlite"
+ROUTING_FILENAME = "routing.sqlite"
+# Bumped whenever the layout (including how ids are hashed) changes
+MANIFEST_VERSION = 1
+# How many shards a new database has, if not told otherwise
+DEFAULT_SHARD_COUNT = 8
+# The type of the placeholders the routing database holds for Records
+ROUTING_PLACEHOLDER_TYPE = "__sharded_placeholder__"
+# How many ids to send out to the shards at a time when reading many Records
+FAN_OUT_CHUNK_SIZE = 5000
+
+
+def _group_by_shard(items, shard_of, key=None):
+    """
+    Split items up by shard, keeping their order within each.
+
+    :param items: An iterable of items (ex: ids or Records).
+    :param shard_of: A function giving the shard of an id.
+    :param key: A function giving an item's id, or None if items are ids.
+
+    :returns: A dict of shard index -> list of its items.
+    """
+    groups = defaultdict(list)
+    for item in items:
+        groups[shard_of(item if key is None else key(item))].append(item)
+    return groups
+
+
+def _merge_statistics(catalogs):
+    """
+    Combine the statistics of several shards into one catalog.
+
+    Counts add up, and the bounds widen to cover every shard's. Histograms are
+    re-bucketed by the midpoints of the shards' buckets. As a value can be in
+    several shards, the number of distinct values is the sum of the shards'
+    if every value of each shard is distinct there, else the largest shard's.
+
+    :param catalogs: The shards' StatisticsCatalogs.
+
+    :returns: A StatisticsCatalog describing the whole database. It's complete
+              only if every shard's is.
+    """
+    grouped = defaultdict(list)
+    for catalog in catalogs:
+        for stats in catalog:
+            grouped[(stats.kind, stats.name)].append(stats)
+    merged = []
+    for (kind, name), shard_stats in six.iteritems(grouped):
+        stats = planner.DatumStatistics(
+            name, kind, count=sum(part.count for part in shard_stats),
+            entries=(sum(part.entries or 0 for part in shard_stats)
+                     if kind.endswith("list") else None),
+            distinct=_merged_distinct(kind, shard_stats))
+        bounded = [part for part in shard_stats if part.min is not None]
+        if bounded:
+            stats.min = min(part.min for part in bounded)
+            stats.max = max(part.max for part in bounded)
+        if kind.startswith("scalar") and bounded:
+            stats.histogram = [0] * planner.HISTOGRAM_BUCKETS
+            for part in bounded:
+                if part.histogram is None:
+                    stats.histogram = None
+                    break
+                width = float(part.max - part.min) / planner.HISTOGRAM_BUCKETS
+                for index, bucket_count in enumerate(part.histogram):
+                    midpoint = part.min + (index + 0.5) * width
+                    stats.histogram[stats.bucket_index(midpoint)] += bucket_count
+        merged.append(stats)
+    catalog = planner.StatisticsCatalog()
+    catalog.replace(merged, complete=all(catalog.complete for catalog in catalogs))
+    return catalog
+
+
+def _merged_distinct(kind, shard_stats):
+    """
+    Estimate the distinct values of a datum across shards. See _merge_statistics().
+
+    :param kind: The kind of datum.
+    :param shard_stats: The datum's DatumStatistics from each shard having it.
+
+    :returns: The estimate, or None if any shard's is unknown.
+    """
+    distincts = [part.distinct for part in shard_stats]
+    if None in distincts:
+        return None
+    all_unique = all(part.distinct == (part.entries if kind.endswith("list") else part.count)
+                     for part in shard_stats)
+    return sum(distincts) if all_unique else max(distincts)
+
+
+class RecordDAO(dao.RecordDAO):
+    """The DAO responsible for handling Records across shards."""
+
+    def __init__(self, factory):
+        """
+        Initialize RecordDAO with the factory whose shards it uses.
+
+        :param factory: The sharded DAOFactory.
+        """
+        self.factory = factory
+        self.shards = [shard.create_record_dao() for shard in factory.shards]
+
+    def _fan_out(self, function, shard_args):
+        """Run a function on several shards at once. See DAOFactory.fan_out()."""
+        return self.factory.fan_out(function, shard_args)
+
+    def get(self, id, data_fields=None, include_files=False):
+        """
+        Given an id, return the matching Record from its shard.
+
+        :param id: The id of the Record to return.
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Record. See sql.RecordDAO.get_many().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: The matching Record.
+
+        :raises NoResultFound: if there's no such Record.
+        """
+        return self.shards[self.factory.shard_of(id)].get(
+            id, data_fields=data_fields, include_files=include_files)
+
+    def get_many(self, iter_of_ids, data_fields=None, include_files=False):
+        """
+        Given an iterable of ids, retrieve each corresponding Record.
+
+        Ids are sent to their shards FAN_OUT_CHUNK_SIZE at a time, each shard
+        reading its share in parallel.
+
+        :param iter_of_ids: An iterable object of ids to find.
+        :param data_fields: The names of the only data to return, or None for
+                            whole Records. See get().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: A generator of found Records, in the order their ids were given.
+
+        :raises NoResultFound: if any id has no Record.
+        """
+        LOGGER.debug('Getting many records with iter: %s', iter_of_ids)
+        for id_chunk in utils.chunked(iter_of_ids, FAN_OUT_CHUNK_SIZE):
+            found = {}
+            for records in self._fan_out(
+                    lambda shard, ids: list(shard.get_many(ids, data_fields, include_files)),
+                    [(self.shards[index], ids) for index, ids
+                     in six.iteritems(_group_by_shard(id_chunk, self.factory.shard_of))]):
+                found.update((record.id, record) for record in records)
+            for id in id_chunk:
+                yield found[id]
+
+    # pylint: disable=arguments-differ
+    # Args differ to match the SQL backend
+    def insert(self, record, force_overwrite=False, trusted=False):
+        """
+        Given a Record, insert it into its shard.
+
+        :param record: A Record to insert
+        :param force_overwrite: Whether to overwrite a preexisting Record that
+                                shares this Record's id.
+        :param trusted: Whether the Record is known to be valid. See
+                        sql.RecordDAO.insert().
+        """
+        self.insert_many([record], force_overwrite=force_overwrite, trusted=trusted)
+
+    # pylint: disable=arguments-differ
+    # Args differ for the same reason as insert()
+    def insert_many(self, list_to_insert, force_overwrite=False, trusted=False):
+        """
+        Given a list of Records, insert them into their shards.
+
+        Each shard's Records are inserted in parallel, in one transaction per
+        shard; a failure in one shard doesn't undo the others' inserts.
+
+        :param list_to_insert: A list of Records to insert
+        :param force_overwrite: Whether to overwrite preexisting Records that
+                                share ids with those given.
+        :param trusted: Whether the Records are known to be valid. See insert().
+        """
+        LOGGER.debug('Inserting %i records into shards with force_overwrite=%s.',
+                     len(list_to_insert), force_overwrite)
+        self._fan_out(lambda shard, records: shard.insert_many(
+            records, force_overwrite=force_overwrite, trusted=trusted),
+                      self._by_shard(list_to_insert))
+
+    def _by_shard(self, records, daos=None):
+        """
+        Pair each shard's DAO with its share of some Records.
+
+        :param records: A list of Records.
+        :param daos: The DAOs of each shard, by default this DAO's shards.
+
+        :returns: A list of (DAO, list of Records) pairs, for fan_out().
+        """
+        daos = self.shards if daos is None else daos
+        return [(daos[index], shard_records) for index, shard_records
+                in six.iteritems(_group_by_shard(records, self.factory.shard_of,
+                                                 key=lambda record: record.id))]
+
+    # pylint: disable=arguments-differ
+    # Args differ for the same reason as insert()
+    def replace_many(self, list_to_replace, trusted=False):
+        """
+        Given a list of Records already in the database, replace their contents.
+
+        See sql.RecordDAO.replace_many(). Shards are written in parallel.
+
+        :param list_to_replace: A list of Records to replace the stored ones with
+        :param trusted: Whether the Records are known to be valid. See insert().
+        """
+        LOGGER.debug('Replacing %i records.', len(list_to_replace))
+        self.insert_many(list_to_replace, force_overwrite=True, trusted=trusted)
+
+    def delete(self, id):
+        """
+        Given the id of a Record, delete all mention of it from the database.
+
+        :param id: The id of the Record to delete.
+        """
+        LOGGER.debug('Deleting record with id: %s', id)
+        self.delete_many([id])
+
+    def delete_many(self, ids_to_delete):
+        """
+        Given a list of Record ids, delete all mentions of them from the database.
+
+        Each shard deletes its share in parallel, after which the routing
+        database drops any Relationships involving them.
+
+        :param ids_to_delete: A list of the ids of Records to delete.
+        """
+        LOGGER.debug('Deleting %i records.', len(ids_to_delete))
+        self._fan_out(lambda shard, ids: shard.delete_many(ids),
+                      [(self.shards[index], ids) for index, ids in six.iteritems(
+                          _group_by_shard(ids_to_delete, self.factory.shard_of))])
+        # The routing database holds no Records, so this only clears Relationships
+        self.factory.routing.create_record_dao().delete_many(ids_to_delete)
+
+    def get_content_hashes(self, ids):
+        """
+        Given some Record ids, return the content hashes stored for those Records.
+
+        :param ids: An iterable of ids of Records to look up.
+
+        :returns: A dict of id: hash for every given id that names a Record.
+        """
+        hashes = {}
+        for shard_hashes in self._fan_out(
+                lambda shard, shard_ids: shard.get_content_hashes(shard_ids),
+                [(self.shards[index], shard_ids) for index, shard_ids
+                 in six.iteritems(_group_by_shard(ids, self.factory.shard_of))]):
+            hashes.update(shard_hashes)
+        return hashes
+
+    def compress_raws(self, compression='zlib', progress_callback=None):
+        """
+        Rewrite the raws of every stored Record, compressing them a given way.
+
+        Every shard is rewritten in parallel. See sql.RecordDAO.compress_raws().
+
+        :param compression: How to compress the raws, one of
+                            codec.RAW_COMPRESSIONS, or None to decompress them.
+        :param progress_callback: If provided, called periodically with the
+                                  number of Records processed so far across
+                                  every shard, and the total (None until every
+                                  shard has reported in).
+
+        :returns: The number of raws rewritten.
+        """
+        progress = {}
+        lock = threading.Lock()
+
+        def compress_shard(index, shard):
+            """Compress one shard's raws, reporting its progress."""
+
+            def report(processed, total):
+                """Combine one shard's progress with the others'."""
+                with lock:
+                    progress[index] = (processed, total)
+                    overall = sum(done for done, _ in progress.values())
+                    known = len(progress) == len(self.shards)
+                    progress_callback(overall, (sum(of for _, of in progress.values())
+                                                if known else None))
+
+            return shard.compress_raws(
+                compression, progress_callback=report if progress_callback else None)
+
+        return sum(self._fan_out(compress_shard, list(enumerate(self.shards))))
+
+    def data_query(self, **kwargs):
+        """
+        Return the ids of all Records whose data fulfill some criteria.
+
+        Criteria are given as for sql.RecordDAO.data_query(). Every shard runs
+        the query in parallel, planning it with its own statistics.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                       must fulfill.
+
+        :returns: A generator of Record ids that fulfill all criteria, sorted.
+
+        :raises ValueError: if not supplied at least one criterion or given
+                            a criterion it does not support
+        """
+        LOGGER.debug('Finding all records fulfilling criteria: %s', kwargs.items())
+        # Catch bad criteria here, rather than in every shard
+        self.explain_query(**kwargs)
+        return self._merged_ids(lambda shard: list(shard.data_query(**kwargs)))
+
+    def _merged_ids(self, function):
+        """
+        Gather ids from every shard in parallel.
+
+        :param function: A function taking a shard's RecordDAO and returning
+                         a list of ids.
+
+        :returns: A generator of the ids, sorted.
+        """
+        for id in utils.union_ordered([sorted(ids) for ids in self._fan_out(
+                function, [(shard,) for shard in self.shards])]):
+            yield id
+
+    def explain_query(self, **kwargs):
+        """
+        Return the plan data_query() would follow for some criteria.
+
+        Each shard plans its part of a query with its own statistics; this
+        is the plan for the combined statistics of every shard.
+
+        :param kwargs: Pairs of the names of data and the criteria that data
+                       must fulfill, as for data_query().
+
+        :returns: A planner.QueryPlan.
+
+        :raises ValueError: if not supplied at least one criterion or given
+                            a criterion it does not support
+        """
+        return planner.build_plan(self.statistics, kwargs)
+
+    @property
+    def statistics(self):
+        """The combined StatisticsCatalog of every shard."""
+        return _merge_statistics([shard.statistics for shard in self.shards])
+
+    def analyze(self):
+        """
+        Collect fresh statistics about every shard's data, in parallel.
+
+        :returns: The combined StatisticsCatalog of every shard.
+        """
+        self._fan_out(lambda shard: shard.analyze(), [(shard,) for shard in self.shards])
+        return self.statistics
+
+    def get_all(self, ids_only=False):
+        """
+        Return every Record in the database.
+
+        :param ids_only: whether to return only the ids of the Records
+
+        :returns: A generator of all Records (or, if ids_only, their ids),
+                  sorted by id.
+        """
+        LOGGER.debug('Getting all records.')
+        ids = self._merged_ids(lambda shard: list(shard.get_all(ids_only=True)))
+        return ids if ids_only else self.get_many(ids)
+
+    def get_all_of_type(self, type, ids_only=False):
+        """
+        Given a type of Record, return all Records of that type.
+
+        :param type: The type of Record to return, ex: run
+        :param ids_only: whether to return only the ids of matching Records
+
+        :returns: A generator of matching Records (or, if ids_only, their
+                  ids), sorted by id.
+        """
+        LOGGER.debug('Getting all records of type %s.', type)
+        ids = self._merged_ids(lambda shard: list(shard.get_all_of_type(type, ids_only=True)))
+        return ids if ids_only else self.get_many(ids)
+
+    def get_given_document_uri(self, uri, accepted_ids_list=None, ids_only=False):
+        """
+        Return all Records associated with documents whose uris match some arg.
+
+        Supports the use of % as a wildcard character. Every shard concerned
+        searches in parallel.
+
+        :param uri: The uri to use as a search term, such as "foo.png"
+        :param accepted_ids_list: A list of ids to restrict the search to.
+                                  If not provided, all ids will be used.
+        :param ids_only: whether to return only the ids of matching Records
+
+        :returns: A generator of matching Records (or, if ids_only, their
+                  ids), sorted by id and without duplicates.
+        """
+        LOGGER.debug('Getting all records related to uri=%s.', uri)
+        if accepted_ids_list is None:
+            shard_args = [(shard, None) for shard in self.shards]
+        else:
+            shard_args = [(self.shards[index], ids) for index, ids in six.iteritems(
+                _group_by_shard(accepted_ids_list, self.factory.shard_of))]
+        ids = utils.union_ordered([sorted(found) for found in self._fan_out(
+            lambda shard, accepted: list(shard.get_given_document_uri(
+                uri, accepted_ids_list=accepted, ids_only=True)), shard_args)])
+        return ids if ids_only else self.get_many(ids)
+
+    def get_scalars(self, id, scalar_names):
+        """
+        LEGACY: retrieve scalars for a given record id.
+
+        :param id: The record id to find scalars for
+        :param scalar_names: A list of the names of scalars to return
+
+        :return: A dict of scalars matching the Mnoda data specification
+        """
+        return self.shards[self.factory.shard_of(id)].get_scalars(id, scalar_names)
+
+    def get_data_for_records(self, id_list, data_list):
+        """
+        Retrieve a subset of data for Records in id_list.
+
+        See sql.RecordDAO.get_data_for_records(). Shards are read in parallel.
+
+        :param id_list: A list of the record ids to find data for
+        :param data_list: A list of the names of data fields to find
+
+        :returns: a dictionary of dictionaries containing the requested data,
+                 keyed by record_id and then data field name.
+        """
+        LOGGER.debug('Getting data in %s for record ids in %s', data_list, id_list)
+        data = defaultdict(lambda: defaultdict(dict))
+        for shard_data in self._fan_out(
+                lambda shard, ids: shard.get_data_for_records(ids, data_list),
+                [(self.shards[index], ids) for index, ids
+                 in six.iteritems(_group_by_shard(id_list, self.factory.shard_of))]):
+            data.update(shard_data)
+        return data
+
+    def get_files(self, id):
+        """
+        Retrieve files for a given record id.
+
+        Files are returned in the alphabetical order of their URIs
+
+        :param id: The record id to find files for
+        :return: A list of file JSON objects matching the Mnoda specification
+        """
+        return self.shards[self.factory.shard_of(id)].get_files(id)
+
+
+class RelationshipDAO(dao.RelationshipDAO):
+    """
+    The DAO responsible for handling Relationships across shards.
+
+    Relationships between two Records of the same shard are kept in that
+    shard; all others (including any involving ids without Records) are
+    kept in the routing database.
+    """
+
+    def __init__(self, factory):
+        """
+        Initialize RelationshipDAO with the factory whose shards it uses.
+
+        :param factory: The sharded DAOFactory.
+        """
+        self.factory = factory
+        self.shards = [shard.create_relationship_dao() for shard in factory.shards]
+        self.routing = factory.routing.create_relationship_dao()
+
+    def insert(self, relationship=None, subject_id=None, object_id=None, predicate=None):
+        """
+        Given some Relationship, insert it where it's kept.
+
+        This can create an entry from either an existing relationship object
+        or from its components (subject id, object id, predicate). If all four
+        are provided, the Relationship will be used.
+
+        :param subject_id: The id of the subject.
+        :param object_id: The id of the object.
+        :param predicate: A string describing the relationship.
+        :param relationship: A Relationship object to build entry from.
+        """
+        subj, obj, pred = self._validate_insert(relationship=relationship,
+                                                subject_id=subject_id,
+                                                object_id=object_id,
+                                                predicate=predicate)
+        self.insert_many([model.Relationship(subject_id=subj, object_id=obj, predicate=pred)])
+
+    def insert_many(self, list_to_insert):
+        """
+        Given a list of Relationships, insert them where they're kept.
+
+        Every Relationship is validated before any are written. Those already
+        in the database (including repeats within the list) are skipped,
+        wherever they're kept. A Relationship stays where it was first kept,
+        so one inserted before its Records (and so routed) stays routed.
+
+        :param list_to_insert: A list of Relationships to insert
+
+        :raises ValueError: if any entry isn't a valid Relationship, in which
+                            case none are inserted.
+        """
+        LOGGER.debug('Inserting %i relationships.', len(list_to_insert))
+        for relationship in list_to_insert:
+            self._validate_insert(subject_id=relationship.subject_id,
+                                  object_id=relationship.object_id,
+                                  predicate=relationship.predicate)
+        stored = self.factory.create_record_dao().get_content_hashes(
+            set(rel.subject_id for rel in list_to_insert)
+            | set(rel.object_id for rel in list_to_insert))
+        homes = defaultdict(list)
+        for relationship in list_to_insert:
+            shard = self.factory.shard_of(relationship.subject_id)
+            local = (relationship.subject_id in stored and relationship.object_id in stored
+                     and shard == self.factory.shard_of(relationship.object_id))
+            homes[self.shards[shard] if local else self.routing].append(relationship)
+        # Those headed for a shard may have been routed before their Records
+        # existed. (The reverse can't happen: a shard only holds Relationships
+        # between its Records.)
+        routed_ids = set(rel.subject_id for home, relationships in six.iteritems(homes)
+                         if home is not self.routing for rel in relationships)
+        kept = set((rel.subject_id, rel.predicate, rel.object_id)
+                   for rel in self.routing._get_many_given(  # pylint: disable=protected-access
+                       'subject_id', list(routed_ids)))
+        for home, relationships in six.iteritems(homes):
+            relationships = [rel for rel in relationships
+                             if (rel.subject_id, rel.predicate, rel.object_id) not in kept]
+            if not relationships:
+                continue
+            if home is self.routing:
+                self._add_placeholders(relationships)
+            home.insert_many(relationships)
+
+    def _add_placeholders(self, relationships):
+        """
+        Stand in for the Records of Relationships kept in the routing database.
+
+        Relationships in a SQL database must be between Records in it, so the
+        routing database holds a placeholder for each id with a Relationship
+        there. Deleting the Record removes its placeholder, and with it, its
+        Relationships.
+
+        :param relationships: A list of Relationships to route.
+        """
+        ids = set(relationship.subject_id for relationship in relationships)
+        ids.update(relationship.object_id for relationship in relationships)
+        session = self.factory.routing.session
+        session.execute(schema.Record.__table__.insert().prefix_with("OR IGNORE"),
+                        [{"id": id, "type": ROUTING_PLACEHOLDER_TYPE} for id in ids])
+        session.commit()
+
+    def _get_given_subject_id(self, subject_id, predicate=None):
+        """
+        Given record id, return all Relationships with that id as subject.
+
+        :param subject_id: The subject_id of Relationships to return
+        :param predicate: Optionally, the Relationship predicate to filter on.
+
+        :returns: A list of Relationships fitting the criteria.
+        """
+        return list(self._get_many_given('subject_id', [subject_id], predicate))
+
+    def _get_given_object_id(self, object_id, predicate=None):
+        """
+        Given record id, return all Relationships with that id as object.
+
+        :param object_id: The object_id of Relationships to return
+        :param predicate: Optionally, the Relationship predicate to filter on.
+
+        :returns: A list of Relationships fitting the criteria.
+        """
+        return list(self._get_many_given('object_id', [object_id], predicate))
+
+    def _get_given_predicate(self, predicate):
+        """
+        Given predicate, return all Relationships with that predicate.
+
+        Every shard, and the routing database, is searched in parallel.
+
+        :param predicate: The predicate describing Relationships to return
+
+        :returns: A list of Relationships fitting the criteria
+        """
+        LOGGER.debug('Getting relationships related to predicate=%s.', predicate)
+        found = self.factory.fan_out(lambda home: home.get(predicate=predicate),
+                                     [(home,) for home in self.shards + [self.routing]])
+        return [relationship for relationships in found for relationship in relationships]
+
+    def _get_many_given(self, key, ids, predicate=None):
+        """
+        Find the Relationships whose subject or object is any of several ids.
+
+        Each id's shard is searched for it, and the routing database for all
+        of them, in parallel.
+
+        :param key: 'subject_id' or 'object_id', whichever the ids are.
+        :param ids: A list of unique ids.
+        :param predicate: If not None, the predicate Relationships must have.
+
+        :returns: A list of Relationships.
+        """
+        homes = [(self.shards[index], shard_ids) for index, shard_ids
+                 in six.iteritems(_group_by_shard(ids, self.factory.shard_of))]
+        homes.append((self.routing, ids))
+        # pylint: disable=protected-access
+        found = self.factory.fan_out(
+            lambda home, home_ids: list(home._get_many_given(key, home_ids, predicate)), homes)
+        return [relationship for relationships in found for relationship in relationships
+                if predicate is None or relationship.predicate == predicate]
+
+    def get_all(self):
+        """
+        Return every Relationship in the database.
+
+        :returns: A generator of Relationships, shard by shard, then those
+                  crossing shards.
+        """
+        LOGGER.debug('Getting all relationships.')
+        for home in self.shards + [self.routing]:
+            for relationship in home.get_all():
+                yield relationship
+
+    def count(self):
+        """Return how many Relationships the database holds."""
+        return sum(home.count() for home in self.shards + [self.routing])
+
+
+class RunDAO(dao.RunDAO):
+    """The DAO responsible for handling Runs (a Record subtype) across shards."""
+
+    def __init__(self, factory, record_dao):
+        """
+        Initialize RunDAO with the factory whose shards it uses.
+
+        :param factory: The sharded DAOFactory.
+        :param record_dao: A RecordDAO for the same factory.
+        """
+        super(RunDAO, self).__init__(record_dao=record_dao)
+        self.factory = factory
+        self.shards = [shard.create_run_dao() for shard in factory.shards]
+
+    # pylint: disable=arguments-differ
+    # Args differ to match the SQL backend
+    def insert(self, run, force_overwrite=False, trusted=False):
+        """
+        Given a Run, insert it into its shard.
+
+        :param run: A Run to insert
+        :param force_overwrite: Whether to overwrite a preexisting Run that
+                                shares this Run's id.
+        :param trusted: Whether the Run is known to be valid. See
+                        sql.RecordDAO.insert().
+        """
+        self.insert_many([run], force_overwrite=force_overwrite, trusted=trusted)
+
+    # pylint: disable=arguments-differ
+    # Args differ for the same reason as insert()
+    def insert_many(self, list_to_insert, force_overwrite=False, trusted=False):
+        """
+        Given a list of Runs, insert them into their shards, in parallel.
+
+        :param list_to_insert: A list of Runs to insert
+        :param force_overwrite: Whether to overwrite preexisting Runs that
+                                share ids with those given.
+        :param trusted: Whether the Runs are known to be valid. See
+                        sql.RecordDAO.insert().
+        """
+        self.factory.fan_out(lambda shard, runs: shard.insert_many(
+            runs, force_overwrite=force_overwrite, trusted=trusted),
+                             self.record_dao._by_shard(  # pylint: disable=protected-access
+                                 list_to_insert, daos=self.shards))
+
+    def get(self, id, data_fields=None, include_files=False):
+        """
+        Given a run's id, return the matching Run from its shard.
+
+        :param id: The id of some run
+        :param data_fields: The names of the only data to return, or None for
+                            the whole Run. See RecordDAO.get().
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: The matching Run.
+
+        :raises NoResultFound: if there's no such Run.
+        """
+        return self.shards[self.factory.shard_of(id)].get(
+            id, data_fields=data_fields, include_files=include_files)
+
+    def get_many(self, iter_of_ids, data_fields=None, include_files=False):
+        """
+        Given an iterable of ids, retrieve each corresponding Run.
+
+        Shards are read in parallel, as for RecordDAO.get_many().
+
+        :param iter_of_ids: An iterable object of ids to find.
+        :param data_fields: The names of the only data to return, or None for
+                            whole Runs.
+        :param include_files: Whether to return files along with data_fields.
+
+        :returns: A generator of found Runs, in the order their ids were given.
+        """
+        for id_chunk in utils.chunked(iter_of_ids, FAN_OUT_CHUNK_SIZE):
+            found = {}
+            for runs in self.factory.fan_out(
+                    lambda shard, ids: list(shard.get_many(ids, data_fields, include_files)),
+                    [(self.shards[index], ids) for index, ids
+                     in six.iteritems(_group_by_shard(id_chunk, self.factory.shard_of))]):
+                found.update((run.id, run) for run in runs)
+            for id in id_chunk:
+                yield found[id]
+
+    def delete(self, id):
+        """
+        Given the id of a Run, delete all mention of it from the database.
+
+        :param id: The id of the Run to delete.
+        """
+        self.record_dao.delete(id)
+
+    def delete_many(self, ids_to_delete):
+        """
+        Given a list of Run ids, delete all mentions of them from the database.
+
+        :param ids_to_delete: A list of the ids of Runs to delete.
+        """
+        self.record_dao.delete_many(ids_to_delete)
+
+    # pylint: disable=arguments-differ
+    # Args differ for the same reason as insert()
+    def replace_many(self, list_to_replace, trusted=False):
+        """
+        Given a list of Runs already in the database, replace their contents.
+
+        :param list_to_replace: A list of Runs to replace the stored ones with
+        :param trusted: Whether the Runs are known to be valid. See
+                        sql.RecordDAO.insert().
+        """
+        self.insert_many(list_to_replace, force_overwrite=True, trusted=trusted)
+
+
+class DAOFactory(dao.DAOFactory):
+    """
+    Build DAOs for interacting with a SQL database split across SQLite files.
+
+    Each shard is a pooled sql.DAOFactory, so the factory (and its DAOs) can
+    be used from many threads at once, ex: by utils.import_many_jsons().
+    """
+
+    supports_parallel_ingestion = True
+
+    def __init__(self, db_dir, shard_count=None,  # pylint: disable=too-many-arguments
+                 raw_compression=None, raw_storage='full', max_workers=None):
+        """
+        Open (or create) a sharded database.
+
+        :param db_dir: The directory holding the database. Created, along
+                       with the database, if it doesn't exist.
+        :param shard_count: How many shards the database has. Defaults to
+                            DEFAULT_SHARD_COUNT for a new database, and to
+                            however many an existing one was created with.
+        :param raw_compression: How to compress the raws of Records inserted,
+                                as for sql.DAOFactory.
+        :param raw_storage: How much of the raws of Records inserted to store,
+                            as for sql.DAOFactory.
+        :param max_workers: How many threads to fan work out to the shards
+                            with. Defaults to one per shard, up to
+                            utils.MAX_THREADS.
+
+        :raises ValueError: if given a shard_count other than that of an
+                            existing database, or a directory that isn't a
+                            sharded database, or a bad raw setting.
+        """
+        self.db_dir = db_dir
+        self.shard_count = self._open_manifest(db_dir, shard_count)
+        self.shards = [sql.DAOFactory(os.path.join(db_dir, SHARD_FILENAME.format(index)),
+                                      pooled=True, raw_compression=raw_compression,
+                                      raw_storage=raw_storage)
+                       for index in range(self.shard_count)]
+        self.routing = sql.DAOFactory(os.path.join(db_dir, ROUTING_FILENAME), pooled=True)
+        self.max_workers = max_workers or min(self.shard_count, utils.MAX_THREADS)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @staticmethod
+    def _open_manifest(db_dir, shard_count):
+        """
+        Read the manifest of a sharded database, writing it first if it's new.
+
+        :param db_dir: The directory holding the database.
+        :param shard_count: The number of shards asked for, or None.
+
+        :returns: The number of shards the database has.
+
+        :raises ValueError: if shard_count disagrees with an existing
+                            database's, or db_dir is a non-empty directory
+                            without a manifest.
+        """
+        manifest_path = os.path.join(db_dir, MANIFEST_FILENAME)
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest.get("version") != MANIFEST_VERSION:
+                msg = ('Sharded database at {} has version {}, but this version of Sina '
+                       'reads {}.'.format(db_dir, manifest.get("version"), MANIFEST_VERSION))
+                LOGGER.error(msg)
+                raise ValueError(msg)
+            if shard_count is not None and shard_count != manifest["shard_count"]:
+                msg = ('Sharded database at {} has {} shards, not {}. The number of shards '
+                       'cannot be changed.'.format(db_dir, manifest["shard_count"],
+                                                   shard_count))
+                LOGGER.error(msg)
+                raise ValueError(msg)
+            return manifest["shard_count"]
+        if os.path.isdir(db_dir) and os.listdir(db_dir):
+            msg = ('{} is not a sharded database, and not empty. Will not create one '
+                   'there.'.format(db_dir))
+            LOGGER.error(msg)
+            raise ValueError(msg)
+        shard_count = DEFAULT_SHARD_COUNT if shard_count is None else shard_count
+        if shard_count < 1:
+            msg = 'A sharded database needs at least one shard, not {}.'.format(shard_count)
+            LOGGER.error(msg)
+            raise ValueError(msg)
+        if not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+        with open(manifest_path, 'w') as manifest_file:
+            json.dump({"version": MANIFEST_VERSION, "shard_count": shard_count}, manifest_file)
+        return shard_count
+
+    def shard_of(self, id):
+        """
+        Return which shard holds (or would hold) a Record.
+
+        Shards are chosen by a CRC-32 of the id, which, unlike hash(), is
+        the same in every process.
+
+        :param id: The Record's id.
+
+        :returns: The index of the shard.
+        """
+        encoded = id.encode('utf-8') if isinstance(id, six.text_type) else id
+        return (zlib.crc32(encoded) & 0xffffffff) % self.shard_count
+
+    def fan_out(self, function, shard_args):
+        """
+        Run a function on several shards at once.
+
+        A single call is run directly, without involving the pool.
+
+        :param function: The function to run.
+        :param shard_args: A list of tuples of arguments, one per call.
+
+        :returns: A list of what each call returned, in the order of shard_args.
+        """
+        if len(shard_args) <= 1:
+            return [function(*args) for args in shard_args]
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPool(processes=self.max_workers)
+        return self._pool.map(_call_with, [(function, args) for args in shard_args])
+
+    def close(self):
+        """
+        Shut down the thread pool and close every database's connections.
+
+        The factory and its DAOs shouldn't be used afterwards.
+        """
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+        for factory in self.shards + [self.routing]:
+            factory.session.remove()
+            factory.engine.dispose()
+
+    def optimize(self, vacuum=None):
+        """
+        Tune every shard, and the routing database, for querying, in parallel.
+
+        See sql.DAOFactory.optimize().
+
+        :param vacuum: How to vacuum the databases, one of sql.VACUUM_MODES,
+                       or None not to.
+
+        :returns: A dict of "shards", the list of each shard's report, and
+                  "routing", the routing database's.
+
+        :raises ValueError: if given an unknown vacuum mode.
+        """
+        reports = self.fan_out(lambda factory: factory.optimize(vacuum=vacuum),
+                               [(factory,) for factory in self.shards + [self.routing]])
+        return {"shards": reports[:-1], "routing": reports[-1]}
+
+    def create_record_dao(self):
+        """
+        Create a DAO for interacting with records.
+
+        :returns: a RecordDAO
+        """
+        return RecordDAO(self)
+
+    def create_relationship_dao(self):
+        """
+        Create a DAO for interacting with relationships.
+
+        :returns: a RelationshipDAO
+        """
+        return RelationshipDAO(self)
+
+    def create_run_dao(self):
+        """
+        Create a DAO for interacting with runs.
+
+        :returns: a RunDAO
+        """
+        return RunDAO(self, record_dao=self.create_record_dao())
+
+    def __repr__(self):
+        """Return a string representation of a sharded SQL DAOFactory."""
+        return 'Sharded SQL DAOFactory <db_dir={}, shard_count={}>'.format(
+            self.db_dir, self.shard_count)
+
+
+def _call_with(function_and_args):
+    """Unpack a function and its args to call them from a ThreadPool."""
+    function, args = function_and_args
+    return function(*args)
@@ -1,12 +1,14 @@
 """Contains toplevel, abstract objects mirroring the Mnoda schema."""
 from __future__ import print_function
-import json
+import hashlib
 import logging
 import collections
 import numbers
 
 import six
 
+import sina.codec as codec
+
 logging.basicConfig()
 LOGGER = logging.getLogger(__name__)
 RESERVED_TYPES = ["run"]  # Types reserved by Record's children
@@ -146,10 +148,31 @@ class Record(object):
 
         :returns: A JSON string representing this Record
         """
-        return json.dumps(self.raw)
+        return codec.dumps(self.raw)
 
-    # Disable the pylint check if and until the team decides to refactor the code
-    def is_valid(self, print_warnings=None):  # pylint: disable=too-many-branches
+    def content_hash(self, raw_json=None):
+        """
+        Compute a digest of this Record's contents.
+
+        The digest is taken over a canonical JSON form of the raw (sorted keys,
+        no whitespace), so two Records with equal raws share it regardless of
+        key order. That form is the standard library's whatever the codec in
+        use (see codec.stable_dumps_bytes()), so digests taken with different
+        JSON libraries installed agree. Used to spot unchanged Records when
+        re-ingesting.
+
+        :param raw_json: The raw already serialized by validate_and_serialize(),
+                         if available. It's reused when the standard library
+                         codec produced it, to save serializing it again.
+        :returns: The SHA-256 hex digest of this Record's raw
+        """
+        if raw_json is not None and codec.codec_name() == 'json':
+            raw_bytes = raw_json.encode('utf-8')
+        else:
+            raw_bytes = codec.stable_dumps_bytes(self.raw)
+        return hashlib.sha256(raw_bytes).hexdigest()
+
+    def is_valid(self, print_warnings=None):
         """Test whether a Record's members are formatted correctly.
 
         The ingester expects certain types to be reserved, and for data
@@ -161,11 +184,60 @@ class Record(object):
         :returns: A tuple containing true or false if valid for ingestion and
                   a list of warnings.
         """
+        is_valid, warnings, _ = self.validate_and_serialize(print_warnings=print_warnings)
+        return is_valid, warnings
+
+    def validate_and_serialize(self, print_warnings=None, trusted=False):
+        """
+        Test whether a Record is valid for ingestion, serializing its raw as we go.
+
+        Serializing the raw is itself a check (that it's valid JSON), so the
+        DAOs store the JSON produced here rather than serializing it again.
+        It's in the codec's canonical form (see codec.canonical_dumps()).
+
+        :param print_warnings: if true, will print warnings. Warnings are
+                                 passed to the logger only by default.
+        :param trusted: Whether the Record comes from a source already known
+                        to be valid, in which case its files and data entries
+                        aren't checked one by one.
+        :returns: A tuple of true or false if valid for ingestion, a list of
+                  warnings, and the raw as a JSON string (None if invalid).
+        """
         warnings = []
         # We should issue a warning if type is reserved and we are not
         # actually a reserved object. This check is removed for now because it
         # warrants significant code changes in sql/cass modules.
 
+        if not trusted:
+            self._check_files_and_data(warnings)
+        elif not isinstance(self.data, dict):
+            (warnings.append("Record {}'s data field must be a dictionary!"
+                             .format(self.id)))
+        raw_json = None
+        try:
+            raw_json = _canonical_json(self.raw)
+        except (TypeError, ValueError):
+            (warnings.append("Record {}'s raw is invalid JSON.'".format(self.id)))
+        if not isinstance(self.user_defined, dict):
+            (warnings.append("Record {}'s user_defined section is not a "
+                             "dictionary. User_defined: {}".format(self.id, self.user_defined)))
+        if warnings:
+            warnstring = "\n".join(warnings)
+            if print_warnings:
+                print(warnstring)
+            LOGGER.warning(warnstring)
+            return False, warnings, None
+        return True, warnings, raw_json
+
+    # Disable the pylint check if and until the team decides to refactor the code
+    def _check_files_and_data(self, warnings):  # pylint: disable=too-many-branches
+        """
+        Check a Record's files and data entry by entry.
+
+        Part of validate_and_serialize().
+
+        :param warnings: The list to add a warning to for each issue found.
+        """
         # For files/data, we break immediately on finding any error--in
         # practice these lists can be thousands of entries long, in which case
         # the error is probably in an importer script (and so present in all
@@ -229,20 +301,6 @@ class Record(object):
                     (warnings.append("At least one value entry belonging "
                                      "to Record {} has a malformed tag "
                                      "list. Value: {}".format(self.id, entry)))
-        try:
-            json.dumps(self.raw)
-        except ValueError:
-            (warnings.append("Record {}'s raw is invalid JSON.'".format(self.id)))
-        if not isinstance(self.user_defined, dict):
-            (warnings.append("Record {}'s user_defined section is not a "
-                             "dictionary. User_defined: {}".format(self.id, self.user_defined)))
-        if warnings:
-            warnstring = "\n".join(warnings)
-            if print_warnings:
-                print(warnstring)
-            LOGGER.warning(warnstring)
-            return False, warnings
-        return True, warnings
 
 
 # Disable pylint check to if and until the team decides to address the issue
@@ -335,6 +393,18 @@ class Run(Record):
                        self.version))
 
 
+def _canonical_json(raw):
+    """
+    Serialize a Record's raw in canonical form: sorted keys, no whitespace.
+
+    :param raw: The raw to serialize.
+    :returns: The raw as a JSON string.
+    :raises TypeError: if the raw contains something JSON can't represent.
+    :raises ValueError: if the raw contains a circular reference.
+    """
+    return codec.canonical_dumps(raw)
+
+
 def _is_valid_list(list_of_data):
     """
     Check if a list of data is valid.
@@ -350,6 +420,12 @@ def _is_valid_list(list_of_data):
     they are None.
     """
     LOGGER.debug('Checking if list of length %i is valid.', len(list_of_data))
+    # Lists almost always hold entries of one or two types, so check those
+    # rather than every entry. Anything amiss is found (and reported) below.
+    entry_types = set(type(list_entry) for list_entry in list_of_data)
+    if (all(issubclass(entry_type, numbers.Real) for entry_type in entry_types)
+            or all(issubclass(entry_type, six.string_types) for entry_type in entry_types)):
+        return (True, None, None)
     is_scalar = False
     is_string = False
     latest_scalar = None
@@ -446,3 +522,26 @@ def convert_record_to_run(record):
                '{}.'.format(record.id))
         LOGGER.warn(msg)
         raise ValueError(msg)
+
+
+def project_record(record, data_fields, include_files=False):
+    """
+    Build a copy of a Record (or Run) holding only some of its contents.
+
+    The copy keeps the id and type (and a Run's application, user, and
+    version), the named data the Record has, and optionally its files. Its
+    user_defined is left out.
+
+    :param record: The Record or Run to copy from.
+    :param data_fields: The names of the data to keep. Names the Record has
+                        no data for are skipped.
+    :param include_files: Whether to keep the Record's files.
+
+    :returns: A Record (or Run, if given one) holding only what was asked for.
+    """
+    data = {name: record.data[name] for name in data_fields if name in record.data}
+    files = record.files if include_files else None
+    if isinstance(record, Run):
+        return Run(id=record.id, application=record.application, user=record.user,
+                   version=record.version, data=data, files=files)
+    return Record(id=record.id, type=record.type, data=data, files=files)
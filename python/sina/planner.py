@@ -0,0 +1,483 @@
+"""
+Plan the execution of data_query() using per-datum statistics.
+
+Backends keep a StatisticsCatalog describing the data stored under each datum
+name (how many records have it, its min/max, a histogram of its values...).
+build_plan() uses those statistics to order a query's criteria so that the
+most selective runs first, and decides when its (small) result should be fed
+into later criteria as an IN filter rather than fetched independently and
+intersected afterwards. execute_plan() then carries the plan out using a
+backend-provided function for running one step.
+"""
+from __future__ import division
+
+import logging
+import threading
+from numbers import Real
+
+import sina.utils as utils
+
+LOGGER = logging.getLogger(__name__)
+
+# Number of equal-width buckets used for scalar histograms
+HISTOGRAM_BUCKETS = 16
+# Once a step is expected to leave at most this many ids, later steps are
+# restricted to those ids with an IN filter. Kept under the ~999
+# variables-per-statement limit some SQL builds enforce.
+IN_FILTER_THRESHOLD = 900
+# While collecting statistics at insert time, distinct values are counted
+# exactly up to this many; past it, the distinct count becomes unknown.
+DISTINCT_TRACKING_LIMIT = 1024
+# Fallback selectivities for when statistics can't give an answer
+DEFAULT_EQUALITY_SELECTIVITY = 0.01
+DEFAULT_RANGE_SELECTIVITY = 1 / 3
+
+# The kinds of data statistics are kept for, matching the tuple order of
+# utils.sort_and_standardize_criteria()
+KINDS = ("scalar", "string", "scalarlist", "stringlist")
+
+# Disable pylint checks due to ubiquitous use of id, min, and max
+# pylint: disable=invalid-name,redefined-builtin
+
+
+class DatumStatistics(object):
+    """
+    Summarize the values stored for one datum name of one kind.
+
+    For scalar and string data, count is the number of records with the datum.
+    For lists, count is likewise the number of records, while entries is the
+    total number of list entries across them; min, max, distinct and the
+    histogram then describe the entries.
+    """
+
+    # Disable the pylint check, as these are all necessary and optional
+    def __init__(self, name, kind, count=0,  # pylint: disable=too-many-arguments
+                 min=None, max=None, distinct=None, histogram=None, entries=None):
+        """
+        Create statistics for a datum.
+
+        :param name: The name of the datum.
+        :param kind: The kind of datum, one of KINDS.
+        :param count: The number of records having the datum.
+        :param min: The smallest value (or list entry) seen.
+        :param max: The largest value (or list entry) seen.
+        :param distinct: The number of distinct values, if known.
+        :param histogram: A list of HISTOGRAM_BUCKETS counts of values falling
+                          into equal-width buckets spanning [min, max]. Scalar
+                          kinds only.
+        :param entries: For lists, the total number of entries.
+        """
+        self.name = name
+        self.kind = kind
+        self.count = count
+        self.min = min
+        self.max = max
+        self.distinct = distinct
+        self.histogram = histogram
+        self.entries = entries
+        # Values seen at insert time, used to keep distinct exact while small.
+        # Only possible if we've seen every value from the start.
+        self._seen = set() if count == 0 and distinct is None else None
+        if self._seen is not None:
+            self.distinct = 0
+
+    def __repr__(self):
+        """Return a comprehensive (debug) representation of DatumStatistics."""
+        return ('DatumStatistics <name={}, kind={}, count={}, min={}, max={}, '
+                'distinct={}, entries={}, histogram={}>'
+                .format(self.name, self.kind, self.count, self.min, self.max,
+                        self.distinct, self.entries, self.histogram))
+
+    def to_json(self):
+        """
+        Return the statistics as a JSON-friendly dict.
+
+        The dict can be passed back to DatumStatistics() as keyword arguments.
+
+        :returns: A dict of the constructor's arguments.
+        """
+        return {"name": self.name, "kind": self.kind, "count": self.count,
+                "min": self.min, "max": self.max, "distinct": self.distinct,
+                "histogram": self.histogram, "entries": self.entries}
+
+    @classmethod
+    def from_values(cls, name, kind, values, count=None):
+        """
+        Build statistics from every value stored for a datum.
+
+        :param name: The name of the datum.
+        :param kind: The kind of datum, one of KINDS.
+        :param values: An iterable of all the datum's values (for lists, of
+                       all entries of all its lists).
+        :param count: For lists, the number of records with the datum.
+
+        :returns: DatumStatistics describing values.
+        """
+        values = list(values)
+        is_list = kind.endswith("list")
+        stats = cls(name, kind,
+                    count=count if is_list else len(values),
+                    entries=len(values) if is_list else None)
+        if values:
+            stats._seen = None  # pylint: disable=protected-access
+            stats.min = min(values)
+            stats.max = max(values)
+            stats.distinct = len(set(values))
+            if kind.startswith("scalar"):
+                stats.histogram = [0] * HISTOGRAM_BUCKETS
+                for val in values:
+                    stats.histogram[stats.bucket_index(val)] += 1
+        return stats
+
+    def bucket_index(self, value):
+        """
+        Return the index of the histogram bucket a scalar value falls into.
+
+        Values outside [min, max] are clamped to the first or last bucket.
+
+        :param value: The value to place.
+
+        :returns: The index of value's bucket.
+        """
+        if self.max == self.min:
+            return 0
+        index = int((value - self.min) * HISTOGRAM_BUCKETS / (self.max - self.min))
+        return max(0, min(index, HISTOGRAM_BUCKETS - 1))
+
+    def observe(self, values):
+        """
+        Update the statistics with a newly-inserted record's value(s).
+
+        The histogram's buckets span [min, max] as of the last analyze. A value
+        falling within them is counted in its bucket; one outside them widens
+        min or max, which would move every bucket's boundaries, so the
+        histogram is dropped until the next analyze.
+
+        :param values: The list of values (or list entries) inserted.
+        """
+        self.count += 1
+        if self.kind.endswith("list"):
+            self.entries = (self.entries or 0) + len(values)
+        for val in values:
+            if self.histogram is not None:
+                if self.min <= val <= self.max:
+                    self.histogram[self.bucket_index(val)] += 1
+                else:
+                    self.histogram = None
+            self.min = val if self.min is None or val < self.min else self.min
+            self.max = val if self.max is None or val > self.max else self.max
+            if self._seen is not None and val not in self._seen:
+                if len(self._seen) >= DISTINCT_TRACKING_LIMIT:
+                    self._seen = None
+                    self.distinct = None
+                else:
+                    self._seen.add(val)
+                    self.distinct = len(self._seen)
+
+    def value_fraction(self, criterion):
+        """
+        Estimate the fraction of values (or list entries) matching a criterion.
+
+        :param criterion: A DataRange or single value.
+
+        :returns: A float between 0 and 1.
+        """
+        if not self.count or self.min is None:
+            return 0.0
+        if not isinstance(criterion, utils.DataRange):
+            criterion = utils.DataRange(criterion, criterion, max_inclusive=True)
+        # Anything entirely outside [min, max] can't match
+        if ((criterion.max_is_finite() and criterion.max < self.min) or
+                (criterion.min_is_finite() and criterion.min > self.max)):
+            return 0.0
+        if criterion.is_single_value():
+            return 1 / self.distinct if self.distinct else DEFAULT_EQUALITY_SELECTIVITY
+        if not criterion.is_numeric_range() or not isinstance(self.min, Real):
+            return DEFAULT_RANGE_SELECTIVITY
+        if self.max == self.min:
+            return 1.0 if self.min in criterion else 0.0
+        low = self.min if not criterion.min_is_finite() else max(criterion.min, self.min)
+        high = self.max if not criterion.max_is_finite() else min(criterion.max, self.max)
+        if not self.histogram:
+            # Assume values are spread uniformly between min and max
+            return max(0.0, (high - low) / (self.max - self.min))
+        width = (self.max - self.min) / HISTOGRAM_BUCKETS
+        matched = 0.0
+        for index, bucket_count in enumerate(self.histogram):
+            bucket_low = self.min + index * width
+            overlap = min(high, bucket_low + width) - max(low, bucket_low)
+            if overlap > 0:
+                matched += bucket_count * overlap / width
+        return min(1.0, matched / sum(self.histogram)) if sum(self.histogram) else 0.0
+
+    def estimate(self, criterion):
+        """
+        Estimate how many records satisfy a criterion on this datum.
+
+        :param criterion: A DataRange or single value for scalars and strings,
+                          or a ListCriteria for lists.
+
+        :returns: The estimated number of matching records.
+        """
+        if not isinstance(criterion, utils.ListCriteria):
+            return self.count * self.value_fraction(criterion)
+        # Chance a record's list has at least one entry matching each entry
+        # criterion, assuming entries are spread evenly over records.
+        per_record = (self.entries / self.count) if self.count else 0
+        chances = [1 - (1 - self.value_fraction(entry)) ** per_record
+                   for entry in criterion.entries]
+        if criterion.operation == utils.ListQueryOperation.ANY:
+            chance = min(1.0, sum(chances))
+        else:
+            # ALL and ONLY match no more than their most selective entry
+            chance = min(chances)
+        return self.count * chance
+
+
+class StatisticsCatalog(object):
+    """
+    Hold DatumStatistics for every datum name in a backend.
+
+    A catalog is complete if it describes everything in the backend, which is
+    the case for a backend created empty alongside it, or after the backend
+    has been analyzed. For a complete catalog, a datum without statistics is
+    known to match nothing; otherwise, its selectivity is unknown.
+    """
+
+    def __init__(self, complete=False):
+        """
+        Create an empty catalog.
+
+        :param complete: Whether the catalog describes everything in its
+                         backend (ex: because the backend is empty).
+        """
+        self.complete = complete
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        """Return a comprehensive (debug) representation of a StatisticsCatalog."""
+        return ('StatisticsCatalog <complete={}, stats={}>'
+                .format(self.complete, list(self._stats.values())))
+
+    def get(self, kind, name):
+        """
+        Return the statistics for a datum, if any.
+
+        :param kind: The kind of datum, one of KINDS.
+        :param name: The name of the datum.
+
+        :returns: The datum's DatumStatistics, or None.
+        """
+        return self._stats.get((kind, name))
+
+    def __iter__(self):
+        """Iterate through all the DatumStatistics in the catalog."""
+        return iter(list(self._stats.values()))
+
+    def replace(self, stats_list, complete=True):
+        """
+        Replace the catalog's contents, as after analyzing a backend.
+
+        :param stats_list: An iterable of DatumStatistics.
+        :param complete: Whether the new statistics describe everything in
+                         the backend.
+        """
+        new_stats = dict(((stats.kind, stats.name), stats) for stats in stats_list)
+        with self._lock:
+            self._stats = new_stats
+            self.complete = complete
+
+    def mark_partial(self):
+        """
+        Note that the backend has changed in ways the catalog can't follow.
+
+        Deleting or overwriting records would need their old values to be
+        taken back out of the statistics, so the catalog is instead left
+        partial until the backend is analyzed again.
+        """
+        with self._lock:
+            self.complete = False
+
+    def observe(self, kind, name, value):
+        """
+        Record that a record with a value for a datum was inserted.
+
+        :param kind: The kind of datum, one of KINDS.
+        :param name: The name of the datum.
+        :param value: The value inserted, or a list of entries for lists.
+        """
+        values = value if kind.endswith("list") else [value]
+        with self._lock:
+            stats = self._stats.get((kind, name))
+            if stats is None:
+                stats = self._stats[(kind, name)] = DatumStatistics(name, kind)
+            stats.observe(values)
+
+    def estimate(self, kind, name, criterion):
+        """
+        Estimate how many records satisfy a criterion.
+
+        :param kind: The kind of datum, one of KINDS.
+        :param name: The name of the datum.
+        :param criterion: The criterion, as accepted by DatumStatistics.estimate().
+
+        :returns: The estimated number of matching records, or None if unknown.
+        """
+        stats = self._stats.get((kind, name))
+        if stats is None:
+            return 0.0 if self.complete else None
+        return stats.estimate(criterion)
+
+
+class PlanStep(object):
+    """One criterion of a QueryPlan."""
+
+    # Disable the pylint check, as these are all necessary
+    def __init__(self, name, kind, criterion,  # pylint: disable=too-many-arguments
+                 estimate, restricted=False):
+        """
+        Create a step.
+
+        :param name: The name of the datum the criterion applies to.
+        :param kind: The kind of datum, one of KINDS.
+        :param criterion: The (standardized) criterion: a DataRange or ListCriteria.
+        :param estimate: The estimated number of records matching, or None.
+        :param restricted: Whether the step only considers the ids matched
+                           by the steps before it (with an IN filter).
+        """
+        self.name = name
+        self.kind = kind
+        self.criterion = criterion
+        self.estimate = estimate
+        self.restricted = restricted
+
+    def __repr__(self):
+        """Return a comprehensive (debug) representation of a PlanStep."""
+        return ('PlanStep <name={}, kind={}, criterion={}, estimate={}, restricted={}>'
+                .format(self.name, self.kind, self.criterion, self.estimate,
+                        self.restricted))
+
+
+class QueryPlan(object):
+    """An ordered list of PlanSteps describing how to run a data_query()."""
+
+    def __init__(self, steps, in_filter_threshold=IN_FILTER_THRESHOLD):
+        """
+        Create a plan.
+
+        :param steps: The PlanSteps, in the order they'll run.
+        :param in_filter_threshold: The most ids that will be passed to a
+                                    restricted step as an IN filter.
+        """
+        self.steps = steps
+        self.in_filter_threshold = in_filter_threshold
+
+    def __repr__(self):
+        """Return a comprehensive (debug) representation of a QueryPlan."""
+        return 'QueryPlan <steps={}>'.format(self.steps)
+
+    def __str__(self):
+        """Return the plan's explanation."""
+        return self.explain()
+
+    def materializes_after(self, index):
+        """
+        Return whether the ids matched so far are collected after a step.
+
+        That's the case when the following step is restricted to them.
+
+        :param index: The index of the step.
+
+        :returns: Whether to collect matching ids after step <index>.
+        """
+        return index + 1 < len(self.steps) and self.steps[index + 1].restricted
+
+    def explain(self):
+        """
+        Describe the plan in human-readable form.
+
+        :returns: A string with one line per step.
+        """
+        lines = []
+        for index, step in enumerate(self.steps):
+            estimate = ("unknown" if step.estimate is None
+                        else "~{:.0f}".format(step.estimate))
+            how = ("restricted to ids matched so far (IN filter)" if step.restricted
+                   else "full scan of its index")
+            lines.append("{}. {} '{}' {}: estimated {} record(s), {}"
+                         .format(index + 1, step.kind, step.name, step.criterion,
+                                 estimate, how))
+        return "\n".join(lines)
+
+
+def build_plan(catalog, criteria, in_filter_threshold=IN_FILTER_THRESHOLD,
+               restrictable_kinds=KINDS):
+    """
+    Order a data_query()'s criteria by estimated selectivity.
+
+    Criteria with known estimates run first, smallest estimate first;
+    criteria whose selectivity is unknown follow in the order given. Once the
+    steps so far are expected to match no more than in_filter_threshold
+    records, every later step of a restrictable kind is restricted to their
+    ids.
+
+    :param catalog: The StatisticsCatalog to draw estimates from.
+    :param criteria: A dict of {name: criterion}, as passed to data_query().
+    :param in_filter_threshold: The most ids to pass along as an IN filter.
+    :param restrictable_kinds: The kinds of data the backend can apply an IN
+                               filter to.
+
+    :returns: A QueryPlan.
+
+    :raises ValueError: if given no criteria or an unsupported criterion.
+    """
+    if not criteria:
+        raise ValueError("You must supply at least one criterion.")
+    steps = []
+    for kind, kind_criteria in zip(KINDS, utils.sort_and_standardize_criteria(criteria)):
+        for name, criterion in kind_criteria:
+            steps.append(PlanStep(name, kind, criterion,
+                                  catalog.estimate(kind, name, criterion)))
+    # sorted() is stable, so ties (and unknowns) keep their original order
+    steps = sorted(steps, key=lambda step: (step.estimate is None, step.estimate or 0))
+    running_estimate = None
+    for step in steps:
+        if running_estimate is not None and running_estimate <= in_filter_threshold:
+            step.restricted = step.kind in restrictable_kinds
+        if step.estimate is not None:
+            running_estimate = (step.estimate if running_estimate is None
+                                else min(running_estimate, step.estimate))
+    plan = QueryPlan(steps, in_filter_threshold)
+    LOGGER.debug('Planned data query:\n%s', plan)
+    return plan
+
+
+def execute_plan(plan, run_step):
+    """
+    Carry out a QueryPlan.
+
+    :param plan: The QueryPlan to execute.
+    :param run_step: A function taking a PlanStep and either None or a sorted
+                     list of ids to restrict it to, and returning an iterator
+                     of the ids matching the step, in sorted order.
+
+    :returns: A generator of the ids matching every step, in sorted order.
+    """
+    id_streams = []
+    accepted_ids = None
+    for index, step in enumerate(plan.steps):
+        restrict_to = accepted_ids if step.restricted else None
+        if restrict_to is not None and len(restrict_to) > plan.in_filter_threshold:
+            # The estimate was off; the ids are still intersected below
+            LOGGER.debug('Skipping IN filter for %s: %i ids matched so far.',
+                         step.name, len(restrict_to))
+            restrict_to = None
+        id_streams.append(run_step(step, restrict_to))
+        if plan.materializes_after(index):
+            accepted_ids = list(utils.intersect_ordered(id_streams))
+            if not accepted_ids:
+                return
+            id_streams = [accepted_ids]
+    for id in utils.intersect_ordered(id_streams):
+        yield id
@@ -8,6 +8,12 @@ import uuid
 import csv
 import time
 import datetime
+import itertools
+import bisect
+import heapq
+import shutil
+import tempfile
+import zipfile
 from numbers import Real
 from enum import Enum
 from multiprocessing.pool import ThreadPool
@@ -15,11 +21,33 @@ from collections import OrderedDict
 
 import six
 
+import sina.codec as codec
 import sina.model as model
+import sina.validation as validation
+
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence  # pylint: disable=ungrouped-imports
+
+try:
+    import numpy as np
+    NUMPY_PRESENT = True
+except ImportError:
+    NUMPY_PRESENT = False
 
 LOGGER = logging.getLogger(__name__)
 MAX_THREADS = 8
 
+# Supported values for export()'s output_type
+EXPORT_TYPES = ('csv', 'json', 'npz')
+# How many records export() requests data for at once. Kept well under the
+# ~999 variables-per-statement limit some SQL builds enforce.
+EXPORT_CHUNK_SIZE = 500
+# What import_json() can do with each Record it reads, as counted in the
+# summaries it returns
+INGEST_OUTCOMES = ('inserted', 'updated', 'skipped')
+
 
 # Disable pylint checks due to ubiquitous use of id, type, max, and min
 # pylint: disable=invalid-name,redefined-builtin
@@ -37,7 +65,7 @@ class ListQueryOperation(Enum):
     ONLY = "ONLY"
 
 
-def import_many_jsons(factory, json_list):
+def import_many_jsons(factory, json_list, trusted=False, validate=False):
     """
     Import multiple JSON documents into a supported backend.
 
@@ -45,36 +73,65 @@ def import_many_jsons(factory, json_list):
 
     :param factory: The factory used to perform the import.
     :param json_list: List of filepaths to import from.
+    :param trusted: Whether the documents are known to be valid. See
+                    import_json().
+    :param validate: Whether to check each document against the Mnoda schema
+                     before importing it. See import_json().
+
+    :returns: A dict of the number of Records inserted, updated, and skipped
+              across every file. See import_json().
     """
     LOGGER.info('Importing json list: %s', json_list)
     if factory.supports_parallel_ingestion:
         LOGGER.debug('Factory supports parallel ingest, building thread pool.')
-        arg_tuples = [(factory, x) for x in json_list]
+        arg_tuples = [(factory, x, trusted, validate) for x in json_list]
         pool = ThreadPool(processes=min(len(json_list), MAX_THREADS))
-        pool.map(_import_tuple_args, arg_tuples)
+        summaries = pool.map(_import_tuple_args, arg_tuples)
         pool.close()
         pool.join()
     else:
         LOGGER.debug('Factory does not support parallel ingest.')
-        for json_file in json_list:
-            import_json(factory, json_file)
+        summaries = [import_json(factory, json_file, trusted, validate)
+                     for json_file in json_list]
+    return {outcome: sum(summary[outcome] for summary in summaries)
+            for outcome in INGEST_OUTCOMES}
 
 
 def _import_tuple_args(unpack_tuple):
     """Unpack args to allow using import_json with ThreadPools in <Python3."""
-    import_json(unpack_tuple[0], unpack_tuple[1])
+    return import_json(*unpack_tuple)
 
 
-def import_json(factory, json_path):
+def import_json(factory, json_path, trusted=False, validate=False):
     """
     Import one JSON document into a supported backend.
 
+    Re-importing is incremental. Records whose ids are already in the backend
+    are compared by content hash (see Record.content_hash()): unchanged ones
+    are skipped, and changed ones have their contents replaced in place,
+    keeping their Relationships. Relationships already present are left be.
+
     :param factory: The factory used to perform the import.
     :param json_path: The filepath to the json to import.
+    :param trusted: Whether the document is known to be valid (ex: it was
+                    written by Sina, or validated when produced). If so, the
+                    Records' data and files aren't checked entry by entry.
+    :param validate: Whether to check the whole document against the Mnoda
+                     schema before anything is written (see
+                     sina.validation). A document that passes is then
+                     treated as trusted.
+
+    :returns: A dict of the number of Records inserted, updated, and skipped.
+
+    :raises ValueError: if validate is set and the document doesn't follow
+                        the schema. Nothing is written.
     """
     LOGGER.debug('Importing %s', json_path)
-    with open(json_path) as file_:
-        data = json.load(file_)
+    with open(json_path, 'rb') as file_:
+        data = codec.load(file_)
+    if validate:
+        validation.get_validator().validate(data, source=json_path)
+        trusted = True
     runs = []
     records = []
     local = {}
@@ -94,8 +151,27 @@ def import_json(factory, json_path):
             runs.append(model.generate_run_from_json(json_input=entry))
         else:
             records.append(model.generate_record_from_json(json_input=entry))
-    factory.create_run_dao().insert_many(runs)
-    factory.create_record_dao().insert_many(records)
+    record_dao = factory.create_record_dao()
+    run_dao = factory.create_run_dao()
+    # Records with local ids were just given new ones, so can't be stored yet
+    generated_ids = set(local.values())
+    stored_hashes = record_dao.get_content_hashes(
+        [record.id for record in itertools.chain(runs, records)
+         if record.id not in generated_ids])
+    summary = dict.fromkeys(INGEST_OUTCOMES, 0)
+    for dao, incoming in ((run_dao, runs), (record_dao, records)):
+        new, changed = [], []
+        for record in incoming:
+            if record.id not in stored_hashes:
+                new.append(record)
+            elif stored_hashes[record.id] != record.content_hash():
+                changed.append(record)
+            else:
+                summary['skipped'] += 1
+        dao.insert_many(new, trusted=trusted)
+        dao.replace_many(changed, trusted=trusted)
+        summary['inserted'] += len(new)
+        summary['updated'] += len(changed)
     relationships = []
     for entry in data.get('relationships', []):
         subj, obj = _process_relationship_entry(entry=entry, local_ids=local)
@@ -103,6 +179,9 @@ def import_json(factory, json_path):
                                                 object_id=obj,
                                                 predicate=entry['predicate']))
     factory.create_relationship_dao().insert_many(relationships)
+    LOGGER.info('Imported %s: %i records inserted, %i updated, %i skipped.',
+                json_path, summary['inserted'], summary['updated'], summary['skipped'])
+    return summary
 
 
 def _process_relationship_entry(entry, local_ids):
@@ -253,86 +332,304 @@ def intersect_ordered(iterables):
     ids. Important to avoid too much being stored in memory; here, we only store
     the generator stack plus (len(iterables)+C) values.
 
-    :param gen_list: A list of iterators. Must be ordered by the same criteria!
+    Inputs are driven smallest-first (where their size is known), and any
+    input that supports indexing (lists, tuples, ranges...) is galloped
+    through with an exponential search rather than stepped one at a time, so
+    a short iterator intersected with a long list costs roughly
+    O(short * log(long)).
+
+    :param iterables: A list of iterators. Must be ordered by the same
+                      criteria, ascending, and contain no duplicates!
 
     :returns: A generator that crawls through the iterators and returns
               values that all of them share.
-
-    :raises StopIteration: when it runs out of values
     """
-    # Quit fast as we'll be assuming at least one generator.
+    # Quit fast as we'll be assuming at least one iterator.
     if not iterables:
         return
 
-    # Standardize all iterators to generators
-    gen_list = []
-    for iter_ in iterables:
-        gen_list.append(x for x in iter_)
+    cursors = sorted((_OrderedCursor(iter_) for iter_ in iterables),
+                     key=lambda cursor: cursor.size_hint)
+    lead, others = cursors[0], cursors[1:]
+    # Because our iterators are ordered, and because this is an intersection,
+    # we know there are no more possible matches once one iterator runs out.
+    try:
+        candidate = lead.advance_to(None)
+        while True:
+            for cursor in others:
+                found = cursor.advance_to(candidate)
+                if found != candidate:
+                    # Everything between candidate and found is a miss for
+                    # this cursor, so skip the lead forward and start over.
+                    candidate = lead.advance_to(found)
+                    break
+            else:
+                # All our iterators agree
+                yield candidate
+                candidate = lead.advance_past(candidate)
+    except StopIteration:
+        return
+
 
-    # Get our first set
-    most_recents = []
-    for gen in gen_list:
-        most_recents.append(six.next(gen))
+def union_ordered(iterables):
+    """
+    Return a generator that yields the distinct union of ordered iterators.
 
-    while True:
-        if most_recents.count(most_recents[0]) == len(most_recents):
-            # All our iterators agree
-            yield most_recents[0]
-            # Get the next
-            for index, gen in enumerate(gen_list):
-                most_recents[index] = six.next(gen)
-        # Once this "else" exits, everything is == or > than max:
+    Companion to intersect_ordered(); only one value per iterator is held
+    in memory at a time.
+
+    :param iterables: A list of iterators, each ordered by the same criteria.
+
+    :returns: A generator of every value found in any of the iterators, in
+              order and without duplicates.
+    """
+    sentinel = object()
+    previous = sentinel
+    for val in heapq.merge(*iterables):
+        if previous is sentinel or val != previous:
+            yield val
+        previous = val
+
+
+def difference_ordered(minuend, subtrahend):
+    """
+    Return a generator that yields ordered values in one iterator but not another.
+
+    :param minuend: An ordered iterator of values to (potentially) yield.
+    :param subtrahend: An ordered iterator of values to exclude.
+
+    :returns: A generator of values found in minuend but not subtrahend, in order.
+    """
+    excluded = _OrderedCursor(subtrahend)
+    exhausted = False
+    for val in minuend:
+        if not exhausted:
+            try:
+                if excluded.advance_to(val) == val:
+                    continue
+            except StopIteration:
+                exhausted = True
+        yield val
+
+
+class _OrderedCursor(object):
+    """
+    Walk an ordered iterable, skipping ahead to requested values.
+
+    Helper for the *_ordered() functions. Sequences are searched by
+    galloping (exponential then binary search) from the current position;
+    other iterators are stepped through.
+    """
+
+    def __init__(self, iterable):
+        """
+        Wrap an ordered iterable.
+
+        :param iterable: The ordered iterable to walk.
+        """
+        self._head = None
+        self._started = False
+        if isinstance(iterable, Sequence):
+            self._seq = iterable
+            self.size_hint = len(iterable)
+            self._pos = 0
+            self._iter = None
         else:
-            maxval = max(most_recents)
-            # Because our generators are ordered, and because this is an intersection,
-            # we know there are no more possible matches once one generator runs out.
-            for index, gen in enumerate(gen_list):
-                while most_recents[index] < maxval:
-                    most_recents[index] = six.next(gen)
+            self._seq = None
+            self._iter = iter(iterable)
+            try:
+                self.size_hint = len(iterable)
+            except TypeError:
+                self.size_hint = float('inf')
+
+    def advance_to(self, value):
+        """
+        Move forward to the first entry >= value and return it.
+
+        The cursor never moves backwards, so if the current entry is already
+        >= value it's returned as-is. None means "the first entry".
+
+        :param value: The value to advance to.
+
+        :returns: The first entry from here on that is >= value.
+
+        :raises StopIteration: if there is no such entry.
+        """
+        if self._seq is not None:
+            return self._seek(value, bisect.bisect_left)
+        if not self._started:
+            self._head = six.next(self._iter)
+            self._started = True
+        while value is not None and self._head < value:
+            self._head = six.next(self._iter)
+        return self._head
+
+    def advance_past(self, value):
+        """
+        Move forward to the first entry > value and return it.
+
+        :param value: The value to advance past.
+
+        :returns: The first entry from here on that is > value.
+
+        :raises StopIteration: if there is no such entry.
+        """
+        if self._seq is not None:
+            return self._seek(value, bisect.bisect_right)
+        head = self.advance_to(value)
+        while head == value:
+            head = self._head = six.next(self._iter)
+        return head
+
+    def _seek(self, value, bisector):
+        """Gallop through a sequence to value, landing according to bisector."""
+        seq, length, pos = self._seq, self.size_hint, self._pos
+        if value is not None and pos < length:
+            # Exponential search for an entry past value, then bisect up to it.
+            # Everything before pos + bound//2 is known to be <= value.
+            bound = 1
+            while pos + bound < length and not value < seq[pos + bound]:
+                bound *= 2
+            pos = bisector(seq, value, pos + bound // 2, min(pos + bound + 1, length))
+        self._pos = pos
+        if pos >= length:
+            raise StopIteration
+        return seq[pos]
+
+
+def chunked(iterable, size):
+    """
+    Split an iterable into lists of at most size entries.
+
+    Only one chunk is held in memory at a time, so this is safe to use on
+    very large generators.
+
+    :param iterable: The iterable to split up.
+    :param size: The maximum number of entries per chunk.
+
+    :returns: A generator of lists, each containing up to size entries.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
 
 
-def export(factory, id_list, scalar_names, output_type, output_file=None):
+def export(factory, id_list=None, scalar_names=None, output_type='csv',
+           output_file=None, criteria=None, chunk_size=EXPORT_CHUNK_SIZE):
     """
-    Export records and corresponding scalars.
+    Export records and corresponding data.
+
+    Data is fetched chunk_size records at a time and written as it arrives,
+    so exports run in roughly constant memory regardless of how many records
+    are involved.
 
     :param factory: The DAOFactory to use.
-    :param id_list: The list of record ids to export.
-    :param scalar_names: The list of scalars to output for each record.
+    :param id_list: The list (or other iterable) of record ids to export. If
+                    criteria are also given, only ids matching them are
+                    exported, sorted.
+    :param scalar_names: The list of data to output for each record.
     :param output_type: The type of output to export to. Acceptable values are:
-                        csv
+                        csv, json (newline-delimited, one object per record),
+                        npz (requires numpy)
     :param output_file: The file to output. If None, then default to a
                         timestamped output.
+    :param criteria: A dict of {name: criterion} as accepted by data_query().
+                     Records matching all of them are exported.
+    :param chunk_size: How many records to fetch data for at once.
+
+    :raises ValueError: if given an unsupported output_type, neither id_list
+                        nor criteria, or a scalar named "id" for npz.
     """
     LOGGER.info('Exporting to type %s.', output_type)
-    LOGGER.debug('Exporting <id_list=%s, scalar_names=%s, output_type=%s, output_file=%s>.',
-                 id_list, scalar_names, output_type, output_file)
-    if not output_type == 'csv':
+    LOGGER.debug('Exporting <id_list=%s, scalar_names=%s, output_type=%s, output_file=%s, '
+                 'criteria=%s>.', id_list, scalar_names, output_type, output_file, criteria)
+    if output_type not in EXPORT_TYPES:
         msg = ('Given "{}" for output_type and it must be one of the '
-               'following: csv'.format(output_type))
+               'following: {}'.format(output_type, ', '.join(EXPORT_TYPES)))
+        LOGGER.error(msg)
+        raise ValueError(msg)
+    if id_list is None and not criteria:
+        msg = 'Must provide an id_list, criteria, or both to export.'
         LOGGER.error(msg)
         raise ValueError(msg)
+    if output_type == 'npz' and not NUMPY_PRESENT:
+        msg = 'Exporting to npz requires numpy, which could not be imported.'
+        LOGGER.error(msg)
+        raise ImportError(msg)
     if not output_file:
         output_file = ('output_' +
                        (datetime.datetime.fromtimestamp(
                            time.time()).strftime('%Y-%m-%d_%H-%M-%S')) +
-                       '.csv')
+                       '.' + output_type)
         LOGGER.debug('Using default output file: %s.', output_file)
-    data_to_export = OrderedDict()
     record_dao = factory.create_record_dao()
-    for id in id_list:
-        data_to_export[id] = record_dao.get_scalars(id=id,
-                                                    scalar_names=scalar_names)
-    _export_csv(data=data_to_export,
-                scalar_names=scalar_names,
-                output_file=output_file)
+    ids = id_list
+    if criteria:
+        matches = record_dao.data_query(**criteria)
+        if id_list is None:
+            ids = matches
+        else:
+            # Matches come back sorted, so only the ids we were given are
+            # held in memory, however many records match
+            ids = intersect_ordered([sorted(set(id_list)), matches])
+    rows = _iter_export_rows(record_dao=record_dao,
+                             ids=ids,
+                             data_names=scalar_names,
+                             chunk_size=chunk_size)
+    writer = {'csv': _export_csv,
+              'json': _export_json,
+              'npz': _export_npz}[output_type]
+    writer(data=rows,
+           scalar_names=scalar_names,
+           output_file=output_file)
+
+
+def _iter_export_rows(record_dao, ids, data_names, chunk_size):
+    """
+    Yield (id, data) pairs for export, fetching data in bulk.
+
+    Ids are yielded in the order given. Records with none of the requested
+    data are skipped.
+
+    :param record_dao: The RecordDAO to pull data from.
+    :param ids: An iterable of record ids.
+    :param data_names: The names of the data to fetch.
+    :param chunk_size: How many records to fetch data for per query.
+
+    :returns: A generator of (id, {name: datum}) tuples.
+    """
+    for id_chunk in chunked(ids, chunk_size):
+        chunk_data = record_dao.get_data_for_records(id_list=id_chunk,
+                                                     data_list=data_names)
+        for id in id_chunk:
+            dataset = chunk_data.get(id)
+            if dataset:
+                yield id, dataset
+
+
+def _iter_export_data(data):
+    """
+    Standardize the data given to the _export_* helpers to (id, dataset) pairs.
+
+    :param data: A dict of id: dataset or an iterable of (id, dataset) tuples.
+
+    :returns: An iterable of (id, dataset) tuples.
+    """
+    return data.items() if isinstance(data, Mapping) else data
 
 
 def _export_csv(data, scalar_names, output_file):
     """
     Export records and corresponding scalars to a csv file.
 
-    :param data: The dictionary of record ids to list of scalars to export.
-                 Use OrderedDict (as in export()) to preserve order.
+    Data that a record doesn't have is written as an empty field.
+
+    :param data: The dictionary of record ids to dict of scalars to export, or
+                 an iterable of (id, scalars) tuples as produced within export().
+                 Use OrderedDict to preserve order if passing a dictionary.
     :param scalar_names: The list of scalars names to output. Used for header.
     :param output_file: The file to output.
     """
@@ -341,10 +638,111 @@ def _export_csv(data, scalar_names, output_file):
     with open(output_file, 'w') as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(header)
-        for run, dataset in data.items():
+        for run, dataset in _iter_export_data(data):
             # Each entry is a dict of scalars
             if dataset:
-                writer.writerow([run] + [dataset[scalar]['value'] for scalar in scalar_names])
+                writer.writerow([run] + [dataset[scalar]['value'] if scalar in dataset else ''
+                                         for scalar in scalar_names])
+
+
+def _export_json(data, scalar_names, output_file):
+    """
+    Export records and corresponding scalars to newline-delimited JSON.
+
+    Each line is an object of the form {"id": id, scalar_name: value, ...}.
+    Data that a record doesn't have is written as null.
+
+    :param data: The dictionary of record ids to dict of scalars to export, or
+                 an iterable of (id, scalars) tuples as produced within export().
+    :param scalar_names: The list of scalars names to output.
+    :param output_file: The file to output.
+    """
+    LOGGER.debug('About to write data to json file: %s', output_file)
+    with open(output_file, 'w') as jsonfile:
+        for run, dataset in _iter_export_data(data):
+            if dataset:
+                _write_json_row(jsonfile, run, dataset, scalar_names)
+
+
+def _write_json_row(file_, id, dataset, scalar_names):
+    """Write one newline-delimited JSON row of exported data to file_."""
+    row = OrderedDict([('id', id)])
+    for name in scalar_names:
+        row[name] = dataset[name]['value'] if name in dataset else None
+    file_.write(codec.dumps(row) + '\n')
+
+
+def _export_npz(data, scalar_names, output_file):
+    """
+    Export records and corresponding scalars to a NumPy .npz archive.
+
+    The archive contains an "id" array and one array per scalar, all the same
+    length and aligned by index. Numeric data is stored as float64 with NaN for
+    missing values; anything else is stored as unicode with "" for missing.
+
+    To keep memory use flat, rows are spooled to a temporary file while column
+    types are determined, then written column-by-column into memory-mapped
+    .npy files that are finally zipped together.
+
+    :param data: The dictionary of record ids to dict of scalars to export, or
+                 an iterable of (id, scalars) tuples as produced within export().
+    :param scalar_names: The list of scalars names to output.
+    :param output_file: The file to output.
+
+    :raises ValueError: if one of the scalar_names is "id", which would
+                        collide with the array of ids.
+    """
+    LOGGER.debug('About to write data to npz file: %s', output_file)
+    if 'id' in scalar_names:
+        msg = ('Can\'t export a scalar named "id" to npz, as the archive\'s "id" '
+               'array holds the record ids.')
+        LOGGER.error(msg)
+        raise ValueError(msg)
+    workdir = tempfile.mkdtemp(prefix='sina_export_')
+    try:
+        spool_path = os.path.join(workdir, 'rows.json')
+        count = 0
+        max_id_len = 1
+        numeric = dict((name, True) for name in scalar_names)
+        max_str_len = dict((name, 1) for name in scalar_names)
+        with open(spool_path, 'w') as spool:
+            for run, dataset in _iter_export_data(data):
+                if not dataset:
+                    continue
+                count += 1
+                max_id_len = max(max_id_len, len(run))
+                for name in scalar_names:
+                    if name in dataset:
+                        val = dataset[name]['value']
+                        if not isinstance(val, Real) or isinstance(val, bool):
+                            numeric[name] = False
+                        max_str_len[name] = max(max_str_len[name], len(six.text_type(val)))
+                _write_json_row(spool, run, dataset, scalar_names)
+
+        dtypes = OrderedDict([('id', 'U{}'.format(max_id_len))])
+        for name in scalar_names:
+            dtypes[name] = 'f8' if numeric[name] else 'U{}'.format(max_str_len[name])
+        # Memory-mapped, so even every column at once doesn't live in RAM
+        columns = [np.lib.format.open_memmap(os.path.join(workdir, '{}.npy'.format(index)),
+                                             mode='w+', dtype=dtype, shape=(count,))
+                   for index, dtype in enumerate(dtypes.values())]
+        with open(spool_path) as spool:
+            for row_num, line in enumerate(spool):
+                # Rows were spooled as ordered objects matching dtypes
+                for column, val in zip(columns, json.loads(line, object_pairs_hook=list)):
+                    val = val[1]
+                    if val is None:
+                        val = float('nan') if column.dtype.kind == 'f' else ''
+                    elif column.dtype.kind != 'f':
+                        val = six.text_type(val)
+                    column[row_num] = val
+        with zipfile.ZipFile(output_file, 'w', allowZip64=True) as archive:
+            for name, column in zip(dtypes, columns):
+                column.flush()
+                archive.write(column.filename, arcname=name + '.npy')
+        del columns
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
 
 
 def parse_data_string(data_string):
@@ -0,0 +1,182 @@
+"""
+Contains a validator for checking whole documents against the Mnoda schema.
+
+Checking Records one at a time (see Record.validate_and_serialize()) happens
+during ingestion, after database work has begun. A DocumentValidator instead
+checks an entire document (or batch of Records) up front, against the
+JSON schema in mnoda.json, and reports exactly where any problems lie.
+
+The schema is compiled once per process. If fastjsonschema is available, it's
+compiled to Python code, which makes checking valid documents quick; if
+jsonschema is available, it's used to explain invalid ones. At least one of
+the two is required.
+"""
+import os
+import json
+import logging
+import threading
+from collections import defaultdict
+
+try:
+    import fastjsonschema
+    FASTJSONSCHEMA_PRESENT = True
+except ImportError:
+    FASTJSONSCHEMA_PRESENT = False
+
+try:
+    import jsonschema
+    JSONSCHEMA_PRESENT = True
+except ImportError:
+    JSONSCHEMA_PRESENT = False
+
+LOGGER = logging.getLogger(__name__)
+
+# The Mnoda schema shipped with Sina (a copy of the repository's mnoda.json)
+MNODA_SCHEMA_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'mnoda.json')
+# The most problems reported for one document. Past this, they're usually
+# the same mistake repeated.
+MAX_REPORTED_ERRORS = 20
+
+_VALIDATORS = {}
+_VALIDATORS_LOCK = threading.Lock()
+
+
+class DocumentValidator(object):
+    """Checks documents against a JSON schema, by default Mnoda's."""
+
+    def __init__(self, schema_path=MNODA_SCHEMA_PATH):
+        """
+        Compile a validator for the schema at schema_path.
+
+        :param schema_path: The path to the JSON schema to validate against.
+
+        :raises ImportError: if neither fastjsonschema nor jsonschema can be
+                             imported.
+        """
+        if not (FASTJSONSCHEMA_PRESENT or JSONSCHEMA_PRESENT):
+            msg = ('Validating documents requires fastjsonschema or jsonschema, '
+                   'neither of which could be imported.')
+            LOGGER.error(msg)
+            raise ImportError(msg)
+        LOGGER.debug('Compiling validator for schema at %s', schema_path)
+        with open(schema_path) as schema_file:
+            self.schema = json.load(schema_file)
+        self._compiled = (fastjsonschema.compile(self.schema)
+                          if FASTJSONSCHEMA_PRESENT else None)
+        self._explainer = (jsonschema.Draft7Validator(self.schema)
+                           if JSONSCHEMA_PRESENT else None)
+
+    def errors(self, document, limit=MAX_REPORTED_ERRORS):
+        """
+        Find the problems with a document.
+
+        :param document: The document (ex: a dict loaded from a JSON file).
+        :param limit: The most problems to report.
+
+        :returns: A list of strings, each giving the path to a problem and a
+                  description of it, ex: "records[3].data.volume.value: 'big'
+                  is not of type 'number'". Empty if the document is valid.
+        """
+        if self._compiled is not None:
+            try:
+                self._compiled(document)
+                return []
+            except fastjsonschema.JsonSchemaValueException as context:
+                if self._explainer is None:
+                    # Names read ex: "data.records[3]", "data" being the document
+                    path = context.name[len('data'):].lstrip('.') or '(document)'
+                    return ['{}: {}'.format(path, context.message)]
+        problems = []
+        for error in self._explainer.iter_errors(document):
+            cause = _most_specific(error)
+            problems.append('{}: {}'.format(_format_path(cause.absolute_path), cause.message))
+            if len(problems) >= limit:
+                break
+        return problems
+
+    def validate(self, document, source=None):
+        """
+        Check that a document is valid.
+
+        :param document: The document (ex: a dict loaded from a JSON file).
+        :param source: Where the document came from (ex: its path), to name
+                       in any error.
+
+        :raises ValueError: if the document is invalid, listing its problems.
+        """
+        problems = self.errors(document)
+        if problems:
+            msg = '{} does not follow the schema:\n{}'.format(
+                source if source is not None else 'Document', '\n'.join(problems))
+            LOGGER.error(msg)
+            raise ValueError(msg)
+
+    def validate_records(self, records, source=None):
+        """
+        Check that a batch of Records, in their JSON form, are valid.
+
+        Problems are reported with paths starting "records[<index in batch>]".
+
+        :param records: A list of the Records' JSON forms (ex: Record.raw).
+        :param source: Where the Records came from, to name in any error.
+
+        :raises ValueError: if any Record is invalid, listing the problems.
+        """
+        if records:
+            self.validate({'records': list(records)}, source=source)
+
+
+def get_validator(schema_path=MNODA_SCHEMA_PATH):
+    """
+    Get the validator for a schema, compiling it on first use.
+
+    Validators are shared by everything in the process, so each schema is
+    only compiled once.
+
+    :param schema_path: The path to the JSON schema to validate against.
+
+    :returns: The DocumentValidator for the schema.
+    """
+    with _VALIDATORS_LOCK:
+        if schema_path not in _VALIDATORS:
+            _VALIDATORS[schema_path] = DocumentValidator(schema_path)
+        return _VALIDATORS[schema_path]
+
+
+def _most_specific(error):
+    """
+    Find the underlying cause of a jsonschema error.
+
+    Errors from oneOf/anyOf only say nothing matched. Their causes are found
+    by following whichever alternative came closest to matching (had the
+    fewest errors), and taking its deepest error.
+
+    :param error: A jsonschema ValidationError.
+
+    :returns: The ValidationError most specifically describing the problem.
+    """
+    if not error.context:
+        return error
+    alternatives = defaultdict(list)
+    for suberror in error.context:
+        alternatives[suberror.relative_schema_path[0]].append(suberror)
+    closest = min(alternatives.values(), key=len)
+    causes = [_most_specific(suberror) for suberror in closest]
+    return max(causes, key=lambda cause: len(cause.absolute_path))
+
+
+def _format_path(path):
+    """
+    Format a path into a document as it'd be written in Python-ish notation.
+
+    :param path: An iterable of keys and indices, ex: ["records", 3, "data"].
+
+    :returns: The path as a string, ex: "records[3].data".
+    """
+    formatted = ''
+    for step in path:
+        if isinstance(step, int):
+            formatted += '[{}]'.format(step)
+        else:
+            formatted += ('.' if formatted else '') + str(step)
+    return formatted or '(document)'
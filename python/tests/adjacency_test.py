@@ -0,0 +1,187 @@
+"""Tests for the Relationship adjacency index."""
+import os
+import shutil
+import tempfile
+import unittest
+
+# Disable pylint check due to its issue with virtual environments
+from mock import patch  # pylint: disable=import-error
+
+import sina.datastores.sql as sql
+from sina.adjacency import AdjacencyIndex, NUMPY_PRESENT
+from sina.model import Record, Relationship
+
+# Disable pylint invalid-name due to significant number of tests with names
+# exceeding the 30 character limit
+# pylint: disable=invalid-name
+
+# study contains two ensembles, which contain runs. run_3 loops back.
+EDGES = (("study", "contains", "ens_1"),
+         ("study", "contains", "ens_2"),
+         ("ens_1", "contains", "run_1"),
+         ("ens_2", "contains", "run_2"),
+         ("ens_2", "contains", "run_3"),
+         ("run_3", "contains", "study"),
+         ("run_1", "uses", "mesh"))
+
+
+def populate(factory):
+    """Insert the Records and Relationships of EDGES."""
+    ids = set(subj for subj, _, _ in EDGES) | set(obj for _, _, obj in EDGES)
+    factory.create_record_dao().insert_many([Record(id, "thing") for id in sorted(ids)])
+    factory.create_relationship_dao().insert_many(
+        [Relationship(subject_id=subj, predicate=pred, object_id=obj)
+         for subj, pred, obj in EDGES])
+
+
+@unittest.skipUnless(NUMPY_PRESENT, "The adjacency index requires numpy")
+class TestAdjacencyIndex(unittest.TestCase):
+    """Tests for building, querying, updating, and saving the index."""
+
+    def setUp(self):
+        """Create a scratch directory for file databases."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "graph.sqlite")
+
+    def tearDown(self):
+        """Remove the scratch directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_queries_match_traverse(self):
+        """Test that the index answers as RelationshipDAO.traverse() would."""
+        factory = sql.DAOFactory(adjacency_index=True)
+        populate(factory)
+        relationship_dao = factory.create_relationship_dao()
+        index = factory.adjacency
+        for direction in ("out", "in", "both"):
+            for predicate in (None, "contains", "nonexistent"):
+                for max_depth in (None, 1, 2):
+                    for start_ids in (["study"], ["run_1", "mesh"], ["nobody"]):
+                        kwargs = {"predicate": predicate, "direction": direction,
+                                  "max_depth": max_depth}
+                        self.assertEqual(index.traverse(start_ids, **kwargs),
+                                         relationship_dao.traverse(start_ids, **kwargs),
+                                         (start_ids, kwargs))
+        self.assertEqual(index.relationship_count, len(EDGES))
+        self.assertEqual(index.neighbors("ens_2"), {"run_2", "run_3"})
+        self.assertEqual(index.siblings("run_2", predicate="contains"), {"run_3"})
+        self.assertEqual(index.siblings("mesh"), set())
+        with self.assertRaises(ValueError):
+            index.traverse(["study"], direction="sideways")
+
+    def test_lazy_load_and_observe(self):
+        """Test that the index builds on first use and then tracks inserts."""
+        factory = sql.DAOFactory(adjacency_index=True)
+        populate(factory)
+        index = factory.adjacency
+        with patch.object(factory.adjacency.relationship_dao, 'get_all',
+                          wraps=index.relationship_dao.get_all) as get_all:
+            self.assertEqual(index.neighbors("run_2"), set())
+            relationship_dao = factory.create_relationship_dao()
+            relationship_dao.insert(subject_id="run_2", predicate="uses", object_id="mesh")
+            relationship_dao.insert_many([
+                Relationship(subject_id="run_2", predicate="uses", object_id="mesh"),
+                Relationship(subject_id="mesh", predicate="made_by", object_id="mesher")])
+            self.assertEqual(get_all.call_count, 1)
+        self.assertEqual(index.traverse(["run_2"]), {"mesh", "mesher"})
+        self.assertEqual(index.neighbors("mesh", direction="in"), {"run_1", "run_2"})
+        self.assertEqual(index.relationship_count, len(EDGES) + 2)
+
+    def test_compaction(self):
+        """Test that folding inserts into the arrays doesn't change any answers."""
+        factory = sql.DAOFactory(adjacency_index=True)
+        populate(factory)
+        index = factory.adjacency
+        index.load()
+        relationship_dao = factory.create_relationship_dao()
+        with patch('sina.adjacency.COMPACT_THRESHOLD', 2):
+            relationship_dao.insert(subject_id="run_2", predicate="uses", object_id="mesh")
+            relationship_dao.insert(subject_id="mesh", predicate="made_by",
+                                    object_id="mesher")
+        # pylint: disable=protected-access
+        self.assertEqual(index._pending_count, 0)
+        self.assertEqual(index.traverse(["study"], direction="out"),
+                         relationship_dao.traverse(["study"], direction="out"))
+        self.assertEqual(index.neighbors("mesher", direction="in"), {"mesh"})
+
+    def test_save_and_reload(self):
+        """Test that a file database's index is saved beside it and memory-mapped."""
+        factory = sql.DAOFactory(self.db_path, adjacency_index=True)
+        populate(factory)
+        expected = factory.adjacency.traverse(["study"])
+        index_path = self.db_path + ".adjacency"
+        self.assertTrue(os.path.isdir(index_path))
+
+        reopened = sql.DAOFactory(self.db_path, adjacency_index=True)
+        with patch.object(reopened.adjacency.relationship_dao, 'get_all') as get_all:
+            self.assertEqual(reopened.adjacency.traverse(["study"]), expected)
+            get_all.assert_not_called()
+
+    def test_stale_file_rebuilt(self):
+        """Test that a saved index is rebuilt when the database has changed."""
+        factory = sql.DAOFactory(self.db_path, adjacency_index=True)
+        populate(factory)
+        factory.adjacency.load()
+        # Written without the index knowing
+        plain_factory = sql.DAOFactory(self.db_path)
+        plain_factory.create_record_dao().insert(Record("mesher", "thing"))
+        plain_factory.create_relationship_dao().insert(subject_id="mesh", predicate="made_by",
+                                                       object_id="mesher")
+        reopened = sql.DAOFactory(self.db_path, adjacency_index=True)
+        self.assertEqual(reopened.adjacency.neighbors("mesh"), {"mesher"})
+
+    def test_stale_file_same_count_rebuilt(self):
+        """Test that a saved index is rebuilt when Relationships are swapped one for one."""
+        factory = sql.DAOFactory(self.db_path, adjacency_index=True)
+        populate(factory)
+        factory.adjacency.load()
+        plain_factory = sql.DAOFactory(self.db_path)
+        record_dao = plain_factory.create_record_dao()
+        record_dao.delete("mesh")
+        record_dao.insert(Record("mesher", "thing"))
+        plain_factory.create_relationship_dao().insert(subject_id="run_1", predicate="uses",
+                                                       object_id="mesher")
+        reopened = sql.DAOFactory(self.db_path, adjacency_index=True)
+        self.assertEqual(reopened.adjacency.neighbors("run_1"), {"mesher"})
+
+    def test_delete_forgets(self):
+        """Test that deleting Records drops their Relationships from the index."""
+        factory = sql.DAOFactory(self.db_path, adjacency_index=True)
+        populate(factory)
+        self.assertIn("run_1", factory.adjacency.traverse(["study"]))
+        record_dao = factory.create_record_dao()
+        record_dao.delete("ens_1")
+        # Updated in place rather than thrown away
+        self.assertTrue(factory.adjacency._loaded)  # pylint: disable=protected-access
+        self.assertEqual(factory.adjacency.traverse(["study"]),
+                         {"ens_2", "run_2", "run_3", "study"})
+        self.assertEqual(factory.adjacency.relationship_count, len(EDGES) - 2)
+        self.assertEqual(factory.adjacency.neighbors("study", direction="in"), {"run_3"})
+        record_dao.delete_many(["ens_2", "run_3"])
+        self.assertEqual(factory.adjacency.traverse(["study"]), set())
+        self.assertEqual(factory.adjacency.relationship_count, 1)
+        factory.adjacency.save()
+        reopened = sql.DAOFactory(self.db_path, adjacency_index=True)
+        self.assertEqual(reopened.adjacency.neighbors("run_1"), {"mesh"})
+        self.assertEqual(reopened.adjacency.traverse(["study"], direction="both"), set())
+
+    def test_delete_then_reinsert(self):
+        """Test that a deleted id inserted again starts without Relationships."""
+        factory = sql.DAOFactory(adjacency_index=True)
+        populate(factory)
+        factory.adjacency.load()
+        record_dao = factory.create_record_dao()
+        record_dao.delete("run_1")
+        record_dao.insert(Record("run_1", "thing"))
+        self.assertEqual(factory.adjacency.neighbors("run_1"), set())
+        self.assertEqual(factory.adjacency.neighbors("run_1", direction="in"), set())
+        factory.create_relationship_dao().insert(subject_id="run_1", predicate="uses",
+                                                 object_id="mesh")
+        self.assertEqual(factory.adjacency.neighbors("mesh", direction="in"), {"run_1"})
+
+    def test_save_without_path(self):
+        """Test that we raise a ValueError saving an in-memory index."""
+        index = AdjacencyIndex(sql.DAOFactory().create_relationship_dao())
+        with self.assertRaises(ValueError) as context:
+            index.save()
+        self.assertIn('no path', str(context.exception))
@@ -5,6 +5,7 @@ import os
 import unittest
 import json
 import csv
+import tempfile
 import logging
 from collections import OrderedDict
 import types
@@ -15,9 +16,12 @@ import six
 from mock import patch  # pylint: disable=import-error
 
 from sina.utils import (DataRange, import_json, export, _export_csv, has_all,
-                        has_any, has_only)
+                        has_any, has_only, NUMPY_PRESENT)
 from sina.model import Run, Record, Relationship
 
+if NUMPY_PRESENT:
+    import numpy as np
+
 LOGGER = logging.getLogger(__name__)
 TARGET = None
 
@@ -193,6 +197,66 @@ class TestModify(unittest.TestCase):
         self.assertEqual(returned_record.files, rec.files)
         self.assertEqual(returned_record.user_defined, rec.user_defined)
 
+    def test_recorddao_replace_many(self):
+        """Test that replacing a Record swaps its contents but keeps its Relationships."""
+        factory = self.create_dao_factory()
+        record_dao = factory.create_record_dao()
+        record_dao.insert_many([
+            Record(id="spam", type="eggs",
+                   data={"eggs": {"value": 12, "tags": ["runny"]},
+                         "flavor": {"value": "tasty"},
+                         "toppings": {"value": ["ham", "cheese", "chives"]}},
+                   files=[{"uri": "eggs.brek"}, {"uri": "eggs.lunch"}]),
+            Record(id="ham", type="eggs")])
+        factory.create_relationship_dao().insert(subject_id="spam", object_id="ham",
+                                                 predicate="precedes")
+        replacement = Record(id="spam", type="omelette",
+                             data={"eggs": {"value": 3, "tags": ["runny"]},
+                                   "flavor": {"value": "tasty"},
+                                   "toppings": {"value": ["ham", "peppers"]}},
+                             files=[{"uri": "eggs.brek", "mimetype": "egg",
+                                     "tags": ["fried"]}])
+        record_dao.replace_many([replacement])
+        returned_record = record_dao.get("spam")
+        self.assertEqual(returned_record.type, "omelette")
+        self.assertEqual(returned_record.data, replacement.data)
+        self.assertEqual(record_dao.get_files("spam"), replacement.files)
+        self.assertFalse(list(record_dao.data_query(eggs=12)))
+        self.assertFalse(list(record_dao.data_query(toppings=has_any("chives", "cheese"))))
+        self.assertEqual(list(record_dao.data_query(toppings=has_all("ham", "peppers"))),
+                         ["spam"])
+        self.assertEqual(record_dao.get_content_hashes(["spam"]),
+                         {"spam": replacement.content_hash()})
+        relationships = factory.create_relationship_dao().get(subject_id="spam")
+        self.assertEqual([rel.object_id for rel in relationships], ["ham"])
+
+    def test_recorddao_compress_raws(self):
+        """Test that compressing stored raws leaves Records unchanged."""
+        factory = self.create_dao_factory()
+        record_dao = factory.create_record_dao()
+        records = [Record(id="rec_{}".format(x), type="sample",
+                          data={"eggs": {"value": x, "tags": ["runny"]},
+                                "flavor": {"value": "tasty"}},
+                          files=[{"uri": "rec_{}.png".format(x)}])
+                   for x in range(3)]
+        record_dao.insert_many(records)
+        factory.create_run_dao().insert(Run(id="run_1", application="breakfast"))
+        progress = []
+        self.assertEqual(record_dao.compress_raws(
+            "zlib", progress_callback=lambda done, _: progress.append(done)), 4)
+        self.assertEqual(progress[-1], 4)
+        for record in records:
+            self.assertEqual(record_dao.get(record.id).raw, record.raw)
+        self.assertEqual(factory.create_run_dao().get("run_1").application, "breakfast")
+        self.assertEqual(list(record_dao.data_query(flavor="tasty")),
+                         ["rec_0", "rec_1", "rec_2"])
+        # Already compressed, so nothing to do
+        self.assertEqual(record_dao.compress_raws("zlib"), 0)
+        self.assertEqual(record_dao.compress_raws(None), 4)
+        self.assertEqual(record_dao.get("rec_2").raw, records[2].raw)
+        with self.assertRaises(ValueError):
+            record_dao.compress_raws("bzip")
+
     def test_recorddao_delete_one(self):
         """Test that RecordDAO is deleting correctly."""
         record_dao = self.create_dao_factory(test_db_dest=self.test_db_dest).create_record_dao()
@@ -265,6 +329,34 @@ class TestModify(unittest.TestCase):
         self.assertFalse(relationship_dao.get(subject_id="rec_3"))
         self.assertEqual(len(relationship_dao.get(object_id="rec_4")), 1)
 
+    def test_recorddao_delete_given_data(self):
+        """Test that RecordDAO can delete the Records whose data match criteria."""
+        factory = self.create_dao_factory(test_db_dest=self.test_db_dest)
+        record_dao = factory.create_record_dao()
+        relationship_dao = factory.create_relationship_dao()
+        record_dao.insert_many([
+            Record(id="rec_1", type="sample",
+                   data={"volume": {"value": 12}, "batch": {"value": "bad"},
+                         "flags": {"value": ["retry", "slow"]}}),
+            Record(id="rec_2", type="sample",
+                   data={"volume": {"value": 12}, "batch": {"value": "good"},
+                         "flags": {"value": ["slow"]}}),
+            Record(id="rec_3", type="sample",
+                   data={"volume": {"value": 15}, "batch": {"value": "bad"},
+                         "flags": {"value": ["slow", "retry", "odd"]}}),
+            Record(id="rec_4", type="sample", data={"volume": {"value": 12}})])
+        relationship_dao.insert(subject_id="rec_4", object_id="rec_1", predicate="reruns")
+        self.assertEqual(record_dao.delete_given_data(volume=12, batch="bad"), 1)
+        self.assertEqual(record_dao.delete_given_data(volume=DataRange(0, 10)), 0)
+        self.assertEqual(record_dao.delete_given_data(flags=has_only("slow", "retry")), 0)
+        self.assertEqual(record_dao.delete_given_data(volume=15,
+                                                      flags=has_any("odd", "retry")), 1)
+        self.assertEqual(record_dao.delete_given_data(flags=has_all("slow", "retry")), 0)
+        six.assertCountEqual(self, record_dao.get_all_of_type("sample", ids_only=True),
+                             ["rec_2", "rec_4"])
+        self.assertFalse(relationship_dao.get(subject_id="rec_4"))
+        self.assertEqual(list(record_dao.data_query(batch="bad")), [])
+
     # RelationshipDAO
     # pylint: disable=fixme
     # TODO: There's no delete method for Relationships. SIBO-781
@@ -298,6 +390,20 @@ class TestModify(unittest.TestCase):
             self.assertEqual(result.object_id, relationship.object_id)
             self.assertEqual(result.predicate, relationship.predicate)
 
+    def test_relationshipdao_insert_many(self):
+        """Test that RelationshipDAO inserts many, skipping any it already has."""
+        relationship_dao = self.create_dao_factory().create_relationship_dao()
+        relationship_dao.insert(subject_id="spam", object_id="eggs", predicate="loves")
+        relationship_dao.insert_many([
+            Relationship(subject_id="spam", object_id="eggs", predicate="loves"),
+            Relationship(subject_id="spam", object_id="ham", predicate="loves"),
+            Relationship(subject_id="spam", object_id="ham", predicate="loves"),
+            Relationship(subject_id="eggs", object_id="ham", predicate="tolerates")])
+        six.assertCountEqual(self, [(x.object_id, x.predicate) for x
+                                    in relationship_dao.get(subject_id="spam")],
+                             [("eggs", "loves"), ("ham", "loves")])
+        self.assertEqual(len(relationship_dao.get(object_id="ham")), 2)
+
     def test_relationshipdao_bad_insert(self):
         """Test that the RelationshipDAO refuses to insert malformed relationships."""
         relationship_dao = self.create_dao_factory().create_relationship_dao()
@@ -305,6 +411,68 @@ class TestModify(unittest.TestCase):
             relationship_dao.insert(subject_id="spam", object_id="eggs")
         self.assertIn('Must supply either', str(context.exception))
 
+    def test_relationshipdao_get_many(self):
+        """Test that RelationshipDAO gets the Relationships of many ids at once."""
+        relationship_dao = self.create_dao_factory().create_relationship_dao()
+        relationship_dao.insert_many([
+            Relationship(subject_id="spam", object_id="eggs", predicate="loves"),
+            Relationship(subject_id="spam", object_id="ham", predicate="loathes"),
+            Relationship(subject_id="eggs", object_id="ham", predicate="loves")])
+
+        def simplify(grouped):
+            """Reduce grouped Relationships to sorted triples for comparison."""
+            return [(id, sorted((x.subject_id, x.predicate, x.object_id) for x in rels))
+                    for id, rels in grouped.items()]
+
+        by_subject = relationship_dao.get_many(subject_ids=["spam", "nobody", "eggs"])
+        self.assertEqual(simplify(by_subject),
+                         [("spam", [("spam", "loathes", "ham"), ("spam", "loves", "eggs")]),
+                          ("nobody", []),
+                          ("eggs", [("eggs", "loves", "ham")])])
+        by_object = relationship_dao.get_many(object_ids=["ham", "eggs"], predicate="loves")
+        self.assertEqual(simplify(by_object),
+                         [("ham", [("eggs", "loves", "ham")]),
+                          ("eggs", [("spam", "loves", "eggs")])])
+        self.assertEqual(relationship_dao.get_many(subject_ids=[]), {})
+        with self.assertRaises(ValueError) as context:
+            relationship_dao.get_many(subject_ids=["spam"], object_ids=["eggs"])
+        self.assertIn('exactly one of', str(context.exception))
+
+    def test_relationshipdao_traverse(self):
+        """Test that the RelationshipDAO follows Relationships transitively."""
+        relationship_dao = self.create_dao_factory().create_relationship_dao()
+        # study contains ensembles, which contain runs. run_3 loops back.
+        for subj, pred, obj in (("study", "contains", "ens_1"),
+                                ("study", "contains", "ens_2"),
+                                ("ens_1", "contains", "run_1"),
+                                ("ens_2", "contains", "run_2"),
+                                ("ens_2", "contains", "run_3"),
+                                ("run_3", "contains", "study"),
+                                ("run_1", "uses", "mesh")):
+            relationship_dao.insert(subject_id=subj, predicate=pred, object_id=obj)
+        everything = {"study", "ens_1", "ens_2", "run_1", "run_2", "run_3", "mesh"}
+        self.assertEqual(relationship_dao.traverse(["study"]), everything)
+        self.assertEqual(relationship_dao.traverse(["study"], predicate="contains"),
+                         everything - {"mesh"})
+        self.assertEqual(relationship_dao.traverse(["study"], max_depth=1),
+                         {"ens_1", "ens_2"})
+        self.assertEqual(relationship_dao.traverse(["run_1"], direction="in"),
+                         everything - {"mesh", "run_1", "run_2"})
+        self.assertEqual(relationship_dao.traverse(["mesh"], direction="both", max_depth=2),
+                         {"mesh", "run_1", "ens_1"})
+        self.assertEqual(relationship_dao.traverse(["nobody"]), set())
+        ids, edges = relationship_dao.traverse(["ens_2", "run_1"], max_depth=1,
+                                               include_edges=True)
+        self.assertEqual(ids, {"run_2", "run_3", "mesh"})
+        six.assertCountEqual(self, [(edge.subject_id, edge.predicate, edge.object_id)
+                                    for edge in edges],
+                             [("ens_2", "contains", "run_2"),
+                              ("ens_2", "contains", "run_3"),
+                              ("run_1", "uses", "mesh")])
+        with self.assertRaises(ValueError) as context:
+            relationship_dao.traverse(["study"], direction="sideways")
+        self.assertIn('direction sideways not recognized', str(context.exception))
+
     # RunDAO
     def test_runddao_insert_retrieve(self):
         """Test that RunDAO is inserting and getting correctly."""
@@ -328,6 +496,19 @@ class TestModify(unittest.TestCase):
         self.assertEqual(returned_run.version, run.version)
         self.assertEqual(returned_run.data, run.data)
 
+    def test_rundao_replace_many(self):
+        """Test that replacing a Run swaps its metadata along with its contents."""
+        run_dao = self.create_dao_factory().create_run_dao()
+        run_dao.insert(Run(id="spam", application="bar", version="1.2.3",
+                           data={"foo": {"value": 12}}))
+        run_dao.replace_many([Run(id="spam", application="baz", version="1.2.4",
+                                  data={"foo": {"value": 13}})])
+        returned_run = run_dao.get("spam")
+        self.assertEqual(returned_run.application, "baz")
+        self.assertEqual(returned_run.version, "1.2.4")
+        self.assertEqual(list(run_dao.data_query(foo=13)), ["spam"])
+        self.assertFalse(list(run_dao.data_query(foo=12)))
+
     def test_rundao_delete(self):
         """Test that RunDAO is deleting correctly."""
         factory = self.create_dao_factory(test_db_dest=self.test_db_dest)
@@ -479,6 +660,44 @@ class TestQuery(unittest.TestCase):  # pylint: disable=too-many-public-methods
                                             val_data_2="double yolks")  # 1, 3, and 4
         self.assertEqual(list(just_3), ["spam3"])
 
+    def test_recorddao_data_query_sorted(self):
+        """Test that data_query yields ids in sorted order, whatever the criteria."""
+        all_spam = list(self.record_dao.data_query(spam_scal=DataRange(-500, 500)))
+        self.assertEqual(all_spam, ["spam", "spam2", "spam3"])
+        lists = list(self.record_dao.data_query(val_data_list_1=has_any(0, 8),
+                                                val_data_list_2=has_all('eggs')))
+        self.assertEqual(lists, ["spam5", "spam6"])
+
+    # ###################### data_query planning ############################
+    def test_recorddao_analyze(self):
+        """Test that the RecordDAO collects statistics on its data."""
+        catalog = self.record_dao.analyze()
+        self.assertTrue(catalog.complete)
+        spam_scal = catalog.get("scalar", "spam_scal")
+        self.assertEqual(spam_scal.count, 3)
+        self.assertEqual(spam_scal.min, 10)
+        self.assertEqual(spam_scal.max, 10.99999)
+        self.assertEqual(spam_scal.distinct, 3)
+        self.assertEqual(sum(spam_scal.histogram), 3)
+        self.assertEqual(catalog.get("string", "val_data_2").distinct, 1)
+        list_1 = catalog.get("scalarlist", "val_data_list_1")
+        self.assertEqual((list_1.count, list_1.entries, list_1.min, list_1.max),
+                         (2, 4, 0, 20))
+        self.assertEqual(catalog.get("stringlist", "val_data_list_2").distinct, 3)
+        self.assertIsNone(catalog.get("scalar", "val_data"))
+
+    def test_recorddao_explain_query(self):
+        """Test that the RecordDAO runs the most selective criterion first."""
+        self.record_dao.analyze()
+        criteria = {"val_data_2": "double yolks",  # 1, 3, and 4
+                    "spam_scal": DataRange(10.2, 11)}  # 2 and 3
+        plan = self.record_dao.explain_query(**criteria)
+        self.assertEqual([step.name for step in plan.steps], ["spam_scal", "val_data_2"])
+        self.assertFalse(plan.steps[0].restricted)
+        self.assertTrue(plan.steps[1].restricted)
+        self.assertIn("IN filter", str(plan))
+        self.assertEqual(list(self.record_dao.data_query(**criteria)), ["spam3"])
+
     # ###################### data_query list queries ########################
     def test_recorddao_data_query_scalar_list_has_all(self):
         """Test that the RecordDAO is retrieving on a has_all list of scalars."""
@@ -610,6 +829,17 @@ class TestQuery(unittest.TestCase):  # pylint: disable=too-many-public-methods
         multi_scalar = list(self.run_dao.data_query(spam_scal=DataRange(-500, 500)))
         six.assertCountEqual(self, multi_scalar, ["spam", "spam2"])
 
+    # ############################# get_all ###############################
+    def test_recorddao_get_all(self):
+        """Test that the RecordDAO returns every Record, and only once."""
+        all_ids = list(self.record_dao.get_all(ids_only=True))
+        self.assertEqual(len(all_ids), len(set(all_ids)))
+        self.assertTrue({"spam", "spam2", "spam4", "eggs"}.issubset(all_ids))
+        all_records = self.record_dao.get_all()
+        self.assertIsInstance(all_records, types.GeneratorType,
+                              "Method must return a generator.")
+        six.assertCountEqual(self, [record.id for record in all_records], all_ids)
+
     # ######################### get_all_of_type ###########################
     def test_recorddao_type(self):
         """Test the RecordDAO is retrieving based on type correctly."""
@@ -636,6 +866,52 @@ class TestQuery(unittest.TestCase):  # pylint: disable=too-many-public-methods
         ids_only = self.record_dao.get_all_of_type("run", ids_only=True)
         six.assertCountEqual(self, list(ids_only), ["spam", "spam2", "spam5"])
 
+    # ########################## projected get ############################
+    def test_recorddao_get_data_fields(self):
+        """Test that the RecordDAO returns Records holding only the data asked for."""
+        record = self.record_dao.get("spam", data_fields=["spam_scal", "val_data", "nope"])
+        self.assertIsInstance(record, Record)
+        self.assertEqual(record.type, "run")
+        self.assertEqual(record.data,
+                         {"spam_scal": {"value": 10, "units": "pigs", "tags": ["hammy"]},
+                          "val_data": {"value": "runny", "tags": ["edible"]}})
+        self.assertEqual(record.files, [])
+        self.assertEqual(record.user_defined, {})
+        with_files = self.record_dao.get("spam5", data_fields=[], include_files=True)
+        self.assertEqual(with_files.data, {})
+        self.assertEqual(with_files.files, [{"uri": "beep.wav", "tags": ["output", "eggs"],
+                                             "mimetype": "audio/wav"}])
+        unsorted = self.record_dao.get("spam", data_fields=[], include_files=True)
+        self.assertEqual(unsorted.files, [{"uri": "beep.wav"}, {"uri": "beep.pong"}])
+
+    def test_recorddao_get_many_data_fields(self):
+        """Test that projected Records come back in order, lists intact."""
+        records = list(self.record_dao.get_many(["spam5", "eggs", "spam3"],
+                                                data_fields=["val_data_list_1", "eggs_scal"]))
+        self.assertEqual([record.id for record in records], ["spam5", "eggs", "spam3"])
+        self.assertEqual([record.data for record in records],
+                         [{"val_data_list_1": {"value": [0, 9.3]}},
+                          {"eggs_scal": {"value": 0}},
+                          {}])
+        whole = list(self.record_dao.get_many(["spam3"]))[0]
+        projected = list(self.record_dao.get_many(["spam3"], data_fields=list(whole.data),
+                                                  include_files=True))[0]
+        self.assertEqual(projected.data, whole.data)
+        self.assertEqual(projected.files, whole.files)
+
+    def test_rundao_get_data_fields(self):
+        """Test that the RunDAO returns Runs holding only the data asked for."""
+        run = self.run_dao.get("spam", data_fields=["spam_scal_2"])
+        self.assertIsInstance(run, Run)
+        self.assertEqual(run.application, "breakfast_maker")
+        self.assertEqual(run.version, "1.4.0")
+        self.assertEqual(run.data, {"spam_scal_2": {"value": 200}})
+        runs = list(self.run_dao.get_many(["spam"], data_fields=["spam_scal"],
+                                          include_files=True))
+        self.assertEqual(runs[0].user, "Bob")
+        # In the order the Run lists them, as from project_record()
+        self.assertEqual(runs[0].files, [{"uri": "beep.wav"}, {"uri": "beep.pong"}])
+
     # ########################### get_files #############################
     def test_recorddao_get_files(self):
         """Test that the RecordDAO is getting files for records correctly."""
@@ -758,6 +1034,43 @@ class TestImportExport(unittest.TestCase):
         self.assertEqual(canonical['relationships'][0]['predicate'],
                          relation[0].predicate)
 
+    def test_reimport(self):
+        """Test that re-importing skips unchanged Records and replaces changed ones."""
+        factory = self.create_dao_factory()
+        json_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                 "test_files/mnoda_1.json")
+        self.assertEqual(import_json(factory=factory, json_path=json_path),
+                         {"inserted": 3, "updated": 0, "skipped": 0})
+        with open(json_path) as json_file:
+            document = json.load(json_file)
+        child = document['records'][1]
+        child['version'] = "2.0"
+        child['data']['scalar_1']['value'] = 400
+        del child['data']['value-3']
+        child['files'] = [{"uri": "bar.png"}]
+        document['records'].append({"id": "grandchild_1", "type": "grandchild"})
+        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False) as json_file:
+            json.dump(document, json_file)
+        try:
+            # The local_id Record gets a fresh id each time
+            self.assertEqual(import_json(factory=factory, json_path=json_file.name),
+                             {"inserted": 2, "updated": 1, "skipped": 1})
+        finally:
+            remove_file(json_file.name)
+        record_dao = factory.create_record_dao()
+        run_dao = factory.create_run_dao()
+        self.assertEqual(run_dao.get("child_1").version, "2.0")
+        self.assertEqual(list(record_dao.data_query(scalar_1=400)), ["child_1"])
+        self.assertFalse(list(record_dao.data_query(scalar_1=387.6)))
+        self.assertFalse(list(record_dao.data_query(**{"value-3": has_any("eggs")})))
+        self.assertEqual(list(record_dao.data_query(**{"value-1": "Tuesday"})), ["child_1"])
+        self.assertEqual([doc['uri'] for doc in record_dao.get_files("child_1")], ["bar.png"])
+        relationships = factory.create_relationship_dao().get(object_id="child_1")
+        self.assertEqual([rel.subject_id for rel in relationships], ["parent_1"])
+        hashes = record_dao.get_content_hashes(["child_1", "parent_1", "nobody"])
+        self.assertEqual(hashes, {"child_1": run_dao.get("child_1").content_hash(),
+                                  "parent_1": record_dao.get("parent_1").content_hash()})
+
     # Exporting
     @patch('sina.utils._export_csv')
     def test_export_csv_good_input_mocked(self, mock):
@@ -864,6 +1177,118 @@ class TestImportExport(unittest.TestCase):
             self.assertEqual(len(rows), 1)
             self.assertEqual(rows[0], ['id', 'bad-scalar'])
 
+    def test_export_csv_missing_data_blank(self):
+        """Test that data a record lacks is exported as an empty csv field."""
+        factory = self.create_dao_factory()
+        populate_database_with_data(factory.create_record_dao())
+        export(
+            factory=factory,
+            id_list=['spam2', 'spam3'],
+            scalar_names=['spam_scal', 'spam_scal_2'],
+            output_type='csv',
+            output_file=self.test_file_path.name,
+            chunk_size=1)
+
+        with open(self.test_file_path.name, 'r') as csvfile:
+            rows = [row for row in csv.reader(csvfile)]
+            self.assertEqual(rows[1], ['spam2', '10.99999', ''])
+            self.assertEqual(rows[2], ['spam3', '10.5', '10.5'])
+
+    def test_export_by_criteria(self):
+        """Test exporting the records that match criteria instead of ids."""
+        factory = self.create_dao_factory()
+        populate_database_with_data(factory.create_record_dao())
+        export(
+            factory=factory,
+            criteria={'spam_scal': DataRange(10.1, 400)},
+            scalar_names=['spam_scal'],
+            output_type='csv',
+            output_file=self.test_file_path.name)
+
+        with open(self.test_file_path.name, 'r') as csvfile:
+            rows = [row for row in csv.reader(csvfile)]
+            six.assertCountEqual(self, [row[0] for row in rows[1:]], ['spam2', 'spam3'])
+
+    def test_export_by_ids_and_criteria(self):
+        """Test that giving both ids and criteria exports only the ids matching."""
+        factory = self.create_dao_factory()
+        populate_database_with_data(factory.create_record_dao())
+        export(
+            factory=factory,
+            id_list=['spam3', 'spam', 'spam5', 'spam2'],
+            criteria={'spam_scal': DataRange(10.1, 400)},
+            scalar_names=['spam_scal'],
+            output_type='csv',
+            output_file=self.test_file_path.name)
+
+        with open(self.test_file_path.name, 'r') as csvfile:
+            rows = [row for row in csv.reader(csvfile)]
+            self.assertEqual([row[0] for row in rows[1:]], ['spam2', 'spam3'])
+
+    def test_export_no_ids_or_criteria(self):
+        """Test that export complains if it isn't told what to export."""
+        with self.assertRaises(ValueError) as context:
+            export(factory=self.create_dao_factory(),
+                   scalar_names=['spam_scal'],
+                   output_type='csv',
+                   output_file=self.test_file_path.name)
+        self.assertIn('Must provide an id_list, criteria, or both',
+                      str(context.exception))
+
+    def test_export_json(self):
+        """Test exporting to newline-delimited json."""
+        factory = self.create_dao_factory()
+        populate_database_with_data(factory.create_record_dao())
+        export(
+            factory=factory,
+            id_list=['spam3', 'spam', 'spam2'],
+            scalar_names=['spam_scal', 'val_data'],
+            output_type='json',
+            output_file=self.test_file_path.name,
+            chunk_size=2)
+
+        with open(self.test_file_path.name, 'r') as jsonfile:
+            rows = [json.loads(line) for line in jsonfile]
+        self.assertEqual(rows, [{'id': 'spam3', 'spam_scal': 10.5, 'val_data': 'chewy'},
+                                {'id': 'spam', 'spam_scal': 10, 'val_data': 'runny'},
+                                {'id': 'spam2', 'spam_scal': 10.99999, 'val_data': None}])
+
+    @unittest.skipUnless(NUMPY_PRESENT, "Exporting to npz requires numpy")
+    def test_export_npz(self):
+        """Test exporting to a NumPy npz archive."""
+        factory = self.create_dao_factory()
+        populate_database_with_data(factory.create_record_dao())
+        export(
+            factory=factory,
+            id_list=['spam3', 'spam', 'spam2'],
+            scalar_names=['spam_scal', 'spam_scal_2', 'val_data'],
+            output_type='npz',
+            output_file=self.test_file_path.name)
+
+        with np.load(self.test_file_path.name) as archive:
+            six.assertCountEqual(self, archive.files,
+                                 ['id', 'spam_scal', 'spam_scal_2', 'val_data'])
+            self.assertEqual(list(archive['id']), ['spam3', 'spam', 'spam2'])
+            self.assertEqual(list(archive['spam_scal']), [10.5, 10, 10.99999])
+            self.assertEqual(archive['spam_scal_2'].dtype, np.float64)
+            self.assertEqual(list(archive['spam_scal_2'][:2]), [10.5, 200])
+            self.assertTrue(np.isnan(archive['spam_scal_2'][2]))
+            self.assertEqual(list(archive['val_data']), ['chewy', 'runny', ''])
+
+    @unittest.skipUnless(NUMPY_PRESENT, "Exporting to npz requires numpy")
+    def test_export_npz_scalar_named_id(self):
+        """Test that npz export refuses a scalar that would overwrite the ids."""
+        factory = self.create_dao_factory()
+        populate_database_with_data(factory.create_record_dao())
+        with self.assertRaises(ValueError) as context:
+            export(
+                factory=factory,
+                id_list=['spam3', 'spam'],
+                scalar_names=['spam_scal', 'id'],
+                output_type='npz',
+                output_file=self.test_file_path.name)
+        self.assertIn('scalar named "id"', str(context.exception))
+
     def test__export_csv(self):
         """Test we can write out data to csv and ensures everything expected is present."""
         # Create temp data
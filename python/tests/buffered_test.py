@@ -0,0 +1,154 @@
+"""Tests for the write-behind BufferedRecordDAO."""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+# Disable pylint check due to its issue with virtual environments
+import sqlalchemy  # pylint: disable=import-error
+
+from sina.model import Record
+from sina.buffered import BufferedRecordDAO
+import sina.datastores.sql as sql
+import sina.datastores.memory as memory
+
+
+class CountingRecordDAO(object):
+    """Stands in for a RecordDAO, noting the batches written to it."""
+
+    def __init__(self, fail_on=None):
+        """
+        Start with no batches.
+
+        :param fail_on: If provided, an id whose batch fails to be written.
+        """
+        self.batches = []
+        self.fail_on = fail_on
+        self.lock = threading.Lock()
+
+    def insert_many(self, list_to_insert, **kwargs):
+        """Note a batch, failing if it holds fail_on."""
+        if self.fail_on in [record.id for record in list_to_insert]:
+            raise ValueError("Can't write {}".format(self.fail_on))
+        with self.lock:
+            self.batches.append(([record.id for record in list_to_insert], kwargs))
+
+    def get_all(self, ids_only=False):
+        """Return the ids of every Record written."""
+        return [id for ids, _ in self.batches for id in ids]
+
+
+class TestBufferedRecordDAO(unittest.TestCase):
+    """Tests for BufferedRecordDAO."""
+
+    def test_batches_by_size(self):
+        """Test that Records are written in batches no larger than batch_size."""
+        target = CountingRecordDAO()
+        with BufferedRecordDAO(target, batch_size=4, max_latency=10,
+                               insert_kwargs={"trusted": True}) as record_dao:
+            record_dao.insert_many([Record(id=str(i), type="step") for i in range(10)])
+        self.assertEqual(target.get_all(), [str(i) for i in range(10)])
+        self.assertTrue(all(len(ids) <= 4 for ids, _ in target.batches))
+        self.assertEqual(target.batches[0], (["0", "1", "2", "3"], {"trusted": True}))
+
+    def test_batches_by_latency(self):
+        """Test that a partial batch is written once max_latency passes."""
+        target = CountingRecordDAO()
+        written = threading.Event()
+        original = target.insert_many
+
+        def insert_many(list_to_insert, **kwargs):
+            """Signal that a batch was written."""
+            original(list_to_insert, **kwargs)
+            written.set()
+
+        target.insert_many = insert_many
+        record_dao = BufferedRecordDAO(target, batch_size=100, max_latency=0.05)
+        record_dao.insert(Record(id="spam", type="step"))
+        self.assertTrue(written.wait(5))
+        self.assertEqual(target.batches, [(["spam"], {})])
+        record_dao.close()
+
+    def test_flush_and_reads(self):
+        """Test that flush() and reads wait for every Record inserted before them."""
+        factory = memory.DAOFactory()
+        record_dao = BufferedRecordDAO(factory.create_record_dao(), max_latency=10)
+        record_dao.insert(Record(id="spam", type="step"))
+        self.assertEqual(record_dao.get("spam").type, "step")
+        record_dao.insert(Record(id="eggs", type="step"))
+        record_dao.flush()
+        self.assertEqual(record_dao.pending, 0)
+        self.assertEqual(sorted(factory.create_record_dao().get_all(ids_only=True)),
+                         ["eggs", "spam"])
+        record_dao.close()
+        record_dao.close()
+        with self.assertRaises(ValueError):
+            record_dao.insert(Record(id="ham", type="step"))
+
+    def test_many_producers(self):
+        """Test that Records from many threads all reach a pooled SQL database."""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            factory = sql.DAOFactory(os.path.join(temp_dir, "buffered.sqlite"), pooled=True)
+            record_dao = BufferedRecordDAO(factory.create_record_dao(), batch_size=16,
+                                           max_queued=8)
+
+            def produce(rank):
+                """Insert a Record per timestep."""
+                for step in range(25):
+                    record_dao.insert(Record(id="{}_{}".format(rank, step), type="step",
+                                             data={"step": {"value": step}}))
+
+            producers = [threading.Thread(target=produce, args=(rank,)) for rank in range(4)]
+            for producer in producers:
+                producer.start()
+            for producer in producers:
+                producer.join()
+            record_dao.close()
+            self.assertEqual(len(list(factory.create_record_dao().get_all(ids_only=True))),
+                             100)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_errors(self):
+        """Test that failed batches go to error_callback, or are raised later."""
+        failures = []
+        with BufferedRecordDAO(CountingRecordDAO(fail_on="eggs"), batch_size=1,
+                               error_callback=lambda batch, error: failures.append(
+                                   ([record.id for record in batch], str(error)))) as record_dao:
+            record_dao.insert_many([Record(id=id, type="step") for id in ("spam", "eggs", "ham")])
+        self.assertEqual(failures, [(["eggs"], "Can't write eggs")])
+        self.assertEqual(record_dao.record_dao.get_all(), ["spam", "ham"])
+        record_dao = BufferedRecordDAO(CountingRecordDAO(fail_on="eggs"), batch_size=1)
+        record_dao.insert(Record(id="eggs", type="step"))
+        with self.assertRaises(ValueError):
+            record_dao.flush()
+        record_dao.insert(Record(id="spam", type="step"))
+        record_dao.close()
+        with self.assertRaises(ValueError):
+            BufferedRecordDAO(CountingRecordDAO(), batch_size=0)
+
+    def test_errors_sql(self):
+        """Test that a failed batch doesn't stop a SQL database taking later ones."""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            factory = sql.DAOFactory(os.path.join(temp_dir, "buffered.sqlite"), pooled=True)
+            failures = []
+            with BufferedRecordDAO(factory.create_record_dao(), batch_size=1,
+                                   error_callback=lambda batch, error: failures.append(
+                                       [record.id for record in batch])) as record_dao:
+                record_dao.insert_many([Record(id=id, type="step")
+                                        for id in ("a", "a", "b", "c")])
+            self.assertEqual(failures, [["a"]])
+            self.assertEqual(sorted(factory.create_record_dao().get_all(ids_only=True)),
+                             ["a", "b", "c"])
+            record_dao = BufferedRecordDAO(factory.create_record_dao(), batch_size=1)
+            record_dao.insert(Record(id="a", type="step"))
+            with self.assertRaises(sqlalchemy.exc.IntegrityError):
+                record_dao.flush()
+            record_dao.insert(Record(id="d", type="step"))
+            record_dao.close()
+            self.assertEqual(record_dao.get("d").type, "step")
+        finally:
+            shutil.rmtree(temp_dir)
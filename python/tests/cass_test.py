@@ -22,6 +22,8 @@ except ImportError:
     pass
 
 import tests.backend_test
+from sina.model import Record, Relationship
+from sina.utils import DataRange, has_all, has_any
 
 # Cassandra's logger is natively Debug, and it's very verbose,
 # even at WARNING.
@@ -131,6 +133,38 @@ class TestModify(CassandraMixin, tests.backend_test.TestModify):
         """Tear down the keyspace so we can start fresh."""
         self.teardown_cass_keyspace()
 
+    @patch('sina.datastores.cass.PURGE_BATCH_SIZE', 2)
+    @patch('sina.datastores.cass.PURGE_CHUNK_SIZE', 2)
+    def test_recorddao_purge(self):
+        """Test that purging Records removes them from every table and reports progress."""
+        factory = self.create_dao_factory()
+        record_dao = factory.create_record_dao()
+        relationship_dao = factory.create_relationship_dao()
+        record_dao.insert_many([Record(id="rec_{}".format(x), type="sample",
+                                       data={"eggs": {"value": x % 2},
+                                             "flavor": {"value": "tasty"},
+                                             "scores": {"value": [x, x, 10]},
+                                             "toppings": {"value": ["spam", "ham"]}},
+                                       files=[{"uri": "rec_{}.png".format(x)}])
+                                for x in range(5)])
+        relationship_dao.insert_many([Relationship(subject_id="rec_{}".format(x),
+                                                   predicate="precedes",
+                                                   object_id="rec_{}".format(x + 1))
+                                      for x in range(4)])
+        progress = []
+        purged = record_dao.purge(["rec_{}".format(x) for x in range(4)],
+                                  progress_callback=lambda *args: progress.append(args))
+        self.assertEqual(purged, 4)
+        self.assertEqual(progress, [(2, 4), (4, 4)])
+        self.assertEqual(list(record_dao.get_all_of_type("sample", ids_only=True)),
+                         ["rec_4"])
+        self.assertEqual(list(record_dao.data_query(flavor="tasty")), ["rec_4"])
+        self.assertEqual(list(record_dao.data_query(eggs=DataRange(0, 2))), ["rec_4"])
+        self.assertEqual(list(record_dao.data_query(scores=has_all(10))), ["rec_4"])
+        self.assertEqual(list(record_dao.data_query(toppings=has_any("ham"))), ["rec_4"])
+        self.assertEqual(relationship_dao.count(), 0)
+        self.assertEqual(record_dao.get_files("rec_0"), [])
+
 
 @attr('cassandra')
 class TestQuery(CassandraMixin, tests.backend_test.TestQuery):
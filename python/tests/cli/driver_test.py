@@ -3,7 +3,9 @@ import unittest
 import os
 import sys
 import json
+import shutil
 import argparse
+import tempfile
 
 from six.moves import cStringIO as StringIO
 
@@ -25,6 +27,8 @@ except ImportError:
     pass
 
 TEMP_DB_NAME = "temp_sqlite_testfile.sqlite"
+# What a mocked import reports having done
+INGEST_SUMMARY = {"inserted": 3, "updated": 1, "skipped": 2}
 
 # Accessing "private" methods is necessary for testing them.
 # pylint: disable=protected-access
@@ -39,7 +43,9 @@ class TestCLI(unittest.TestCase):
         # We need to provide initial minimal args, but will change per test
         self.args = self.parser.parse_args(['ingest', '-d', 'null.sqlite',
                                             'null.json'])
-        self.created_db = "fake.sqlite"
+        # Some tests build real factories, which create their database
+        self.temp_dir = tempfile.mkdtemp()
+        self.created_db = os.path.join(self.temp_dir, "fake.sqlite")
         self.temp_parser = argparse.ArgumentParser(prog='sina_tester',
                                                    description='A software package to process '
                                                    'data stored in the sina_model format.',
@@ -48,21 +54,43 @@ class TestCLI(unittest.TestCase):
             title='subcommands', help='Available sub-commands.', dest='subparser_name')
         self.temp_subparser = self.subparsers.add_parser('eat', help='eat some food.')
 
-    @patch('sina.cli.driver.import_json', return_value=True)
+    def tearDown(self):
+        """Remove any database a test created."""
+        shutil.rmtree(self.temp_dir)
+
+    @patch('sina.cli.driver.import_json', return_value=INGEST_SUMMARY)
     def test_ingest_json_sql(self, mock_import):
         """Verify CLI fetches and feeds json to the importer (sql)."""
         self.args.source = "fake.json"
         self.args.database_type = 'sql'
         self.args.database = self.created_db
-        driver.ingest(self.args)
+        try:
+            # Grab stdout and send to string io
+            sys.stdout = StringIO()
+            driver.ingest(self.args)
+            std_output = sys.stdout.getvalue().strip()
+        finally:
+            # Reset stdout
+            sys.stdout = sys.__stdout__
+        self.assertEqual(std_output, "Records inserted: 3, updated: 1, "
+                                     "skipped as unchanged: 2")
         mock_import.assert_called_once()
         mock_args = mock_import.call_args[1]  # Named args
         self.assertIsInstance(mock_args['factory'], sina_sql.DAOFactory)
         self.assertEqual(mock_args['factory'].db_path, self.created_db)
+        self.assertIsNone(mock_args['factory'].raw_compression)
         self.assertEqual(mock_args['json_path'], self.args.source)
+        self.assertFalse(mock_args['trusted'])
+        self.assertFalse(mock_args['validate'])
+        flagged_args = self.parser.parse_args(['ingest', '-d', self.created_db,
+                                               '--trusted', '--validate',
+                                               '--compress-raw', 'zlib', 'fake.json'])
+        self.assertTrue(flagged_args.trusted)
+        self.assertTrue(flagged_args.validate)
+        self.assertEqual(flagged_args.raw_compression, 'zlib')
 
     @attr('cassandra')
-    @patch('sina.cli.driver.import_json', return_value=True)
+    @patch('sina.cli.driver.import_json', return_value=INGEST_SUMMARY)
     @patch('sina.datastores.cass.schema.form_connection', return_value=True)
     def test_ingest_json_cass(self, mock_connect, mock_import):
         """Verify CLI fetches and feeds json to the importer (cass)."""
@@ -78,6 +106,8 @@ class TestCLI(unittest.TestCase):
         self.assertEqual(mock_args['factory'].keyspace,
                          self.args.cass_keyspace)
         self.assertEqual(mock_args['json_path'], self.args.source)
+        self.assertFalse(mock_args['trusted'])
+        self.assertFalse(mock_args['validate'])
         self.args.cass_keyspace = None
         # Ingesting without keyspace shouldn't result in another call
         with self.assertRaises(ValueError) as context:
@@ -85,6 +115,71 @@ class TestCLI(unittest.TestCase):
         self.assertIn("not provided. In the future", str(context.exception))
         mock_import.assert_called_once()
 
+    @patch('sina.cli.driver.utils.export')
+    def test_export_criteria(self, mock_export):
+        """Verify CLI can export records matching criteria rather than ids."""
+        args = self.parser.parse_args(['export', '-d', self.created_db,
+                                       '--scalars', 'spam,eggs',
+                                       '--criteria', 'spam=[1,2]',
+                                       '--export-type', 'json'])
+        driver.export(args)
+        mock_export.assert_called_once()
+        mock_args = mock_export.call_args[1]  # Named args
+        self.assertIsNone(mock_args['id_list'])
+        self.assertEqual(mock_args['criteria'], {'spam': DataRange(1, 2, max_inclusive=True)})
+        self.assertEqual(mock_args['scalar_names'], ['spam', 'eggs'])
+        self.assertEqual(mock_args['output_type'], 'json')
+
+    @patch('sina.datastores.sql.RecordDAO.compress_raws', return_value=4)
+    def test_compress_sql(self, mock_compress):
+        """Verify CLI compresses (and decompresses) the raws of a database."""
+        for method, compression in (([], 'zlib'), (['--method', 'none'], None)):
+            args = self.parser.parse_args(['compress', '-d', self.created_db] + method)
+            try:
+                sys.stdout = StringIO()
+                driver.compress(args)
+                std_output = sys.stdout.getvalue().strip()
+            finally:
+                sys.stdout = sys.__stdout__
+            self.assertEqual(std_output, "Records rewritten: 4")
+            self.assertEqual(mock_compress.call_args[1]['compression'], compression)
+        with self.assertRaises(ValueError):
+            driver.compress(self.parser.parse_args(['compress', '-d', 'spam']))
+
+    @patch('sina.datastores.sql.DAOFactory.optimize', return_value={
+        "seconds": {"statistics": 0.5, "analyze": 0.25}, "size_before": 8192,
+        "size_after": 4096, "tables": {"Record": {"rows": 2, "bytes": 4096},
+                                       "Run": {"rows": 0, "bytes": None}}})
+    def test_maintain_sql(self, mock_optimize):
+        """Verify CLI optimizes a database and reports on it."""
+        args = self.parser.parse_args(['maintain', '-d', self.created_db,
+                                       '--vacuum', 'incremental'])
+        try:
+            sys.stdout = StringIO()
+            driver.maintain(args)
+            std_output = sys.stdout.getvalue().strip()
+        finally:
+            sys.stdout = sys.__stdout__
+        self.assertEqual(std_output.splitlines(),
+                         ["Time spent (seconds): analyze=0.250, statistics=0.500",
+                          "Database size: 8192 -> 4096 bytes",
+                          "Tables:",
+                          "  Record: 2 rows, 4096 bytes",
+                          "  Run: 0 rows, size unknown"])
+        self.assertEqual(mock_optimize.call_args[1]['vacuum'], 'incremental')
+        self.assertIsNone(self.parser.parse_args(['maintain', '-d', self.created_db]).vacuum)
+        with self.assertRaises(ValueError):
+            driver.maintain(self.parser.parse_args(['maintain', '-d', 'spam']))
+
+    def test_export_requires_ids_or_criteria(self):
+        """Verify CLI export complains if given neither ids nor criteria."""
+        args = self.parser.parse_args(['export', '-d', self.created_db,
+                                       '--scalars', 'spam'])
+        with self.assertRaises(ValueError) as context:
+            driver.export(args)
+        self.assertIn('Require one or more record ids or criteria to export.',
+                      str(context.exception))
+
     def test_ingest_local_ids(self):
         """Verify importer is correctly substituting local IDs for globals."""
         test_json = os.path.join(os.path.dirname(os.path.realpath(__file__)),
@@ -153,7 +248,7 @@ class TestCLI(unittest.TestCase):
         self.args.raw = ""
         self.args.uri = ""
         self.args.id = False
-        self.args.database = 'fake.sqlite'
+        self.args.database = self.created_db
         self.args.scalar = 'somescalar=[1,2]'
         driver.query(self.args)
         # As long as this is called, we know we correctly used sql
@@ -237,7 +332,7 @@ class TestCLI(unittest.TestCase):
     @attr('cli_tools')
     def test_compare_records_good(self, mock_model_print, mock_get):
         """Verify compare subcommand prints the correct output."""
-        self.args.database = "fake.sqlite"
+        self.args.database = self.created_db
         self.args.id_one = "some_id"
         self.args.id_two = "another_id"
         driver.compare_records(self.args)
@@ -251,7 +346,7 @@ class TestCLI(unittest.TestCase):
     @attr('cli_tools')
     def test_compare_records_bad(self, mock_model_print, mock_get):
         """Verify compare subcommand prints useful error if given a bad id."""
-        self.args.database = "fake.sqlite"
+        self.args.database = self.created_db
         self.args.id_one = "bad_id"
         self.args.id_two = "another_id"
         error_msg = 'Could not find record with id <{}>. Check id and '\
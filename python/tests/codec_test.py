@@ -0,0 +1,217 @@
+"""Tests for the pluggable JSON codec."""
+import io
+import json
+import math
+import unittest
+
+import sina.codec as codec
+import sina.datastores.sql as sql
+from sina.model import Record
+
+# Disable pylint invalid-name due to significant number of tests with names
+# exceeding the 30 character limit
+# pylint: disable=invalid-name
+
+INSTALLED_CODECS = [name for name, present in (('orjson', codec.ORJSON_PRESENT),
+                                               ('ujson', codec.UJSON_PRESENT),
+                                               ('json', True)) if present]
+
+RAW = {"id": "spam", "type": "food",
+       "data": {"weight": {"value": 2.5, "units": "kg", "tags": ["input"]},
+                "origin": {"value": u"caf\u00e9/kitchen"},
+                "scores": {"value": [1, 2, 3]}}}
+
+
+class TestCodec(unittest.TestCase):
+    """Tests that every installed codec behaves the same."""
+
+    def setUp(self):
+        """Remember which codec was in use."""
+        self.original = codec.codec_name()
+
+    def tearDown(self):
+        """Restore the codec in use."""
+        codec.use_codec(self.original)
+
+    def test_round_trip(self):
+        """Test that everything written can be read back, by any codec."""
+        for writer in INSTALLED_CODECS:
+            codec.use_codec(writer)
+            as_str = codec.dumps(RAW)
+            as_bytes = codec.dumps_bytes(RAW)
+            canonical = codec.canonical_dumps(RAW)
+            self.assertIsInstance(as_bytes, bytes)
+            self.assertEqual(codec.canonical_dumps_bytes(RAW), canonical.encode('utf-8'))
+            for reader in INSTALLED_CODECS:
+                codec.use_codec(reader)
+                for serialized in (as_str, as_bytes, canonical):
+                    self.assertEqual(codec.loads(serialized), RAW, (writer, reader))
+                self.assertEqual(codec.load(io.BytesIO(as_bytes)), RAW)
+
+    def test_canonical(self):
+        """Test that canonical JSON is compact and independent of key order."""
+        reordered = {"type": "food", "id": "spam", "data": RAW["data"]}
+        for name in INSTALLED_CODECS:
+            codec.use_codec(name)
+            canonical = codec.canonical_dumps(RAW)
+            self.assertEqual(canonical, codec.canonical_dumps(reordered))
+            self.assertTrue(canonical.startswith('{"data":{"origin":'))
+            self.assertNotIn(' ', canonical)
+            record = Record("spam", "food", data=RAW["data"])
+            self.assertEqual(record.content_hash(),
+                             record.content_hash(codec.canonical_dumps(record.raw)))
+
+    def test_content_hash_independent_of_codec(self):
+        """Test that a Record's content hash is the same under every codec."""
+        record = Record("spam", "food", data={"weight": {"value": 0.1 + 0.2},
+                                              "label": {"value": u"\u00e9pinard/jambon"}})
+        hashes = set()
+        for name in INSTALLED_CODECS:
+            codec.use_codec(name)
+            _, _, raw_json = record.validate_and_serialize()
+            hashes.update((record.content_hash(), record.content_hash(raw_json)))
+        self.assertEqual(len(hashes), 1)
+
+    def test_non_finite_stored(self):
+        """Test that NaN and infinities in stored raws survive every codec."""
+        for name in INSTALLED_CODECS:
+            codec.use_codec(name)
+            for value in (float('inf'), float('-inf')):
+                self.assertEqual(codec.loads(codec.dumps([value, None])), [value, None])
+                self.assertEqual(codec.loads(codec.canonical_dumps_bytes({"x": value})),
+                                 {"x": value})
+            self.assertTrue(math.isnan(codec.loads(codec.dumps_bytes([float('nan')]))[0]))
+            record_dao = sql.DAOFactory().create_record_dao()
+            record_dao.insert(Record("spam", "food",
+                                     user_defined={"limits": [float('-inf'), float('inf')]}))
+            self.assertEqual(record_dao.get("spam").user_defined["limits"],
+                             [float('-inf'), float('inf')], name)
+
+    def test_beyond_standard_json(self):
+        """Test that what only some libraries support is handled by all codecs."""
+        for name in INSTALLED_CODECS:
+            codec.use_codec(name)
+            self.assertEqual(codec.loads(codec.dumps({1: 2 ** 70})), {"1": 2 ** 70})
+            self.assertEqual(codec.loads('[Infinity]'), [float('inf')])
+            circular = []
+            circular.append(circular)
+            with self.assertRaises(ValueError):
+                codec.canonical_dumps(circular)
+            with self.assertRaises(TypeError):
+                codec.dumps({"value": object()})
+            with self.assertRaises(ValueError):
+                codec.loads(b'{"unfinished":')
+
+    def test_use_codec(self):
+        """Test choosing codecs by name."""
+        self.assertEqual(codec.use_codec(), INSTALLED_CODECS[0])
+        self.assertEqual(codec.use_codec("json"), "json")
+        self.assertEqual(codec.codec_name(), "json")
+        with self.assertRaises(ValueError) as context:
+            codec.use_codec("yaml")
+        self.assertIn("Supported codecs are: orjson, ujson, json", str(context.exception))
+        for name in set(codec.CODECS) - set(INSTALLED_CODECS):
+            with self.assertRaises(ImportError):
+                codec.use_codec(name)
+
+
+# Objects the codecs must agree on, each alongside the same contents with
+# keys in a different order
+PARITY_CASES = [(RAW, {"type": "food", "data": RAW["data"], "id": "spam"}),
+                ({"b": float('nan'), "a": [float('inf'), float('-inf'), None]},
+                 {"a": [float('inf'), float('-inf'), None], "b": float('nan')}),
+                ({"z": {"y": 0.1 + 0.2, "x": u"\u00e9\u4e2d"}, "w": [{"v": 1, "u": 1e300}]},
+                 {"w": [{"u": 1e300, "v": 1}], "z": {"x": u"\u00e9\u4e2d", "y": 0.1 + 0.2}}),
+                ({"big": 2 ** 70, "nested": {"inf": float('inf'), "ok": True}},
+                 {"nested": {"ok": True, "inf": float('inf')}, "big": 2 ** 70})]
+
+
+def _key_order(serialized):
+    """Get the keys of every object in some JSON, in the order they appear."""
+    keys = []
+
+    def gather(pairs):
+        """Note an object's keys, in order."""
+        keys.extend(key for key, _ in pairs)
+        return dict(pairs)
+    json.loads(serialized, object_pairs_hook=gather)
+    return keys
+
+
+@unittest.skipIf(len(INSTALLED_CODECS) < 2, "Needs a codec besides the standard library's")
+class TestCodecParity(unittest.TestCase):
+    """Tests that the faster codecs give the same results as the standard library."""
+
+    def setUp(self):
+        """Remember which codec was in use."""
+        self.original = codec.codec_name()
+
+    def tearDown(self):
+        """Restore the codec in use."""
+        codec.use_codec(self.original)
+
+    def results(self, name, obj):
+        """Get what a codec makes of an object, in a form comparable across codecs."""
+        codec.use_codec(name)
+        canonical = codec.canonical_dumps_bytes(obj)
+        # Read back through the standard library, so NaN compares equal
+        return {"stable": codec.stable_dumps_bytes(obj),
+                "round_trip": codec.stable_dumps_bytes(codec.loads(codec.dumps_bytes(obj))),
+                "canonical": codec.stable_dumps_bytes(json.loads(canonical.decode('utf-8'))),
+                "canonical_keys": _key_order(canonical.decode('utf-8')),
+                "hash": Record("spam", "food", data={"value": {"value": obj}}).content_hash()}
+
+    def test_parity(self):
+        """Test that every codec agrees with the standard library, whatever the key order."""
+        for obj, reordered in PARITY_CASES:
+            expected = self.results('json', obj)
+            self.assertEqual(expected, self.results('json', reordered))
+            for name in INSTALLED_CODECS:
+                self.assertEqual(self.results(name, obj), expected, name)
+                self.assertEqual(self.results(name, reordered), expected, name)
+
+    def test_stable_dumps_bytes(self):
+        """Test that stable JSON is the standard library's, byte for byte, under every codec."""
+        for obj, reordered in PARITY_CASES:
+            expected = json.dumps(obj, sort_keys=True, separators=(',', ':')).encode('ascii')
+            for name in INSTALLED_CODECS:
+                codec.use_codec(name)
+                self.assertEqual(codec.stable_dumps_bytes(obj), expected, name)
+                self.assertEqual(codec.stable_dumps_bytes(reordered), expected, name)
+
+
+class TestRawCompression(unittest.TestCase):
+    """Tests for compressing stored raws."""
+
+    def setUp(self):
+        """Serialize a raw to compress."""
+        self.raw_json = codec.canonical_dumps(RAW)
+
+    def test_round_trip(self):
+        """Test that raws read back the same however they're stored."""
+        for compression in [None, 'zlib'] + (['lz4'] if codec.LZ4_PRESENT else []):
+            for as_text in (False, True):
+                stored = codec.encode_raw(self.raw_json, compression, as_text=as_text)
+                if compression is None:
+                    self.assertIs(stored, self.raw_json)
+                elif as_text:
+                    self.assertNotIsInstance(stored, bytes)
+                else:
+                    self.assertTrue(stored.startswith(codec.COMPRESSED_RAW_MARKER))
+                self.assertEqual(codec.raw_compression(stored), compression)
+                self.assertEqual(codec.raw_json(stored), self.raw_json)
+                self.assertEqual(codec.decode_raw(stored), RAW)
+        self.assertEqual(codec.decode_raw(memoryview(codec.encode_raw(self.raw_json, 'zlib'))),
+                         RAW)
+        self.assertEqual(codec.decode_raw(self.raw_json.encode('utf-8')), RAW)
+
+    def test_unsupported(self):
+        """Test that unknown compressions are rejected, on write and read."""
+        with self.assertRaises(ValueError) as context:
+            codec.encode_raw(self.raw_json, 'bzip')
+        self.assertIn('Supported compressions are: zlib, lz4', str(context.exception))
+        with self.assertRaises(ValueError):
+            codec.decode_raw(codec.COMPRESSED_RAW_MARKER + b'?' + b'garbage')
+        if not codec.LZ4_PRESENT:
+            with self.assertRaises(ImportError):
+                codec.check_raw_compression('lz4')
@@ -0,0 +1,207 @@
+#!/bin/python
+"""Runs the tests contained in backend_test.py on the in-memory backend."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import tests.backend_test
+from sina.model import Record, Relationship, Run
+from sina.utils import DataRange, has_any
+import sina.datastores.sql as sql
+import sina.datastores.memory as backend
+
+
+# Disable pylint no-init check just on the Mixin class, since it has no use
+# for an __init__ and there is no expectation of adding more public methods.
+class MemoryMixin(object):  # pylint: disable=no-init,too-few-public-methods
+    """Contains the methods shared between all test classes."""
+
+    __test__ = False
+    # Ensure the selected backend is passed to child tests.
+    backend = backend
+
+    # This has to be a classmethod because it's called before instantiation
+    # (See TestQuery)
+    @classmethod
+    def create_dao_factory(cls, test_db_dest=None):  # pylint: disable=unused-argument
+        """
+        Create a DAO for the in-memory backend.
+
+        :param test_db_dest: Ignored; every factory holds its own contents.
+        """
+        return backend.DAOFactory()
+
+
+class TestSetup(MemoryMixin, tests.backend_test.TestSetup):
+    """
+    Provides methods needed for setup-type tests on the in-memory backend.
+
+    Also runs any setup-type tests that are unique to it.
+    """
+
+    __test__ = True
+
+    def setUp(self):
+        """Define a path no test should create."""
+        self.test_db_dest = os.path.join(tempfile.gettempdir(), 'sina_memory_never_written')
+
+    def test_factory_raw_compression(self):
+        """Test that a factory can hold its raws compressed."""
+        factory = backend.DAOFactory(raw_compression="zlib")
+        record = Record(id="spam", type="eggs", data={"yolks": {"value": 2}})
+        factory.create_record_dao().insert(record)
+        self.assertEqual(factory.create_record_dao().get("spam").raw, record.raw)
+        self.assertEqual(factory.create_record_dao().compress_raws("zlib"), 0)
+        with self.assertRaises(ValueError):
+            backend.DAOFactory(raw_compression="bzip")
+        self.assertEqual(repr(factory), "Memory DAOFactory <records=1>")
+
+
+class TestModify(MemoryMixin, tests.backend_test.TestModify):
+    """
+    Provides methods needed for modify-type tests on the in-memory backend.
+
+    Also runs any modify-type tests that are unique to it.
+    """
+
+    __test__ = True
+
+    def setUp(self):
+        """Define a few shared variables."""
+        self.test_db_dest = None
+
+    def test_recorddao_insert_conflicts(self):
+        """Test that inserting an id already held fails without inserting anything."""
+        record_dao = self.create_dao_factory().create_record_dao()
+        record_dao.insert(Record(id="spam", type="eggs", data={"yolks": {"value": 2}}))
+        with self.assertRaises(ValueError):
+            record_dao.insert_many([Record(id="ham", type="eggs"),
+                                    Record(id="spam", type="eggs")])
+        with self.assertRaises(ValueError):
+            record_dao.insert_many([Record(id="ham", type="eggs"),
+                                    Record(id="ham", type="eggs")])
+        self.assertEqual(list(record_dao.get_all(ids_only=True)), ["spam"])
+        record_dao.insert(Record(id="spam", type="toast", data={"yolks": {"value": 3}}),
+                          force_overwrite=True)
+        self.assertEqual(list(record_dao.get_all_of_type("toast", ids_only=True)), ["spam"])
+        self.assertEqual(list(record_dao.data_query(yolks=DataRange(0, 10))), ["spam"])
+        self.assertFalse(list(record_dao.get_all_of_type("eggs")))
+        with self.assertRaises(ValueError):
+            record_dao.get("ham")
+
+    def test_recorddao_returns_copies(self):
+        """Test that changing inserted or returned Records doesn't change those held."""
+        record_dao = self.create_dao_factory().create_record_dao()
+        record = Record(id="spam", type="eggs", data={"flags": {"value": ["fried"]}},
+                        files=[{"uri": "spam.png", "tags": ["photo"]}])
+        record_dao.insert(record)
+        record.data["flags"]["value"].append("runny")
+        returned = record_dao.get("spam", data_fields=["flags"], include_files=True)
+        returned.data["flags"]["value"].append("scrambled")
+        returned.files[0]["tags"].append("blurry")
+        self.assertEqual(record_dao.get("spam").data["flags"]["value"], ["fried"])
+        self.assertEqual(list(record_dao.data_query(flags=has_any("runny", "scrambled"))), [])
+        self.assertEqual(record_dao.get_files("spam")[0]["tags"], ["photo"])
+
+
+class TestQuery(MemoryMixin, tests.backend_test.TestQuery):
+    """
+    Provides methods needed for query-type tests on the in-memory backend.
+
+    Also runs any query-type tests that are unique to it.
+    """
+
+    __test__ = True
+
+    @classmethod
+    def setUpClass(cls):
+        """Create the factory and populate it."""
+        tests.backend_test.create_daos(cls)
+        tests.backend_test.populate_database_with_data(cls.record_dao)
+
+    def test_matches_sql(self):
+        """Test that queries agree with the SQL backend's, statistics included."""
+        sql_dao = sql.DAOFactory().create_record_dao()
+        tests.backend_test.populate_database_with_data(sql_dao)
+        for criteria in ({"spam_scal": DataRange(10, 10.5)},
+                         {"spam_scal": DataRange(min=10, min_inclusive=False)},
+                         {"val_data": DataRange("a", "z", max_inclusive=True)},
+                         {"val_data_list_2": has_any("eggs", DataRange("s", "z"))}):
+            self.assertEqual(list(self.record_dao.data_query(**criteria)),
+                             sorted(sql_dao.data_query(**criteria)), criteria)
+        for uri in ("beep.wav", "beep%", "%.%", "%png"):
+            self.assertEqual(list(self.record_dao.get_given_document_uri(uri, ids_only=True)),
+                             sorted(sql_dao.get_given_document_uri(uri, ids_only=True)), uri)
+        memory_stats = self.record_dao.analyze()
+        sql_stats = sql_dao.analyze()
+        for kind, name in (("scalar", "spam_scal"), ("stringlist", "val_data_list_2")):
+            expected = sql_stats.get(kind, name)
+            found = memory_stats.get(kind, name)
+            self.assertEqual((found.count, found.min, found.max, found.distinct,
+                              found.entries, found.histogram),
+                             (expected.count, expected.min, expected.max, expected.distinct,
+                              expected.entries, expected.histogram))
+
+
+class TestSaveLoad(MemoryMixin, unittest.TestCase):
+    """Tests for moving contents between memory and files or other backends."""
+
+    __test__ = True
+
+    def setUp(self):
+        """Fill a factory with Records, a Run, and Relationships."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.factory = self.create_dao_factory()
+        self.factory.create_record_dao().insert_many([
+            Record(id="spam", type="food",
+                   data={"weight": {"value": 2.5, "units": "kg"},
+                         "flags": {"value": ["canned", "pink"]}},
+                   files=[{"uri": "spam.png", "mimetype": "image/png"}]),
+            Record(id="eggs", type="food", data={"yolks": {"value": 2}}),
+            Record(id="ham", type="food", user_defined={"smoked": True})])
+        self.factory.create_run_dao().insert(Run(id="toast", application="breakfast",
+                                                 data={"slices": {"value": 2}}))
+        self.factory.create_relationship_dao().insert_many([
+            Relationship(subject_id="spam", object_id="eggs", predicate="precedes"),
+            Relationship(subject_id="toast", object_id="spam", predicate="supports")])
+
+    def tearDown(self):
+        """Remove any files written."""
+        shutil.rmtree(self.temp_dir)
+
+    def assert_same_contents(self, factory):
+        """Assert that another factory holds just what self.factory does."""
+        expected_dao = self.factory.create_record_dao()
+        record_dao = factory.create_record_dao()
+        ids = list(expected_dao.get_all(ids_only=True))
+        self.assertEqual(sorted(record_dao.get_all(ids_only=True)), ids)
+        self.assertEqual(record_dao.get_content_hashes(ids),
+                         expected_dao.get_content_hashes(ids))
+        self.assertEqual(factory.create_run_dao().get("toast").application, "breakfast")
+        self.assertEqual(sorted(str(rel) for rel in factory.create_relationship_dao().get_all()),
+                         sorted(str(rel) for rel
+                                in self.factory.create_relationship_dao().get_all()))
+
+    def test_json_round_trip(self):
+        """Test saving to and loading from a Mnoda JSON file."""
+        json_path = os.path.join(self.temp_dir, "saved.json")
+        self.factory.save_json(json_path)
+        loaded = backend.DAOFactory()
+        self.assertEqual(loaded.load_json(json_path, validate=True)["inserted"], 4)
+        self.assert_same_contents(loaded)
+        self.assertEqual(loaded.load_json(json_path)["skipped"], 4)
+
+    def test_sql_round_trip(self):
+        """Test saving to and loading from a SQL database."""
+        sql_factory = sql.DAOFactory(os.path.join(self.temp_dir, "saved.sqlite"))
+        self.assertEqual(self.factory.save_to(sql_factory)["inserted"], 4)
+        self.assertEqual(sql_factory.create_run_dao().get("toast").application, "breakfast")
+        self.factory.create_record_dao().replace_many([Record(id="eggs", type="omelette")])
+        self.assertEqual(self.factory.save_to(sql_factory),
+                         {"inserted": 0, "updated": 1, "skipped": 3})
+        loaded = backend.DAOFactory()
+        self.assertEqual(loaded.load_from(sql_factory)["inserted"], 4)
+        self.assert_same_contents(loaded)
+        self.assertEqual(loaded.create_record_dao().get("eggs").type, "omelette")
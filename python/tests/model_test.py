@@ -74,6 +74,26 @@ class TestModel(unittest.TestCase):
         # all previous errors fixed: "maximal" valid run
         self.assertTrue(spam.is_valid()[0])
 
+    def test_validate_and_serialize(self):
+        """Ensure validation returns the canonical JSON of valid Records only."""
+        is_valid, warnings, raw_json = self.record_one.validate_and_serialize()
+        self.assertTrue(is_valid)
+        self.assertEqual(warnings, [])
+        self.assertEqual(json.loads(raw_json), self.record_one.raw)
+        self.assertEqual(raw_json, json.dumps(self.record_one.raw, sort_keys=True,
+                                              separators=(',', ':')))
+        self.assertEqual(self.record_one.content_hash(raw_json),
+                         self.record_one.content_hash())
+        is_valid, _, raw_json = self.record_two.validate_and_serialize()
+        self.assertFalse(is_valid)
+        self.assertIsNone(raw_json)
+        # Trusted Records' data isn't checked, but they must still be valid JSON
+        self.assertTrue(self.record_two.validate_and_serialize(trusted=True)[0])
+        self.record_two["unserializable"] = {"set"}
+        is_valid, warnings, raw_json = self.record_two.validate_and_serialize(trusted=True)
+        self.assertFalse(is_valid)
+        self.assertIn("invalid JSON", warnings[0])
+
     def test__is_valid_list_good(self):
         """Test we report a list as valid when it is."""
         self.assertTrue(model._is_valid_list(
@@ -115,6 +135,19 @@ class TestModel(unittest.TestCase):
         del rec["eggs"]
         self.assertTrue('eggs' not in rec.__dict__["raw"])
 
+    def test_content_hash(self):
+        """Ensure a Record's content hash depends on its contents but not their order."""
+        original = model.generate_record_from_json(
+            {"id": "hello", "type": "greeting",
+             "data": {"language": {"value": "english"}, "mood": {"value": "friendly"}}})
+        reordered = model.generate_record_from_json(
+            {"type": "greeting", "id": "hello",
+             "data": {"mood": {"value": "friendly"}, "language": {"value": "english"}}})
+        self.assertEqual(original.content_hash(), reordered.content_hash())
+        self.assertEqual(len(original.content_hash()), 64)
+        reordered.data["mood"]["value"] = "grumpy"
+        self.assertNotEqual(original.content_hash(), reordered.content_hash())
+
     def test_generate_json(self):
         """Ensure JSON is generating properly."""
         target_json = ('{"id":"hello", "type":"greeting", '
@@ -257,3 +290,20 @@ class TestModel(unittest.TestCase):
             model.convert_record_to_run(record=rec)
         self.assertIn('Record must be of subtype Run to convert to Run. Given',
                       str(context.exception))
+
+    def test_project_record(self):
+        """Test that projections keep only the named data, and files if asked."""
+        rec = Record(id="spam", type="eggs", user_defined={"note": "kept out"},
+                     data={"yolks": {"value": 2}, "shell": {"value": "brown"}},
+                     files=[{"uri": "eggs.png"}])
+        projected = model.project_record(rec, ["yolks", "whites"])
+        self.assertEqual(projected.raw, {"id": "spam", "type": "eggs",
+                                         "data": {"yolks": {"value": 2}},
+                                         "files": [], "user_defined": {}})
+        self.assertEqual(model.project_record(rec, [], include_files=True).files,
+                         [{"uri": "eggs.png"}])
+        run = Run(id="run1", application="foo", user="John Doe", data=rec.data)
+        projected_run = model.project_record(run, ["shell"])
+        self.assertEqual(type(projected_run), Run)
+        self.assertEqual(projected_run.application, "foo")
+        self.assertEqual(projected_run.data, {"shell": {"value": "brown"}})
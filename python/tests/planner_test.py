@@ -0,0 +1,127 @@
+"""Tests for the data_query planner."""
+import unittest
+
+from sina.planner import (DatumStatistics, StatisticsCatalog, build_plan,
+                          execute_plan, HISTOGRAM_BUCKETS)
+from sina.utils import DataRange, has_all, has_any
+
+# Disable pylint invalid-name due to significant number of tests with names
+# exceeding the 30 character limit
+# pylint: disable=invalid-name
+
+
+class TestDatumStatistics(unittest.TestCase):
+    """Tests for collecting and using statistics on a single datum."""
+
+    def test_from_values(self):
+        """Test building statistics from every value of a datum."""
+        stats = DatumStatistics.from_values("spam", "scalar", [0, 5, 5, 10])
+        self.assertEqual((stats.count, stats.min, stats.max, stats.distinct),
+                         (4, 0, 10, 3))
+        self.assertEqual(len(stats.histogram), HISTOGRAM_BUCKETS)
+        self.assertEqual(stats.histogram[0], 1)
+        self.assertEqual(stats.histogram[-1], 1)
+        lists = DatumStatistics.from_values("eggs", "stringlist", ["a", "b", "a"], count=2)
+        self.assertEqual((lists.count, lists.entries, lists.distinct), (2, 3, 2))
+        self.assertIsNone(lists.histogram)
+
+    def test_to_json(self):
+        """Test that statistics can be rebuilt from their JSON form."""
+        stats = DatumStatistics.from_values("spam", "scalar", [0, 5, 5, 10])
+        rebuilt = DatumStatistics(**stats.to_json())
+        self.assertEqual((rebuilt.name, rebuilt.kind, rebuilt.count, rebuilt.min, rebuilt.max,
+                          rebuilt.distinct, rebuilt.histogram, rebuilt.entries),
+                         (stats.name, stats.kind, stats.count, stats.min, stats.max,
+                          stats.distinct, stats.histogram, stats.entries))
+
+    def test_observe(self):
+        """Test that observing values matches building from them."""
+        stats = DatumStatistics("spam", "scalarlist")
+        stats.observe([3, 1])
+        stats.observe([2])
+        self.assertEqual((stats.count, stats.entries, stats.min, stats.max, stats.distinct),
+                         (2, 3, 1, 3, 3))
+
+    def test_observe_keeps_buckets(self):
+        """Test that observing never moves the histogram's bucket boundaries."""
+        stats = DatumStatistics.from_values("spam", "scalar", [0, 10])
+        stats.observe([5])
+        self.assertEqual(sum(stats.histogram), 3)
+        self.assertEqual(stats.histogram[stats.bucket_index(5)], 1)
+        stats.observe([20])
+        self.assertEqual((stats.count, stats.min, stats.max), (4, 0, 20))
+        self.assertIsNone(stats.histogram)
+
+    def test_estimate_scalar(self):
+        """Test estimating matches for single values and ranges."""
+        stats = DatumStatistics.from_values("spam", "scalar", range(100))
+        self.assertAlmostEqual(stats.estimate(50), 1)
+        self.assertAlmostEqual(stats.estimate(DataRange(0, 50)), 50, delta=5)
+        self.assertEqual(stats.estimate(DataRange(200, 300)), 0)
+        self.assertEqual(stats.estimate(DataRange(max=-1)), 0)
+
+    def test_estimate_list(self):
+        """Test that has_any is estimated to match more than has_all."""
+        stats = DatumStatistics.from_values("spam", "scalarlist", range(100), count=10)
+        any_estimate = stats.estimate(has_any(1, 2))
+        all_estimate = stats.estimate(has_all(1, 2))
+        self.assertGreater(any_estimate, all_estimate)
+        self.assertLessEqual(any_estimate, 10)
+
+
+class TestPlanner(unittest.TestCase):
+    """Tests for building and executing query plans."""
+
+    def setUp(self):
+        """Create a catalog describing a common and a rare datum."""
+        self.catalog = StatisticsCatalog()
+        self.catalog.replace([DatumStatistics.from_values("common", "scalar", [1] * 5000),
+                              DatumStatistics.from_values(
+                                  "rare", "string", ["x{}".format(num) for num in range(5000)])],
+                             complete=False)
+
+    def test_build_plan_orders_by_selectivity(self):
+        """Test that the most selective criterion runs first, and restricts the next."""
+        plan = build_plan(self.catalog, {"common": 1, "rare": "x1"})
+        self.assertEqual([step.name for step in plan.steps], ["rare", "common"])
+        self.assertEqual([step.restricted for step in plan.steps], [False, True])
+
+    def test_build_plan_no_restriction_when_large(self):
+        """Test that large intermediate results aren't used as IN filters."""
+        plan = build_plan(self.catalog, {"common": 1, "rare": "x1"}, in_filter_threshold=0.5)
+        self.assertEqual([step.restricted for step in plan.steps], [False, False])
+
+    def test_build_plan_unknown_last(self):
+        """Test that criteria with unknown selectivity run after known ones."""
+        plan = build_plan(self.catalog, {"mystery": 1, "common": 1})
+        self.assertEqual([step.name for step in plan.steps], ["common", "mystery"])
+        self.assertIsNone(plan.steps[1].estimate)
+        self.assertIn("unknown", plan.explain())
+
+    def test_build_plan_complete_catalog(self):
+        """Test that a complete catalog knows a missing datum matches nothing."""
+        self.catalog.complete = True
+        plan = build_plan(self.catalog, {"common": 1, "mystery": 1})
+        self.assertEqual([step.name for step in plan.steps], ["mystery", "common"])
+        self.assertEqual(plan.steps[0].estimate, 0)
+
+    def test_build_plan_no_criteria(self):
+        """Test that we raise a ValueError if given no criteria."""
+        with self.assertRaises(ValueError) as context:
+            build_plan(self.catalog, {})
+        self.assertIn("at least one criterion", str(context.exception))
+
+    def test_execute_plan(self):
+        """Test that restricted steps are given the ids matched so far."""
+        plan = build_plan(self.catalog, {"common": 1, "rare": "x1"})
+        matches = {"rare": ["a", "c", "e"], "common": ["a", "b", "c", "d"]}
+        restrictions = []
+
+        def run_step(step, accepted_ids):
+            """Return a step's matches, noting its restriction."""
+            restrictions.append(accepted_ids)
+            return iter([id_ for id_ in matches[step.name]
+                         if accepted_ids is None or id_ in accepted_ids])
+
+        self.assertEqual(list(execute_plan(plan, run_step)), ["a", "c"])
+        self.assertEqual(restrictions, [None, ["a", "c", "e"]])
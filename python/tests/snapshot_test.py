@@ -0,0 +1,170 @@
+"""Tests for the read-only snapshot backend."""
+import os
+import shutil
+import tempfile
+import unittest
+
+import tests.backend_test
+import sina.datastores.sql as sql
+from sina.model import Record, Run
+from sina.utils import DataRange, has_any, has_only
+
+try:
+    import sina.datastores.snapshot as backend
+    from sina.datastores.snapshot import NUMPY_PRESENT
+except ImportError:
+    NUMPY_PRESENT = False
+
+# Disable pylint invalid-name due to significant number of tests with names
+# exceeding the 30 character limit
+# pylint: disable=invalid-name
+
+
+def build_snapshot(path, populate=tests.backend_test.populate_database_with_data,
+                   **kwargs):
+    """
+    Build a snapshot of a populated SQL database.
+
+    :param path: Where to write the snapshot.
+    :param populate: A function filling the SQL database, given a RecordDAO.
+    :param kwargs: Passed on to create_snapshot().
+
+    :returns: The SQL DAOFactory and the snapshot's DAOFactory.
+    """
+    source = sql.DAOFactory()
+    populate(source.create_record_dao())
+    return source, backend.create_snapshot(source, path, **kwargs)
+
+
+@unittest.skipUnless(NUMPY_PRESENT, "Snapshots require numpy")
+class TestQuery(tests.backend_test.TestQuery):
+    """Runs the shared query tests against a snapshot of the usual test data."""
+
+    __test__ = True
+
+    @classmethod
+    def setUpClass(cls):
+        """Build the snapshot once for every test."""
+        cls.temp_dir = tempfile.mkdtemp()
+        _, cls.factory = build_snapshot(os.path.join(cls.temp_dir, "snapshot"))
+        cls.record_dao = cls.factory.create_record_dao()
+        cls.run_dao = cls.factory.create_run_dao()
+        cls.relationship_dao = cls.factory.create_relationship_dao()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the snapshot."""
+        shutil.rmtree(cls.temp_dir)
+
+
+@unittest.skipUnless(NUMPY_PRESENT, "Snapshots require numpy")
+class TestSnapshot(unittest.TestCase):
+    """Tests for building snapshots and what's unique to them."""
+
+    def setUp(self):
+        """Create a scratch directory for snapshots."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "snapshot")
+
+    def tearDown(self):
+        """Remove the scratch directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_matches_source(self):
+        """Test that a snapshot reads back everything its source held."""
+        source, factory = build_snapshot(self.path, raw_compression="zlib")
+        source_dao = source.create_record_dao()
+        record_dao = factory.create_record_dao()
+        ids = list(source_dao.get_all(ids_only=True))
+        self.assertEqual(list(record_dao.get_all(ids_only=True)), sorted(ids))
+        for record in source_dao.get_many(ids):
+            self.assertEqual(record_dao.get(record.id).raw, record.raw)
+        self.assertEqual(record_dao.get_content_hashes(ids + ["missing"]),
+                         source_dao.get_content_hashes(ids))
+        self.assertEqual(record_dao.get_files("spam"), source_dao.get_files("spam"))
+        self.assertEqual(record_dao.get_data_for_records(ids, ["spam_scal", "val_data"]),
+                         source_dao.get_data_for_records(ids, ["spam_scal", "val_data"]))
+        for criteria in ({"spam_scal": DataRange(10, 10.5)},
+                         {"spam_scal": DataRange(min=10, min_inclusive=False)},
+                         {"val_data": DataRange("a", "z", max_inclusive=True)},
+                         {"val_data_list_2": has_any("eggs", DataRange("s", "z"))},
+                         {"val_data_list_1": has_only(DataRange(-10, 8.5))}):
+            self.assertEqual(list(record_dao.data_query(**criteria)),
+                             sorted(source_dao.data_query(**criteria)), criteria)
+        with self.assertRaises(ValueError):
+            record_dao.get("missing")
+
+    def test_statistics(self):
+        """Test that a snapshot can plan queries as soon as it's opened."""
+        build_snapshot(self.path)
+        catalog = backend.DAOFactory(self.path).snapshot.statistics
+        self.assertTrue(catalog.complete)
+        spam_scal = catalog.get("scalar", "spam_scal")
+        self.assertEqual((spam_scal.count, spam_scal.min, spam_scal.max, spam_scal.distinct),
+                         (3, 10, 10.99999, 3))
+        self.assertEqual(sum(spam_scal.histogram), 3)
+        list_2 = catalog.get("stringlist", "val_data_list_2")
+        self.assertEqual((list_2.count, list_2.entries, list_2.distinct), (2, 4, 3))
+
+    def test_relationships(self):
+        """Test that a snapshot's Relationships match its source's."""
+
+        def populate(record_dao):
+            """Insert Records and Relationships between them."""
+            record_dao.insert_many([Record("spam", "food"), Record("eggs", "food")])
+            relationship_dao = sql.RelationshipDAO(record_dao.session)
+            relationship_dao.insert(subject_id="spam", object_id="eggs", predicate="precedes")
+            relationship_dao.insert(subject_id="eggs", object_id="spam", predicate="follows")
+            relationship_dao.insert(subject_id="spam", object_id="ham", predicate="precedes")
+
+        source, factory = build_snapshot(self.path, populate=populate)
+        source_dao = source.create_relationship_dao()
+        relationship_dao = factory.create_relationship_dao()
+        self.assertEqual(relationship_dao.count(), 3)
+        for kwargs in ({"subject_id": "spam"}, {"object_id": "spam"},
+                       {"predicate": "precedes"}, {"object_id": "toast"}):
+            self.assertEqual(sorted(map(str, relationship_dao.get(**kwargs))),
+                             sorted(map(str, source_dao.get(**kwargs))), kwargs)
+        self.assertEqual(relationship_dao.get(subject_id="spam", predicate="follows"), [])
+        self.assertEqual(
+            {id: sorted(map(str, rels)) for id, rels
+             in relationship_dao.get_many(object_ids=["spam", "ham", "eggs"]).items()},
+            {id: sorted(map(str, rels)) for id, rels
+             in source_dao.get_many(object_ids=["spam", "ham", "eggs"]).items()})
+
+    def test_read_only(self):
+        """Test that snapshots refuse to change."""
+        _, factory = build_snapshot(self.path)
+        with self.assertRaises(NotImplementedError):
+            factory.create_record_dao().insert(Record("toast", "food"))
+        with self.assertRaises(NotImplementedError):
+            factory.create_run_dao().delete("spam")
+        with self.assertRaises(NotImplementedError):
+            factory.create_relationship_dao().insert(subject_id="spam", object_id="eggs",
+                                                     predicate="likes")
+
+    def test_replace(self):
+        """Test that only snapshots are replaced by new ones."""
+        build_snapshot(self.path)
+
+        def populate(record_dao):
+            """Insert a single Run."""
+            record_dao.insert(Run("toast", "breakfast", data={"slices": {"value": 2}}))
+
+        _, factory = build_snapshot(self.path, populate=populate)
+        self.assertEqual(list(factory.create_record_dao().get_all(ids_only=True)), ["toast"])
+        self.assertEqual(factory.create_run_dao().get("toast").application, "breakfast")
+        self.assertEqual(os.listdir(self.temp_dir), ["snapshot"])
+        with self.assertRaises(ValueError):
+            build_snapshot(self.temp_dir)
+        with self.assertRaises(ValueError):
+            backend.DAOFactory(self.temp_dir)
+
+    def test_empty(self):
+        """Test a snapshot of an empty backend."""
+        _, factory = build_snapshot(self.path, populate=lambda record_dao: None)
+        record_dao = factory.create_record_dao()
+        self.assertEqual(list(record_dao.get_all()), [])
+        self.assertEqual(list(record_dao.data_query(spam=DataRange(1, 2))), [])
+        self.assertEqual(list(record_dao.get_given_document_uri("%", ids_only=True)), [])
+        self.assertEqual(factory.create_relationship_dao().get(subject_id="spam"), [])
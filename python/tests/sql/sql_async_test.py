@@ -0,0 +1,103 @@
+"""Unit tests for the async SQL DAOs."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import six
+
+from sina.model import Record, Relationship, Run
+from sina.utils import DataRange
+
+if not six.PY2:
+    import asyncio
+    import sina.datastores.sql_async as sina_sql_async
+
+
+@unittest.skipIf(six.PY2, "asyncio requires Python 3")
+class TestSQLAsyncDAO(unittest.TestCase):
+    """Unit tests for the async SQL DAOs."""
+
+    def setUp(self):
+        """Create a factory on a file database, so calls can run concurrently."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.factory = sina_sql_async.AsyncDAOFactory(
+            os.path.join(self.temp_dir, "test.sqlite"), max_workers=4)
+        self.record_dao = self.factory.create_record_dao()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.records = [Record(id="rec_{}".format(num), type="sample",
+                               data={"num": {"value": num}},
+                               files=[{"uri": "rec_{}.png".format(num)}])
+                        for num in range(10)]
+        self.wait_for(self.record_dao.insert_many(self.records))
+
+    def tearDown(self):
+        """Close the factory and event loop, then remove the database."""
+        self.factory.close()
+        self.loop.close()
+        shutil.rmtree(self.temp_dir)
+
+    def wait_for(self, coroutine):
+        """Run a coroutine to completion on the test's event loop."""
+        return self.loop.run_until_complete(coroutine)
+
+    def test_concurrent_gets(self):
+        """Test that many concurrent reads each get the right Record."""
+        coroutines = [self.record_dao.get(record.id) for record in self.records]
+        records = self.wait_for(asyncio.gather(*coroutines))
+        self.assertEqual([record.id for record in records],
+                         [record.id for record in self.records])
+        self.assertEqual(records[3].data["num"]["value"], 3)
+
+    def test_get_many(self):
+        """Test that get_many returns a list of Records in order."""
+        records = self.wait_for(self.record_dao.get_many(["rec_2", "rec_1"]))
+        self.assertEqual([record.id for record in records], ["rec_2", "rec_1"])
+
+    def test_queries_return_lists(self):
+        """Test that methods returning generators synchronously return lists."""
+        ids = self.wait_for(self.record_dao.data_query(num=DataRange(2, 5)))
+        self.assertEqual(ids, ["rec_2", "rec_3", "rec_4"])
+        uris = self.wait_for(self.record_dao.get_given_document_uri("rec_1%.png",
+                                                                    ids_only=True))
+        self.assertEqual(uris, ["rec_1"])
+        files = self.wait_for(self.record_dao.get_files("rec_0"))
+        self.assertEqual(files[0]["uri"], "rec_0.png")
+
+    def test_delete(self):
+        """Test that deletions are visible to later calls."""
+        self.wait_for(self.record_dao.delete("rec_0"))
+        ids = self.wait_for(self.record_dao.get_all_of_type("sample", ids_only=True))
+        self.assertEqual(len(ids), 9)
+
+    def test_bad_query_raises(self):
+        """Test that errors raised on the thread pool reach the caller."""
+        with self.assertRaises(ValueError):
+            self.wait_for(self.record_dao.data_query())
+
+    def test_relationships_and_runs(self):
+        """Test the async Relationship and Run DAOs."""
+        relationship_dao = self.factory.create_relationship_dao()
+        run_dao = self.factory.create_run_dao()
+        self.wait_for(run_dao.insert(Run(id="run_1", application="breakfast_maker")))
+        self.wait_for(relationship_dao.insert(subject_id="run_1", predicate="makes",
+                                              object_id="rec_0"))
+        self.assertEqual(self.wait_for(run_dao.get("run_1")).application, "breakfast_maker")
+        self.assertEqual(self.wait_for(run_dao.get_all(ids_only=True)), ["run_1"])
+        relationships = self.wait_for(relationship_dao.get(subject_id="run_1"))
+        self.assertEqual([(rel.subject_id, rel.predicate, rel.object_id)
+                          for rel in relationships],
+                         [("run_1", "makes", "rec_0")])
+        self.assertIsInstance(relationships[0], Relationship)
+
+    def test_in_memory(self):
+        """Test that an in-memory database is shared across calls."""
+        factory = sina_sql_async.AsyncDAOFactory()
+        record_dao = factory.create_record_dao()
+        try:
+            self.wait_for(record_dao.insert(self.records[0]))
+            self.assertEqual(self.wait_for(record_dao.get("rec_0")).id, "rec_0")
+        finally:
+            factory.close()
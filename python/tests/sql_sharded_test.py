@@ -0,0 +1,259 @@
+#!/bin/python
+"""Runs the tests contained in backend_test.py on the sharded SQL backend."""
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import tests.backend_test
+from sina.model import Record, Relationship, Run
+from sina.utils import DataRange, has_any, import_many_jsons
+import sina.datastores.sql as sql
+import sina.datastores.sql_sharded as backend
+
+# Directories holding the databases created during these tests
+TEMP_DIRS = []
+# Factories created during the current test, closed when it ends
+FACTORIES = []
+
+
+def tearDownModule():  # pylint: disable=invalid-name
+    """Remove every database created during these tests."""
+    for temp_dir in TEMP_DIRS:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+# Disable pylint no-init check just on the Mixin class, since it has no use
+# for an __init__ and there is no expectation of adding more public methods.
+class ShardedMixin(object):  # pylint: disable=no-init,too-few-public-methods
+    """Contains the methods shared between all test classes."""
+
+    __test__ = False
+    # Ensure the selected backend is passed to child tests.
+    backend = backend
+
+    # This has to be a classmethod because it's called before instantiation
+    # (See TestQuery)
+    @classmethod
+    def create_dao_factory(cls, test_db_dest=None):
+        """
+        Create a DAO for the sharded SQL backend.
+
+        Sharded databases are always on disk, so each is given a fresh
+        temporary directory if not told where to go.
+
+        :param test_db_dest: The directory the DAOFactory should target.
+        """
+        if test_db_dest is None:
+            test_db_dest = tempfile.mkdtemp()
+            TEMP_DIRS.append(test_db_dest)
+        FACTORIES.append(backend.DAOFactory(test_db_dest, shard_count=3))
+        return FACTORIES[-1]
+
+    def tearDown(self):
+        """Close the factories the test created, releasing their threads and files."""
+        while FACTORIES:
+            FACTORIES.pop().close()
+
+
+class TestSetup(ShardedMixin, tests.backend_test.TestSetup):
+    """
+    Provides methods needed for setup-type tests on the sharded SQL backend.
+
+    Also runs any setup-type tests that are unique to it.
+    """
+
+    __test__ = True
+
+    def setUp(self):
+        """Define a directory for the database."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.test_db_dest = os.path.join(self.temp_dir, "sharded")
+
+    def tearDown(self):
+        """Close the factories and remove the database."""
+        super(TestSetup, self).tearDown()
+        shutil.rmtree(self.temp_dir)
+
+    def test_factory_manifest(self):
+        """Test that a database keeps the number of shards it was created with."""
+        factory = self.create_dao_factory(self.test_db_dest)
+        self.assertEqual(sorted(os.listdir(self.test_db_dest))[:2],
+                         ["routing.sqlite", "shard_000.sqlite"])
+        with open(os.path.join(self.test_db_dest, backend.MANIFEST_FILENAME)) as manifest:
+            self.assertEqual(json.load(manifest)["shard_count"], 3)
+        factory.create_record_dao().insert(Record(id="spam", type="eggs"))
+        reopened = backend.DAOFactory(self.test_db_dest)
+        FACTORIES.append(reopened)
+        self.assertEqual(reopened.shard_count, 3)
+        self.assertEqual(reopened.create_record_dao().get("spam").type, "eggs")
+        self.assertEqual(repr(reopened), "Sharded SQL DAOFactory <db_dir={}, shard_count=3>"
+                         .format(self.test_db_dest))
+        with self.assertRaises(ValueError):
+            backend.DAOFactory(self.test_db_dest, shard_count=4)
+        with self.assertRaises(ValueError):
+            backend.DAOFactory(self.temp_dir)
+        with self.assertRaises(ValueError):
+            backend.DAOFactory(os.path.join(self.temp_dir, "empty"), shard_count=0)
+
+    def test_shard_of(self):
+        """Test that ids are spread over shards the same way every time."""
+        factory = self.create_dao_factory(self.test_db_dest)
+        self.assertEqual([factory.shard_of(id) for id in ("spam", u"spam", b"spam")],
+                         [factory.shard_of("spam")] * 3)
+        self.assertEqual(len({factory.shard_of("rec_{}".format(i)) for i in range(30)}), 3)
+
+
+class TestModify(ShardedMixin, tests.backend_test.TestModify):
+    """
+    Provides methods needed for modify-type tests on the sharded SQL backend.
+
+    Also runs any modify-type tests that are unique to it.
+    """
+
+    __test__ = True
+
+    def setUp(self):
+        """Define a few shared variables."""
+        self.test_db_dest = None
+
+    def test_relationships_routed(self):
+        """Test that Relationships crossing shards are kept in the routing database."""
+        factory = self.create_dao_factory()
+        ids = ["rec_{}".format(i) for i in range(12)]
+        factory.create_record_dao().insert_many([Record(id=id, type="eggs") for id in ids])
+        relationships = [Relationship(subject_id=ids[0], object_id=id, predicate="precedes")
+                         for id in ids[1:]]
+        relationship_dao = factory.create_relationship_dao()
+        relationship_dao.insert_many(relationships)
+        crossing = [rel for rel in relationships
+                    if factory.shard_of(rel.object_id) != factory.shard_of(ids[0])]
+        self.assertTrue(crossing)
+        self.assertEqual(factory.routing.create_relationship_dao().count(), len(crossing))
+        self.assertEqual(relationship_dao.count(), len(relationships))
+        self.assertEqual(sorted(map(str, relationship_dao.get(subject_id=ids[0]))),
+                         sorted(map(str, relationships)))
+        self.assertEqual(relationship_dao.get(subject_id=ids[0], predicate="follows"), [])
+        self.assertEqual(list(map(str, relationship_dao.get(object_id=crossing[0].object_id))),
+                         [str(crossing[0])])
+        factory.create_record_dao().delete(crossing[0].object_id)
+        self.assertEqual(factory.routing.create_relationship_dao().count(), len(crossing) - 1)
+
+    def test_relationship_before_records_not_duplicated(self):
+        """Test that a Relationship routed before its Records exist isn't kept twice."""
+        factory = self.create_dao_factory()
+        # Two ids in the same shard, so the Relationship would be kept there
+        ids = ["rec_{}".format(i) for i in range(12)]
+        subject_id, object_id = next((subj, obj) for subj in ids for obj in ids
+                                     if subj != obj
+                                     and factory.shard_of(subj) == factory.shard_of(obj))
+        relationship = Relationship(subject_id=subject_id, object_id=object_id,
+                                    predicate="precedes")
+        relationship_dao = factory.create_relationship_dao()
+        relationship_dao.insert(relationship)
+        factory.create_record_dao().insert_many([Record(id=subject_id, type="eggs"),
+                                                 Record(id=object_id, type="eggs")])
+        relationship_dao.insert(relationship)
+        relationship_dao.insert_many([relationship, relationship])
+        self.assertEqual(relationship_dao.count(), 1)
+        self.assertEqual(list(map(str, relationship_dao.get(subject_id=subject_id))),
+                         [str(relationship)])
+        # New ones between the Records are kept in their shard
+        relationship_dao.insert(subject_id=object_id, object_id=subject_id, predicate="follows")
+        self.assertEqual(relationship_dao.count(), 2)
+        self.assertEqual(factory.routing.create_relationship_dao().count(), 1)
+
+    def test_import_many_jsons_parallel(self):
+        """Test that many JSON files are ingested into the shards at once."""
+        factory = self.create_dao_factory()
+        json_dir = tempfile.mkdtemp()
+        TEMP_DIRS.append(json_dir)
+        paths = []
+        for index in range(6):
+            paths.append(os.path.join(json_dir, "{}.json".format(index)))
+            with open(paths[-1], "w") as json_file:
+                json.dump({"records": [{"id": "rec_{}_{}".format(index, i), "type": "eggs",
+                                        "data": {"yolks": {"value": i}}}
+                                       for i in range(5)]}, json_file)
+        summary = import_many_jsons(factory, paths)
+        self.assertEqual(summary["inserted"], 30)
+        self.assertEqual(len(list(factory.create_record_dao().data_query(
+            yolks=DataRange(0, 2)))), 12)
+
+
+class TestQuery(ShardedMixin, tests.backend_test.TestQuery):
+    """
+    Provides methods needed for query-type tests on the sharded SQL backend.
+
+    Also runs any query-type tests that are unique to it.
+    """
+
+    __test__ = True
+
+    @classmethod
+    def setUpClass(cls):
+        """Create the factory and populate it."""
+        tests.backend_test.create_daos(cls)
+        # Shared by every test, so closed only once they're all done
+        FACTORIES.remove(cls.factory)
+        tests.backend_test.populate_database_with_data(cls.record_dao)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Close the shared factory."""
+        cls.factory.close()
+
+    def test_matches_sql(self):
+        """Test that fanned-out reads agree with a single SQL database's."""
+        sql_dao = sql.DAOFactory().create_record_dao()
+        tests.backend_test.populate_database_with_data(sql_dao)
+        for criteria in ({"spam_scal": DataRange(10, 10.5)},
+                         {"spam_scal": DataRange(min=10, min_inclusive=False)},
+                         {"val_data": DataRange("a", "z", max_inclusive=True)},
+                         {"val_data_list_2": has_any("eggs", DataRange("s", "z"))}):
+            self.assertEqual(list(self.record_dao.data_query(**criteria)),
+                             sorted(sql_dao.data_query(**criteria)), criteria)
+        ids = list(sql_dao.get_all(ids_only=True))
+        self.assertEqual([record.id for record in self.record_dao.get_many(ids)], ids)
+        self.assertEqual(self.record_dao.get_data_for_records(ids, ["spam_scal", "val_data"]),
+                         sql_dao.get_data_for_records(ids, ["spam_scal", "val_data"]))
+        self.assertEqual(self.record_dao.get_content_hashes(ids),
+                         sql_dao.get_content_hashes(ids))
+
+    def test_merged_statistics(self):
+        """Test that the shards' statistics combine into those of the whole."""
+        catalog = self.record_dao.analyze()
+        self.assertTrue(catalog.complete)
+        spam_scal = catalog.get("scalar", "spam_scal")
+        self.assertEqual((spam_scal.count, spam_scal.min, spam_scal.max, spam_scal.distinct),
+                         (3, 10, 10.99999, 3))
+        self.assertEqual(sum(spam_scal.histogram), 3)
+        self.assertEqual(catalog.get("stringlist", "val_data_list_2").entries, 4)
+
+    def test_optimize(self):
+        """Test that optimizing tunes every shard and the routing database."""
+        report = self.factory.optimize()
+        self.assertEqual(len(report["shards"]), 3)
+        self.assertEqual(sum(shard["tables"]["Record"]["rows"] for shard in report["shards"]),
+                         len(list(self.record_dao.get_all(ids_only=True))))
+        self.assertEqual(report["routing"]["tables"]["ScalarData"]["rows"], 0)
+
+
+class TestShardedRuns(ShardedMixin, unittest.TestCase):
+    """Tests for Runs spread over shards."""
+
+    def test_runs(self):
+        """Test inserting, reading, and deleting Runs across shards."""
+        run_dao = self.create_dao_factory().create_run_dao()
+        runs = [Run(id="run_{}".format(i), application="breakfast",
+                    data={"slices": {"value": i}}) for i in range(6)]
+        run_dao.insert_many(runs)
+        self.assertEqual([run.application for run in run_dao.get_many(["run_4", "run_1"])],
+                         ["breakfast"] * 2)
+        run_dao.replace_many([Run(id="run_4", application="lunch")])
+        self.assertEqual(run_dao.get("run_4").application, "lunch")
+        run_dao.delete_many(["run_0", "run_1"])
+        self.assertEqual(list(run_dao.get_all(ids_only=True)),
+                         ["run_{}".format(i) for i in range(2, 6)])
@@ -4,9 +4,21 @@
 import os
 import time
 import tempfile
+from multiprocessing.pool import ThreadPool
+
+import six
+# Disable pylint check due to its issue with virtual environments
+from mock import patch  # pylint: disable=import-error
+import sqlalchemy  # pylint: disable=import-error
 
 import tests.backend_test
+import sina.dao
+from sina.model import Record, Relationship, Run
+from sina.utils import DataRange
+import sina.model as model
+import sina.codec as codec
 import sina.datastores.sql as backend
+import sina.datastores.sql_schema as schema
 
 
 # Disable pylint no-init check just on the Mixin class, since it has no use
@@ -48,13 +60,94 @@ class TestSetup(SQLMixin, tests.backend_test.TestSetup):
 
     def tearDown(self):
         """Remove any temp files created during test."""
-        tests.backend_test.remove_file(self.test_db_dest)
+        # WAL-mode databases leave a log and shared-memory file alongside
+        for suffix in ("", "-wal", "-shm"):
+            tests.backend_test.remove_file(self.test_db_dest + suffix)
 
     def test_factory_instantiate_file(self):
         """Test to ensure SQL DAOFactory is able to create files."""
         self.create_dao_factory(self.test_db_dest)
         self.assertTrue(os.path.isfile(self.test_db_dest))
 
+    def test_factory_adds_missing_tables(self):
+        """Test that opening an older database creates the tables it lacks."""
+        older = self.create_dao_factory(self.test_db_dest)
+        older.session.execute('DROP TABLE RecordHash')
+        older.session.commit()
+        factory = self.create_dao_factory(self.test_db_dest)
+        record_dao = factory.create_record_dao()
+        record_dao.insert(Record(id="spam", type="eggs"))
+        self.assertEqual(record_dao.get_content_hashes(["spam"]),
+                         {"spam": Record(id="spam", type="eggs").content_hash()})
+
+    def test_factory_encodes_old_data_names(self):
+        """Test that opening a database storing names in its data tables moves them."""
+        records = [Record(id="spam", type="eggs",
+                          data={"yolks": {"value": 2, "units": "count", "tags": ["in"]},
+                                "shell": {"value": "brown"},
+                                "sizes": {"value": ["L", "XL"]},
+                                "weights": {"value": [50, 60.5]}}),
+                   Record(id="ham", type="eggs", data={"yolks": {"value": 1}})]
+        older = self.create_dao_factory(self.test_db_dest)
+        older.create_record_dao().insert_many(records)
+        # Put the data tables back the way they were before DataName
+        for table in backend.DATA_TABLES:
+            older.session.execute(
+                'CREATE TABLE old AS SELECT DataName.name AS name, {} FROM "{table}" '
+                'JOIN DataName ON DataName.id = "{table}".name_id'.format(
+                    ', '.join('"{}"."{}"'.format(table.name, column.name)
+                              for column in table.columns if column.name != 'name_id'),
+                    table=table.name))
+            older.session.execute('DROP TABLE "{}"'.format(table.name))
+            older.session.execute('ALTER TABLE old RENAME TO "{}"'.format(table.name))
+        older.session.execute('CREATE INDEX record_scalar_idx ON ScalarData (id, name)')
+        older.session.execute('DELETE FROM DataName')
+        older.session.commit()
+        older.session.close()
+        factory = self.create_dao_factory(self.test_db_dest)
+        columns = [row[1] for row in factory.session.execute('PRAGMA table_info(ScalarData)')]
+        self.assertIn("name_id", columns)
+        self.assertNotIn("name", columns)
+        self.assertEqual(factory.session.query(schema.DataName).count(), 4)
+        record_dao = factory.create_record_dao()
+        for record in records:
+            self.assertEqual(record_dao.get(record.id, data_fields=list(record.data)).data,
+                             record.data)
+        self.assertEqual(list(record_dao.data_query(yolks=DataRange(0, 5))), ["ham", "spam"])
+        # Already moved, so nothing to do the next time
+        reopened = self.create_dao_factory(self.test_db_dest)
+        self.assertEqual(reopened.session.query(schema.DataName).count(), 4)
+
+    def test_factory_pooled(self):
+        """Test that a pooled factory gives each thread its own session."""
+        factory = backend.DAOFactory(self.test_db_dest, pooled=True)
+        self.assertTrue(factory.supports_parallel_ingestion)
+        tests.backend_test.populate_database_with_data(factory.create_record_dao())
+        journal_mode = factory.session.execute('pragma journal_mode').scalar()
+        self.assertEqual(journal_mode, "wal")
+
+        def read_spam(_):
+            """Read a Record and report which session did so."""
+            record_dao = factory.create_record_dao()
+            record = record_dao.get("spam")
+            return record.id, id(record_dao.session())
+
+        pool = ThreadPool(processes=4)
+        try:
+            results = pool.map(read_spam, range(8))
+        finally:
+            pool.close()
+            pool.join()
+        self.assertEqual(set(result[0] for result in results), {"spam"})
+        self.assertNotIn(id(factory.session()), set(result[1] for result in results))
+        self.assertIn("pooled=True", repr(factory))
+
+    def test_factory_pooled_in_memory(self):
+        """Test that we raise a ValueError when asked to pool an in-memory db."""
+        with self.assertRaises(ValueError) as context:
+            backend.DAOFactory(pooled=True)
+        self.assertIn("requires a db_path", str(context.exception))
+
 
 class TestModify(SQLMixin, tests.backend_test.TestModify):
     """
@@ -75,6 +168,292 @@ class TestModify(SQLMixin, tests.backend_test.TestModify):
         """Remove any temp files created during test."""
         tests.backend_test.remove_file(self.test_db_dest)
 
+    def test_recorddao_delete_many_chunked(self):
+        """Test that bulk deletes clear every table without relying on cascades."""
+        # In-memory databases don't cascade, so nothing may be left behind
+        factory = self.create_dao_factory()
+        record_dao = factory.create_record_dao()
+        record_dao.insert_many([Record(id="rec_{}".format(x), type="sample",
+                                       data={"eggs": {"value": x},
+                                             "flavors": {"value": ["spam", "tasty"]}},
+                                       files=[{"uri": "rec_{}.png".format(x)}])
+                                for x in range(5)])
+        factory.create_relationship_dao().insert(subject_id="rec_0", object_id="rec_4",
+                                                 predicate="precedes")
+        with patch('sina.datastores.sql.IN_CHUNK_SIZE', 2):
+            record_dao.delete_many(["rec_{}".format(x) for x in range(4)])
+        for column in backend.RECORD_ID_COLUMNS:
+            remaining = set(row[0] for row in factory.session.query(column))
+            self.assertLessEqual(remaining, {"rec_4"}, column)
+        self.assertEqual(factory.create_relationship_dao().count(), 0)
+
+    def test_recorddao_get_after_delete(self):
+        """Test that a DAO doesn't keep serving the Records it deleted."""
+        record_dao = self.create_dao_factory(test_db_dest=self.test_db_dest).create_record_dao()
+        record_dao.insert_many([Record(id="rec_1", type="sample", data={"eggs": {"value": 1}}),
+                                Record(id="rec_2", type="sample")])
+        self.assertEqual(record_dao.get("rec_1").data["eggs"]["value"], 1)
+        loaded = record_dao.session.query(schema.Record).filter(schema.Record.id == "rec_1").one()
+        record_dao.delete_many(["rec_1"])
+        self.assertNotIn(loaded, record_dao.session)
+        with self.assertRaises(sqlalchemy.orm.exc.NoResultFound):
+            record_dao.get("rec_1")
+        # The id's free for reuse, and gets see the new Record
+        record_dao.insert(Record(id="rec_1", type="sample", data={"eggs": {"value": 2}}))
+        self.assertEqual(record_dao.get("rec_1").data["eggs"]["value"], 2)
+        loaded = record_dao.session.query(schema.Record).filter(schema.Record.id == "rec_1").one()
+        record_dao.delete_given_data(eggs=2)
+        self.assertNotIn(loaded, record_dao.session)
+        with self.assertRaises(sqlalchemy.orm.exc.NoResultFound):
+            record_dao.get("rec_1")
+
+    def test_recorddao_delete_given_data_in_sql(self):
+        """Test that deleting by data doesn't gather the ids in Python."""
+        record_dao = self.create_dao_factory().create_record_dao()
+        tests.backend_test.populate_database_with_data(record_dao)
+        expected_gone = set(record_dao.data_query(spam_scal=DataRange(10, 10.5)))
+        with patch.object(record_dao, 'data_query') as data_query:
+            count = record_dao.delete_given_data(spam_scal=DataRange(10, 10.5))
+            data_query.assert_not_called()
+        self.assertEqual(count, len(expected_gone))
+        self.assertFalse(expected_gone & set(record_dao.get_all_of_type("run", ids_only=True)))
+
+    def test_recorddao_overwrite_diffs_rows(self):
+        """Test that an overwriting insert only writes rows that changed."""
+        factory = self.create_dao_factory()
+        record_dao = factory.create_record_dao()
+        record_dao.insert(Record(id="spam", type="eggs",
+                                 data={"eggs": {"value": 12}, "bacon": {"value": 2},
+                                       "toast": {"value": ["rye", "wheat"]}},
+                                 files=[{"uri": "eggs.brek"}]))
+        with patch('sina.datastores.sql._upsert', wraps=backend._upsert) as upsert:
+            record_dao.insert(Record(id="spam", type="eggs",
+                                     data={"eggs": {"value": 13}, "bacon": {"value": 2},
+                                           "toast": {"value": ["rye"]}},
+                                     files=[{"uri": "eggs.brek"}]),
+                              force_overwrite=True)
+        written = {args[1].name: args[2] for args, _ in upsert.call_args_list if args[2]}
+        self.assertEqual(sorted(written), ["Record", "RecordHash", "ScalarData"])
+        eggs_id = factory.names.ids_of(factory.session, ["eggs"])["eggs"]
+        self.assertEqual(written["ScalarData"], [{"id": "spam", "name_id": eggs_id, "value": 13,
+                                                  "units": None, "tags": None}])
+        remaining = factory.session.query(schema.ListStringDataEntry.value).all()
+        self.assertEqual(remaining, [("rye",)])
+
+    def test_data_names_encoded(self):
+        """Test that each datum name is stored once, and referred to by id."""
+        factory = self.create_dao_factory()
+        record_dao = factory.create_record_dao()
+        record_dao.insert_many([Record(id=id, type="eggs",
+                                       data={"yolks": {"value": 2}, "shell": {"value": "brown"},
+                                             "sizes": {"value": ["L", "XL"]}})
+                                for id in ("spam", "ham")])
+        names = dict(factory.session.query(schema.DataName.name, schema.DataName.id))
+        self.assertEqual(sorted(names), ["shell", "sizes", "yolks"])
+        self.assertEqual(factory.session.query(schema.ScalarData.name_id).distinct().all(),
+                         [(names["yolks"],)])
+        self.assertEqual(factory.session.query(schema.ListStringDataEntry.name_id)
+                         .distinct().all(), [(names["sizes"],)])
+        self.assertEqual(record_dao.get("ham").data["sizes"]["value"], ["L", "XL"])
+        self.assertEqual(list(record_dao.data_query(shell="brown")), ["ham", "spam"])
+        self.assertEqual(list(record_dao.data_query(whites=DataRange(0, 3))), [])
+        self.assertEqual(record_dao.get_data_for_records(["spam"], ["yolks", "whites"]),
+                         {"spam": {"yolks": {"value": 2}}})
+        # Deleting the Records leaves their names be
+        record_dao.delete_many(["spam", "ham"])
+        self.assertEqual(factory.session.query(schema.DataName).count(), 3)
+
+    def test_data_names_rolled_back(self):
+        """Test that names added by a rolled-back transaction aren't cached."""
+        factory = self.create_dao_factory()
+        record_dao = factory.create_record_dao()
+        record_dao.insert(Record(id="spam", type="eggs", data={"yolks": {"value": 2}}))
+        record_dao.insert(Record(id="ham", type="eggs", data={"ghost": {"value": 1}}),
+                          called_from_child=True)
+        factory.session.rollback()
+        self.assertEqual(factory.names.ids_of(factory.session, ["ghost"]), {})
+        # Likely to be given the id "ghost" had
+        record_dao.insert(Record(id="ham", type="eggs", data={"toast": {"value": 1}}))
+        self.assertEqual(record_dao.get("ham", data_fields=["toast", "ghost"]).data,
+                         {"toast": {"value": 1}})
+        self.assertEqual(factory.create_record_dao().get_scalars("ham", ["toast"]),
+                         {"toast": {"value": 1, "units": None, "tags": None}})
+
+    def test_runs_overwritten_by_records(self):
+        """Test that a Run overwritten by a plain Record loses its Run entry."""
+        factory = self.create_dao_factory()
+        run_dao = factory.create_run_dao()
+        run_dao.insert(Run(id="spam", application="eggs"))
+        run_dao.insert(Run(id="spam", application="ham"), force_overwrite=True)
+        self.assertEqual(run_dao.get("spam").application, "ham")
+        factory.create_record_dao().insert(Record(id="spam", type="ham"), force_overwrite=True)
+        self.assertEqual(factory.session.query(schema.Run).count(), 0)
+        self.assertEqual(list(run_dao.get_all(ids_only=True)), [])
+        # Overwriting is also how Records are inserted if they don't exist yet
+        factory.create_record_dao().insert(Record(id="toast", type="bread"),
+                                           force_overwrite=True)
+        self.assertEqual(factory.create_record_dao().get("toast").type, "bread")
+
+    def test_recorddao_insert_serializes_once(self):
+        """Test that inserting serializes each raw once, and trusting skips list checks."""
+        record_dao = self.create_dao_factory().create_record_dao()
+        records = [Record(id="rec_{}".format(x), type="sample",
+                          data={"eggs": {"value": [x, x + 1]}})
+                   for x in range(3)]
+        with patch('sina.model._canonical_json', wraps=model._canonical_json) as serialize, \
+                patch('sina.model._is_valid_list', wraps=model._is_valid_list) as check_list:
+            record_dao.insert_many(records[:2])
+            self.assertEqual(serialize.call_count, 2)
+            self.assertEqual(check_list.call_count, 2)
+            record_dao.insert(records[2], trusted=True)
+            self.assertEqual(serialize.call_count, 3)
+            self.assertEqual(check_list.call_count, 2)
+        self.assertEqual(record_dao.get("rec_2").data, records[2].data)
+        with self.assertRaises(ValueError):
+            record_dao.insert(Record(id="bad", type="sample", user_defined={"set"}),
+                              trusted=True)
+
+    def test_raw_compression(self):
+        """Test that compressed raws are stored marked, read back as-is, and shrink the file."""
+        factory = backend.DAOFactory(self.test_db_dest, raw_compression="zlib")
+        record = Record(id="spam", type="eggs", data={"eggs": {"value": 12}})
+        factory.create_record_dao().insert(record)
+        plain_dao = backend.DAOFactory(self.test_db_dest).create_record_dao()
+        plain_dao.insert_many([Record(id="rec_{}".format(x), type="sample",
+                                      data={"datum_{}".format(y): {"value": y, "units": "cm"}
+                                            for y in range(200)})
+                               for x in range(50)])
+        stored = dict(plain_dao.session.query(schema.Record.id, schema.Record.raw))
+        # A BLOB, read back as bytes (or a buffer, on Python 2)
+        self.assertNotIsInstance(stored["spam"], six.text_type)
+        self.assertEqual(codec.raw_compression(stored["spam"]), "zlib")
+        self.assertIsNone(codec.raw_compression(stored["rec_0"]))
+        self.assertEqual(plain_dao.get("spam").raw, record.raw)
+        size = os.path.getsize(self.test_db_dest)
+        self.assertEqual(plain_dao.compress_raws("zlib"), 50)
+        self.assertLess(os.path.getsize(self.test_db_dest), size)
+        with self.assertRaises(ValueError):
+            backend.DAOFactory(raw_compression="bzip")
+
+    def test_raw_remainder(self):
+        """Test that raws stored as remainders read back exactly, leaving out what tables hold."""
+        data = {"count": {"value": 12, "units": "", "tags": []},
+                "mass": {"value": 2.5, "units": "kg", "tags": ["input", "output"]},
+                "color": {"value": "green"},
+                "sizes": {"value": [3, 1, 2], "units": "cm"},
+                "scores": {"value": [0.5, -1.25], "tags": ["output"]},
+                "names": {"value": ["spam", "eggs"]},
+                "flag": {"value": True},
+                "huge": {"value": 2 ** 60},
+                "extra": {"value": 1.5, "note": "kept as is"}}
+        files = [{"uri": "/a/plain.txt"},
+                 {"uri": "/a/typed.png", "mimetype": "image/png", "tags": ["plot"]},
+                 {"uri": "/a/extra.txt", "note": "kept as is"}]
+        record = Record(id="spam", type="eggs", data=data, files=files,
+                        user_defined={"nested": {"key": [1, 2]}})
+        run = Run(id="run", application="app", version="1.0", data={"steps": {"value": 7}})
+        for compression in (None, "zlib"):
+            factory = backend.DAOFactory(raw_compression=compression, raw_storage="remainder")
+            record_dao = factory.create_record_dao()
+            factory.create_run_dao().insert(run)
+            record_dao.insert(record)
+            self.assertEqual(record_dao.get("spam").raw, record.raw)
+            self.assertEqual(factory.create_run_dao().get("run").raw, run.raw)
+            # pylint: disable=protected-access
+            stored = codec.decode_raw(record_dao.session.query(schema.Record.raw)
+                                      .filter(schema.Record.id == "spam").scalar())
+            self.assertEqual(stored["data"]["sizes"], backend._FROM_TABLES_AS_INTS)
+            self.assertEqual(stored["data"]["mass"], backend._FROM_TABLES)
+            for name in ("flag", "huge", "extra"):
+                self.assertEqual(stored["data"][name], data[name])
+            self.assertEqual(stored["files"], ["/a/plain.txt", "/a/typed.png", files[2]])
+            self.assertEqual(stored["user_defined"], record.user_defined)
+        full_dao = backend.DAOFactory().create_record_dao()
+        full_dao.insert(Record(id="full", type="eggs", data=data))
+        full_dao.raw_storage = "remainder"
+        full_dao.insert(record, force_overwrite=True)
+        with patch('sina.datastores.sql.IN_CHUNK_SIZE', 1):
+            got = list(full_dao.get_many(["spam", "full", "spam"]))
+        self.assertEqual([rec.raw for rec in got], [record.raw, got[1].raw, record.raw])
+        self.assertEqual(got[1].data, data)
+        with self.assertRaises(sqlalchemy.orm.exc.NoResultFound):
+            list(full_dao.get_many(["spam", "missing"]))
+        with self.assertRaises(ValueError):
+            backend.DAOFactory(raw_storage="partial")
+
+    def test_get_data_fields_chunked(self):
+        """Test that projected reads find everything when split across several queries."""
+        factory = backend.DAOFactory()
+        runs = [Run(id="run_{}".format(x), application="app", user="user",
+                    data={"datum_{}".format(y): {"value": y, "tags": ["in"]} for y in range(5)},
+                    files=[{"uri": "file_{}".format(x)}])
+                for x in range(5)]
+        factory.create_run_dao().insert_many(runs)
+        names = ["datum_1", "datum_3", "datum_4", "missing"]
+        with patch('sina.datastores.sql.IN_CHUNK_SIZE', 4):
+            got = list(factory.create_run_dao().get_many(
+                ["run_{}".format(x) for x in range(5)], data_fields=names, include_files=True))
+            records = list(factory.create_record_dao().get_many(["run_3", "run_0"],
+                                                                data_fields=names))
+        self.assertEqual([run.raw for run in got],
+                         [model.project_record(run, names, include_files=True).raw
+                          for run in runs])
+        self.assertEqual([record.data for record in records],
+                         [{name: runs[0].data[name] for name in names[:3]}] * 2)
+        with self.assertRaises(sqlalchemy.orm.exc.NoResultFound):
+            factory.create_run_dao().get("missing", data_fields=names)
+
+    def test_relationshipdao_insert_many_all_or_nothing(self):
+        """Test that an invalid Relationship keeps the rest of its list out."""
+        relationship_dao = self.create_dao_factory().create_relationship_dao()
+        with self.assertRaises(ValueError):
+            relationship_dao.insert_many([
+                Relationship(subject_id="spam", object_id="eggs", predicate="loves"),
+                Relationship(subject_id="spam", object_id="ham", predicate=None)])
+        self.assertEqual(relationship_dao.get(subject_id="spam"), [])
+
+    def test_relationshipdao_insert_many_generator(self):
+        """Test that Relationships can be inserted from any iterable."""
+        relationship_dao = self.create_dao_factory().create_relationship_dao()
+        relationship_dao.insert_many(Relationship(subject_id="spam", object_id=id,
+                                                  predicate="loves")
+                                     for id in ("eggs", "ham"))
+        self.assertEqual(relationship_dao.count(), 2)
+
+    def test_relationshipdao_get_many_chunked(self):
+        """Test that get_many() finds everything when split across several queries."""
+        relationship_dao = self.create_dao_factory().create_relationship_dao()
+        relationship_dao.insert_many([Relationship(subject_id="rec_{}".format(x),
+                                                   predicate="precedes",
+                                                   object_id="rec_{}".format(x + 1))
+                                      for x in range(7)])
+        ids = ["rec_{}".format(x) for x in range(8)]
+        with patch('sina.datastores.sql.IN_CHUNK_SIZE', 3):
+            grouped = relationship_dao.get_many(subject_ids=ids)
+        self.assertEqual(list(grouped), ids)
+        self.assertEqual([[rel.object_id for rel in rels] for rels in grouped.values()],
+                         [["rec_{}".format(x + 1)] for x in range(7)] + [[]])
+
+    def test_traverse_matches_generic(self):
+        """Test that the recursive query agrees with the one-hop-at-a-time walk."""
+        relationship_dao = self.create_dao_factory().create_relationship_dao()
+        for subj, obj in (("a", "b"), ("b", "c"), ("c", "a"), ("c", "d"),
+                          ("e", "d"), ("d", "f")):
+            relationship_dao.insert(subject_id=subj, predicate="links", object_id=obj)
+        relationship_dao.insert(subject_id="b", predicate="cites", object_id="e")
+        for direction in ("out", "in", "both"):
+            for predicate in (None, "links"):
+                for max_depth in (None, 1, 2, 3):
+                    kwargs = {"predicate": predicate, "direction": direction,
+                              "max_depth": max_depth, "include_edges": True}
+                    ids, edges = relationship_dao.traverse(["a", "e"], **kwargs)
+                    expected_ids, expected_edges = sina.dao.RelationshipDAO.traverse(
+                        relationship_dao, ["a", "e"], **kwargs)
+                    self.assertEqual(ids, expected_ids, kwargs)
+                    six.assertCountEqual(
+                        self, [(x.subject_id, x.predicate, x.object_id) for x in edges],
+                        [(x.subject_id, x.predicate, x.object_id) for x in expected_edges])
+
 
 class TestQuery(SQLMixin, tests.backend_test.TestQuery):
     """
@@ -91,6 +470,86 @@ class TestQuery(SQLMixin, tests.backend_test.TestQuery):
         tests.backend_test.create_daos(cls)
         tests.backend_test.populate_database_with_data(cls.record_dao)
 
+    def test_statistics_collected_on_insert(self):
+        """Test that a new database's statistics are kept up to date on insert."""
+        factory = self.create_dao_factory()
+        catalog = factory.statistics
+        self.assertTrue(catalog.complete)
+        tests.backend_test.populate_database_with_data(factory.create_record_dao())
+        spam_scal = catalog.get("scalar", "spam_scal")
+        self.assertEqual((spam_scal.count, spam_scal.min, spam_scal.max, spam_scal.distinct),
+                         (3, 10, 10.99999, 3))
+        list_2 = catalog.get("stringlist", "val_data_list_2")
+        self.assertEqual((list_2.count, list_2.entries, list_2.distinct), (2, 4, 3))
+        # Known to be absent, rather than unknown
+        self.assertEqual(catalog.estimate("scalar", "nonexistant", 1), 0.0)
+
+    def test_statistics_follow_commits(self):
+        """Test that only committed inserts are observed, and other changes leave stats partial."""
+        factory = self.create_dao_factory()
+        record_dao = factory.create_record_dao()
+        record_dao.insert(Record(id="spam", type="eggs", data={"yolks": {"value": 2}}))
+        with self.assertRaises(sqlalchemy.exc.IntegrityError):
+            record_dao.insert(Record(id="spam", type="eggs", data={"yolks": {"value": 3}}))
+        factory.session.rollback()
+        self.assertEqual(factory.statistics.get("scalar", "yolks").count, 1)
+        self.assertTrue(factory.statistics.complete)
+        record_dao.insert(Record(id="ham", type="eggs", data={"yolks": {"value": 1}}),
+                          force_overwrite=True)
+        self.assertTrue(factory.statistics.complete)
+        record_dao.insert(Record(id="spam", type="eggs", data={"yolks": {"value": 4}}),
+                          force_overwrite=True)
+        self.assertEqual(factory.statistics.get("scalar", "yolks").count, 2)
+        self.assertFalse(factory.statistics.complete)
+        factory.create_record_dao().analyze()
+        record_dao.delete("spam")
+        self.assertFalse(factory.statistics.complete)
+        self.assertEqual(factory.create_record_dao().analyze().get("scalar", "yolks").count, 1)
+
+    def test_statistics_existing_database(self):
+        """Test that an existing database's statistics are unknown until analyzed."""
+        with tempfile.NamedTemporaryFile(suffix='.sqlite') as db_file:
+            factory = self.create_dao_factory(test_db_dest=db_file.name)
+            self.assertFalse(factory.statistics.complete)
+            self.assertIsNone(factory.statistics.estimate("scalar", "spam_scal", 1))
+
+    def test_statistics_stored_by_analyze(self):
+        """Test that analyzing stores statistics that later factories start with."""
+        with tempfile.NamedTemporaryFile(suffix='.sqlite') as db_file:
+            factory = self.create_dao_factory(test_db_dest=db_file.name)
+            tests.backend_test.populate_database_with_data(factory.create_record_dao())
+            factory.create_record_dao().analyze()
+            reopened = self.create_dao_factory(test_db_dest=db_file.name).statistics
+            self.assertFalse(reopened.complete)
+            for kind, name in (("scalar", "spam_scal"), ("stringlist", "val_data_list_2")):
+                self.assertEqual(reopened.get(kind, name).to_json(),
+                                 factory.statistics.get(kind, name).to_json())
+            self.assertIsNone(reopened.estimate("scalar", "nonexistant", 1))
+
+    def test_optimize(self):
+        """Test that optimizing a database analyzes it, vacuums it, and reports on it."""
+        with tempfile.NamedTemporaryFile(suffix='.sqlite') as db_file:
+            factory = self.create_dao_factory(test_db_dest=db_file.name)
+            record_dao = factory.create_record_dao()
+            record_dao.insert_many([Record(id=str(i), type="eggs", data={"yolks": {"value": i}})
+                                    for i in range(500)])
+            record_dao.delete_many([str(i) for i in range(400)])
+            report = factory.optimize(vacuum="incremental")
+            self.assertLess(report["size_after"], report["size_before"])
+            self.assertEqual(sorted(report["seconds"]),
+                             ["analyze", "optimize", "statistics", "vacuum"])
+            self.assertEqual(report["tables"]["ScalarData"]["rows"], 100)
+            self.assertEqual(report["tables"]["DatumStatistics"]["rows"], 1)
+            self.assertEqual(factory.statistics.get("scalar", "yolks").count, 100)
+            self.assertTrue(factory.session.execute(
+                "SELECT COUNT(*) FROM sqlite_stat1").scalar())
+            record_dao.delete_many([str(i) for i in range(400, 450)])
+            self.assertLessEqual(factory.optimize(vacuum="incremental")["size_after"],
+                                 report["size_after"])
+            self.assertNotIn("vacuum", factory.optimize()["seconds"])
+            with self.assertRaises(ValueError):
+                factory.optimize(vacuum="thorough")
+
 
 class TestImportExport(SQLMixin, tests.backend_test.TestImportExport):
     """
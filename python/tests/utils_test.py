@@ -185,6 +185,40 @@ class TestSinaUtils(unittest.TestCase):  # pylint: disable=too-many-public-metho
         no_iterator = sina.utils.intersect_ordered([])
         self.assertTrue(isinstance(no_iterator, GeneratorType))
 
+    def test_intersect_ordered_gallops(self):
+        """Test that a short iterator is intersected correctly with long sequences."""
+        short = (i for i in [3, 500, 501, 9998, 20000])
+        long_even = list(range(0, 10000, 2))
+        long_all = range(10000)
+        self.assertEqual(list(sina.utils.intersect_ordered([long_even, short, long_all])),
+                         [500, 9998])
+
+    def test_union_ordered(self):
+        """Test that ordered iterators are merged in order without duplicates."""
+        gen_even = (i for i in range(0, 10, 2))
+        list_rando = [-1, 0, 1, 2, 5]
+        union = sina.utils.union_ordered([gen_even, list_rando, []])
+        self.assertIsInstance(union, GeneratorType)
+        self.assertEqual(list(union), [-1, 0, 1, 2, 4, 5, 6, 8])
+        self.assertEqual(list(sina.utils.union_ordered([])), [])
+
+    def test_difference_ordered(self):
+        """Test that we yield what's in one ordered iterator but not another."""
+        gen_10 = (i for i in range(10))
+        gen_rando = (i for i in [-1, 0, 1, 2, 5, 6])
+        difference = sina.utils.difference_ordered(gen_10, gen_rando)
+        self.assertIsInstance(difference, GeneratorType)
+        self.assertEqual(list(difference), [3, 4, 7, 8, 9])
+        self.assertEqual(list(sina.utils.difference_ordered(["eggs", "spam"], [])),
+                         ["eggs", "spam"])
+
+    def test_chunked(self):
+        """Test we split an iterable into lists of at most the given size."""
+        chunks = sina.utils.chunked((x for x in range(7)), 3)
+        self.assertIsInstance(chunks, GeneratorType)
+        self.assertEqual(list(chunks), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(sina.utils.chunked([], 3)), [])
+
     def test_merge_overlapping_ranges(self):
         """Test that we merge overlapping DataRanges."""
         ranges = [DataRange(max=0),
@@ -0,0 +1,101 @@
+"""Tests for validating documents against the Mnoda schema."""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import sina.datastores.sql as sql
+from sina.utils import import_json
+from sina.validation import (get_validator, DocumentValidator, MNODA_SCHEMA_PATH,
+                             FASTJSONSCHEMA_PRESENT, JSONSCHEMA_PRESENT)
+
+# Disable pylint invalid-name due to significant number of tests with names
+# exceeding the 30 character limit
+# pylint: disable=invalid-name
+
+TEST_FILES = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'test_files')
+
+
+def _unprefixed(errors):
+    """Drop the u prefix Python 2 gives the reprs in error messages."""
+    return [error.replace("u'", "'") for error in errors]
+
+
+@unittest.skipUnless(FASTJSONSCHEMA_PRESENT or JSONSCHEMA_PRESENT,
+                     "Validation requires fastjsonschema or jsonschema")
+class TestDocumentValidator(unittest.TestCase):
+    """Tests for checking documents and reporting their problems."""
+
+    def setUp(self):
+        """Create a scratch directory for documents."""
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the scratch directory."""
+        shutil.rmtree(self.temp_dir)
+
+    def test_packaged_schema(self):
+        """Test that the schema shipped with Sina matches the repository's."""
+        repo_schema = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                   '..', '..', 'mnoda.json')
+        if not os.path.isfile(repo_schema):
+            self.skipTest("Not running from a repository checkout")
+        with open(repo_schema) as repo_file, open(MNODA_SCHEMA_PATH) as packaged_file:
+            self.assertEqual(json.load(repo_file), json.load(packaged_file))
+
+    def test_valid_documents(self):
+        """Test that valid documents have no problems."""
+        validator = get_validator()
+        self.assertIs(validator, get_validator())
+        for name in ('mnoda_1.json', 'mnoda_2.json'):
+            with open(os.path.join(TEST_FILES, name)) as doc_file:
+                document = json.load(doc_file)
+            self.assertEqual(validator.errors(document), [])
+            validator.validate(document, source=name)
+
+    def test_invalid_document(self):
+        """Test that problems are reported with the paths to where they are."""
+        document = {"records": [{"id": "spam", "type": "food"},
+                                {"id": "eggs", "type": "food",
+                                 "data": {"yolks": {"value": 2, "tags": "fried"}}}]}
+        validator = DocumentValidator()
+        with self.assertRaises(ValueError) as context:
+            validator.validate(document, source="breakfast.json")
+        message = str(context.exception)
+        self.assertIn("breakfast.json does not follow the schema", message)
+        self.assertIn("records[1]", message)
+        if JSONSCHEMA_PRESENT:
+            # jsonschema gives the schema's strings' reprs, u'array' on Python 2
+            self.assertEqual(_unprefixed(validator.errors(document)),
+                             ["records[1].data.yolks.tags: 'fried' is not of type 'array'"])
+            self.assertEqual(_unprefixed(validator.errors({"records": [{"type": "food"}] * 3},
+                                                          limit=2)),
+                             ["records[0]: 'id' is a required property",
+                              "records[1]: 'id' is a required property"])
+
+    def test_validate_records(self):
+        """Test checking a batch of Records' JSON forms."""
+        validator = get_validator()
+        validator.validate_records([])
+        validator.validate_records([{"id": "spam", "type": "food"}])
+        with self.assertRaises(ValueError) as context:
+            validator.validate_records([{"id": "spam", "type": "food"},
+                                        {"id": "eggs", "type": 2}], source="batch")
+        self.assertIn("records[1]", str(context.exception))
+
+    def test_import_validates_first(self):
+        """Test that importing an invalid document writes nothing."""
+        doc_path = os.path.join(self.temp_dir, "bad.json")
+        with open(doc_path, "w") as doc_file:
+            json.dump({"records": [{"id": "spam", "type": "food"},
+                                   {"id": "eggs", "type": "food",
+                                    "files": [{"mimetype": "png"}]}]}, doc_file)
+        factory = sql.DAOFactory()
+        with self.assertRaises(ValueError) as context:
+            import_json(factory, doc_path, validate=True)
+        self.assertIn("records[1].files[0]", str(context.exception))
+        self.assertFalse(factory.create_record_dao().get_content_hashes(["spam", "eggs"]))
+        summary = import_json(factory, os.path.join(TEST_FILES, 'mnoda_1.json'),
+                              validate=True)
+        self.assertGreater(summary['inserted'], 0)